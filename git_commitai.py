@@ -4,25 +4,32 @@ from __future__ import annotations
 
 import os
 import sys
-import json
 import subprocess
-import shlex
-import argparse
 import time
 import re
-from datetime import datetime
-from fnmatch import fnmatch
-from urllib.request import Request, urlopen
-from urllib.error import URLError, HTTPError
-from typing import Dict, List, Optional, Tuple, Any, Union
+import io
+import math
+import threading
+from collections import Counter, deque
+from contextlib import ExitStack, contextmanager, redirect_stdout
+from functools import partial
+from itertools import chain, islice
+from dataclasses import dataclass, field, replace
+from typing import TYPE_CHECKING, Callable, Dict, Generator, Iterable, Iterator, List, Optional, Set, Tuple, Any, Union
+
+# Everything else is imported where it is used, so that --version, --help
+# and editor integrations that run the tool on every keystroke don't pay for
+# the network stack and json at startup (see tests/test_startup.py)
+if TYPE_CHECKING:
+    import argparse
+    import http.client
+    from urllib.request import Request
+    from urllib.response import addinfourl
 
 
 # Version information
 __version__ = "0.1.0"
 
-# Global debug flag
-DEBUG: bool = False
-
 # Retry configuration constants
 MAX_RETRIES: int = 3
 RETRY_DELAY: int = 2  # seconds between retries
@@ -46,6 +53,484 @@ MAX_DIFF_SIZE: int = int(os.environ.get("GIT_COMMIT_AI_MAX_DIFF_SIZE", 40 * 1024
 # Total prompt size limit (safety margin for model context)
 MAX_PROMPT_SIZE: int = int(os.environ.get("GIT_COMMIT_AI_MAX_PROMPT_SIZE", 120 * 1024))  # 120KB (~30K tokens)
 
+# Environment variables behind each size limit; when set they take precedence
+# over config files
+LIMIT_ENV_VARS: Dict[str, str] = {
+    "max_file_size": "GIT_COMMIT_AI_MAX_FILE_SIZE",
+    "max_total_files": "GIT_COMMIT_AI_MAX_TOTAL_FILES",
+    "max_diff_size": "GIT_COMMIT_AI_MAX_DIFF_SIZE",
+    "max_prompt_size": "GIT_COMMIT_AI_MAX_PROMPT_SIZE",
+}
+
+
+# Read-only git calls run with a fast, predictable profile: no optional index
+# locks (which contend with IDE git integrations), no colour, and for diffs no
+# external diff drivers or textconv filters. core.fsmonitor and
+# core.untrackedCache are deliberately not overridden, so the repository's
+# settings for them keep speeding up status and diff. Disable the profile
+# with GIT_COMMIT_AI_GIT_FAST_PATH=0.
+GIT_FAST_CONFIG: List[str] = ["-c", "color.ui=never"]
+GIT_FAST_ENV: Dict[str, str] = {"GIT_OPTIONAL_LOCKS": "0"}
+GIT_FAST_DIFF_OPTIONS: List[str] = ["--no-ext-diff", "--no-textconv"]
+GIT_DIFF_COMMANDS: Tuple[str, ...] = ("diff", "show", "log")
+
+# Set on git calls that must not fetch missing objects from the promisor
+# remote of a partial clone, one network round trip per object
+GIT_NO_LAZY_FETCH_ENV: Dict[str, str] = {"GIT_NO_LAZY_FETCH": "1"}
+
+# Submodule updates are summarised with at most SUBMODULE_LOG_LIMIT commits
+# each. The submodules are looked up concurrently, and each one's git log
+# gets SUBMODULE_TIME_BUDGET seconds before it is reported as timed out.
+SUBMODULE_LOG_LIMIT: int = 20
+SUBMODULE_TIME_BUDGET: float = 2.0
+SUBMODULE_WORKERS: int = 8
+
+# Names this module used to import at load time, still available as module
+# attributes (e.g. git_commitai.urlopen) but imported on first access
+_LAZY_ATTRIBUTES: Dict[str, Tuple[str, Optional[str]]] = {
+    "json": ("json", None),
+    "shlex": ("shlex", None),
+    "argparse": ("argparse", None),
+    "fnmatch": ("fnmatch", "fnmatch"),
+    "Request": ("urllib.request", "Request"),
+    "urlopen": ("urllib.request", "urlopen"),
+    "URLError": ("urllib.error", "URLError"),
+    "HTTPError": ("urllib.error", "HTTPError"),
+}
+
+
+def __getattr__(name: str) -> Any:
+    """Import a name from _LAZY_ATTRIBUTES on first access (PEP 562)."""
+    if name not in _LAZY_ATTRIBUTES:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+    import importlib
+
+    module_name, attribute = _LAZY_ATTRIBUTES[name]
+    value: Any = importlib.import_module(module_name)
+    if attribute:
+        value = getattr(value, attribute)
+    globals()[name] = value
+    return value
+
+
+def _lazy(name: str) -> Any:
+    """Get a lazily imported module attribute, honouring any replacement.
+
+    Functions use this instead of a local import for names that callers
+    (and tests) may replace on the module, such as urlopen.
+    """
+    return globals()[name] if name in globals() else __getattr__(name)
+
+
+class CommitAIError(Exception):
+    """Error that ends a git-commitai run; main() turns it into an exit code."""
+
+    exit_code: int = 1
+
+
+class ConfigError(CommitAIError):
+    """Required configuration (such as the API key) is missing."""
+
+
+class APIRequestError(CommitAIError):
+    """The API request was rejected or failed after all retries."""
+
+
+@dataclass(frozen=True)
+class Limits:
+    """Prompt size limits for one run, in bytes.
+
+    Unspecified limits default to the module-level values, which already
+    include any environment variable overrides.
+    """
+
+    max_file_size: int = field(default_factory=lambda: MAX_FILE_SIZE)
+    max_total_files: int = field(default_factory=lambda: MAX_TOTAL_FILES)
+    max_diff_size: int = field(default_factory=lambda: MAX_DIFF_SIZE)
+    max_prompt_size: int = field(default_factory=lambda: MAX_PROMPT_SIZE)
+
+    @classmethod
+    def from_config(cls, repo_config: Dict[str, Any]) -> Limits:
+        """Build limits from merged config files; environment variables win.
+
+        Args:
+            repo_config: Configuration from load_gitcommitai_config()
+
+        Returns:
+            Limits for the run
+        """
+        overrides: Dict[str, int] = {
+            key: repo_config[key]
+            for key, env_var in LIMIT_ENV_VARS.items()
+            if key in repo_config and env_var not in os.environ
+        }
+        return cls(**overrides)
+
+
+@dataclass(frozen=True)
+class RepoLayout:
+    """Storage features of a repository that change how content is read.
+
+    In a partial clone, blobs can be missing locally and git fetches each one
+    from the promisor remote on first access. With a sparse index, looking up
+    paths one at a time can make git expand the index to a full one.
+    """
+
+    partial_clone: bool = False
+    # Remote missing objects are fetched from (None: not a partial clone)
+    promisor_remote: Optional[str] = None
+    sparse_checkout: bool = False
+    sparse_index: bool = False
+
+    @property
+    def read_by_object_id(self) -> bool:
+        """Whether staged content should be listed once and read by blob id."""
+        return self.partial_clone or self.sparse_index
+
+
+@dataclass(frozen=True)
+class RunSettings:
+    """Settings for one message generation.
+
+    Passed explicitly to get_git_diff(), get_staged_files(), build_ai_prompt()
+    and make_api_request() instead of mutating module globals, so several
+    repositories can be processed concurrently, one RunSettings per thread.
+    """
+
+    limits: Limits = field(default_factory=Limits)
+    # Working directory for git commands (None: the process cwd)
+    cwd: Optional[str] = None
+    debug: bool = False
+    max_retries: int = field(default_factory=lambda: MAX_RETRIES)
+    retry_delay: float = field(default_factory=lambda: RETRY_DELAY)
+    retry_backoff: float = field(default_factory=lambda: RETRY_BACKOFF)
+    timeout: float = field(default_factory=lambda: REQ_TIMEOUT)
+    # Run read-only git calls with the GIT_FAST_* profile
+    git_fast_path: bool = field(
+        default_factory=lambda: parse_bool(os.environ.get("GIT_COMMIT_AI_GIT_FAST_PATH", "1"))
+    )
+    # Span recorder for --profile (None: profiling off)
+    profiler: Optional[Profiler] = None
+    # Collects the run's record for the metrics ledger (None: not recorded)
+    metrics: Optional[RunMetrics] = None
+    # Peak traced memory in bytes per phase, for --memory-report (None: off)
+    memory_peaks: Optional[Dict[str, int]] = None
+    # Partial-clone and sparse-index features, see detect_repo_layout()
+    layout: RepoLayout = field(default_factory=RepoLayout)
+    # Let git fetch missing objects from a promisor remote on demand
+    lazy_fetch: bool = True
+    # Seconds each run_git() call may take (None: no limit)
+    git_timeout: Optional[float] = None
+    # Shrink file contents with CONTENT_NORMALIZERS and diff prose by word
+    normalize: bool = field(
+        default_factory=lambda: parse_bool(os.environ.get("GIT_COMMIT_AI_NORMALIZE", "1"))
+    )
+    # Files left out of the diff and FILES, see load_skip_matcher() (None: none)
+    skip: Optional[SkipMatcher] = None
+    # Processes for CPU-heavy stages, see ParallelStage (1: this one only)
+    workers: int = field(
+        default_factory=lambda: env_int(
+            "GIT_COMMIT_AI_WORKERS", min(PARALLEL_WORKERS, os.cpu_count() or 1), minimum=1
+        )
+    )
+    # Past this many changed files, FILES and the commit template list only
+    # the most changed ones and sum up the rest by directory (0: never)
+    rollup_files: int = field(
+        default_factory=lambda: env_int("GIT_COMMIT_AI_ROLLUP_FILES", ROLLUP_FILES)
+    )
+
+
+# Settings of the generation running on the current thread, for helpers such
+# as run_git() and debug_log() that are too deep to take them as arguments
+_run_state = threading.local()
+
+
+def active_settings() -> RunSettings:
+    """Get the settings of the run on the current thread.
+
+    Returns:
+        The settings installed by run_context(), or defaults
+    """
+    settings: Optional[RunSettings] = getattr(_run_state, "settings", None)
+    return settings if settings is not None else RunSettings()
+
+
+@contextmanager
+def run_context(settings: RunSettings) -> Iterator[RunSettings]:
+    """Install settings for the current thread for the duration of a block.
+
+    Args:
+        settings: Settings to install
+
+    Yields:
+        The installed settings
+    """
+    previous: Optional[RunSettings] = getattr(_run_state, "settings", None)
+    _run_state.settings = settings
+    try:
+        yield settings
+    finally:
+        _run_state.settings = previous
+
+
+# Events that mean part of the changes was left out of the prompt
+TRUNCATION_EVENTS: Tuple[str, ...] = (
+    "diff_truncated", "file_too_large", "file_over_budget", "blob_not_fetched", "file_list_truncated",
+)
+
+
+@dataclass
+class RunMetrics:
+    """Operational measurements of one run, for the metrics ledger."""
+
+    repo: Optional[str] = None
+    model: Optional[str] = None
+    # Prompt size in bytes per section (base, diff, files, total)
+    prompt_bytes: Dict[str, int] = field(default_factory=dict)
+    # Truncations, cache hits and misses, ... by name
+    events: Dict[str, int] = field(default_factory=dict)
+    # API requests sent, including retries
+    attempts: int = 0
+    usage: Dict[str, int] = field(default_factory=dict)
+    # Seconds per phase
+    timings: Dict[str, float] = field(default_factory=dict)
+    committed: bool = False
+
+    def to_record(self, exit_code: Any) -> Dict[str, Any]:
+        """Build the ledger record for this run.
+
+        Args:
+            exit_code: The process exit code
+
+        Returns:
+            JSON-serializable record
+        """
+        return {
+            "time": round(time.time(), 3),
+            "version": __version__,
+            "repo": self.repo or active_settings().cwd or os.getcwd(),
+            "model": self.model,
+            "exit_code": exit_code,
+            "committed": self.committed,
+            "prompt_bytes": self.prompt_bytes,
+            "events": self.events,
+            "attempts": self.attempts,
+            "usage": self.usage,
+            "timings": self.timings,
+        }
+
+
+def count_event(name: str, amount: int = 1) -> None:
+    """Count an event in the metrics of the active run, if it has any.
+
+    Args:
+        name: Event name, e.g. "diff_truncated"
+        amount: How much to add
+    """
+    metrics: Optional[RunMetrics] = active_settings().metrics
+    if metrics is not None:
+        metrics.events[name] = metrics.events.get(name, 0) + amount
+
+
+@dataclass
+class Span:
+    """A timed operation recorded by a Profiler."""
+
+    name: str
+    span_id: str
+    parent_id: Optional[str]
+    # time.perf_counter_ns() readings
+    start_ns: int
+    end_ns: int
+    thread_id: int
+    attributes: Dict[str, Any] = field(default_factory=dict)
+
+
+class Profiler:
+    """Records spans for every phase of a run, for --profile.
+
+    Spans nest per thread: a span opened inside another becomes its child.
+    The result can be written as a Chrome trace-event file (chrome://tracing,
+    Perfetto) and as OTLP-style JSON spans for tracing backends.
+    """
+
+    def __init__(self) -> None:
+        self.trace_id: str = os.urandom(16).hex()
+        self.spans: List[Span] = []
+        self._lock = threading.Lock()
+        self._stacks = threading.local()
+        self._start_ns: int = time.perf_counter_ns()
+        # Offset from perf_counter_ns() readings to Unix epoch nanoseconds
+        self._epoch_offset_ns: int = time.time_ns() - self._start_ns
+
+    def _stack(self) -> List[str]:
+        stack: Optional[List[str]] = getattr(self._stacks, "ids", None)
+        if stack is None:
+            stack = self._stacks.ids = []
+        return stack
+
+    def record(self, name: str, start_ns: int, end_ns: int, **attributes: Any) -> Span:
+        """Record a span that has already finished.
+
+        Args:
+            name: Span name
+            start_ns: Start time from time.perf_counter_ns()
+            end_ns: End time from time.perf_counter_ns()
+            **attributes: Attributes to attach to the span
+
+        Returns:
+            The recorded span
+        """
+        stack = self._stack()
+        span = Span(
+            name=name,
+            span_id=os.urandom(8).hex(),
+            parent_id=stack[-1] if stack else None,
+            start_ns=start_ns,
+            end_ns=end_ns,
+            thread_id=threading.get_ident(),
+            attributes=attributes,
+        )
+        with self._lock:
+            self.spans.append(span)
+        return span
+
+    @contextmanager
+    def span(self, name: str, **attributes: Any) -> Iterator[Dict[str, Any]]:
+        """Time a block as a span.
+
+        Args:
+            name: Span name
+            **attributes: Attributes to attach to the span
+
+        Yields:
+            The span's attribute dict, to add attributes known only later
+        """
+        stack = self._stack()
+        span_id: str = os.urandom(8).hex()
+        parent_id: Optional[str] = stack[-1] if stack else None
+        stack.append(span_id)
+        start_ns: int = time.perf_counter_ns()
+        try:
+            yield attributes
+        except BaseException as e:
+            attributes["error"] = type(e).__name__
+            raise
+        finally:
+            end_ns: int = time.perf_counter_ns()
+            stack.pop()
+            with self._lock:
+                self.spans.append(Span(
+                    name, span_id, parent_id, start_ns, end_ns, threading.get_ident(), attributes
+                ))
+
+    def chrome_trace(self) -> Dict[str, Any]:
+        """Build a Chrome trace-event document.
+
+        Returns:
+            Document with one complete ("X") event per span, times in microseconds
+        """
+        pid: int = os.getpid()
+        events: List[Dict[str, Any]] = [
+            {"name": "process_name", "ph": "M", "pid": pid, "tid": 0, "args": {"name": "git-commitai"}}
+        ]
+        for span in sorted(self.spans, key=lambda s: s.start_ns):
+            events.append({
+                "name": span.name,
+                "cat": span.name.split(" ", 1)[0].split(".", 1)[0],
+                "ph": "X",
+                "ts": (span.start_ns - self._start_ns) / 1000,
+                "dur": (span.end_ns - span.start_ns) / 1000,
+                "pid": pid,
+                "tid": span.thread_id,
+                "args": span.attributes,
+            })
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def otlp(self) -> Dict[str, Any]:
+        """Build an OTLP/JSON trace document (ExportTraceServiceRequest).
+
+        Returns:
+            Document with all spans under one resource and instrumentation scope
+        """
+        def attribute(key: str, value: Any) -> Dict[str, Any]:
+            if isinstance(value, bool):
+                typed: Dict[str, Any] = {"boolValue": value}
+            elif isinstance(value, int):
+                typed = {"intValue": str(value)}
+            elif isinstance(value, float):
+                typed = {"doubleValue": value}
+            else:
+                typed = {"stringValue": str(value)}
+            return {"key": key, "value": typed}
+
+        spans: List[Dict[str, Any]] = []
+        for span in sorted(self.spans, key=lambda s: s.start_ns):
+            document: Dict[str, Any] = {
+                "traceId": self.trace_id,
+                "spanId": span.span_id,
+                "name": span.name,
+                "kind": 1,  # SPAN_KIND_INTERNAL
+                "startTimeUnixNano": str(span.start_ns + self._epoch_offset_ns),
+                "endTimeUnixNano": str(span.end_ns + self._epoch_offset_ns),
+                "attributes": [attribute(k, v) for k, v in span.attributes.items()],
+            }
+            if span.parent_id:
+                document["parentSpanId"] = span.parent_id
+            if "error" in span.attributes:
+                document["status"] = {"code": 2, "message": str(span.attributes["error"])}
+            spans.append(document)
+
+        return {"resourceSpans": [{
+            "resource": {"attributes": [
+                attribute("service.name", "git-commitai"),
+                attribute("service.version", __version__),
+                attribute("process.pid", os.getpid()),
+            ]},
+            "scopeSpans": [{"scope": {"name": "git_commitai", "version": __version__}, "spans": spans}],
+        }]}
+
+    def write(self, directory: str) -> Tuple[str, str]:
+        """Write the Chrome trace and OTLP files.
+
+        Args:
+            directory: Directory for the files, created if missing
+
+        Returns:
+            Tuple of (Chrome trace path, OTLP spans path)
+        """
+        import json
+
+        os.makedirs(directory, exist_ok=True)
+        stem: str = os.path.join(directory, f"profile-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}")
+        trace_path, otlp_path = f"{stem}.trace.json", f"{stem}.otlp.json"
+        with open(trace_path, "w") as f:
+            json.dump(self.chrome_trace(), f)
+        with open(otlp_path, "w") as f:
+            json.dump(self.otlp(), f)
+        return trace_path, otlp_path
+
+
+@contextmanager
+def profile_span(name: str, **attributes: Any) -> Iterator[Optional[Dict[str, Any]]]:
+    """Time a block as a span when the active run is being profiled.
+
+    Args:
+        name: Span name
+        **attributes: Attributes to attach to the span
+
+    Yields:
+        The span's attribute dict, or None when profiling is off, so callers
+        only compute expensive attributes when they are recorded
+    """
+    profiler: Optional[Profiler] = active_settings().profiler
+    if profiler is None:
+        yield None
+        return
+    with profiler.span(name, **attributes) as span_attributes:
+        yield span_attributes
+
 
 def redact_secrets(message: Union[str, Any]) -> str:
     """Redact sensitive information from debug messages.
@@ -105,13 +590,233 @@ def redact_secrets(message: Union[str, Any]) -> str:
     return redacted
 
 
+# Known credential formats scrubbed from the outbound prompt, as
+# (kind, pattern, literal hints). A pattern only runs when one of its hints
+# occurs in the text, and every pattern starts with a literal so the regex
+# engine can skip ahead instead of testing each position. When a pattern has a
+# group only that group is replaced; otherwise the whole match is replaced
+# with a typed marker so the model still sees that a credential was there.
+SECRET_FORMATS: List[Tuple[str, str, Tuple[str, ...]]] = [
+    ("private-key", r"-----BEGIN [A-Z ]*PRIVATE KEY-----[\s\S]+?-----END [A-Z ]*PRIVATE KEY-----", ("PRIVATE KEY-----",)),
+    ("aws-access-key", r"(?:AKIA|ASIA)[0-9A-Z]{16}(?![0-9A-Za-z])", ("AKIA", "ASIA")),
+    ("github-token", r"gh[pousr]_[A-Za-z0-9]{36,}|github_pat_[A-Za-z0-9_]{22,}",
+     ("ghp_", "gho_", "ghu_", "ghs_", "ghr_", "github_pat_")),
+    ("gitlab-token", r"glpat-[A-Za-z0-9_\-]{20,}", ("glpat-",)),
+    ("slack-token", r"xox[abposr]-[A-Za-z0-9\-]{10,}", ("xox",)),
+    ("stripe-key", r"[rs]k_(?:live|test)_[A-Za-z0-9]{16,}", ("k_live_", "k_test_")),
+    ("google-api-key", r"AIza[0-9A-Za-z_\-]{35}", ("AIza",)),
+    ("openai-key", r"sk-[A-Za-z0-9_\-]{20,}", ("sk-",)),
+    ("jwt", r"eyJ[A-Za-z0-9_\-]{8,}\.eyJ[A-Za-z0-9_\-]{8,}\.[A-Za-z0-9_\-]{8,}", ("eyJ",)),
+    ("url-credentials", r"://([A-Za-z0-9._%+~\-]+:[^\s/@:'\"()\[\]{}]+)@", ("://",)),
+]
+
+# .env-style, YAML and code assignments to sensitive-looking variables; only
+# the value is scrubbed. The keyword, in any case, must start a word, follow
+# an underscore or start a camel-case part (so MONKEY_PATCH is not a key),
+# and the variable name back to the start of the line is checked
+# separately. Values followed by a call, subscript or attribute access are
+# code, not literals, and are left alone, as are URLs and unquoted
+# identifiers and numbers (see _SECRET_ASSIGNMENT_PLAIN_VALUE_PATTERN).
+_SECRET_ASSIGNMENT_PATTERN = (
+    # The leading character-class lookahead lets the regex engine skip
+    # ahead to candidate keyword starts instead of trying every position
+    r"(?=[CKPSTckpst])(?:(?<![A-Za-z0-9])|(?<=[a-z])(?=[A-Z]))"
+    r"(?i:PASSWORD|PASSWD|SECRET|TOKEN|KEY|CREDENTIAL)[A-Za-z0-9_]*[\"']?[ \t]*[:=][ \t]*[\"']?"
+    r"([^\s\"'()\[\]{},;]{8,})(?![\w(\[.])"
+)
+_SECRET_ASSIGNMENT_NAME_PATTERN = r"[+\- ]?[ \t]*(?:export[ \t]+)?[\"']?(?:[A-Za-z_][A-Za-z0-9_.]*)?"
+# Unquoted values that name something rather than hold a secret: identifiers
+# without digits (get_secret_from_vault, settings.DB_KEY) and numbers
+_SECRET_ASSIGNMENT_PLAIN_VALUE_PATTERN = r"[A-Za-z_][A-Za-z_.]*|[0-9][0-9_.]*"
+
+# Candidate tokens for the entropy detector: long runs of base64/url-safe
+# characters.
+_ENTROPY_TOKEN_PATTERN = r"(?<![A-Za-z0-9+/_\-])[A-Za-z0-9+/_\-]{20,}={0,2}(?![A-Za-z0-9+/_\-=])"
+_HEX_TOKEN_PATTERN = r"[0-9a-fA-F]+=*"
+_HASH_PREFIX_PATTERN = r"sha(?:1|224|256|384|512)-"
+# Words of a camel-case or snake_case identifier (getElementById2 -> get,
+# Element, By, Id); digits and separators are not words
+_IDENTIFIER_WORD_PATTERN = r"[A-Z]?[a-z]+|[A-Z]+(?![a-z])"
+
+# A candidate token is treated as an identifier, not a secret, when its words
+# average at least this many letters and enough of those letters are vowels.
+# Random strings split into one- or two-letter words with few vowels.
+IDENTIFIER_MIN_WORD_LENGTH: float = 3.5
+IDENTIFIER_MIN_VOWEL_RATIO: float = 0.2
+
+# A candidate token is scrubbed when its entropy (bits per character) reaches
+# ENTROPY_LENGTH_FACTOR * log2(len), capped at ENTROPY_THRESHOLD. Random
+# strings approach log2(len) while camel-case identifiers fall well short.
+ENTROPY_THRESHOLD: float = 4.5
+ENTROPY_LENGTH_FACTOR: float = 0.85
+
+# Below this many candidate tokens the pure-Python entropy path is faster than
+# paying for the NumPy import
+NUMPY_MIN_TOKENS: int = 2048
+
+_numpy: Any = None
+_numpy_checked: bool = False
+
+
+def _optional_numpy() -> Any:
+    """Import NumPy on first use, returning None if it is not installed."""
+    global _numpy, _numpy_checked
+    if not _numpy_checked:
+        _numpy_checked = True
+        try:
+            import numpy  # type: ignore[import-not-found]
+            _numpy = numpy
+        except ImportError:
+            _numpy = None
+    return _numpy
+
+
+def shannon_entropies(tokens: List[str]) -> List[float]:
+    """Compute the Shannon entropy (bits per character) of each ASCII token.
+
+    Large batches are computed in one vectorized pass with NumPy when it is
+    available; otherwise (or for small batches) a pure-Python loop is used.
+
+    Args:
+        tokens: ASCII strings to measure
+
+    Returns:
+        Entropy of each token, in input order
+    """
+    if not tokens:
+        return []
+
+    np = _optional_numpy() if len(tokens) >= NUMPY_MIN_TOKENS else None
+    if np is not None:
+        lengths = np.fromiter((len(t) for t in tokens), dtype=np.int64, count=len(tokens))
+        data = np.frombuffer("".join(tokens).encode("ascii"), dtype=np.uint8).astype(np.int64)
+        owner = np.repeat(np.arange(len(tokens), dtype=np.int64), lengths)
+        counts = np.bincount(owner * 128 + data, minlength=len(tokens) * 128).reshape(len(tokens), 128)
+        probs = counts / lengths[:, None]
+        logs = np.log2(probs, out=np.zeros_like(probs), where=probs > 0)
+        return [float(x) for x in -(probs * logs).sum(axis=1)]
+
+    entropies: List[float] = []
+    for token in tokens:
+        size = len(token)
+        entropy = 0.0
+        for count in Counter(token).values():
+            p = count / size
+            entropy -= p * math.log2(p)
+        entropies.append(entropy)
+    return entropies
+
+
+def looks_like_identifier(token: str) -> bool:
+    """Check whether a token reads like a code identifier made of words.
+
+    Args:
+        token: Candidate token from the entropy detector
+
+    Returns:
+        True for names like getElementById2ForUserAccount or
+        x86_64_linux_toolchain, False for random-looking strings
+    """
+    words: List[str] = re.findall(_IDENTIFIER_WORD_PATTERN, token)
+    if not words:
+        return False
+    letters = sum(len(word) for word in words)
+    vowels = sum(token.count(c) for c in "aeiouAEIOU")
+    return letters >= IDENTIFIER_MIN_WORD_LENGTH * len(words) and vowels >= IDENTIFIER_MIN_VOWEL_RATIO * letters
+
+
+def scrub_prompt_secrets(text: str) -> Tuple[str, Dict[str, int]]:
+    """Scrub credentials from prompt text before it leaves the machine.
+
+    Known credential formats and sensitive .env-style assignments are
+    replaced first; the remaining long mixed-character tokens are then
+    scored in bulk with shannon_entropies() and replaced when they look
+    random.
+
+    Args:
+        text: Prompt section (diff or file contents) to scrub
+
+    Returns:
+        Tuple of the scrubbed text and a count of replacements per kind
+    """
+    findings: Dict[str, int] = {}
+    if not text:
+        return text, findings
+
+    # Patterns are compiled on first use (re caches them) rather than at
+    # import, which would slow down startup for every invocation
+    assignment_name_re: re.Pattern[str] = re.compile(_SECRET_ASSIGNMENT_NAME_PATTERN)
+    plain_value_re: re.Pattern[str] = re.compile(_SECRET_ASSIGNMENT_PLAIN_VALUE_PATTERN)
+    hex_token_re: re.Pattern[str] = re.compile(_HEX_TOKEN_PATTERN)
+    hash_prefix_re: re.Pattern[str] = re.compile(_HASH_PREFIX_PATTERN)
+
+    def replace_format(m: re.Match[str], kind: str) -> str:
+        start = m.start()
+        if start and m.group()[0].isalnum() and (m.string[start - 1].isalnum() or m.string[start - 1] in "_-"):
+            # Pattern matched inside a longer word
+            return m.group()
+        findings[kind] = findings.get(kind, 0) + 1
+        if m.re.groups:
+            return m.group()[:m.start(1) - start] + f"[REDACTED:{kind}]" + m.group()[m.end(1) - start:]
+        return f"[REDACTED:{kind}]"
+
+    def replace_assignment(m: re.Match[str]) -> str:
+        line_start = m.string.rfind("\n", 0, m.start()) + 1
+        if not assignment_name_re.fullmatch(m.string, line_start, m.start()):
+            return m.group()
+        value: str = m.group(1)
+        quoted: bool = m.string[m.start(1) - 1] in "\"'"
+        if "://" in value or (not quoted and plain_value_re.fullmatch(value)):
+            return m.group()
+        findings["assignment"] = findings.get("assignment", 0) + 1
+        return m.group()[:m.start(1) - m.start()] + "[REDACTED:assignment]"
+
+    for kind, pattern, hints in SECRET_FORMATS:
+        if any(hint in text for hint in hints):
+            text = re.sub(pattern, partial(replace_format, kind=kind), text)
+    text = re.sub(_SECRET_ASSIGNMENT_PATTERN, replace_assignment, text)
+
+    spans: List[Tuple[int, int]] = []
+    tokens: List[str] = []
+    for m in re.finditer(_ENTROPY_TOKEN_PATTERN, text):
+        token = m.group()
+        # Cheap filters first: secrets mix character classes, plain hex is
+        # almost always a commit id or checksum, integrity hashes in
+        # lockfiles are not secrets, and names made of words are code.
+        if token.lower() == token or token.upper() == token or not any(c.isdigit() for c in token):
+            continue
+        if hex_token_re.fullmatch(token) or hash_prefix_re.match(token) or text.endswith("h1:", 0, m.start()):
+            continue
+        if looks_like_identifier(token):
+            continue
+        spans.append(m.span())
+        tokens.append(token)
+
+    if not tokens:
+        return text, findings
+
+    pieces: List[str] = []
+    last = 0
+    for (start, end), entropy in zip(spans, shannon_entropies(tokens)):
+        if entropy >= min(ENTROPY_THRESHOLD, ENTROPY_LENGTH_FACTOR * math.log2(end - start)):
+            pieces.append(text[last:start])
+            pieces.append("[REDACTED:high-entropy]")
+            last = end
+            findings["high-entropy"] = findings.get("high-entropy", 0) + 1
+    if not pieces:
+        return text, findings
+    pieces.append(text[last:])
+    return "".join(pieces), findings
+
+
 def debug_log(message: str) -> None:
     """Log debug messages if debug mode is enabled, with secret redaction.
 
     Args:
         message: Debug message to log
     """
-    if DEBUG:
+    settings: Optional[RunSettings] = getattr(_run_state, "settings", None)
+    if settings is not None and settings.debug:
         # Redact sensitive information before logging
         safe_message: str = redact_secrets(message)
         print(f"DEBUG: {safe_message}", file=sys.stderr)
@@ -138,6 +843,45 @@ def show_man_page() -> bool:
     return False
 
 
+def parse_bool(value: Any) -> bool:
+    """Interpret a config or environment value as a boolean.
+
+    Args:
+        value: Raw value (bool, or a string such as "true", "0", "off")
+
+    Returns:
+        Parsed boolean; unrecognised strings count as True
+    """
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() not in ("0", "false", "no", "off", "")
+
+
+def env_int(name: str, default: int, minimum: int = 0) -> int:
+    """Read a whole-number setting from the environment.
+
+    Args:
+        name: Environment variable
+        default: Value when the variable is unset, empty or invalid
+        minimum: Smallest valid value
+
+    Returns:
+        The parsed value, or default when it is not a number of at least
+        minimum (logged, not an error)
+    """
+    raw: Optional[str] = os.environ.get(name)
+    if raw is None or not raw.strip():
+        return default
+    try:
+        value: int = int(raw.strip())
+    except ValueError:
+        value = minimum - 1
+    if value < minimum:
+        debug_log(f"Ignoring invalid {name}={raw!r}, using {default}")
+        return default
+    return value
+
+
 def get_git_root() -> str:
     """Get the root directory of the git repository.
 
@@ -147,847 +891,3696 @@ def get_git_root() -> str:
     try:
         return run_git(["rev-parse", "--show-toplevel"]).strip()
     except (subprocess.CalledProcessError, Exception):
-        return os.getcwd()
+        return active_settings().cwd or os.getcwd()
 
 
-def load_gitcommitai_config() -> Dict[str, Any]:
-    """Load configuration from .gitcommitai file in the repository root.
+def _parse_positive_int(value: str) -> int:
+    """Parse a size limit, rejecting zero and negative values."""
+    number = int(str(value).strip())
+    if number <= 0:
+        raise ValueError(f"expected a positive number of bytes, got {number}")
+    return number
 
-    The .gitcommitai file should contain a prompt template with placeholders:
-    - {CONTEXT} - User-provided context via -m flag
-    - {DIFF} - The git diff of changes
-    - {FILES} - The modified files with their content
-    - {GITMESSAGE} - Content from .gitmessage template if exists
-    - {AMEND_NOTE} - Note about amending if --amend is used
 
-    Also supports optional model configuration.
+def _parse_untracked_mode(value: str) -> str:
+    """Parse an untracked-file mode for git status -u."""
+    mode = str(value).strip().lower()
+    if mode not in ("no", "normal", "all"):
+        raise ValueError(f"expected no, normal or all, got {mode!r}")
+    return mode
+
+
+def parse_gzip_hosts(value: Any) -> List[str]:
+    """Parse the gzip_requests setting into the API hosts to gzip requests for.
+
+    Args:
+        value: Raw value: a boolean ("yes" means every endpoint), or host
+            names separated by commas or spaces
 
     Returns:
-        Dictionary containing configuration (may be empty)
+        Lowercased host names, ["*"] for every endpoint or [] for none
     """
-    debug_log("Looking for .gitcommitai configuration file")
+    if isinstance(value, bool):
+        return ["*"] if value else []
+    words: List[str] = str(value).replace(",", " ").lower().split()
+    if words in (["1"], ["true"], ["yes"], ["on"]):
+        return ["*"]
+    if not words or words in (["0"], ["false"], ["no"], ["off"]):
+        return []
+    return words
+
+
+# Settings recognised at the top of a config file, mapped to their parsers
+CONFIG_SETTINGS: Dict[str, Callable[[str], Any]] = {
+    "model": lambda value: str(value).strip(),
+    "max_file_size": _parse_positive_int,
+    "max_total_files": _parse_positive_int,
+    "max_diff_size": _parse_positive_int,
+    "max_prompt_size": _parse_positive_int,
+    "scrub_secrets": parse_bool,
+    "untracked_files": _parse_untracked_mode,
+    "gzip_requests": parse_gzip_hosts,
+}
+
+_CONFIG_LINE_PATTERN = r"([a-z_]+)[:=]"
+
+# Bump when the shape of the cached config changes
+CONFIG_CACHE_VERSION: int = 1
+CONFIG_CACHE_FILE: str = "gitcommitai-config.json"
+
+
+def parse_gitcommitai_config(content: str) -> Dict[str, Any]:
+    """Parse the contents of a git-commitai config file.
+
+    The file is either a JSON object (for backward compatibility) or a prompt
+    template preceded by ``key: value`` settings lines. Settings that fail
+    validation are ignored.
 
+    Args:
+        content: Raw file contents
+
+    Returns:
+        Dictionary containing configuration (may be empty)
+    """
     config: Dict[str, Any] = {}
 
-    try:
-        git_root: str = get_git_root()
-        config_path: str = os.path.join(git_root, ".gitcommitai")
+    # Check if it's JSON format (for backward compatibility)
+    if content.strip().startswith('{'):
+        import json
 
-        if not os.path.exists(config_path):
-            debug_log("No .gitcommitai file found")
+        try:
+            json_config: Dict[str, Any] = json.loads(content)
+            for key, parser in CONFIG_SETTINGS.items():
+                if key in json_config:
+                    try:
+                        config[key] = parser(json_config[key])
+                    except (TypeError, ValueError) as e:
+                        debug_log(f"Ignoring invalid {key} setting: {e}")
+            if 'prompt' in json_config:
+                config['prompt_template'] = json_config['prompt']
+            debug_log("Loaded config as JSON format")
             return config
+        except json.JSONDecodeError:
+            debug_log("Failed to parse as JSON, treating as template")
+
+    # Parse configuration lines, the rest is the prompt template
+    template_lines: List[str] = []
+    for line in content.split('\n'):
+        match = re.match(_CONFIG_LINE_PATTERN, line.strip())
+        if not match or match.group(1) not in CONFIG_SETTINGS:
+            template_lines.append(line)
+            continue
+
+        # e.g. "model: gpt-4" or "model=gpt-4"
+        setting: str = match.group(1)
+        value: str = line.split(':', 1)[1] if ':' in line else line.split('=', 1)[1]
+        try:
+            config[setting] = CONFIG_SETTINGS[setting](value)
+            debug_log(f"Found {setting} setting: {config[setting]}")
+        except ValueError as e:
+            debug_log(f"Ignoring invalid {setting} setting: {e}")
 
-        debug_log(f"Found .gitcommitai at: {config_path}")
+    prompt_template: str = '\n'.join(template_lines).strip()
+    if prompt_template:
+        config['prompt_template'] = prompt_template
+        debug_log(f"Loaded prompt template ({len(prompt_template)} characters)")
 
-        with open(config_path, 'r') as f:
-            content: str = f.read()
+    return config
 
-        # Check if it's JSON format (for backward compatibility)
-        content_stripped: str = content.strip()
-        if content_stripped.startswith('{'):
-            try:
-                json_config: Dict[str, Any] = json.loads(content)
-                # Extract only model and prompt from JSON
-                if 'model' in json_config:
-                    config['model'] = json_config['model']
-                if 'prompt' in json_config:
-                    config['prompt_template'] = json_config['prompt']
-                debug_log("Loaded .gitcommitai as JSON format")
-                return config
-            except json.JSONDecodeError:
-                debug_log("Failed to parse as JSON, treating as template")
-
-        # Parse configuration lines at the top of the file
-        lines: List[str] = content.split('\n')
-        template_lines: List[str] = []
 
-        for line in lines:
-            stripped = line.strip()
-
-            # Check for model specification (e.g., "model: gpt-4" or "model=gpt-4")
-            if stripped.startswith('model:') or stripped.startswith('model='):
-                model_value: str = line.split(':', 1)[1] if ':' in line else line.split('=', 1)[1]
-                config['model'] = model_value.strip()
-                debug_log(f"Found model specification: {config['model']}")
-
-            # Check for size limit overrides
-            elif stripped.startswith('max_file_size:') or stripped.startswith('max_file_size='):
-                size_value: str = line.split(':', 1)[1] if ':' in line else line.split('=', 1)[1]
-                config['max_file_size'] = int(size_value.strip())
-                debug_log(f"Found max_file_size override: {config['max_file_size']}")
-
-            elif stripped.startswith('max_total_files:') or stripped.startswith('max_total_files='):
-                size_value = line.split(':', 1)[1] if ':' in line else line.split('=', 1)[1]
-                config['max_total_files'] = int(size_value.strip())
-                debug_log(f"Found max_total_files override: {config['max_total_files']}")
-
-            elif stripped.startswith('max_diff_size:') or stripped.startswith('max_diff_size='):
-                size_value = line.split(':', 1)[1] if ':' in line else line.split('=', 1)[1]
-                config['max_diff_size'] = int(size_value.strip())
-                debug_log(f"Found max_diff_size override: {config['max_diff_size']}")
-
-            elif stripped.startswith('max_prompt_size:') or stripped.startswith('max_prompt_size='):
-                size_value = line.split(':', 1)[1] if ':' in line else line.split('=', 1)[1]
-                config['max_prompt_size'] = int(size_value.strip())
-                debug_log(f"Found max_prompt_size override: {config['max_prompt_size']}")
+def get_global_config_path() -> str:
+    """Get the path of the user-level config file.
 
-            else:
-                template_lines.append(line)
+    Returns:
+        $XDG_CONFIG_HOME/git-commitai/config, defaulting to ~/.config
+    """
+    base: str = os.environ.get("XDG_CONFIG_HOME") or os.path.join(os.path.expanduser("~"), ".config")
+    return os.path.join(base, "git-commitai", "config")
 
-        # The rest is the prompt template
-        prompt_template: str = '\n'.join(template_lines).strip()
-        if prompt_template:
-            config['prompt_template'] = prompt_template
-            debug_log(f"Loaded prompt template ({len(prompt_template)} characters)")
 
-    except Exception as e:  # Catch all exceptions
-        debug_log(f"Error loading .gitcommitai: {e}")
+def get_cache_dir() -> str:
+    """Get the directory for files git-commitai keeps between runs.
 
-    return config
+    Returns:
+        $XDG_CACHE_HOME/git-commitai, defaulting to ~/.cache
+    """
+    base: str = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "git-commitai")
 
 
-def get_env_config(args: argparse.Namespace) -> Dict[str, Any]:
-    """Get configuration from environment variables, .gitcommitai file, and command line args.
+# Metrics ledger: one JSON line per run in the cache directory. When the file
+# would grow past METRICS_MAX_BYTES it is rotated to metrics.jsonl.1, .2, ...
+METRICS_FILE: str = "metrics.jsonl"
+METRICS_MAX_BYTES: int = 1024 * 1024
+METRICS_BACKUPS: int = 3
 
-    Args:
-        args: Parsed command line arguments
+
+def get_metrics_path() -> str:
+    """Get the path of the metrics ledger.
 
     Returns:
-        Configuration dictionary with API settings and repo config
+        metrics.jsonl in the cache directory
     """
-    debug_log("Loading environment configuration")
+    return os.path.join(get_cache_dir(), METRICS_FILE)
 
-    # Load from .gitcommitai file first
-    repo_config: Dict[str, Any] = load_gitcommitai_config()
 
-    # Build final config with precedence: CLI args > env vars > .gitcommitai > defaults
-    config: Dict[str, Any] = {
-        "api_key": (
-            args.api_key or
-            os.environ.get("GIT_COMMIT_AI_KEY")
-        ),
-        "api_url": (
-            args.api_url or
-            os.environ.get("GIT_COMMIT_AI_URL", "https://openrouter.ai/api/v1/chat/completions")
-        ),
-        "model": (
-            args.model or
-            os.environ.get("GIT_COMMIT_AI_MODEL") or
-            repo_config.get("model") or
-            "qwen/qwen3-coder"
-        ),
-    }
+def append_metrics(record: Dict[str, Any], path: Optional[str] = None) -> None:
+    """Append a record to the metrics ledger, rotating it when full.
 
-    # Add repository-specific configuration
-    config["repo_config"] = repo_config
+    Failures are logged and otherwise ignored; metrics never break a commit.
 
-    # Apply size limit overrides from .gitcommitai config
-    global MAX_FILE_SIZE, MAX_TOTAL_FILES, MAX_DIFF_SIZE, MAX_PROMPT_SIZE
-    if 'max_file_size' in repo_config:
-        MAX_FILE_SIZE = repo_config['max_file_size']
-        debug_log(f"Applied max_file_size override: {MAX_FILE_SIZE} bytes")
-    if 'max_total_files' in repo_config:
-        MAX_TOTAL_FILES = repo_config['max_total_files']
-        debug_log(f"Applied max_total_files override: {MAX_TOTAL_FILES} bytes")
-    if 'max_diff_size' in repo_config:
-        MAX_DIFF_SIZE = repo_config['max_diff_size']
-        debug_log(f"Applied max_diff_size override: {MAX_DIFF_SIZE} bytes")
-    if 'max_prompt_size' in repo_config:
-        MAX_PROMPT_SIZE = repo_config['max_prompt_size']
-        debug_log(f"Applied max_prompt_size override: {MAX_PROMPT_SIZE} bytes")
+    Args:
+        record: JSON-serializable record
+        path: Ledger path (default: get_metrics_path())
+    """
+    import json
 
-    # Log config with redacted sensitive values
-    debug_log(f"Config loaded - URL: {config['api_url']}, Model: {config['model']}, Key present: {bool(config['api_key'])}")
-    debug_log(f"Repository config keys: {list(repo_config.keys())}")
+    path = path or get_metrics_path()
+    try:
+        line: str = json.dumps(record, separators=(",", ":")) + "\n"
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if os.path.exists(path) and os.path.getsize(path) + len(line) > METRICS_MAX_BYTES:
+            for index in range(METRICS_BACKUPS - 1, 0, -1):
+                if os.path.exists(f"{path}.{index}"):
+                    os.replace(f"{path}.{index}", f"{path}.{index + 1}")
+            os.replace(path, f"{path}.1")
+        # One write in append mode, so concurrent runs don't interleave lines
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(line)
+    except (OSError, TypeError, ValueError) as e:
+        debug_log(f"Could not write metrics: {e}")
+
+
+def read_metrics(path: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+    """Read the metrics ledger, oldest record first, including rotated files.
 
-    if not config["api_key"]:
-        print("Error: GIT_COMMIT_AI_KEY environment variable is not set")
-        print()
-        print("Please set up your API credentials:")
-        print("  export GIT_COMMIT_AI_KEY='your-api-key'")
-        print(
-            "  export GIT_COMMIT_AI_URL='https://openrouter.ai/api/v1/chat/completions' # or your provider's URL"
-        )
-        print("  export GIT_COMMIT_AI_MODEL='qwen/qwen3-coder' # or your preferred model")
-        print()
-        print("For quick setup, run: curl -sSL https://raw.githubusercontent.com/semperai/git-commitai/master/install.sh | bash")
-        sys.exit(1)
+    Args:
+        path: Ledger path (default: get_metrics_path())
 
-    return config
+    Yields:
+        Records; lines that don't parse are skipped
+    """
+    import json
+
+    path = path or get_metrics_path()
+    for name in [f"{path}.{i}" for i in range(METRICS_BACKUPS, 0, -1)] + [path]:
+        try:
+            with open(name, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record: Any = json.loads(line)
+                    except ValueError:
+                        continue
+                    if isinstance(record, dict):
+                        yield record
+        except OSError:
+            continue
 
 
-def run_git(args: List[str], check: bool = True) -> str:
-    """Run git with a list of args safely (no shell). Returns stdout text.
+def find_git_dir(git_root: str) -> Optional[str]:
+    """Locate the git directory of a work tree without running git.
+
+    Handles both a plain ``.git`` directory and the ``gitdir:`` file used by
+    worktrees and submodules.
 
     Args:
-        args: List of git command arguments
-        check: Whether to raise exception on non-zero exit code
+        git_root: Repository work tree root
 
     Returns:
-        Standard output from git command
-
-    Raises:
-        subprocess.CalledProcessError: If check=True and command fails
+        Path to the git directory, or None if it cannot be determined
     """
-    debug_log(f"Running git command: git {' '.join(args)}")
-
+    dot_git: str = os.path.join(git_root, ".git")
+    if os.path.isdir(dot_git):
+        return dot_git
     try:
-        result = subprocess.run(
-            ["git"] + args,
-            capture_output=True,
-            text=True,
-            check=check
-        )
-        debug_log(f"Git command successful, output length: {len(result.stdout)} chars")
-        return result.stdout
-    except subprocess.CalledProcessError as e:
-        debug_log(f"Git command failed with code {e.returncode}: {e.stderr}")
-        if check:
-            raise
-        return e.stdout if e.stdout else ""
+        with open(dot_git, 'r') as f:
+            first_line: str = f.readline().strip()
+    except (IOError, OSError):
+        return None
+    if first_line.startswith("gitdir:"):
+        git_dir: str = first_line[len("gitdir:"):].strip()
+        return git_dir if os.path.isabs(git_dir) else os.path.normpath(os.path.join(git_root, git_dir))
+    return None
 
 
-def build_ai_prompt(repo_config: Dict[str, Any], args: argparse.Namespace) -> str:
-    """Build the AI prompt, incorporating repository-specific customization.
+def find_work_tree(cwd: Optional[str] = None) -> Optional[str]:
+    """Find the root of the work tree containing a directory without running git.
 
     Args:
-        repo_config: Repository-specific configuration
-        args: Parsed command line arguments
+        cwd: Directory inside the work tree (default: the process cwd)
 
     Returns:
-        Complete prompt string for AI
+        The nearest directory, walking up, that has a git directory, or None
     """
+    directory: str = os.path.abspath(cwd or os.getcwd())
+    while find_git_dir(directory) is None:
+        parent: str = os.path.dirname(directory)
+        if parent == directory:
+            return None
+        directory = parent
+    return directory
 
-    # Check if repository has a custom prompt template
-    if repo_config.get('prompt_template'):
-        debug_log("Using custom prompt template from .gitcommitai")
-
-        # Read .gitmessage if it exists
-        gitmessage_content: str = read_gitmessage_template() or ""
-
-        # Prepare replacement values
-        replacements: Dict[str, str] = {
-            'CONTEXT': f"Additional context from user: {args.message}" if args.message else "",
-            'GITMESSAGE': gitmessage_content,
-            'AMEND_NOTE': "Note: You are amending the previous commit." if args.amend else "",
-        }
-
-        # Start with the template
-        base_prompt: str = repo_config['prompt_template']
 
-        # Replace placeholders - but don't add them yet for DIFF and FILES
-        # We'll add those at the end of the function
-        for key, value in replacements.items():
-            if key not in ['DIFF', 'FILES']:
-                placeholder: str = '{' + key + '}'
-                if placeholder in base_prompt:
-                    base_prompt = base_prompt.replace(placeholder, value)
+_GIT_CONFIG_SECTION_PATTERN = r'\[\s*([A-Za-z0-9.-]+)(?:\s+"((?:[^"\\]|\\.)*)")?\s*\]'
+_GIT_CONFIG_ENTRY_PATTERN = r'([A-Za-z][A-Za-z0-9-]*)\s*(?:=\s*(.*))?$'
 
-        # Normalize excessive blank lines introduced by empty replacements
-        base_prompt = re.sub(r"\n{3,}", "\n\n", base_prompt).strip("\n")
 
-    else:
-        # Use default prompt
-        debug_log("Using default prompt")
-        base_prompt = """You are a git commit message generator that follows Git best practices strictly.
-
-CRITICAL RULES YOU MUST FOLLOW:
-
-1. STRUCTURE:
-   - If the change is simple and clear, use ONLY a subject line (single line commit)
-   - For complex changes that need explanation, use subject + blank line + body
-   - Never add a body unless it provides valuable context about WHY the change was made
-
-2. SUBJECT LINE (FIRST LINE):
-   - Maximum 50 characters (aim for less when possible)
-   - Start with a capital letter
-   - NO period at the end
-   - Use imperative mood (e.g., "Add", "Fix", "Update", not "Added", "Fixes", "Updated")
-   - Be concise but descriptive
-   - Think: "If applied, this commit will [your subject line]"
-
-3. BODY (ONLY if needed):
-   - Leave one blank line after the subject
-   - Wrap lines at 72 characters maximum
-   - Explain WHAT changed and WHY, not HOW (the code shows how)
-   - Focus on the motivation and context for the change
-   - Use bullet points with "-" for multiple items if needed
-
-4. GOOD SUBJECT LINE EXAMPLES:
-   - "Add user authentication module"
-   - "Fix memory leak in data processor"
-   - "Update dependencies to latest versions"
-   - "Refactor database connection logic"
-   - "Remove deprecated API endpoints"
-
-5. CODE ISSUE DETECTION:
-   After generating the message, check the code changes for potential issues.
-   If you detect any obvious problems, add warnings as Git-style comments after the commit message.
-   These warnings help the developer catch bugs before committing.
-
-   Look for these types of severe or critical issues:
-   - Hardcoded secrets
-   - Syntax errors or typos in variable names
-   - null/undefined reference errors
-   - Missing imports that will cause runtime errors
-
-   Format warnings like this:
-   # ⚠️  WARNING: [Brief description of issue]
-   # Found in: [filename]
-   # Details: [Specific concern]
-
-6. OUTPUT FORMAT:
-   - Generate the commit message following ALL formatting rules correctly
-   - Add a blank line after the message
-   - If code issues detected, add warning comments
-   - NO explanations outside of warning comments
-   - NO markdown formatting
-   - NEVER warn about commit message formatting (you should generate it correctly)
-
-Remember:
-- Most commits only need a clear subject line
-- You are responsible for generating a properly formatted message - don't warn about your own formatting
-- Only warn about actual code issues that could cause problems"""
-
-    # Add .gitmessage template context if available and not already included via template
-    if not repo_config.get('prompt_template'):
-        gitmessage_template: Optional[str] = read_gitmessage_template()
-        if gitmessage_template:
-            base_prompt += f"""
-
-PROJECT-SPECIFIC COMMIT TEMPLATE/GUIDELINES:
-The following template or guidelines are configured for this project. Use this as additional context
-to understand the project's commit message conventions, but still follow the Git best practices above:
-
-{gitmessage_template}
-"""
-            debug_log("Added .gitmessage template to prompt context")
-
-        # Add user context
-        if args.message:
-            base_prompt += f"\n\nAdditional context from user: {args.message}"
-
-    return base_prompt
+def read_git_config_file(path: str) -> Dict[str, str]:
+    """Read one git config file without running git.
 
+    Only plain ``key = value`` entries are understood: include directives are
+    not followed and values keep backslash escapes. That is enough for the
+    settings git itself writes with ``git config``.
 
-def stage_all_tracked_files() -> bool:
-    """Stage all tracked, modified files (equivalent to git add -u).
+    Args:
+        path: Config file path
 
     Returns:
-        True if successful, False otherwise
+        Dictionary of ``section[.subsection].key`` to value, with section and
+        key lower-cased; keys without a value map to "true". Empty if the
+        file is missing or unreadable.
     """
-    debug_log("Staging all tracked files with 'git add -u'")
-
+    entries: Dict[str, str] = {}
     try:
-        # git add -u stages all tracked files that have been modified or deleted
-        # but does NOT add untracked files
-        subprocess.run(["git", "add", "-u"], check=True, capture_output=True)
-        debug_log("Successfully staged tracked files")
-        return True
-    except subprocess.CalledProcessError as e:
-        debug_log(f"Failed to stage tracked files: {e}")
-        print(f"Error: Failed to stage tracked files: {e}")
-        return False
-
-
-def check_staged_changes(amend: bool = False, auto_stage: bool = False, allow_empty: bool = False) -> bool:
-    """Check if there are staged changes and provide git-like output if not.
+        with open(path, 'r', encoding="utf-8", errors="replace") as f:
+            lines: List[str] = f.readlines()
+    except (IOError, OSError):
+        return entries
+
+    section: str = ""
+    for raw_line in lines:
+        line: str = raw_line.strip()
+        header = re.match(_GIT_CONFIG_SECTION_PATTERN, line)
+        if header:
+            name: str = header.group(1).lower()
+            if header.group(2) is not None:
+                name += "." + header.group(2)
+            section = name
+            line = line[header.end():].strip()
+        if not line or line[0] in "#;" or not section:
+            continue
+        entry = re.match(_GIT_CONFIG_ENTRY_PATTERN, line)
+        if not entry:
+            continue
+        value: str = "true" if entry.group(2) is None else re.split(r"\s+[#;]", entry.group(2), 1)[0].strip()
+        if len(value) >= 2 and value[0] == value[-1] == '"':
+            value = value[1:-1]
+        entries[f"{section}.{entry.group(1).lower()}"] = value
+    return entries
+
+
+def detect_repo_layout(cwd: Optional[str] = None) -> RepoLayout:
+    """Detect partial clones, sparse checkouts and sparse indexes.
+
+    Reads the repository's config files directly rather than running git, so
+    it costs a few file reads. Both the shared config and the per-worktree
+    config.worktree (where ``git sparse-checkout`` stores its settings) are
+    consulted.
 
     Args:
-        amend: Whether we're amending a commit
-        auto_stage: Whether to auto-stage tracked files
-        allow_empty: Whether to allow empty commits
+        cwd: Directory inside the work tree (default: the process cwd)
 
     Returns:
-        True if we can proceed with commit, False otherwise
+        The detected layout; a plain RepoLayout outside a repository
     """
-    debug_log(f"Checking staged changes - amend: {amend}, auto_stage: {auto_stage}, allow_empty: {allow_empty}")
+    git_dir: Optional[str] = os.environ.get("GIT_DIR")
+    if git_dir and cwd and not os.path.isabs(git_dir):
+        git_dir = os.path.join(cwd, git_dir)
+    if not git_dir:
+        work_tree: Optional[str] = find_work_tree(cwd)
+        git_dir = find_git_dir(work_tree) if work_tree else None
+    if not git_dir:
+        return RepoLayout()
+
+    # Linked worktrees keep the shared config in the common git directory
+    common_dir: str = git_dir
+    try:
+        with open(os.path.join(git_dir, "commondir"), 'r') as f:
+            common_dir = os.path.normpath(os.path.join(git_dir, f.read().strip()))
+    except (IOError, OSError):
+        pass
 
-    if auto_stage and not amend:
-        # First, check if there are any changes to stage
-        try:
-            # Check for modified tracked files
-            result = subprocess.run(["git", "diff", "--quiet"], capture_output=True)
-            if result.returncode != 0:
-                debug_log("Found unstaged changes, auto-staging them")
-                # There are unstaged changes in tracked files, stage them
-                if not stage_all_tracked_files():
-                    return False
-            else:
-                debug_log("No unstaged changes to auto-stage")
-            # Continue to check if we now have staged changes
-        except subprocess.CalledProcessError:
-            pass
+    config: Dict[str, str] = read_git_config_file(os.path.join(common_dir, "config"))
+    if parse_bool(config.get("extensions.worktreeconfig", "false")):
+        config.update(read_git_config_file(os.path.join(git_dir, "config.worktree")))
+
+    promisor_remote: Optional[str] = config.get("extensions.partialclone")
+    if not promisor_remote:
+        promisor_remote = next(
+            (
+                key[len("remote."):-len(".promisor")]
+                for key, value in config.items()
+                if key.startswith("remote.") and key.endswith(".promisor") and parse_bool(value)
+            ),
+            None,
+        )
+    layout = RepoLayout(
+        partial_clone=promisor_remote is not None,
+        promisor_remote=promisor_remote,
+        sparse_checkout=parse_bool(config.get("core.sparsecheckout", "false")),
+        sparse_index=parse_bool(config.get("index.sparse", "false")),
+    )
+    debug_log(f"Repository layout: {layout}")
+    return layout
 
-    if amend:
-        # For --amend, we're modifying the last commit, so we don't need staged changes
-        # But we should check if there's a previous commit to amend
+
+def _config_signature(paths: List[str]) -> List[List[Any]]:
+    """Describe config source files by path, mtime and size for cache keys."""
+    signature: List[List[Any]] = []
+    for path in paths:
         try:
-            run_git(["rev-parse", "HEAD"], check=True)
-            debug_log("Found previous commit to amend")
-            return True
-        except subprocess.CalledProcessError:
+            st = os.stat(path)
+            signature.append([path, st.st_mtime_ns, st.st_size])
+        except OSError:
+            signature.append([path, None, None])
+    return signature
+
+
+def _read_config_cache(cache_path: str, signature: List[List[Any]]) -> Optional[Dict[str, Any]]:
+    """Return the cached merged config if it was built from the same sources."""
+    import json
+
+    try:
+        with open(cache_path, 'r') as f:
+            cached: Dict[str, Any] = json.load(f)
+    except (IOError, OSError, ValueError):
+        return None
+    if (
+        cached.get("version") != CONFIG_CACHE_VERSION
+        or cached.get("tool_version") != __version__
+        or cached.get("sources") != signature
+        or not isinstance(cached.get("config"), dict)
+    ):
+        return None
+    config: Dict[str, Any] = cached["config"]
+    return config
+
+
+def _write_config_cache(cache_path: str, signature: List[List[Any]], config: Dict[str, Any]) -> None:
+    """Atomically store the merged config next to the repository's git data."""
+    import json
+
+    payload: Dict[str, Any] = {
+        "version": CONFIG_CACHE_VERSION,
+        "tool_version": __version__,
+        "sources": signature,
+        "config": config,
+    }
+    tmp_path: str = f"{cache_path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, 'w') as f:
+            json.dump(payload, f)
+        os.replace(tmp_path, cache_path)
+    except (IOError, OSError, TypeError) as e:
+        debug_log(f"Could not write config cache: {e}")
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+
+
+def _load_config_file(path: str) -> Dict[str, Any]:
+    """Read and parse one config file, returning {} if missing or unreadable."""
+    try:
+        if not os.path.exists(path):
+            return {}
+        debug_log(f"Found config file at: {path}")
+        with open(path, 'r') as f:
+            content: str = f.read()
+        return parse_gitcommitai_config(content)
+    except Exception as e:  # Catch all exceptions
+        debug_log(f"Error loading {path}: {e}")
+        return {}
+
+
+def load_gitcommitai_config() -> Dict[str, Any]:
+    """Load configuration from the user config file and .gitcommitai.
+
+    Two layers are merged, later ones overriding earlier ones:
+    1. $XDG_CONFIG_HOME/git-commitai/config (shared by all repositories)
+    2. .gitcommitai in the repository root
+
+    Both use the same format: optional settings lines (model, size limits,
+    scrub_secrets) followed by a prompt template with placeholders:
+    - {CONTEXT} - User-provided context via -m flag
+    - {DIFF} - The git diff of changes
+    - {FILES} - The modified files with their content
+    - {GITMESSAGE} - Content from .gitmessage template if exists
+    - {AMEND_NOTE} - Note about amending if --amend is used
+
+    The merged result is cached in the git directory, keyed by the mtime and
+    size of both files, so unchanged config is not parsed again.
+
+    Returns:
+        Dictionary containing configuration (may be empty)
+    """
+    debug_log("Looking for git-commitai configuration files")
+
+    global_path: str = get_global_config_path()
+    try:
+        # Found by walking up the directory tree, without running git
+        git_root: Optional[str] = find_work_tree(active_settings().cwd)
+    except Exception as e:  # Catch all exceptions
+        debug_log(f"Could not determine repository root: {e}")
+        git_root = None
+
+    sources: List[str] = [global_path]
+    if git_root:
+        sources.append(os.path.join(git_root, ".gitcommitai"))
+        metrics: Optional[RunMetrics] = active_settings().metrics
+        if metrics is not None:
+            metrics.repo = git_root
+
+    cache_path: Optional[str] = None
+    signature: List[List[Any]] = []
+    try:
+        git_dir: Optional[str] = find_git_dir(git_root) if git_root else None
+        if git_dir:
+            cache_path = os.path.join(git_dir, CONFIG_CACHE_FILE)
+            signature = _config_signature(sources)
+            cached: Optional[Dict[str, Any]] = _read_config_cache(cache_path, signature)
+            if cached is not None:
+                debug_log(f"Using cached configuration from {cache_path}")
+                count_event("config_cache_hit")
+                return cached
+            count_event("config_cache_miss")
+    except Exception as e:  # Catch all exceptions
+        debug_log(f"Error checking config cache: {e}")
+        cache_path = None
+
+    config: Dict[str, Any] = {}
+    for path in sources:
+        config.update(_load_config_file(path))
+
+    if cache_path:
+        _write_config_cache(cache_path, signature, config)
+
+    return config
+
+
+# Patterns of files to leave out of the prompt, in the repository root, and
+# where their compiled form is cached in the git directory
+IGNORE_FILE: str = ".gitcommitaiignore"
+IGNORE_CACHE_FILE: str = "gitcommitai-ignore.json"
+
+_GLOB_SPECIAL_CHARACTERS: str = "*?[\\"
+
+
+@dataclass(frozen=True)
+class IgnoreRule:
+    """One pattern of a .gitcommitaiignore file, translated to a regex."""
+
+    # As written, for messages
+    pattern: str
+    # Matches a whole path, or a whole name for basename rules
+    regex: str
+    negated: bool = False
+    directory_only: bool = False
+    # No slash in the pattern: matched against the name at any depth
+    basename: bool = False
+    # The path or name a pattern without wildcards matches
+    literal: Optional[str] = None
+    # Text every match contains, for finding the rules worth matching: a
+    # directory name without wildcards, or the start or end of the name
+    component: Optional[str] = None
+    prefix: Optional[str] = None
+    suffix: Optional[str] = None
+
+
+def glob_to_regex(pattern: str, gitignore: bool = True) -> str:
+    """Translate a glob to a regex matching whole paths.
+
+    Args:
+        pattern: Glob
+        gitignore: gitignore semantics ("*" stops at "/", "**" crosses
+            directories, backslash escapes); otherwise fnmatch semantics,
+            as for --skip ("*" matches "/" too)
+
+    Returns:
+        Regex source without groups
+    """
+    star: str = "[^/]*" if gitignore else ".*"
+    one: str = "[^/]" if gitignore else "."
+    out: List[str] = []
+    i: int = 0
+    while i < len(pattern):
+        c: str = pattern[i]
+        if c == "*":
+            end: int = i
+            while end < len(pattern) and pattern[end] == "*":
+                end += 1
+            whole_component: bool = end - i == 2 and (i == 0 or pattern[i - 1] == "/")
+            if gitignore and whole_component and end == len(pattern):
+                out.append(".*")
+            elif gitignore and whole_component and pattern.startswith("/", end):
+                out.append("(?:.*/)?")
+                end += 1
+            else:
+                out.append(star)
+            i = end
+            continue
+        if c == "?":
+            out.append(one)
+        elif c == "[":
+            start: int = i + 2 if pattern[i + 1:i + 2] in ("!", "^") else i + 1
+            close: int = pattern.find("]", start + 1)
+            if close < 0:
+                out.append(re.escape(c))
+            else:
+                members: str = pattern[start:close].replace("\\", "\\\\")
+                out.append(("[^/" if start > i + 1 else "[") + members + "]")
+                i = close
+        elif c == "\\" and gitignore and i + 1 < len(pattern):
+            i += 1
+            out.append(re.escape(pattern[i]))
+        else:
+            out.append(re.escape(c))
+        i += 1
+    return "".join(out)
+
+
+def parse_ignore_rule(line: str) -> Optional[IgnoreRule]:
+    """Parse one line of a .gitcommitaiignore file, as git parses .gitignore.
+
+    Args:
+        line: Line without its newline
+
+    Returns:
+        The rule, or None for blank lines and comments
+    """
+    # Trailing spaces are dropped unless escaped
+    pattern: str = re.sub(r"(?<!\\) +$", "", line)
+    if not pattern or pattern.startswith("#"):
+        return None
+    negated: bool = pattern.startswith("!")
+    if negated:
+        pattern = pattern[1:]
+    directory_only: bool = pattern.endswith("/")
+    pattern = pattern.rstrip("/")
+    # A slash at the start or in the middle anchors the pattern to the root
+    basename: bool = "/" not in pattern
+    pattern = pattern.lstrip("/")
+    if not pattern:
+        return None
+
+    keys: Dict[str, str] = {}
+    # Text between wildcards, bracket expressions and escapes
+    plain: List[str] = re.split(r"\[[!^]?\]?[^\]]*\]|[*?\[]|\\.", pattern)
+    if len(plain) == 1:
+        keys["literal"] = pattern
+    elif basename and plain[-1]:
+        keys["suffix"] = plain[-1]
+    elif basename and plain[0]:
+        keys["prefix"] = plain[0]
+    elif not basename:
+        components: List[str] = [
+            part for part in pattern.split("/") if part and not any(c in part for c in _GLOB_SPECIAL_CHARACTERS)
+        ]
+        if components:
+            keys["component"] = max(components, key=len)
+    return IgnoreRule(
+        pattern=line.strip(),
+        regex=glob_to_regex(pattern),
+        negated=negated,
+        directory_only=directory_only,
+        basename=basename,
+        **keys,
+    )
+
+
+class _RuleIndex:
+    """Find the last of a list of ignore rules that matches a path.
+
+    Rules are indexed by text that every path they match contains (see
+    IgnoreRule), so a path only runs the regexes of the few rules its
+    directory names and name select, and of the rules without such text.
+    """
+
+    def __init__(self, rules: List[Tuple[int, IgnoreRule]]) -> None:
+        self.names: Dict[str, int] = {}
+        self.paths: Dict[str, int] = {}
+        # (index, regex, matched against the name only) by indexed text
+        self.components: Dict[str, List[Tuple[int, re.Pattern[str], bool]]] = {}
+        self.prefixes: Dict[str, List[Tuple[int, re.Pattern[str], bool]]] = {}
+        self.suffixes: Dict[str, List[Tuple[int, re.Pattern[str], bool]]] = {}
+        self.others: List[Tuple[int, re.Pattern[str], bool]] = []
+        for index, rule in rules:
+            if rule.literal is not None:
+                (self.names if rule.basename else self.paths)[rule.literal] = index
+                continue
+            entry: Tuple[int, re.Pattern[str], bool] = (index, re.compile(rule.regex, re.DOTALL), rule.basename)
+            if rule.component is not None:
+                self.components.setdefault(rule.component, []).append(entry)
+            elif rule.prefix is not None:
+                self.prefixes.setdefault(rule.prefix, []).append(entry)
+            elif rule.suffix is not None:
+                self.suffixes.setdefault(rule.suffix, []).append(entry)
+            else:
+                self.others.append(entry)
+        self.prefix_lengths: List[int] = sorted({len(prefix) for prefix in self.prefixes})
+        self.suffix_lengths: List[int] = sorted({len(suffix) for suffix in self.suffixes})
+
+    def last(self, path: str, name: str) -> int:
+        """Get the index of the last rule matching a path with a name, or -1."""
+        found: int = max(self.names.get(name, -1), self.paths.get(path, -1))
+        candidates: List[Tuple[int, re.Pattern[str], bool]] = self.others
+        hits: Optional[List[Tuple[int, re.Pattern[str], bool]]]
+        if self.components:
+            for component in path.split("/"):
+                hits = self.components.get(component)
+                if hits:
+                    candidates = candidates + hits
+        for length in self.prefix_lengths:
+            hits = self.prefixes.get(name[:length])
+            if hits:
+                candidates = candidates + hits
+        for length in self.suffix_lengths:
+            # Longer than the name, the slice is the name, which is too short to match
+            hits = self.suffixes.get(name[-length:])
+            if hits:
+                candidates = candidates + hits
+        for index, regex, basename in sorted(candidates, key=lambda candidate: -candidate[0]):
+            if index <= found:
+                break
+            if regex.fullmatch(name if basename else path):
+                return index
+        return found
+
+
+class SkipMatcher:
+    """Decide which files to leave out of the prompt.
+
+    Combines .gitcommitaiignore rules, with gitignore semantics (the last
+    matching rule wins, "!" re-includes, nothing is re-included under an
+    excluded directory), and --skip globs, with fnmatch semantics. Rules
+    are compiled once into dictionaries and a few regexes, and the verdict
+    for each directory is remembered, so a path costs a few lookups.
+    """
+
+    def __init__(self, rules: Iterable[IgnoreRule] = (), globs: Iterable[str] = ()) -> None:
+        self.rules: List[IgnoreRule] = list(rules)
+        self.globs: List[str] = list(globs)
+        indexed: List[Tuple[int, IgnoreRule]] = list(enumerate(self.rules))
+        self._files: _RuleIndex = _RuleIndex([(i, rule) for i, rule in indexed if not rule.directory_only])
+        self._directories: _RuleIndex = _RuleIndex(indexed)
+        self._glob_regex: Optional[re.Pattern[str]] = (
+            re.compile(
+                "|".join(f"(?P<g{i}>{glob_to_regex(glob, gitignore=False)})" for i, glob in enumerate(self.globs)),
+                re.DOTALL,
+            )
+            if self.globs
+            else None
+        )
+        # Pattern excluding each directory looked at (None: not excluded)
+        self._excluded_directories: Dict[str, Optional[str]] = {}
+
+    @classmethod
+    def parse(cls, content: str) -> "SkipMatcher":
+        """Build a matcher from the contents of a .gitcommitaiignore file."""
+        rules: List[IgnoreRule] = []
+        for line in content.splitlines():
+            rule: Optional[IgnoreRule] = parse_ignore_rule(line)
+            if rule is not None:
+                rules.append(rule)
+        return cls(rules)
+
+    def with_globs(self, globs: Iterable[str]) -> "SkipMatcher":
+        """Get a matcher that also skips files matching --skip globs."""
+        return SkipMatcher(self.rules, self.globs + list(globs))
+
+    def __bool__(self) -> bool:
+        return bool(self.rules or self.globs)
+
+    def _directory(self, directory: str) -> Optional[str]:
+        """Get the pattern excluding a directory, if any."""
+        if directory in self._excluded_directories:
+            return self._excluded_directories[directory]
+        parent, _, name = directory.rpartition("/")
+        excluded: Optional[str] = self._directory(parent) if parent else None
+        if excluded is None:
+            index: int = self._directories.last(directory, name)
+            if index >= 0 and not self.rules[index].negated:
+                excluded = self.rules[index].pattern
+        self._excluded_directories[directory] = excluded
+        return excluded
+
+    def match(self, path: str) -> Optional[str]:
+        """Check whether to leave a file out of the prompt.
+
+        Args:
+            path: Path relative to the repository root, with "/" separators
+
+        Returns:
+            The pattern excluding the file, or None to include it
+        """
+        if self._glob_regex is not None:
+            glob = self._glob_regex.match(path)
+            if glob is not None and glob.lastgroup is not None:
+                return self.globs[int(glob.lastgroup[1:])]
+        if not self.rules:
+            return None
+        directory, _, name = path.rpartition("/")
+        if directory:
+            excluded: Optional[str] = self._directory(directory)
+            if excluded is not None:
+                return excluded
+        index: int = self._files.last(path, name)
+        if index >= 0 and not self.rules[index].negated:
+            return self.rules[index].pattern
+        return None
+
+
+def load_skip_matcher(cwd: Optional[str] = None) -> SkipMatcher:
+    """Load the .gitcommitaiignore file of a repository.
+
+    The compiled rules are cached in the git directory next to the config
+    cache, keyed by the file's mtime and size.
+
+    Args:
+        cwd: Directory inside the work tree (default: the process cwd)
+
+    Returns:
+        The matcher; without rules outside a repository or without the file
+    """
+    work_tree: Optional[str] = find_work_tree(cwd)
+    if work_tree is None:
+        return SkipMatcher()
+    path: str = os.path.join(work_tree, IGNORE_FILE)
+    if not os.path.exists(path):
+        return SkipMatcher()
+
+    git_dir: Optional[str] = find_git_dir(work_tree)
+    cache_path: Optional[str] = os.path.join(git_dir, IGNORE_CACHE_FILE) if git_dir else None
+    signature: List[List[Any]] = _config_signature([path])
+    cached: Optional[Dict[str, Any]] = _read_config_cache(cache_path, signature) if cache_path else None
+    if cached is not None:
+        try:
+            debug_log(f"Using cached ignore rules from {cache_path}")
+            return SkipMatcher(IgnoreRule(**rule) for rule in cached["rules"])
+        except (KeyError, TypeError) as e:
+            debug_log(f"Ignoring unreadable ignore rule cache: {e}")
+
+    try:
+        with open(path, 'r', encoding="utf-8", errors="replace") as f:
+            matcher: SkipMatcher = SkipMatcher.parse(f.read())
+    except (IOError, OSError) as e:
+        debug_log(f"Could not read {path}: {e}")
+        return SkipMatcher()
+    debug_log(f"Loaded {len(matcher.rules)} rules from {path}")
+    if cache_path:
+        _write_config_cache(cache_path, signature, {"rules": [vars(rule) for rule in matcher.rules]})
+    return matcher
+
+
+def get_env_config(args: argparse.Namespace, repo_config: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Get configuration from config files, environment variables, and command line args.
+
+    Precedence, highest first: CLI args, environment variables, repository
+    .gitcommitai, user config file, defaults.
+
+    Args:
+        args: Parsed command line arguments
+        repo_config: Configuration already read by load_gitcommitai_config()
+            (default: read it now)
+
+    Returns:
+        Configuration dictionary with API settings, size limits and repo config
+
+    Raises:
+        ConfigError: If no API key is configured
+    """
+    debug_log("Loading environment configuration")
+
+    # Load from the user config file and .gitcommitai first
+    if repo_config is None:
+        repo_config = load_gitcommitai_config()
+
+    # Build final config with precedence: CLI args > env vars > .gitcommitai > defaults
+    config: Dict[str, Any] = {
+        "api_key": (
+            args.api_key or
+            os.environ.get("GIT_COMMIT_AI_KEY")
+        ),
+        "api_url": (
+            args.api_url or
+            os.environ.get("GIT_COMMIT_AI_URL", "https://openrouter.ai/api/v1/chat/completions")
+        ),
+        "model": (
+            args.model or
+            os.environ.get("GIT_COMMIT_AI_MODEL") or
+            repo_config.get("model") or
+            "qwen/qwen3-coder"
+        ),
+    }
+
+    # Outbound secret scrubbing is on unless turned off by env or .gitcommitai
+    env_scrub: Optional[str] = os.environ.get("GIT_COMMIT_AI_SCRUB_SECRETS")
+    config["scrub_secrets"] = (
+        parse_bool(env_scrub) if env_scrub is not None
+        else repo_config.get("scrub_secrets", True)
+    )
+
+    # Hosts whose API accepts gzip-compressed request bodies (none by default)
+    env_gzip: Optional[str] = os.environ.get("GIT_COMMIT_AI_GZIP")
+    config["gzip_requests"] = (
+        parse_gzip_hosts(env_gzip) if env_gzip is not None
+        else repo_config.get("gzip_requests", [])
+    )
+
+    # Add repository-specific configuration
+    config["repo_config"] = repo_config
+
+    # Size limits from config files, unless the matching environment
+    # variable (already read into the defaults) is set
+    limits: Limits = Limits.from_config(repo_config)
+    config["limits"] = limits
+    debug_log(f"Size limits: {limits}")
+
+    # Log config with redacted sensitive values
+    debug_log(f"Config loaded - URL: {config['api_url']}, Model: {config['model']}, Key present: {bool(config['api_key'])}")
+    debug_log(f"Repository config keys: {list(repo_config.keys())}")
+
+    if not config["api_key"]:
+        raise ConfigError(
+            "GIT_COMMIT_AI_KEY environment variable is not set\n"
+            "\n"
+            "Please set up your API credentials:\n"
+            "  export GIT_COMMIT_AI_KEY='your-api-key'\n"
+            "  export GIT_COMMIT_AI_URL='https://openrouter.ai/api/v1/chat/completions' # or your provider's URL\n"
+            "  export GIT_COMMIT_AI_MODEL='qwen/qwen3-coder' # or your preferred model\n"
+            "\n"
+            "For quick setup, run: curl -sSL https://raw.githubusercontent.com/semperai/git-commitai/master/install.sh | bash"
+        )
+
+    return config
+
+
+def git_command(args: List[str]) -> Tuple[List[str], Dict[str, Any]]:
+    """Build the argv and subprocess options for a read-only git call.
+
+    Applies the GIT_FAST_* profile unless the active run disabled it, the
+    active run's working directory, and GIT_NO_LAZY_FETCH_ENV when the run
+    must not fetch missing objects.
+
+    Args:
+        args: git arguments, starting with the subcommand
+
+    Returns:
+        Tuple of (full argv, extra keyword arguments for subprocess.run)
+    """
+    settings: RunSettings = active_settings()
+    extra: Dict[str, Any] = {}
+    if settings.cwd:
+        extra["cwd"] = settings.cwd
+
+    env_overrides: Dict[str, str] = {} if settings.lazy_fetch else dict(GIT_NO_LAZY_FETCH_ENV)
+
+    if not settings.git_fast_path:
+        if env_overrides:
+            extra["env"] = {**os.environ, **env_overrides}
+        return ["git"] + args, extra
+
+    if args and args[0] in GIT_DIFF_COMMANDS:
+        args = args[:1] + GIT_FAST_DIFF_OPTIONS + args[1:]
+    env: Dict[str, str] = dict(os.environ)
+    env.update(GIT_FAST_ENV)
+    env.update(env_overrides)
+    extra["env"] = env
+    return ["git"] + GIT_FAST_CONFIG + args, extra
+
+
+def run_git(args: List[str], check: bool = True) -> str:
+    """Run git with a list of args safely (no shell). Returns stdout text.
+
+    Args:
+        args: List of git command arguments
+        check: Whether to raise exception on non-zero exit code
+
+    Returns:
+        Standard output from git command
+
+    Raises:
+        subprocess.CalledProcessError: If check=True and command fails
+        subprocess.TimeoutExpired: If the active run's git_timeout is exceeded
+    """
+    debug_log(f"Running git command: git {' '.join(args)}")
+
+    argv, extra = git_command(args)
+    timeout: Optional[float] = active_settings().git_timeout
+    if timeout is not None:
+        extra["timeout"] = timeout
+    with profile_span(f"git {args[0]}" if args else "git", argv=" ".join(argv)) as span:
+        try:
+            result = subprocess.run(
+                argv,
+                capture_output=True,
+                text=True,
+                check=check,
+                **extra
+            )
+        except subprocess.TimeoutExpired:
+            debug_log(f"Git command timed out after {timeout}s")
+            if span is not None:
+                span["timed_out"] = True
+            raise
+        except subprocess.CalledProcessError as e:
+            debug_log(f"Git command failed with code {e.returncode}: {e.stderr}")
+            if span is not None:
+                span["exit_code"] = e.returncode
+            if check:
+                raise
+            return e.stdout if e.stdout else ""
+        output: str = result.stdout
+        if span is not None:
+            span["exit_code"] = result.returncode
+            span["bytes_out"] = len(output.encode("utf-8", "surrogateescape"))
+        debug_log(f"Git command successful, output length: {len(output)} chars")
+        return output
+
+
+def stream_git_text(
+    args: List[str], check: bool = True, chunk_size: int = 256 * 1024, newline: Optional[str] = None
+) -> Iterator[str]:
+    """Run git and yield its output in chunks of text, without holding all of it.
+
+    Chunks end anywhere, not on line boundaries; use stream_git() for lines.
+    Output is decoded as UTF-8 (invalid bytes replaced), like run_git().
+
+    Args:
+        args: List of git command arguments
+        check: Whether to raise exception on non-zero exit code
+        chunk_size: Maximum characters per chunk
+        newline: Newline translation, as for open(); None gives universal newlines
+
+    Yields:
+        Chunks of output
+
+    Raises:
+        subprocess.CalledProcessError: If check=True and command fails, after
+            the output has been consumed
+    """
+    debug_log(f"Streaming git command: git {' '.join(args)}")
+
+    argv, extra = git_command(args)
+    with profile_span(f"git {args[0]}" if args else "git", argv=" ".join(argv)) as span:
+        process = subprocess.Popen(argv, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, **extra)
+        assert process.stdout is not None
+        output_chars: int = 0
+        try:
+            stdout = io.TextIOWrapper(process.stdout, encoding="utf-8", errors="replace", newline=newline)
+            while True:
+                chunk: str = stdout.read(chunk_size)
+                if not chunk:
+                    break
+                output_chars += len(chunk)
+                yield chunk
+        finally:
+            # Stop git if the caller stopped reading early
+            if process.poll() is None:
+                process.kill()
+            process.stdout.close()
+            returncode: int = process.wait()
+        if span is not None:
+            span["exit_code"] = returncode
+            span["chars_out"] = output_chars
+        debug_log(f"Git command finished with code {returncode}, output length: {output_chars} chars")
+        if check and returncode != 0:
+            raise subprocess.CalledProcessError(returncode, argv)
+
+
+def stream_git(
+    args: List[str], check: bool = True, max_line: int = 64 * 1024, separator: str = "\n"
+) -> Iterator[str]:
+    """Run git and yield its output line by line, without holding all of it.
+
+    Use instead of run_git() for output that can be arbitrarily large. Lines
+    are decoded as in stream_git_text(), with universal newlines, and
+    yielded without the newline. For -z output pass separator="\\0";
+    records are then split on NUL only, so they can contain newlines.
+
+    Args:
+        args: List of git command arguments
+        check: Whether to raise exception on non-zero exit code
+        max_line: Lines longer than this many characters are yielded in pieces
+        separator: "\\n" for lines, or another single character ending records
+
+    Yields:
+        Output lines (or records)
+
+    Raises:
+        subprocess.CalledProcessError: If check=True and command fails, after
+            the output has been consumed
+    """
+    pending: str = ""
+    chunks: Iterator[str] = stream_git_text(
+        args, check=check, chunk_size=max_line, newline=None if separator == "\n" else ""
+    )
+    for chunk in chunks:
+        records: List[str] = (pending + chunk).split(separator)
+        pending = records.pop()
+        # Only the first record can span chunks and outgrow max_line
+        if records and len(records[0]) > max_line:
+            first: str = records.pop(0)
+            yield from (first[start:start + max_line] for start in range(0, len(first), max_line))
+        yield from records
+        while len(pending) > max_line:
+            yield pending[:max_line]
+            pending = pending[max_line:]
+    if pending:
+        yield pending
+
+
+def comment_text(chunks: Iterable[str]) -> Iterator[str]:
+    """Turn a stream of text chunks into "# "-prefixed comment lines.
+
+    Works on whole chunks, so long output such as a verbose diff is
+    commented without handling each line separately.
+
+    Args:
+        chunks: Text split anywhere
+
+    Yields:
+        Commented text; the last line always ends with a newline
+    """
+    at_line_start: bool = True
+    for chunk in chunks:
+        if not chunk:
+            continue
+        text: str = chunk.replace("\n", "\n# ")
+        if at_line_start:
+            text = "# " + text
+        # The prefix for the next line is added with that line
+        at_line_start = text.endswith("\n# ")
+        yield text[:-2] if at_line_start else text
+    if not at_line_start:
+        yield "\n"
+
+
+class ExcerptBuffer:
+    """Keeps the beginning and end of a stream of lines within a byte budget.
+
+    Lines are kept whole until the budget is exceeded. After that, the
+    first and last lines (about 45% of the budget each) are kept and the
+    lines in between are only counted, so memory stays proportional to the
+    budget however long the stream is. Text can be added line by line or in
+    chunks split anywhere (feed()); chunks skip over the middle of a long
+    stream without handling each line.
+    """
+
+    # Lines kept at each end even when they are longer than the budget
+    MIN_LINES: int = 10
+
+    def __init__(self, max_bytes: int) -> None:
+        self.max_bytes: int = max_bytes
+        self.head: List[str] = []
+        self.tail: deque[Tuple[str, int]] = deque()
+        self.head_bytes: int = 0
+        self.tail_bytes: int = 0
+        self.total_lines: int = 0
+        self.total_bytes: int = 0
+        self.omitted_lines: int = 0
+        self.truncated: bool = False
+        # Incomplete last line of the text fed so far
+        self.partial: str = ""
+
+    def add(self, line: str) -> None:
+        """Add one line (without its newline)."""
+        size: int = (len(line) if line.isascii() else len(line.encode("utf-8"))) + 1
+        self.total_lines += 1
+        self.total_bytes += size
+        if not self.truncated:
+            self.head.append(line)
+            self.head_bytes += size
+            if self.total_bytes > self.max_bytes:
+                self._start_truncating()
+            return
+        if len(self.head) < self.MIN_LINES and not self.tail:
+            self.head.append(line)
+            self.head_bytes += size
+            return
+        self.tail.append((line, size))
+        self.tail_bytes += size
+        self._trim_tail()
+
+    def extend(self, lines: Iterable[str]) -> None:
+        """Add lines."""
+        for line in lines:
+            self.add(line)
+
+    def feed(self, text: str) -> None:
+        """Add a chunk of text; lines may span chunks until flush()."""
+        ascii_only: bool = text.isascii() and self.partial.isascii()
+        lines: List[str] = (self.partial + text).split("\n")
+        self.partial = lines.pop()
+        i: int = 0
+        # Line by line until the head is settled
+        while i < len(lines) and (not self.truncated or (len(self.head) < self.MIN_LINES and not self.tail)):
+            self.add(lines[i])
+            i += 1
+        if i < len(lines):
+            self._add_to_tail(lines[i:] if i else lines, ascii_only)
+
+    def flush(self) -> None:
+        """Add the incomplete last line of the text fed so far, if any."""
+        if self.partial:
+            self.add(self.partial)
+            self.partial = ""
+
+    def _add_to_tail(self, lines: List[str], ascii_only: bool) -> None:
+        if ascii_only:
+            self.total_bytes += sum(map(len, lines)) + len(lines)
+        else:
+            self.total_bytes += sum(len(line.encode("utf-8")) + 1 for line in lines)
+        self.total_lines += len(lines)
+
+        # Only the lines that fit in the tail matter; walk back from the end
+        keep: int = int(self.max_bytes * 0.45)
+        kept: List[Tuple[str, int]] = []
+        kept_bytes: int = 0
+        for line in reversed(lines):
+            size: int = (len(line) if line.isascii() else len(line.encode("utf-8"))) + 1
+            if len(kept) >= self.MIN_LINES and kept_bytes + size > keep:
+                break
+            kept.append((line, size))
+            kept_bytes += size
+        if len(kept) < len(lines):
+            self.omitted_lines += len(self.tail) + len(lines) - len(kept)
+            self.tail = deque(reversed(kept))
+            self.tail_bytes = kept_bytes
+            return
+        self.tail.extend(reversed(kept))
+        self.tail_bytes += kept_bytes
+        self._trim_tail()
+
+    def _start_truncating(self) -> None:
+        self.truncated = True
+        keep: int = int(self.max_bytes * 0.45)
+        moved: List[Tuple[str, int]] = []
+        while len(self.head) > self.MIN_LINES and self.head_bytes > keep:
+            line: str = self.head.pop()
+            size: int = (len(line) if line.isascii() else len(line.encode("utf-8"))) + 1
+            self.head_bytes -= size
+            moved.append((line, size))
+        self.tail.extend(reversed(moved))
+        self.tail_bytes = sum(size for _, size in moved)
+        self._trim_tail()
+
+    def _trim_tail(self) -> None:
+        keep: int = int(self.max_bytes * 0.45)
+        while len(self.tail) > self.MIN_LINES and self.tail_bytes > keep:
+            _, size = self.tail.popleft()
+            self.tail_bytes -= size
+            self.omitted_lines += 1
+
+    def lines(self) -> List[str]:
+        """Get the kept lines, with a truncation notice in the gap.
+
+        Returns:
+            Lines without newlines
+        """
+        self.flush()
+        if not self.truncated:
+            return self.head + [line for line, _ in self.tail]
+        return (
+            self.head
+            + [
+                "",
+                f"# ... [TRUNCATED: {self.omitted_lines} lines omitted, diff too large] ...",
+                f"# Original size: {self.total_bytes / 1024:.1f}KB, limit: {self.max_bytes / 1024:.1f}KB",
+                "",
+            ]
+            + [line for line, _ in self.tail]
+        )
+
+
+def build_ai_prompt(
+    repo_config: Dict[str, Any],
+    args: argparse.Namespace,
+    settings: Optional[RunSettings] = None,
+) -> str:
+    """Build the AI prompt, incorporating repository-specific customization.
+
+    Args:
+        repo_config: Repository-specific configuration
+        args: Parsed command line arguments
+        settings: Settings for this run (default: the active run's)
+
+    Returns:
+        Complete prompt string for AI
+    """
+    settings = settings or active_settings()
+    with run_context(settings):
+
+        # Check if repository has a custom prompt template
+        if repo_config.get('prompt_template'):
+            debug_log("Using custom prompt template from .gitcommitai")
+
+            # Read .gitmessage if it exists
+            gitmessage_content: str = read_gitmessage_template() or ""
+
+            # Prepare replacement values
+            replacements: Dict[str, str] = {
+                'CONTEXT': f"Additional context from user: {args.message}" if args.message else "",
+                'GITMESSAGE': gitmessage_content,
+                'AMEND_NOTE': "Note: You are amending the previous commit." if args.amend else "",
+            }
+
+            # Start with the template
+            base_prompt: str = repo_config['prompt_template']
+
+            # Replace placeholders - but don't add them yet for DIFF and FILES
+            # We'll add those at the end of the function
+            for key, value in replacements.items():
+                if key not in ['DIFF', 'FILES']:
+                    placeholder: str = '{' + key + '}'
+                    if placeholder in base_prompt:
+                        base_prompt = base_prompt.replace(placeholder, value)
+
+            # Normalize excessive blank lines introduced by empty replacements
+            base_prompt = re.sub(r"\n{3,}", "\n\n", base_prompt).strip("\n")
+
+        else:
+            # Use default prompt
+            debug_log("Using default prompt")
+            base_prompt = """You are a git commit message generator that follows Git best practices strictly.
+
+    CRITICAL RULES YOU MUST FOLLOW:
+
+    1. STRUCTURE:
+       - If the change is simple and clear, use ONLY a subject line (single line commit)
+       - For complex changes that need explanation, use subject + blank line + body
+       - Never add a body unless it provides valuable context about WHY the change was made
+
+    2. SUBJECT LINE (FIRST LINE):
+       - Maximum 50 characters (aim for less when possible)
+       - Start with a capital letter
+       - NO period at the end
+       - Use imperative mood (e.g., "Add", "Fix", "Update", not "Added", "Fixes", "Updated")
+       - Be concise but descriptive
+       - Think: "If applied, this commit will [your subject line]"
+
+    3. BODY (ONLY if needed):
+       - Leave one blank line after the subject
+       - Wrap lines at 72 characters maximum
+       - Explain WHAT changed and WHY, not HOW (the code shows how)
+       - Focus on the motivation and context for the change
+       - Use bullet points with "-" for multiple items if needed
+
+    4. GOOD SUBJECT LINE EXAMPLES:
+       - "Add user authentication module"
+       - "Fix memory leak in data processor"
+       - "Update dependencies to latest versions"
+       - "Refactor database connection logic"
+       - "Remove deprecated API endpoints"
+
+    5. CODE ISSUE DETECTION:
+       After generating the message, check the code changes for potential issues.
+       If you detect any obvious problems, add warnings as Git-style comments after the commit message.
+       These warnings help the developer catch bugs before committing.
+
+       Look for these types of severe or critical issues:
+       - Hardcoded secrets
+       - Syntax errors or typos in variable names
+       - null/undefined reference errors
+       - Missing imports that will cause runtime errors
+
+       Format warnings like this:
+       # ⚠️  WARNING: [Brief description of issue]
+       # Found in: [filename]
+       # Details: [Specific concern]
+
+    6. OUTPUT FORMAT:
+       - Generate the commit message following ALL formatting rules correctly
+       - Add a blank line after the message
+       - If code issues detected, add warning comments
+       - NO explanations outside of warning comments
+       - NO markdown formatting
+       - NEVER warn about commit message formatting (you should generate it correctly)
+
+    Remember:
+    - Most commits only need a clear subject line
+    - You are responsible for generating a properly formatted message - don't warn about your own formatting
+    - Only warn about actual code issues that could cause problems"""
+
+        # Add .gitmessage template context if available and not already included via template
+        if not repo_config.get('prompt_template'):
+            gitmessage_template: Optional[str] = read_gitmessage_template()
+            if gitmessage_template:
+                base_prompt += f"""
+
+    PROJECT-SPECIFIC COMMIT TEMPLATE/GUIDELINES:
+    The following template or guidelines are configured for this project. Use this as additional context
+    to understand the project's commit message conventions, but still follow the Git best practices above:
+
+    {gitmessage_template}
+    """
+                debug_log("Added .gitmessage template to prompt context")
+
+            # Add user context
+            if args.message:
+                base_prompt += f"\n\nAdditional context from user: {args.message}"
+
+        return base_prompt
+
+
+def assemble_prompt(base_prompt: str, repo_config: Dict[str, Any], git_diff: str, all_files: str) -> str:
+    """Insert the diff and file contents into a prompt from build_ai_prompt().
+
+    Custom templates get them at their {DIFF} and {FILES} placeholders, or
+    appended when a placeholder is missing; the default prompt gets them
+    appended.
+
+    Args:
+        base_prompt: Prompt returned by build_ai_prompt()
+        repo_config: Repository-specific configuration
+        git_diff: Formatted diff from get_git_diff()
+        all_files: Formatted file contents from get_staged_files()
+
+    Returns:
+        Complete prompt to send to the API
+    """
+    prompt: str = base_prompt
+
+    # Handle template placeholders if using custom template
+    if repo_config.get('prompt_template'):
+        # Check if template has placeholders for DIFF and FILES
+        if '{DIFF}' in prompt:
+            prompt = prompt.replace('{DIFF}', git_diff)
+        else:
+            # Append at the end if no placeholder
+            prompt += f"\n\nHere is the git diff of changes:\n\n{git_diff}"
+
+        if '{FILES}' in prompt:
+            prompt = prompt.replace('{FILES}', all_files)
+        else:
+            # Append at the end if no placeholder
+            prompt += f"\n\nHere are all the modified files with their content for context:\n\n{all_files}"
+
+        # Add final instruction if not already in template
+        if "Generate the commit message" not in prompt and "generate the commit message" not in prompt.lower():
+            prompt += "\n\nGenerate the commit message following the rules above:"
+    else:
+        # Default behavior - append diff and files
+        prompt += f"""
+
+Here is the git diff of changes:
+
+{git_diff}
+
+Here are all the modified files with their content for context:
+
+{all_files}
+
+Generate the commit message following the rules above:"""
+
+    return prompt
+
+
+def stage_all_tracked_files() -> bool:
+    """Stage all tracked, modified files (equivalent to git add -u).
+
+    Returns:
+        True if successful, False otherwise
+    """
+    debug_log("Staging all tracked files with 'git add -u'")
+
+    try:
+        # git add -u stages all tracked files that have been modified or deleted
+        # but does NOT add untracked files
+        subprocess.run(["git", "add", "-u"], check=True, capture_output=True)
+        debug_log("Successfully staged tracked files")
+        return True
+    except subprocess.CalledProcessError as e:
+        debug_log(f"Failed to stage tracked files: {e}")
+        print(f"Error: Failed to stage tracked files: {e}")
+        return False
+
+
+def check_staged_changes(
+    amend: bool = False,
+    auto_stage: bool = False,
+    allow_empty: bool = False,
+    repo_config: Optional[Dict[str, Any]] = None,
+) -> bool:
+    """Check if there are staged changes and provide git-like output if not.
+
+    Args:
+        amend: Whether we're amending a commit
+        auto_stage: Whether to auto-stage tracked files
+        allow_empty: Whether to allow empty commits
+        repo_config: Configuration already read by load_gitcommitai_config(),
+            passed on to show_git_status()
+
+    Returns:
+        True if we can proceed with commit, False otherwise
+    """
+    debug_log(f"Checking staged changes - amend: {amend}, auto_stage: {auto_stage}, allow_empty: {allow_empty}")
+
+    if auto_stage and not amend:
+        # First, check if there are any changes to stage
+        try:
+            # Check for modified tracked files
+            argv, extra = git_command(["diff", "--quiet"])
+            result = subprocess.run(argv, capture_output=True, **extra)
+            if result.returncode != 0:
+                debug_log("Found unstaged changes, auto-staging them")
+                # There are unstaged changes in tracked files, stage them
+                if not stage_all_tracked_files():
+                    return False
+            else:
+                debug_log("No unstaged changes to auto-stage")
+            # Continue to check if we now have staged changes
+        except subprocess.CalledProcessError:
+            pass
+
+    if amend:
+        # For --amend, we're modifying the last commit, so we don't need staged changes
+        # But we should check if there's a previous commit to amend
+        try:
+            run_git(["rev-parse", "HEAD"], check=True)
+            debug_log("Found previous commit to amend")
+            return True
+        except subprocess.CalledProcessError:
             debug_log("No previous commit to amend")
             print("fatal: You have nothing to amend.")
             return False
 
-    # If --allow-empty is set, we can proceed even without staged changes
-    if allow_empty:
-        debug_log("Allow empty flag set, proceeding without staged changes")
-        return True
+    # If --allow-empty is set, we can proceed even without staged changes
+    if allow_empty:
+        debug_log("Allow empty flag set, proceeding without staged changes")
+        return True
+
+    try:
+        argv, extra = git_command(["diff", "--cached", "--quiet"])
+        result = subprocess.run(argv, capture_output=True, **extra)
+        if result.returncode == 0:
+            debug_log("No staged changes found")
+            # No staged changes - mimic git commit output
+            show_git_status(repo_config=repo_config)
+            return False
+        debug_log("Found staged changes")
+        return True
+    except subprocess.CalledProcessError:
+        return False
+
+
+def parse_status_v2(output: str) -> Tuple[Dict[str, str], List[Tuple[str, str]]]:
+    """Parse the output of git status --porcelain=v2 --branch -z.
+
+    Args:
+        output: NUL-separated status output
+
+    Returns:
+        Tuple of (branch headers such as "branch.head" and "branch.oid",
+        list of (XY status, path) entries; untracked files have XY "??")
+    """
+    headers: Dict[str, str] = {}
+    entries: List[Tuple[str, str]] = []
+    # Number of space-separated fields before the path, per record type
+    path_field: Dict[str, int] = {"1": 8, "2": 9, "u": 10}
+
+    records: List[str] = output.split("\0")
+    i: int = 0
+    while i < len(records):
+        record: str = records[i]
+        i += 1
+        if record.startswith("# "):
+            key, _, value = record[2:].partition(" ")
+            headers[key] = value
+        elif record.startswith("? "):
+            entries.append(("??", record[2:]))
+        elif record[:1] in path_field and record[1:2] == " ":
+            fields: List[str] = record.split(" ", path_field[record[0]])
+            entries.append((fields[1], fields[-1]))
+            if record[0] == "2":
+                # Renames and copies are followed by the original path
+                i += 1
+    return headers, entries
+
+
+def show_git_status(untracked_files: Optional[str] = None, repo_config: Optional[Dict[str, Any]] = None) -> None:
+    """Show git status output similar to what 'git commit' shows.
+
+    Branch, initial-commit state and file changes all come from a single
+    git status --porcelain=v2 --branch -z call; NUL-separated records keep
+    paths with spaces or newlines intact.
+
+    Args:
+        untracked_files: Untracked-file mode for git status -u ("no",
+            "normal" or "all"). Defaults to the untracked_files setting
+            from .gitcommitai, then to git's status.showUntrackedFiles.
+        repo_config: Configuration already read by load_gitcommitai_config()
+            (default: read it now, if untracked_files is not given)
+    """
+    debug_log("Showing git status")
+
+    if untracked_files is None:
+        try:
+            if repo_config is None:
+                repo_config = load_gitcommitai_config()
+            untracked_files = repo_config.get("untracked_files")
+        except Exception as e:
+            debug_log(f"Could not load untracked_files setting: {e}")
+
+    status_args: List[str] = ["status", "--porcelain=v2", "--branch", "-z"]
+    if untracked_files:
+        # Skipping the untracked scan is much faster in large work trees
+        status_args.append(f"-u{untracked_files}")
+
+    try:
+        headers, entries = parse_status_v2(run_git(status_args))
+    except Exception as e:
+        debug_log(f"Error showing git status: {e}")
+        # Fallback to simple message if something goes wrong
+        print("No changes staged for commit")
+        return
+
+    # Branch name, or the commit id in detached HEAD state
+    oid: str = headers.get("branch.oid", "")
+    head: str = headers.get("branch.head", "")
+    if head == "(detached)":
+        print(f"HEAD detached at {oid[:7]}")
+    else:
+        print(f"On branch {head or 'master'}")
+
+    if oid == "(initial)":
+        print("\nInitial commit\n")
+
+    untracked: List[str] = []
+    modified: List[str] = []
+    deleted: List[str] = []
+    for xy, path in entries:
+        if xy == "??":
+            untracked.append(path)
+        elif xy[1] == "M":  # Modified in working tree
+            modified.append(path)
+        elif xy[1] == "D":  # Deleted in working tree
+            deleted.append(path)
+
+    # Show unstaged changes
+    changes_shown: bool = False
+    if modified or deleted:
+        print("Changes not staged for commit:")
+        print('  (use "git add <file>..." to update what will be committed)')
+        print(
+            '  (use "git restore <file>..." to discard changes in working directory)'
+        )
+        for f in sorted(modified):
+            print(f"\tmodified:   {f}")
+        for f in sorted(deleted):
+            print(f"\tdeleted:    {f}")
+        changes_shown = True
+
+    # Show untracked files
+    if untracked:
+        if changes_shown:
+            print()
+        print("Untracked files:")
+        print('  (use "git add <file>..." to include in what will be committed)')
+        for f in sorted(untracked):
+            print(f"\t{f}")
+        changes_shown = True
+
+    # Final message
+    if not changes_shown:
+        if untracked_files == "no":
+            print("nothing to commit (use -u to show untracked files)")
+        else:
+            print("nothing to commit, working tree clean")
+    else:
+        print()
+        if untracked and not modified and not deleted:
+            print(
+                'nothing added to commit but untracked files present (use "git add" to track)'
+            )
+        elif modified or deleted:
+            print(
+                'no changes added to commit (use "git add" and/or "git commit -a")'
+            )
+
+
+@dataclass(frozen=True)
+class StagedEntry:
+    """A changed path and the blob its content is read from."""
+
+    path: str
+    # Diff status letter: A, M, D, R, C or T
+    status: str
+    # Blob to describe ("" for a deletion with nothing to show)
+    oid: str
+    # From --numstat; None when it could not be computed
+    binary: Optional[bool] = None
+    # Lines added and deleted, from --numstat (0 for binary files)
+    added: int = 0
+    deleted: int = 0
+
+
+_NULL_OID_PATTERN = r"0+"
+
+
+def parse_raw_diff(output: str) -> Dict[str, StagedEntry]:
+    """Parse the output of git diff --raw [--numstat] -z --no-abbrev.
+
+    Args:
+        output: NUL-separated raw (and optionally numstat) records
+
+    Returns:
+        Dictionary of path to entry, in output order. Renamed and copied
+        entries are keyed by their new path. Deleted entries keep the old
+        blob id, so callers can still describe what was removed.
+    """
+    entries: Dict[str, StagedEntry] = {}
+    counts: Dict[str, Tuple[str, str]] = {}
+
+    records: List[str] = output.split("\0")
+    i: int = 0
+    while i < len(records):
+        record: str = records[i]
+        i += 1
+        if record.startswith(":"):
+            # :old_mode new_mode old_oid new_oid status, then one or two paths
+            fields: List[str] = record[1:].split(" ")
+            if len(fields) < 5:
+                continue
+            status: str = fields[4][:1]
+            i += 2 if status in "RC" else 1
+            if i > len(records):
+                break
+            path: str = records[i - 1]
+            oid: str = fields[2] if re.fullmatch(_NULL_OID_PATTERN, fields[3]) else fields[3]
+            entries[path] = StagedEntry(path, status, "" if re.fullmatch(_NULL_OID_PATTERN, oid) else oid)
+        elif record:
+            # added<TAB>deleted<TAB>path; renames leave the path empty and
+            # add the old and new paths as two more records
+            added, _, rest = record.partition("\t")
+            deleted, _, path = rest.partition("\t")
+            if not path:
+                i += 2
+                path = records[i - 1] if i <= len(records) else ""
+            counts[path] = (added, deleted)
+
+    for path, (added, deleted) in counts.items():
+        if path in entries:
+            binary: bool = added == "-"
+            entries[path] = replace(
+                entries[path],
+                binary=binary,
+                added=0 if binary else int(added),
+                deleted=0 if binary else int(deleted),
+            )
+    return entries
+
+
+def run_git_local(args: List[str], check: bool = True) -> str:
+    """Run git without letting it fetch missing objects from a promisor remote.
+
+    Args:
+        args: List of git command arguments
+        check: Whether to raise exception on non-zero exit code
+
+    Returns:
+        Standard output from git command
+
+    Raises:
+        subprocess.CalledProcessError: If check=True and command fails,
+            including when an object it needs is not available locally
+    """
+    with run_context(replace(active_settings(), lazy_fetch=False)):
+        return run_git(args, check=check)
+
+
+def list_staged_entries(amend: bool = False) -> Dict[str, StagedEntry]:
+    """List the changes to describe, with blob ids, from one diff per side.
+
+    Used for partial clones and sparse indexes instead of looking each path
+    up in the index and HEAD. `git diff` works on a sparse index without
+    expanding it, and in a partial clone it fetches all the blobs it needs
+    for --numstat in one batch; afterwards every blob to describe is local.
+    If that fetch fails (e.g. offline), the changes are listed without
+    content and blobs that are not local get described as metadata only.
+
+    Args:
+        amend: Whether we're amending a commit; the changes of HEAD are then
+            included, with the staged version of a path taking precedence
+
+    Returns:
+        Dictionary of path to entry, in git's order (sorted when amending)
+    """
+    sides: List[List[str]] = [["diff", "--cached"]]
+    if amend:
+        sides.insert(0, ["diff-tree", "-r", "--root", "--no-commit-id", "HEAD"])
+
+    entries: Dict[str, StagedEntry] = {}
+    offline: bool = False
+    for side in sides:
+        output: str = ""
+        if not offline:
+            try:
+                output = run_git(side + ["--raw", "--numstat", "-z", "--no-abbrev"])
+            except subprocess.CalledProcessError:
+                debug_log(f"Could not diff with content for git {' '.join(side)}, listing changes without it")
+                offline = True
+        if offline:
+            # Without rename detection no blob content is needed
+            output = run_git_local(side + ["--raw", "-z", "--no-abbrev", "--no-renames"], check=False)
+        # Deleted paths have no content, except that when amending a path
+        # deleted from the index is still described as it is in HEAD
+        keep_deleted: bool = amend and side[0] == "diff"
+        for path, entry in parse_raw_diff(output).items():
+            entries[path] = entry if entry.status != "D" or keep_deleted else replace(entry, oid="")
+
+    return dict(sorted(entries.items())) if amend else entries
+
+
+def read_blob(oid: str) -> Optional[str]:
+    """Read a blob that is available locally.
+
+    Args:
+        oid: Blob id ("" reads as empty content)
+
+    Returns:
+        The blob's content, or None if it is not available locally
+    """
+    if not oid:
+        return ""
+    try:
+        return run_git_local(["cat-file", "blob", oid])
+    except subprocess.CalledProcessError:
+        return None
+
+
+def get_binary_file_info(filename: str, amend: bool = False, entry: Optional[StagedEntry] = None) -> str:
+    """Get information about a binary file.
+
+    Args:
+        filename: Path to the binary file
+        amend: Whether we're amending a commit
+        entry: The file's entry from list_staged_entries(); its blob and
+            status are then used instead of looking the path up again
+
+    Returns:
+        Formatted information about the binary file
+    """
+    debug_log(f"Getting binary file info for: {filename}")
+
+    info_parts: List[str] = []
+
+    # Get file extension
+    _, ext = os.path.splitext(filename)
+    if ext:
+        info_parts.append(f"File type: {ext}")
+
+    # Try to get file size from git
+    try:
+        size_output: str
+        if entry is not None:
+            size_output = run_git_local(["cat-file", "-s", entry.oid], check=False) if entry.oid else ""
+        elif amend:
+            # Try to get size from index first, then HEAD
+            size_output = run_git(["cat-file", "-s", f":{filename}"], check=False)
+            if not size_output or "fatal:" in size_output:
+                size_output = run_git(["cat-file", "-s", f"HEAD:{filename}"], check=False)
+        else:
+            size_output = run_git(["cat-file", "-s", f":{filename}"], check=False)
+
+        if size_output and "fatal:" not in size_output:
+            size_bytes: int = int(size_output.strip())
+            size_str: str
+            # Format size nicely
+            if size_bytes < 1024:
+                size_str = f"{size_bytes} bytes"
+            elif size_bytes < 1024 * 1024:
+                size_str = f"{size_bytes / 1024:.1f} KB"
+            else:
+                size_str = f"{size_bytes / (1024 * 1024):.1f} MB"
+            info_parts.append(f"Size: {size_str}")
+    except:
+        pass
+
+    # Common binary file type descriptions
+    binary_descriptions: Dict[str, str] = {
+        ".jpg": "JPEG image",
+        ".jpeg": "JPEG image",
+        ".png": "PNG image",
+        ".gif": "GIF image",
+        ".webp": "WebP image",
+        ".svg": "SVG vector image",
+        ".ico": "Icon file",
+        ".pdf": "PDF document",
+        ".zip": "ZIP archive",
+        ".tar": "TAR archive",
+        ".gz": "Gzip compressed file",
+        ".exe": "Windows executable",
+        ".dll": "Dynamic link library",
+        ".so": "Shared object library",
+        ".dylib": "Dynamic library (macOS)",
+        ".mp3": "MP3 audio",
+        ".mp4": "MP4 video",
+        ".avi": "AVI video",
+        ".mov": "QuickTime video",
+        ".ttf": "TrueType font",
+        ".woff": "Web font",
+        ".woff2": "Web font 2.0",
+        ".db": "Database file",
+        ".sqlite": "SQLite database",
+    }
+
+    if ext.lower() in binary_descriptions:
+        info_parts.append(f"Description: {binary_descriptions[ext.lower()]}")
+
+    # Check if it's a new file or modified
+    try:
+        if entry is not None:
+            info_parts.append("Status: New file" if entry.status == "A" else "Status: Modified")
+        elif amend:
+            # Check if file exists in parent commit
+            run_git(["cat-file", "-e", f"HEAD^:{filename}"], check=True)
+            info_parts.append("Status: Modified")
+        else:
+            # Check if file exists in HEAD
+            run_git(["cat-file", "-e", f"HEAD:{filename}"], check=True)
+            info_parts.append("Status: Modified")
+    except:
+        info_parts.append("Status: New file")
+
+    return (
+        "\n".join(info_parts)
+        if info_parts
+        else "Binary file (no additional information available)"
+    )
+
+
+# Jupyter notebooks: their content and diffs are rendered from the cell
+# sources, without outputs (often base64 images) or metadata
+NOTEBOOK_EXTENSIONS: Tuple[str, ...] = (".ipynb",)
+
+# Lockfiles whose diffs are replaced by a summary of the dependency changes,
+# listing at most LOCKFILE_SUMMARY_LIMIT packages
+LOCKFILE_NAMES: Tuple[str, ...] = ("package-lock.json", "yarn.lock", "poetry.lock", "Cargo.lock", "go.sum")
+LOCKFILE_SUMMARY_LIMIT: int = 50
+_DIFF_SECTION_PATTERN = r"(?m)^(diff --git [^\n]*\n)"
+# Partial lines longer than this are passed on rather than held back; diff
+# section headers are shorter
+_DIFF_HEADER_MAX: int = 4096
+
+
+def render_notebook(content: str) -> Optional[str]:
+    """Render a Jupyter notebook as the source of its cells.
+
+    Parses the JSON once and drops outputs, execution counts and metadata.
+    Each cell becomes a "# %%" marker, followed by the cell type for
+    non-code cells (as in jupytext's percent format), then its source.
+
+    Args:
+        content: Notebook file content
+
+    Returns:
+        The rendered cells, or None if content is not a notebook
+    """
+    import json
+
+    try:
+        notebook: Any = json.loads(content)
+    except ValueError:
+        return None
+    if not isinstance(notebook, dict):
+        return None
+    cells: Any = notebook.get("cells")
+    if cells is None:
+        # nbformat 3 keeps the cells in worksheets
+        worksheets: Any = notebook.get("worksheets")
+        if isinstance(worksheets, list) and worksheets and isinstance(worksheets[0], dict):
+            cells = worksheets[0].get("cells")
+    if not isinstance(cells, list):
+        return None
+
+    rendered: List[str] = []
+    for cell in cells:
+        if not isinstance(cell, dict):
+            continue
+        source: Any = cell.get("source", cell.get("input", ""))
+        if isinstance(source, list):
+            source = "".join(str(line) for line in source)
+        cell_type: str = str(cell.get("cell_type", "code"))
+        marker: str = "# %%" if cell_type == "code" else f"# %% [{cell_type}]"
+        rendered.append(f"{marker}\n{str(source).rstrip()}\n")
+    return "\n".join(rendered)
+
+
+def unified_diff(old: str, new: str, files: List[str]) -> str:
+    """Diff two texts in git's unified format.
+
+    Args:
+        old: Old text
+        new: New text
+        files: The "---" and "+++" file names
+
+    Returns:
+        The file names and hunks, every line ending in a newline
+    """
+    import difflib
+
+    hunks: Iterator[str] = difflib.unified_diff(old.splitlines(True), new.splitlines(True), files[0], files[1])
+    return "".join(line if line.endswith("\n") else line + "\n" for line in hunks)
+
+
+def notebook_diff(old: str, new: str, files: List[str]) -> str:
+    """Diff two versions of a notebook by their rendered cells.
+
+    Args:
+        old: Old notebook ("" if added)
+        new: New notebook ("" if deleted)
+        files: The "---" and "+++" file names
+
+    Returns:
+        The diff of the rendered notebooks
+    """
+    versions: List[str] = []
+    for content in (old, new):
+        rendered: Optional[str] = render_notebook(content) if content else ""
+        versions.append(content if rendered is None else rendered)
+    if versions[0] == versions[1]:
+        return "# Only notebook outputs or metadata changed\n"
+    return unified_diff(versions[0], versions[1], files)
+
+
+_TOML_STRING_PATTERN = r'(name|version)\s*=\s*"([^"]*)"'
+_YARN_VERSION_PATTERN = r'\s+version:?\s+"?([^"\s]+)"?'
+
+
+def parse_lockfile(name: str, content: str) -> Optional[Dict[str, Set[str]]]:
+    """Read the locked versions of each package from a lockfile.
+
+    Args:
+        name: Lockfile name, one of LOCKFILE_NAMES
+        content: Lockfile content
+
+    Returns:
+        Dictionary of package name to its locked versions, or None if the
+        lockfile cannot be parsed
+    """
+    packages: Dict[str, Set[str]] = {}
+
+    def add(package: str, version: Any) -> None:
+        packages.setdefault(package, set()).add(str(version))
+
+    if name == "package-lock.json":
+        import json
+
+        try:
+            lock: Any = json.loads(content)
+        except ValueError:
+            return None
+        if not isinstance(lock, dict):
+            return None
+        if isinstance(lock.get("packages"), dict):
+            # lockfileVersion 2 and 3: keyed by install path
+            for path, info in lock["packages"].items():
+                if path and isinstance(info, dict) and "version" in info:
+                    add(info.get("name") or path.rsplit("node_modules/", 1)[-1], info["version"])
+        else:
+            # lockfileVersion 1: nested dependency trees
+            trees: List[Any] = [lock.get("dependencies")]
+            while trees:
+                tree: Any = trees.pop()
+                if not isinstance(tree, dict):
+                    continue
+                for package, info in tree.items():
+                    if isinstance(info, dict):
+                        if "version" in info:
+                            add(package, info["version"])
+                        trees.append(info.get("dependencies"))
+    elif name == "yarn.lock":
+        package_name: Optional[str] = None
+        for line in content.splitlines():
+            if not line or line.startswith("#"):
+                continue
+            if not line[0].isspace():
+                # 'name@range, name@range:' (classic) or '"name@npm:range":' (berry)
+                spec: str = line.rstrip(":").split(",")[0].strip().strip('"')
+                at: int = spec.find("@", 1)
+                package_name = spec[:at] if at > 0 else spec
+                if package_name.startswith("__"):
+                    package_name = None
+            elif package_name:
+                version = re.match(_YARN_VERSION_PATTERN, line)
+                if version:
+                    add(package_name, version.group(1))
+                    package_name = None
+    elif name == "go.sum":
+        for line in content.splitlines():
+            fields: List[str] = line.split()
+            if len(fields) >= 2:
+                add(fields[0], fields[1][:-len("/go.mod")] if fields[1].endswith("/go.mod") else fields[1])
+    else:
+        # poetry.lock and Cargo.lock: [[package]] tables with name and version
+        table: Dict[str, str] = {}
+        in_package: bool = False
+        for line in chain(content.splitlines(), ["[end]"]):
+            stripped: str = line.strip()
+            if stripped.startswith("["):
+                if in_package and "name" in table and "version" in table:
+                    add(table["name"], table["version"])
+                in_package, table = stripped == "[[package]]", {}
+            elif in_package:
+                entry = re.match(_TOML_STRING_PATTERN, stripped)
+                if entry:
+                    table[entry.group(1)] = entry.group(2)
+    return packages
+
+
+def lockfile_diff(old: str, new: str, files: List[str]) -> str:
+    """Summarise the dependency changes between two versions of a lockfile.
+
+    Lists updated, added and removed packages, at most
+    LOCKFILE_SUMMARY_LIMIT of them, instead of the lockfile's diff.
+
+    Args:
+        old: Old lockfile ("" if added)
+        new: New lockfile ("" if deleted)
+        files: The "---" and "+++" file names
+
+    Returns:
+        The summary, or the diff if the lockfile cannot be parsed
+    """
+    name: str = (files[1] if files[1] != "/dev/null" else files[0]).rsplit("/", 1)[-1]
+    before: Optional[Dict[str, Set[str]]] = parse_lockfile(name, old) if old else {}
+    after: Optional[Dict[str, Set[str]]] = parse_lockfile(name, new) if new else {}
+    if before is None or after is None:
+        return unified_diff(old, new, files)
+
+    def versions(package_versions: Set[str]) -> str:
+        return ", ".join(sorted(package_versions))
+
+    updated: List[str] = [
+        f"{package} {versions(before[package])} \u2192 {versions(after[package])}"
+        for package in sorted(before.keys() & after.keys())
+        if before[package] != after[package]
+    ]
+    added: List[str] = [f"+ {package} {versions(after[package])}" for package in sorted(after.keys() - before.keys())]
+    removed: List[str] = [
+        f"- {package} {versions(before[package])}" for package in sorted(before.keys() - after.keys())
+    ]
+    changes: List[str] = updated + added + removed
+    lines: List[str] = [
+        f"# Dependency changes: {len(updated)} updated, {len(added)} added, {len(removed)} removed"
+    ]
+    lines.extend(f"#   {change}" for change in changes[:LOCKFILE_SUMMARY_LIMIT])
+    if len(changes) > LOCKFILE_SUMMARY_LIMIT:
+        lines.append(f"#   ... and {len(changes) - LOCKFILE_SUMMARY_LIMIT} more")
+    return "\n".join(lines) + "\n"
+
+
+def diff_section_rewriter(path: str) -> Optional[Callable[[str, str, List[str]], str]]:
+    """Find how to rewrite the diff section of a file, if at all.
+
+    Args:
+        path: File path, as on the section's "diff --git" line
+
+    Returns:
+        A function from (old content, new content, file names) to the
+        section's new body, or None to keep git's diff
+    """
+    name: str = path.rsplit("/", 1)[-1]
+    if name in LOCKFILE_NAMES:
+        return lockfile_diff
+    if name.endswith(NOTEBOOK_EXTENSIONS):
+        return notebook_diff
+    if name.endswith(PROSE_EXTENSIONS) and active_settings().normalize:
+        return prose_diff
+    return None
+
+
+def rewrite_diff_section(header: List[str], rewriter: Callable[[str, str, List[str]], str]) -> str:
+    """Rewrite a diff section from the old and new content of its file.
+
+    The old and new content are read by the blob ids on the section's index
+    line, without fetching missing objects.
+
+    Args:
+        header: Lines of the section up to its first hunk, with newlines
+        rewriter: Function writing the section's body, see diff_section_rewriter()
+
+    Returns:
+        The rewritten section
+    """
+    index_line: Optional[str] = next((line for line in header if line.startswith("index ")), None)
+    files: List[str] = [line[4:].rstrip("\n") for line in header if line.startswith(("--- ", "+++ "))]
+    if index_line is None or len(files) != 2:
+        # Mode changes, pure renames and binary files have no hunks
+        return "".join(header)
+    kept: str = "".join(line for line in header if not line.startswith(("--- ", "+++ ")))
+
+    versions: List[str] = []
+    for oid in index_line.split()[1].split(".."):
+        blob: Optional[str] = "" if re.fullmatch(_NULL_OID_PATTERN, oid) else read_blob(oid)
+        if blob is None:
+            return f"{kept}# Content not available locally\n"
+        versions.append(blob)
+    return kept + rewriter(versions[0], versions[1], files)
+
+
+def diff_line_path(line: str) -> str:
+    """Get the file path of a diff section from its "diff --git" line.
+
+    Args:
+        line: The line, with or without "diff --git " and the newline
+
+    Returns:
+        The path, on the new side for renames
+    """
+    names: str = line[len("diff --git "):] if line.startswith("diff --git ") else line
+    names = names.rstrip("\n")
+    middle: int = len(names) // 2
+    if names.startswith("a/") and names[middle:middle + 3] == " b/" and names[2:middle] == names[middle + 3:]:
+        return names[2:middle]
+    new: str = re.split(r' "?b/', names)[-1].rstrip('"')
+    if "\\" in new:
+        # Quoted by git: C escapes, with non-ASCII bytes in octal
+        new = new.encode("latin-1", "backslashreplace").decode("unicode_escape")
+        new = new.encode("latin-1", "replace").decode("utf-8", "replace")
+    return new
+
+
+def _skipping_pattern(line: str) -> Optional[str]:
+    """Get the pattern leaving the file of a diff section out, if any."""
+    skip: Optional[SkipMatcher] = active_settings().skip
+    return skip.match(diff_line_path(line)) if skip else None
+
+
+def _has_rewritten_section(text: str) -> bool:
+    """Check whether any section of a diff text is rewritten or skipped, cheaply."""
+    for section in text.split("diff --git ")[1:]:
+        line: str = section[:_DIFF_HEADER_MAX].partition("\n")[0]
+        if diff_section_rewriter(line.rstrip('"')) is not None or _skipping_pattern(line) is not None:
+            return True
+    return False
+
+
+def rewrite_diff_sections(chunks: Iterable[str]) -> Iterator[str]:
+    """Rewrite the diff sections of notebooks, lockfiles and prose in a streamed diff.
+
+    Text without such sections passes through chunk by chunk. A section to
+    rewrite (see diff_section_rewriter()) is held back up to its first hunk,
+    the rest of it is dropped, and rewrite_diff_section() writes it anew.
+    Sections of files the active run skips keep only their header lines.
+
+    Args:
+        chunks: Diff text split anywhere
+
+    Yields:
+        Diff text
+    """
+    # Header lines of the section being rewritten, and its rewriter
+    section: Optional[List[str]] = None
+    rewriter: Optional[Callable[[str, str, List[str]], str]] = None
+    # Pattern skipping the file of the section being held, if any
+    skipped: Optional[str] = None
+    in_hunks: bool = False
+    pending: str = ""
+    for chunk in chain(chunks, [None]):
+        if chunk is None:
+            text, pending = pending, ""
+        else:
+            pending += chunk
+            end: int = pending.rfind("\n") + 1
+            text, pending = pending[:end], pending[end:]
+            if len(pending) > _DIFF_HEADER_MAX:
+                text, pending = text + pending, ""
+        if section is None and not _has_rewritten_section(text):
+            if text:
+                yield text
+            continue
+
+        # Alternating text and section headers
+        pieces: List[str] = re.split(_DIFF_SECTION_PATTERN, text)
+        for i, piece in enumerate(pieces):
+            if i % 2:
+                if section is not None:
+                    yield _finish_diff_section(section, rewriter, skipped)
+                    section = None
+                skipped = _skipping_pattern(piece)
+                rewriter = diff_section_rewriter(piece.rstrip('"\n'))
+                if rewriter is not None or skipped is not None:
+                    section, in_hunks = [piece], False
+                else:
+                    yield piece
+            elif section is None:
+                if piece:
+                    yield piece
+            elif not in_hunks:
+                hunk = re.search(r"(?m)^@@", piece)
+                section.extend((piece[:hunk.start()] if hunk else piece).splitlines(True))
+                in_hunks = hunk is not None
+    if section is not None:
+        yield _finish_diff_section(section, rewriter, skipped)
+
+
+def _finish_diff_section(
+    header: List[str], rewriter: Optional[Callable[[str, str, List[str]], str]], skipped: Optional[str]
+) -> str:
+    """Write a section held back by rewrite_diff_sections()."""
+    if skipped is not None:
+        return "".join(header) + f"# File content excluded from AI prompt (matches pattern '{skipped}')\n"
+    return rewrite_diff_section(header, rewriter) if rewriter is not None else "".join(header)
+
+
+# Hunks up to this many characters are compared with earlier ones; larger
+# hunks pass through. At most HUNK_INDEX_LIMIT distinct hunks are remembered.
+HUNK_DEDUP_MAX: int = 8192
+HUNK_INDEX_LIMIT: int = 50_000
+# Hunks repeating a change are dropped from this occurrence on, and only
+# once the diff has outgrown its budget
+REPEATED_HUNK_MIN: int = 3
+# Repeated changes listed, and files named for each
+REPEATED_HUNK_LIMIT: int = 20
+REPEATED_HUNK_FILES_LIMIT: int = 10
+# Diffs of at least this many bytes have their hunks reduced to their
+# changes on a process pool (see ParallelStage); in one process that takes
+# around half a second, enough to pay for starting the workers
+PARALLEL_MIN_BYTES: int = 512 * 1024
+PARALLEL_WORKERS: int = 8
+_HUNK_BOUNDARY_PATTERN = r"(?m)^(?=@@ |diff --git )"
+_HUNK_TOKEN_PATTERN = r"\w+|[^\w\s]"
+
+
+def hunk_changes(hunk: str) -> List[Tuple[str, str]]:
+    """Reduce a hunk to the tokens it changes.
+
+    Context lines and the tokens a changed line keeps (the identifiers
+    around a renamed symbol, say) are left out, so the same substitution
+    gives the same result wherever it is made.
+
+    Args:
+        hunk: Hunk text, from its "@@" line
+
+    Returns:
+        (old, new) text of each changed run of tokens; empty for hunks
+        changing fewer than two lines, or only whitespace
+    """
+    from difflib import SequenceMatcher
+
+    body: str = hunk.partition("\n")[2]
+    removed_lines: List[str] = re.findall(r"(?m)^-(.*)", body)
+    added_lines: List[str] = re.findall(r"(?m)^\+(.*)", body)
+    if len(removed_lines) + len(added_lines) < 2:
+        return []
+    if not removed_lines or not added_lines:
+        # Nothing to compare with; the lines themselves are the change
+        old_text: str = "\n".join(removed_lines).strip()
+        new_text: str = "\n".join(added_lines).strip()
+        return [(old_text, new_text)] if old_text or new_text else []
+
+    removed: List[str] = re.findall(_HUNK_TOKEN_PATTERN, "\n".join(removed_lines))
+    added: List[str] = re.findall(_HUNK_TOKEN_PATTERN, "\n".join(added_lines))
+    matcher = SequenceMatcher(None, removed, added, autojunk=False)
+    return [
+        (" ".join(removed[i1:i2]), " ".join(added[j1:j2]))
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes()
+        if tag != "equal"
+    ]
+
+
+def describe_hunk_changes(changes: List[Tuple[str, str]], limit: int = 80) -> str:
+    """Describe changed tokens in word diff notation, e.g. "[-foo-]{+bar+}"."""
+    parts: List[str] = []
+    for old, new in changes:
+        old, new = " ".join(old.split()), " ".join(new.split())
+        parts.append((f"[-{old}-]" if old else "") + (f"{{+{new}+}}" if new else ""))
+    description: str = " ".join(part for part in parts if part)
+    return description if len(description) <= limit else description[:limit - 3] + "..."
+
+
+def _section_path(header: str) -> str:
+    """Get the file path of a diff section from its header lines."""
+    names: Dict[str, str] = dict(re.findall(r"(?m)^(---|\+\+\+) (.*)", header))
+    path: str = names.get("+++", "/dev/null")
+    if path == "/dev/null":
+        path = names.get("---") or header.partition("\n")[0].rsplit(" b/", 1)[-1]
+    path = path.strip('"')
+    return path[2:] if path.startswith(("a/", "b/")) else path
+
+
+@dataclass
+class RepeatedHunk:
+    """A change seen in one or more hunks of a diff."""
+
+    description: str
+    # Files it was seen in, the first ones being where it is shown
+    files: List[str]
+    last_file: str
+    file_count: int = 1
+    hunk_count: int = 1
+    # Hunks left out of the diff
+    dropped: int = 0
+
+
+class ParallelStage:
+    """Apply a CPU-heavy function to batches of items, in order.
+
+    With more than one worker, batches are split into chunks across a
+    process pool, started on the first batch of several items. Callers
+    decide up front whether the work is large enough to pay for starting
+    workers, and pass workers=1 when it is not. Results come back in the
+    order of the items either way. The function must be a picklable
+    module-level function.
+    """
+
+    def __init__(self, func: Callable[[Any], Any], workers: int) -> None:
+        self.func: Callable[[Any], Any] = func
+        self.workers: int = workers
+        self.pool: Optional[Any] = None
+
+    def map(self, items: List[Any]) -> List[Any]:
+        """Apply the function to each item.
+
+        Args:
+            items: Arguments for the function
+
+        Returns:
+            The results, in the order of the items
+        """
+        if self.pool is None and self.workers > 1 and len(items) > 1:
+            from concurrent.futures import ProcessPoolExecutor
+            import multiprocessing
+
+            debug_log(f"Running {self.func.__name__} on {self.workers} processes")
+            # spawn rather than fork: the same on every platform, and safe with threads running
+            self.pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+            count_event("parallel_stage")
+        if self.pool is not None and len(items) > 1:
+            try:
+                return list(self.pool.map(self.func, items, chunksize=max(1, len(items) // (self.workers * 4))))
+            except Exception as e:
+                debug_log(f"Process pool failed ({e}), continuing in this process")
+                self.close()
+                self.workers = 1
+        return [self.func(item) for item in items]
+
+    def close(self) -> None:
+        """Stop the workers, if any were started."""
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+
+
+class HunkDeduplicator:
+    """Drop hunks that repeat an earlier hunk's change from a streamed diff.
+
+    A mass search-and-replace makes the same change in hundreds of files.
+    Hunks are compared by the tokens they change (see hunk_changes()).
+    Since unrelated edits can change the same tokens (two constants going
+    from 10 to 20, say), nothing is dropped until the diff has passed its
+    budget, and then only hunks whose change has been seen at least
+    REPEATED_HUNK_MIN times; the header of a section left without hunks
+    goes with them. summary() then lists where each dropped change was
+    applied.
+    """
+
+    def __init__(self, budget: int = 0) -> None:
+        """Create a deduplicator.
+
+        Args:
+            budget: Characters of diff to pass through before dropping
+                anything, normally max_diff_size
+        """
+        self.budget: int = budget
+        # Characters of diff read so far, kept or dropped
+        self.read: int = 0
+        # Each change, by digest of its tokens
+        self.seen: Dict[bytes, RepeatedHunk] = {}
+        self.dropped_hunks: int = 0
+
+    @staticmethod
+    def comparable(hunk: str) -> bool:
+        """Check whether a hunk is the kind of change that repeats."""
+        # Added and deleted files are not
+        return not (hunk.startswith("@@ -0,0 ") or " +0,0 @@" in hunk.partition("\n")[0])
+
+    def keep(self, hunk: str, path: str) -> bool:
+        """Record a hunk and tell whether it is the first with its change."""
+        return not self.comparable(hunk) or self.record(hunk_changes(hunk), path)
+
+    def record(self, changes: List[Tuple[str, str]], path: str) -> bool:
+        """Record the changes of a hunk and tell whether they are new."""
+        import hashlib
+
+        if not changes:
+            return True
+        digest: bytes = hashlib.blake2b(repr(changes).encode("utf-8"), digest_size=16).digest()
+        repeated: Optional[RepeatedHunk] = self.seen.get(digest)
+        if repeated is None:
+            if len(self.seen) < HUNK_INDEX_LIMIT:
+                self.seen[digest] = RepeatedHunk("", [path], path)
+            return True
+        repeated.hunk_count += 1
+        # Sections come file by file, so a new file differs from the last one
+        if path != repeated.last_file:
+            repeated.last_file = path
+            repeated.file_count += 1
+            if len(repeated.files) < REPEATED_HUNK_FILES_LIMIT:
+                repeated.files.append(path)
+        if repeated.hunk_count < REPEATED_HUNK_MIN or self.read <= self.budget:
+            return True
+        if not repeated.dropped:
+            repeated.description = describe_hunk_changes(changes)
+        repeated.dropped += 1
+        self.dropped_hunks += 1
+        return False
+
+    def filter(self, chunks: Iterable[str]) -> Iterator[str]:
+        """Pass a diff through, without repeated hunks.
+
+        The hunks of each chunk are reduced to their changes together, on
+        a ParallelStage, and then kept or dropped in diff order. Whether
+        that stage uses a process pool is decided once, before any hunk is
+        reduced, by reading ahead up to PARALLEL_MIN_BYTES of the diff.
+
+        Args:
+            chunks: Diff text split anywhere
+
+        Yields:
+            Diff text
+        """
+        batches: Iterator[List[Tuple[str, str, str]]] = _diff_items(chunks)
+        ahead: List[List[Tuple[str, str, str]]] = []
+        ahead_bytes: int = 0
+        for items in batches:
+            ahead.append(items)
+            ahead_bytes += sum(len(text) for _, text, _ in items)
+            if ahead_bytes >= PARALLEL_MIN_BYTES:
+                break
+        # The pool itself only starts once there are hunks to compare
+        workers: int = active_settings().workers if ahead_bytes >= PARALLEL_MIN_BYTES else 1
+        stage: ParallelStage = ParallelStage(hunk_changes, workers)
+        # Header of the current section, held until one of its hunks is kept
+        header: Optional[str] = None
+        dropped: bool = False
+        try:
+            for items in chain(ahead, batches):
+                if len(items) == 1 and items[0][0] == "text":
+                    self.read += len(items[0][1])
+                    yield items[0][1]
+                    continue
+                hunks: List[str] = [item[1] for item in items if item[0] == "hunk" and self.comparable(item[1])]
+                changes: Iterator[List[Tuple[str, str]]] = iter(stage.map(hunks) if hunks else [])
+                # Text to pass on, yielded once per chunk
+                out: List[str] = []
+                for kind, text, path in items:
+                    self.read += len(text)
+                    if kind == "header":
+                        if header is not None and not dropped:
+                            out.append(header)
+                        header, dropped = text, False
+                    elif kind == "text":
+                        out.append(text)
+                    elif kind == "large" or not self.comparable(text) or self.record(next(changes), path):
+                        if header is not None:
+                            out.append(header)
+                            header = None
+                        out.append(text)
+                    else:
+                        dropped = True
+                if out:
+                    yield "".join(out)
+            if header is not None and not dropped:
+                yield header
+        finally:
+            stage.close()
+
+    def summary(self) -> str:
+        """List the repeated changes left out of the diff, most widespread first.
+
+        Returns:
+            Comment lines, or "" if no hunk was dropped
+        """
+        repeated: List[RepeatedHunk] = sorted(
+            (group for group in self.seen.values() if group.dropped),
+            key=lambda group: (-group.file_count, -group.hunk_count),
+        )
+        if not repeated:
+            return ""
+        lines: List[str] = ["# Repeated changes, shown only in their first hunks in the diff above:"]
+        for group in repeated[:REPEATED_HUNK_LIMIT]:
+            names: str = ", ".join(group.files)
+            if group.file_count > len(group.files):
+                names += f", ... and {group.file_count - len(group.files)} more"
+            hunks: str = f" ({group.hunk_count} hunks)" if group.hunk_count != group.file_count else ""
+            files: str = "1 file" if group.file_count == 1 else f"{group.file_count} files"
+            lines.append(f"# {group.description}: applied in {files}{hunks}: {names}")
+        if len(repeated) > REPEATED_HUNK_LIMIT:
+            lines.append(f"# ... and {len(repeated) - REPEATED_HUNK_LIMIT} more repeated changes")
+        return "\n".join(lines)
+
+
+def _diff_items(chunks: Iterable[str]) -> Iterator[List[Tuple[str, str, str]]]:
+    """Split a streamed diff into section headers, hunks and other text.
+
+    Args:
+        chunks: Diff text split anywhere
+
+    Yields:
+        For each chunk, the (kind, text, path) items it completes: kind is
+        "header", "hunk", "large" (a hunk, or its start, too large to
+        compare) or "text"; path is the file of a hunk
+    """
+    # Header of the current section while it is being read
+    header: str = ""
+    in_header: bool = False
+    path: str = ""
+    # Hunk being read, while it is small enough to compare
+    hunk: Optional[List[str]] = None
+    hunk_size: int = 0
+    pending: str = ""
+    for chunk in chain(chunks, [None]):
+        if chunk is None:
+            text, pending = pending, ""
+        else:
+            pending += chunk
+            end: int = pending.rfind("\n") + 1
+            text, pending = pending[:end], pending[end:]
+            if len(pending) > _DIFF_HEADER_MAX:
+                text, pending = text + pending, ""
+        if hunk is None and not in_header and "@@" not in text and "diff --git " not in text:
+            if text:
+                yield [("text", text, "")]
+            continue
+
+        items: List[Tuple[str, str, str]] = []
+        pieces: List[str] = re.split(_HUNK_BOUNDARY_PATTERN, text)
+        if chunk is None:
+            # The end of the diff ends its last hunk and section
+            pieces.append("diff --git ")
+        for piece in pieces:
+            if not piece:
+                continue
+            if piece.startswith(("@@ ", "diff --git ")) and hunk is not None:
+                items.append(("hunk", "".join(hunk), path))
+                hunk = None
+            if piece.startswith("diff --git "):
+                if in_header:
+                    items.append(("header", header, ""))
+                header, in_header = piece, True
+            elif piece.startswith("@@ "):
+                if in_header:
+                    items.append(("header", header, ""))
+                    path = _section_path(header)
+                    in_header = False
+                hunk, hunk_size = [piece], len(piece)
+            elif in_header:
+                header += piece
+            elif hunk is not None:
+                hunk.append(piece)
+                hunk_size += len(piece)
+            else:
+                items.append(("text", piece, ""))
+            if hunk is not None and hunk_size > HUNK_DEDUP_MAX:
+                # Too large to compare, and to hold
+                items.append(("large", "".join(hunk), path))
+                hunk = None
+        if items:
+            yield items
+
+
+# Runs of base64 at least this long are replaced by a placeholder
+BASE64_MIN_LENGTH: int = 200
+_BASE64_RUN_PATTERN = r"(?<![A-Za-z0-9+/])[A-Za-z0-9+/]{%d,}={0,2}" % BASE64_MIN_LENGTH
+
+# Lines that start a Markdown block rather than continue a paragraph
+_MARKDOWN_BLOCK_PATTERN = r"\s*(?:[#>|<]|[-*+]\s|\d+[.)]\s|```|~~~|[-=*_]{3,}\s*$)"
+
+
+def strip_base64(text: str) -> str:
+    """Replace long base64 runs (embedded images, keys, data URIs) by their size.
+
+    Args:
+        text: File content
+
+    Returns:
+        The content with each run replaced by "[base64, N chars]"
+    """
+    if len(text) < BASE64_MIN_LENGTH:
+        return text
+
+    def placeholder(run: re.Match[str]) -> str:
+        encoded: str = run.group()
+        # Real base64 mixes cases and digits; "xxxx..." or "----" runs are not base64
+        if re.search(r"[a-z]", encoded) and re.search(r"[A-Z]", encoded) and re.search(r"[0-9]", encoded):
+            return f"[base64, {len(encoded)} chars]"
+        return encoded
+
+    return re.sub(_BASE64_RUN_PATTERN, placeholder, text)
+
+
+def collapse_indentation(text: str) -> str:
+    """Indent by one space per level and drop trailing whitespace.
+
+    The indentation unit is the greatest common divisor of the space
+    indentation widths in the file; each tab counts as one level.
+
+    Args:
+        text: Source code
+
+    Returns:
+        The re-indented source, with the same structure
+    """
+    lines: List[str] = [line.rstrip() for line in text.split("\n")]
+    indents: List[str] = [line[:len(line) - len(line.lstrip(" \t"))] for line in lines]
+    unit: int = 0
+    for indent in indents:
+        unit = math.gcd(unit, indent.count(" "))
+    if unit <= 1 and not any("\t" in indent for indent in indents):
+        return "\n".join(lines)
+    unit = max(unit, 1)
+    return "\n".join(
+        " " * (indent.count("\t") + indent.count(" ") // unit) + line[len(indent):]
+        for line, indent in zip(lines, indents)
+    )
+
+
+def minify_json(text: str) -> str:
+    """Re-serialise JSON without insignificant whitespace.
+
+    Args:
+        text: JSON document
+
+    Returns:
+        The compact JSON, or text unchanged if it is not valid JSON
+    """
+    import json
 
     try:
-        result = subprocess.run(
-            ["git", "diff", "--cached", "--quiet"], capture_output=True
-        )
-        if result.returncode == 0:
-            debug_log("No staged changes found")
-            # No staged changes - mimic git commit output
-            show_git_status()
-            return False
-        debug_log("Found staged changes")
-        return True
-    except subprocess.CalledProcessError:
-        return False
+        return json.dumps(json.loads(text), ensure_ascii=False, separators=(",", ":"))
+    except (ValueError, RecursionError):
+        return text
 
 
-def show_git_status() -> None:
-    """Show git status output similar to what 'git commit' shows."""
-    debug_log("Showing git status")
+def minify_yaml(text: str) -> str:
+    """Shrink YAML's whitespace: one space per indentation level, no blank lines.
 
-    # Get branch name
-    try:
-        branch: str = run_git(["branch", "--show-current"]).strip()
-        if not branch:  # detached HEAD state
-            branch = run_git(["rev-parse", "--short", "HEAD"]).strip()
-            print(f"HEAD detached at {branch}")
-        else:
-            print(f"On branch {branch}")
-    except:
-        print("On branch master")
+    Args:
+        text: YAML document
 
-    # Check if this is initial commit
-    try:
-        run_git(["rev-parse", "HEAD"], check=True)
-    except:
-        print("\nInitial commit\n")
+    Returns:
+        The document with the same structure
+    """
+    return "\n".join(line for line in collapse_indentation(text).split("\n") if line)
 
-    # Get untracked and modified files - don't strip to preserve all lines
-    try:
-        status_output: str = run_git(["status", "--porcelain"])
-
-        untracked: List[str] = []
-        modified: List[str] = []
-        deleted: List[str] = []
-
-        if status_output:
-            # Split on newlines but preserve empty strings to handle all lines
-            lines: List[str] = (
-                status_output.rstrip("\n").split("\n")
-                if status_output.rstrip("\n")
-                else []
-            )
 
-            for line in lines:
-                if not line:
-                    continue
-                # Git status --porcelain format: XY filename
-                # X = staged status, Y = working tree status
-                if len(line) >= 3:
-                    staged_status: str = line[0] if len(line) > 0 else " "
-                    working_status: str = line[1] if len(line) > 1 else " "
-                    filename: str = line[3:] if len(line) > 3 else ""
-
-                    if not filename:
-                        continue
+def unwrap_paragraphs(text: str) -> str:
+    """Join the hard-wrapped lines of Markdown paragraphs.
 
-                    if staged_status == "?" and working_status == "?":
-                        untracked.append(filename)
-                    elif working_status == "M":  # Modified in working tree
-                        modified.append(filename)
-                    elif working_status == "D":  # Deleted in working tree
-                        deleted.append(filename)
-
-        # Show unstaged changes
-        changes_shown: bool = False
-        if modified or deleted:
-            print("Changes not staged for commit:")
-            print('  (use "git add <file>..." to update what will be committed)')
-            print(
-                '  (use "git restore <file>..." to discard changes in working directory)'
-            )
-            for f in sorted(modified):
-                print(f"\tmodified:   {f}")
-            for f in sorted(deleted):
-                print(f"\tdeleted:    {f}")
-            changes_shown = True
-
-        # Show untracked files
-        if untracked:
-            if changes_shown:
-                print()
-            print("Untracked files:")
-            print('  (use "git add <file>..." to include in what will be committed)')
-            for f in sorted(untracked):
-                print(f"\t{f}")
-            changes_shown = True
-
-        # Final message
-        if not changes_shown:
-            print("nothing to commit, working tree clean")
+    Headings, lists, quotes, tables and fenced code are left as they are;
+    a list item's wrapped continuation lines are joined to it.
+
+    Args:
+        text: Markdown document
+
+    Returns:
+        The document with one line per paragraph
+    """
+    lines: List[str] = []
+    in_fence: bool = False
+    joinable: bool = False
+    for line in text.split("\n"):
+        stripped: str = line.strip()
+        if stripped.startswith(("```", "~~~")):
+            in_fence = not in_fence
+        if in_fence or stripped.startswith(("```", "~~~")):
+            lines.append(line.rstrip())
+            joinable = False
+            continue
+        block: bool = bool(re.match(_MARKDOWN_BLOCK_PATTERN, line))
+        if joinable and stripped and not block:
+            lines[-1] += " " + stripped
         else:
-            print()
-            if untracked and not modified and not deleted:
-                print(
-                    'nothing added to commit but untracked files present (use "git add" to track)'
-                )
-            elif modified or deleted:
-                print(
-                    'no changes added to commit (use "git add" and/or "git commit -a")'
-                )
-    except Exception as e:
-        debug_log(f"Error showing git status: {e}")
-        # Fallback to simple message if something goes wrong
-        print("No changes staged for commit")
+            lines.append(line.rstrip())
+        # Headings, tables, rules and hard breaks ("  ") end the line
+        joinable = bool(stripped) and not stripped.startswith(("#", "|")) and not line.endswith("  ") and not (
+            block and re.match(r"[-=*_]{3,}$", stripped)
+        )
+    return "\n".join(lines)
+
+
+# Normalizers applied in order to the content of staged files in the prompt,
+# by file extension, then those under "" for every text file. They keep the
+# meaning of the content but drop tokens the model does not need.
+CONTENT_NORMALIZERS: Dict[str, Tuple[Callable[[str], str], ...]] = {
+    ".json": (minify_json,),
+    ".yaml": (minify_yaml,),
+    ".yml": (minify_yaml,),
+    ".md": (unwrap_paragraphs,),
+    ".markdown": (unwrap_paragraphs,),
+    **{
+        extension: (collapse_indentation,)
+        for extension in (
+            ".py", ".js", ".jsx", ".ts", ".tsx", ".java", ".kt", ".scala", ".go", ".rs", ".c", ".h",
+            ".cc", ".cpp", ".hpp", ".cs", ".swift", ".rb", ".php", ".sh", ".html", ".xml", ".css", ".scss",
+        )
+    },
+    "": (strip_base64,),
+}
 
+# Content longer than this many times max_file_size is not normalized: no
+# normalizer shrinks it enough to fit
+NORMALIZE_MAX_FACTOR: int = 16
 
-def get_binary_file_info(filename: str, amend: bool = False) -> str:
-    """Get information about a binary file.
+# Files whose diffs are shown word by word, see prose_diff()
+PROSE_EXTENSIONS: Tuple[str, ...] = (".md", ".markdown")
+
+
+def normalize_content(filename: str, content: str) -> str:
+    """Apply the CONTENT_NORMALIZERS for a file.
 
     Args:
-        filename: Path to the binary file
-        amend: Whether we're amending a commit
+        filename: File path, for its extension
+        content: File content
 
     Returns:
-        Formatted information about the binary file
+        The normalized content
     """
-    debug_log(f"Getting binary file info for: {filename}")
+    extension: str = os.path.splitext(filename)[1].lower()
+    for normalizer in CONTENT_NORMALIZERS.get(extension, ()) + CONTENT_NORMALIZERS[""]:
+        content = normalizer(content)
+    return content
 
-    info_parts: List[str] = []
 
-    # Get file extension
-    _, ext = os.path.splitext(filename)
-    if ext:
-        info_parts.append(f"File type: {ext}")
+def word_diff(old: str, new: str) -> str:
+    """Mark the words that differ between two texts, like git's --word-diff=plain.
 
-    # Try to get file size from git
-    try:
-        size_output: str
-        if amend:
-            # Try to get size from index first, then HEAD
-            size_output = run_git(["cat-file", "-s", f":{filename}"], check=False)
-            if not size_output or "fatal:" in size_output:
-                size_output = run_git(["cat-file", "-s", f"HEAD:{filename}"], check=False)
-        else:
-            size_output = run_git(["cat-file", "-s", f":{filename}"], check=False)
+    Args:
+        old: Old text
+        new: New text
 
-        if size_output and "fatal:" not in size_output:
-            size_bytes: int = int(size_output.strip())
-            size_str: str
-            # Format size nicely
-            if size_bytes < 1024:
-                size_str = f"{size_bytes} bytes"
-            elif size_bytes < 1024 * 1024:
-                size_str = f"{size_bytes / 1024:.1f} KB"
+    Returns:
+        The new text with removed words as [-...-] and added ones as {+...+}
+    """
+    import difflib
+
+    old_words: List[str] = re.findall(r"\S+\s*", old)
+    new_words: List[str] = re.findall(r"\S+\s*", new)
+    parts: List[str] = []
+    matcher = difflib.SequenceMatcher(None, old_words, new_words, autojunk=False)
+    for tag, old_start, old_end, new_start, new_end in matcher.get_opcodes():
+        added: str = "".join(new_words[new_start:new_end])
+        if tag == "equal":
+            parts.append(added)
+            continue
+        removed: str = "".join(old_words[old_start:old_end])
+        if removed:
+            parts.append(f"[-{removed.rstrip()}-]")
+        if added:
+            parts.append(f"{{+{added.rstrip()}+}}")
+        # Keep the space that followed the changed words
+        changed: str = added or removed
+        parts.append(changed[len(changed.rstrip()):])
+    return "".join(parts).rstrip()
+
+
+def prose_diff(old: str, new: str, files: List[str]) -> str:
+    """Diff two versions of a Markdown file paragraph by paragraph, word by word.
+
+    Re-wrapping a paragraph changes all of its lines but few of its words;
+    after unwrap_paragraphs() only the changed words are shown, in the
+    format of git's --word-diff=plain.
+
+    Args:
+        old: Old document ("" if added)
+        new: New document ("" if deleted)
+        files: The "---" and "+++" file names
+
+    Returns:
+        The word diff, with @@ paragraph ranges
+    """
+    if not old or not new:
+        return unified_diff(unwrap_paragraphs(old), unwrap_paragraphs(new), files)
+
+    import difflib
+
+    old_paragraphs: List[str] = unwrap_paragraphs(old).split("\n")
+    new_paragraphs: List[str] = unwrap_paragraphs(new).split("\n")
+    lines: List[str] = [f"--- {files[0]}", f"+++ {files[1]}"]
+    matcher = difflib.SequenceMatcher(None, old_paragraphs, new_paragraphs, autojunk=False)
+    for group in matcher.get_grouped_opcodes(1):
+        old_first, old_last = group[0][1], group[-1][2]
+        new_first, new_last = group[0][3], group[-1][4]
+        lines.append(
+            f"@@ -{old_first + 1},{old_last - old_first} +{new_first + 1},{new_last - new_first} @@"
+        )
+        for tag, old_start, old_end, new_start, new_end in group:
+            if tag == "equal":
+                lines.extend(new_paragraphs[new_start:new_end])
+                continue
+            pairs: int = min(old_end - old_start, new_end - new_start) if tag == "replace" else 0
+            lines.extend(
+                word_diff(old_paragraphs[old_start + i], new_paragraphs[new_start + i]) for i in range(pairs)
+            )
+            lines.extend(f"[-{paragraph}-]" for paragraph in old_paragraphs[old_start + pairs:old_end] if paragraph)
+            lines.extend(f"{{+{paragraph}+}}" for paragraph in new_paragraphs[new_start + pairs:new_end] if paragraph)
+    return "\n".join(lines) + "\n" if len(lines) > 2 else ""
+
+
+def iter_staged_paths(amend: bool = False) -> Generator[str, None, None]:
+    """Yield the paths of the changes to describe, streamed from git.
+
+    Reads NUL-terminated (-z) output, so names containing newlines or
+    non-ASCII characters arrive unquoted and intact, and names are produced
+    only as fast as the caller consumes them.
+
+    Args:
+        amend: Whether we're amending a commit; the files of the last commit
+            are then included too, deduplicated and sorted
+
+    Yields:
+        Paths relative to the repository root
+    """
+    if not amend:
+        yield from stream_git(["diff", "--cached", "--name-only", "-z"], separator="\0")
+        return
+
+    # One commit's worth of names, plus anything staged since
+    filenames: set[str] = set(
+        stream_git(["diff-tree", "--no-commit-id", "--name-only", "-r", "-z", "HEAD"], separator="\0")
+    )
+    filenames.update(stream_git(["diff", "--cached", "--name-only", "-z"], separator="\0"))
+    yield from sorted(filenames)
+
+
+# Past RunSettings.rollup_files changed files, the files section and the
+# commit template show the ROLLUP_DETAIL_FILES files with the most changed
+# lines one by one and sum up the rest by directory, in at most ROLLUP_GROUPS
+# lines
+ROLLUP_FILES: int = 200
+ROLLUP_DETAIL_FILES: int = 50
+ROLLUP_GROUPS: int = 30
+
+STATUS_WORDS: Dict[str, str] = {
+    "A": "added",
+    "M": "modified",
+    "D": "deleted",
+    "R": "renamed",
+    "C": "copied",
+    "T": "type changed",
+}
+
+
+def short_count(number: int) -> str:
+    """Format a count compactly: 950, 1.2k, 12k, 3.4M."""
+    if number < 1000:
+        return str(number)
+    value: float
+    suffix: str
+    value, suffix = (number / 1_000_000, "M") if number >= 999_500 else (number / 1000, "k")
+    return (f"{value:.1f}".rstrip("0").rstrip(".") if value < 9.95 else f"{value:.0f}") + suffix
+
+
+class _ChangeGroup:
+    """Changed files under a directory, or a few files, for summarize_by_directory()."""
+
+    def __init__(self, label: str, directory: Optional[str] = None) -> None:
+        self.label: str = label
+        # Path of the directory (None: a group that cannot be split further)
+        self.directory: Optional[str] = directory
+        self.subdirectories: Dict[str, _ChangeGroup] = {}
+        self.files: List[StagedEntry] = []
+        self.count: int = 0
+        self.added: int = 0
+        self.deleted: int = 0
+        self.statuses: Counter[str] = Counter()
+        self._parts: Optional[List[_ChangeGroup]] = None
+
+    def add(self, entry: StagedEntry) -> None:
+        self.count += 1
+        self.added += entry.added
+        self.deleted += entry.deleted
+        self.statuses[entry.status] += 1
+
+    def parts(self) -> List[_ChangeGroup]:
+        """Split the group into its subdirectories and files, largest first."""
+        if self._parts is not None:
+            return self._parts
+        parts: List[_ChangeGroup] = []
+        for subdirectory in self.subdirectories.values():
+            # Directories holding only one directory are named by the deepest
+            while len(subdirectory.subdirectories) == 1 and not subdirectory.files:
+                subdirectory = next(iter(subdirectory.subdirectories.values()))
+            if subdirectory.count == 1:
+                entry: StagedEntry = next(_group_entries(subdirectory))
+                subdirectory = _ChangeGroup.of([entry], entry.path)
+            parts.append(subdirectory)
+        if len(self.files) == 1 or not self.subdirectories:
+            parts.extend(_ChangeGroup.of([entry], entry.path) for entry in self.files)
+        elif self.files:
+            files: _ChangeGroup = _ChangeGroup.of(self.files, f"{self.directory}/*" if self.directory else "*")
+            files.directory = self.directory
+            parts.append(files)
+        self._parts = sorted(parts, key=lambda part: -part.count)
+        return self._parts
+
+    @classmethod
+    def of(cls, entries: List[StagedEntry], label: str) -> _ChangeGroup:
+        group: _ChangeGroup = cls(label)
+        group.files = list(entries)
+        for entry in entries:
+            group.add(entry)
+        return group
+
+    def describe(self, line_counts: bool = True) -> str:
+        lines: str = f" (+{short_count(self.added)}/-{short_count(self.deleted)})" if line_counts else ""
+        if self.count == 1 and not self.subdirectories:
+            return f"{self.label} — {STATUS_WORDS.get(next(iter(self.statuses)), 'changed')}{lines}"
+        statuses: List[str] = [
+            f"{count:,} {STATUS_WORDS.get(status, 'changed')}" for status, count in self.statuses.most_common()
+        ]
+        if len(statuses) == 1:
+            return f"{self.label} — {self.count:,} files {statuses[0].partition(' ')[2]}{lines}"
+        return f"{self.label} — {self.count:,} files: {', '.join(statuses)}{lines}"
+
+
+def summarize_by_directory(
+    entries: List[StagedEntry], max_groups: int = ROLLUP_GROUPS, line_counts: bool = True
+) -> List[str]:
+    """Sum up changed files by directory, e.g. "src/gen/** — 1,842 files modified (+12k/-11k)".
+
+    Builds a tree of the paths and, starting from the root, splits the
+    largest group into its subdirectories and files for as long as the
+    result fits in max_groups lines.
+
+    Args:
+        entries: Changed files
+        max_groups: Lines to write at most
+        line_counts: Whether the entries carry line counts to add up
+
+    Returns:
+        One line per group, sorted by path, the rest of the files last
+    """
+    root: _ChangeGroup = _ChangeGroup("**", "")
+    for entry in entries:
+        node: _ChangeGroup = root
+        names: List[str] = entry.path.split("/")
+        for depth, name in enumerate(names[:-1], 1):
+            child: Optional[_ChangeGroup] = node.subdirectories.get(name)
+            if child is None:
+                directory: str = "/".join(names[:depth])
+                child = node.subdirectories[name] = _ChangeGroup(f"{directory}/**", directory)
+            node = child
+        node.add(entry)
+        node.files.append(entry)
+    # Add up the totals of subdirectories, deepest first
+    nodes: List[_ChangeGroup] = [root]
+    for node in nodes:
+        nodes.extend(node.subdirectories.values())
+    for node in reversed(nodes):
+        for child in node.subdirectories.values():
+            node.count += child.count
+            node.added += child.added
+            node.deleted += child.deleted
+            node.statuses.update(child.statuses)
+
+    groups: List[_ChangeGroup] = [root]
+    # Smallest parts of the one group when even its split does not fit
+    other: Optional[_ChangeGroup] = None
+    split: Optional[List[_ChangeGroup]] = [root]
+    while split is not None:
+        split = None
+        room: int = max_groups - len(groups) + 1
+        for group in sorted(groups, key=lambda group: -group.count):
+            # Only a few files are listed one by one rather than as a directory
+            if group.directory is None or group.count == 1 or (not group.subdirectories and group.count > 4):
+                continue
+            parts: List[_ChangeGroup] = group.parts()
+            if len(parts) <= room:
+                split = parts
+            elif len(groups) == 1 and room > 1:
+                folded: List[_ChangeGroup] = parts[room - 1:]
+                other = _ChangeGroup.of(
+                    [entry for part in folded for entry in _group_entries(part)], f"{len(folded):,} other paths"
+                )
+                split = parts[:room - 1] + [other]
             else:
-                size_str = f"{size_bytes / (1024 * 1024):.1f} MB"
-            info_parts.append(f"Size: {size_str}")
-    except:
-        pass
+                continue
+            groups.remove(group)
+            groups.extend(split)
+            break
+    return [
+        group.describe(line_counts) for group in sorted(groups, key=lambda group: (group is other, group.label))
+    ]
 
-    # Common binary file type descriptions
-    binary_descriptions: Dict[str, str] = {
-        ".jpg": "JPEG image",
-        ".jpeg": "JPEG image",
-        ".png": "PNG image",
-        ".gif": "GIF image",
-        ".webp": "WebP image",
-        ".svg": "SVG vector image",
-        ".ico": "Icon file",
-        ".pdf": "PDF document",
-        ".zip": "ZIP archive",
-        ".tar": "TAR archive",
-        ".gz": "Gzip compressed file",
-        ".exe": "Windows executable",
-        ".dll": "Dynamic link library",
-        ".so": "Shared object library",
-        ".dylib": "Dynamic library (macOS)",
-        ".mp3": "MP3 audio",
-        ".mp4": "MP4 video",
-        ".avi": "AVI video",
-        ".mov": "QuickTime video",
-        ".ttf": "TrueType font",
-        ".woff": "Web font",
-        ".woff2": "Web font 2.0",
-        ".db": "Database file",
-        ".sqlite": "SQLite database",
-    }
 
-    if ext.lower() in binary_descriptions:
-        info_parts.append(f"Description: {binary_descriptions[ext.lower()]}")
+def _group_entries(group: _ChangeGroup) -> Iterator[StagedEntry]:
+    """Yield the files of a group and its subdirectories."""
+    yield from group.files
+    for subdirectory in group.subdirectories.values():
+        yield from _group_entries(subdirectory)
 
-    # Check if it's a new file or modified
-    try:
-        if amend:
-            # Check if file exists in parent commit
-            run_git(["cat-file", "-e", f"HEAD^:{filename}"], check=True)
-            info_parts.append("Status: Modified")
-        else:
-            # Check if file exists in HEAD
-            run_git(["cat-file", "-e", f"HEAD:{filename}"], check=True)
-            info_parts.append("Status: Modified")
-    except:
-        info_parts.append("Status: New file")
 
+def rollup_changes(
+    entries: List[StagedEntry], skip: Optional[SkipMatcher] = None
+) -> Tuple[List[StagedEntry], List[str]]:
+    """Pick the files to show one by one from a long list of changes.
+
+    Args:
+        entries: Changed files, with line counts
+        skip: Files whose content is left out of the prompt; they are
+            summed up rather than picked
+
+    Returns:
+        The ROLLUP_DETAIL_FILES files with the most changed lines, in their
+        original order, and summarize_by_directory() lines for the others
+    """
+    ranked: List[int] = sorted(
+        range(len(entries)),
+        key=lambda i: (skip is not None and skip.match(entries[i].path) is not None, -entries[i].added - entries[i].deleted),
+    )
+    picked: Set[int] = set(ranked[:ROLLUP_DETAIL_FILES])
     return (
-        "\n".join(info_parts)
-        if info_parts
-        else "Binary file (no additional information available)"
+        [entries[i] for i in sorted(picked)],
+        summarize_by_directory([entry for i, entry in enumerate(entries) if i not in picked]),
     )
 
 
-def get_staged_files(amend: bool = False, allow_empty: bool = False, skip_patterns: Optional[List[str]] = None) -> str:
-    """Get list of staged files with their staged contents.
+# Files over max_file_size are excerpted: their first and last lines and the
+# lines around changed hunks, with this many unchanged lines of context.
+# At most LARGE_FILE_READ_LIMIT bytes of such a file, and of its diff, are read.
+EXCERPT_CONTEXT_LINES: int = 3
+LARGE_FILE_READ_LIMIT: int = 8 * 1024 * 1024
+
+_HUNK_HEADER_PATTERN = r"@@ -\S+ \+(\d+)(?:,(\d+))? @@"
+
+
+def read_text_prefix(args: List[str], max_bytes: int) -> Tuple[str, Optional[Iterator[str]]]:
+    """Read git output up to a size, leaving the rest of it unread.
 
     Args:
-        amend: Whether we're amending a commit
-        allow_empty: Whether this is an empty commit
-        skip_patterns: List of glob patterns to exclude from AI prompt
+        args: git arguments
+        max_bytes: Bytes to read at most, give or take a chunk
 
     Returns:
-        Formatted string with file contents
+        Tuple of (text read, None) if the whole output fit in max_bytes;
+        otherwise the text read so far and an iterator over the remaining
+        chunks, which stops git when closed
     """
-    if skip_patterns is None:
-        skip_patterns = []
-    debug_log(f"Getting staged files - amend: {amend}, allow_empty: {allow_empty}")
+    chunks: Iterator[str] = stream_git_text(args, check=False)
+    read: List[str] = []
+    size: int = 0
+    for chunk in chunks:
+        read.append(chunk)
+        size += len(chunk) if chunk.isascii() else len(chunk.encode("utf-8"))
+        if size > max_bytes:
+            return "".join(read), chunks
+    return "".join(read), None
 
-    files_output: str
-    if amend:
-        # For --amend, get files from the last commit plus any newly staged files
-        # First, get files from the last commit
-        last_commit_files: str = run_git(
-            ["diff-tree", "--no-commit-id", "--name-only", "-r", "HEAD"]
-        ).strip()
-        # Then, get any newly staged files
-        staged_files: str = run_git(["diff", "--cached", "--name-only"]).strip()
-
-        # Combine and deduplicate
-        all_filenames: set[str] = set()
-        if last_commit_files:
-            all_filenames.update(last_commit_files.split("\n"))
-        if staged_files:
-            all_filenames.update(staged_files.split("\n"))
-
-        files_output = "\n".join(sorted(all_filenames))
-    else:
-        files_output = run_git(["diff", "--cached", "--name-only"]).strip()
 
-    debug_log(f"Found {len(files_output.split()) if files_output else 0} staged files")
+def changed_line_ranges(filename: str, amend: bool = False) -> List[Tuple[int, int]]:
+    """Find the lines of a staged file that the commit changes.
 
-    if not files_output:
-        if allow_empty:
-            return "# No files changed (empty commit)"
-        return ""
+    Reads hunk headers from a diff without context, up to
+    LARGE_FILE_READ_LIMIT bytes of it. Added files give no ranges.
 
-    all_files: List[str] = []
-    total_files_size: int = 0  # Track total size of all file contents
-
-    for filename in files_output.split("\n"):
-        if filename:
-            # Check if file matches any skip pattern
-            skip_file = False
-            skip_pattern_matched = None
-            for pattern in skip_patterns:
-                if fnmatch(filename, pattern):
-                    debug_log(f"Skipping file content for {filename} (matches pattern: {pattern})")
-                    skip_file = True
-                    skip_pattern_matched = pattern
-                    break
+    Args:
+        filename: File path
+        amend: Whether we're amending a commit (compare with HEAD's parent)
+
+    Returns:
+        (first, last) line ranges in the staged file, 1-based; a deletion
+        gives the line before it
+    """
+    ranges: List[Tuple[int, int]] = []
+    read: int = 0
+    lines: Iterator[str] = stream_git(
+        # Added files are changed throughout; leaving them out spares git diffing them
+        ["diff", "--cached", "-U0", "--diff-filter=M"] + (["HEAD^"] if amend else []) + ["--", filename],
+        check=False,
+    )
+    for line in lines:
+        read += len(line) + 1
+        if line.startswith("@@"):
+            hunk = re.match(_HUNK_HEADER_PATTERN, line)
+            if hunk:
+                first: int = max(int(hunk.group(1)), 1)
+                ranges.append((first, first + max(int(hunk.group(2) or 1), 1) - 1))
+        if read > LARGE_FILE_READ_LIMIT:
+            break
+    if isinstance(lines, Generator):
+        lines.close()
+    return ranges
+
+
+def large_file_excerpt(
+    chunks: Iterable[str], max_bytes: int, changed: List[Tuple[int, int]]
+) -> Tuple[List[str], int, bool]:
+    """Excerpt a file too large to include whole.
+
+    Keeps the first and last lines (a quarter of max_bytes each) and the
+    lines around changed hunks (half of max_bytes); the rest is only
+    counted, so memory stays proportional to max_bytes. Reading stops after
+    LARGE_FILE_READ_LIMIT bytes, and the end of the file is then left out.
+
+    Args:
+        chunks: File content split anywhere
+        max_bytes: Size of the excerpt, roughly
+        changed: Changed line ranges, see changed_line_ranges()
 
-            if skip_file:
-                # Include filename but not content
-                all_files.append(f"{filename} (skipped: matches pattern '{skip_pattern_matched}')\n```\nFile content excluded from AI prompt\n```\n")
+    Returns:
+        Tuple of (excerpt lines, with notes where lines were left out;
+        bytes read; whether the whole file was read)
+    """
+    regions: List[Tuple[int, int]] = sorted(
+        (first - EXCERPT_CONTEXT_LINES, last + EXCERPT_CONTEXT_LINES) for first, last in changed
+    )
+    # Longer lines (minified code, data) are cut
+    line_limit: int = max(max_bytes // 8, 40)
+    head_budget: int = max_bytes // 4
+    region_budget: int = max_bytes // 2
+    tail_budget: int = max_bytes // 4
+    head_open: bool = True
+    kept: List[Tuple[int, str]] = []
+    tail: deque[Tuple[int, str, int]] = deque()
+    tail_bytes: int = 0
+    region: int = 0
+    number: int = 0
+    read_bytes: int = 0
+    complete: bool = True
+    pending: str = ""
+
+    for chunk in chain(chunks, [None]):
+        if chunk is None:
+            lines: List[str] = [pending] if pending else []
+        else:
+            read_bytes += len(chunk) if chunk.isascii() else len(chunk.encode("utf-8"))
+            lines = (pending + chunk).split("\n")
+            pending = lines.pop()
+        for line in lines:
+            number += 1
+            if len(line) > line_limit:
+                line = line[:line_limit] + " [... line cut ...]"
+            cost: int = len(line) + 1
+            if head_open and cost <= head_budget:
+                kept.append((number, line))
+                head_budget -= cost
                 continue
+            head_open = False
+            while region < len(regions) and regions[region][1] < number:
+                region += 1
+            if region < len(regions) and regions[region][0] <= number and cost <= region_budget:
+                kept.append((number, line))
+                region_budget -= cost
+                continue
+            tail.append((number, line, cost))
+            tail_bytes += cost
+            while tail_bytes > tail_budget:
+                tail_bytes -= tail.popleft()[2]
+        if chunk is not None and read_bytes > LARGE_FILE_READ_LIMIT:
+            complete = False
+            break
+
+    if complete:
+        kept.extend((tail_number, line) for tail_number, line, _ in tail)
+    excerpt: List[str] = []
+    previous: int = 0
+    for line_number, line in sorted(kept):
+        if line_number > previous + 1:
+            excerpt.append(f"[... {line_number - previous - 1} lines omitted ...]")
+        excerpt.append(line)
+        previous = line_number
+    if not complete:
+        excerpt.append("[... rest of the file not read ...]")
+    elif number > previous:
+        excerpt.append(f"[... {number - previous} lines omitted ...]")
+    return excerpt, read_bytes, complete
+
+
+def get_staged_files(
+    amend: bool = False,
+    allow_empty: bool = False,
+    skip_patterns: Optional[List[str]] = None,
+    settings: Optional[RunSettings] = None,
+) -> str:
+    """Get list of staged files with their staged contents.
 
-            try:
-                # Check if file is binary
-                is_binary_check: str
-                if amend:
-                    # For amend, check if file exists in index first, then HEAD
-                    is_binary_check = run_git(
-                        ["diff", "--cached", "--numstat", "--", filename], check=False
-                    )
-                    if not is_binary_check or "fatal:" in is_binary_check:
+    Args:
+        amend: Whether we're amending a commit
+        allow_empty: Whether this is an empty commit
+        skip_patterns: List of glob patterns to exclude from AI prompt, in
+            addition to settings.skip
+        settings: Settings for this run (default: the active run's)
+
+    Returns:
+        Formatted string with file contents
+    """
+    settings = settings or active_settings()
+    limits: Limits = settings.limits
+    with run_context(settings):
+        debug_log(f"Getting staged files - amend: {amend}, allow_empty: {allow_empty}")
+
+        paths: Generator[str, None, None]
+        # Partial clones and sparse indexes: list every change with its blob
+        # id up front rather than looking each path up in the index and HEAD
+        entries: Optional[Dict[str, StagedEntry]] = None
+        if settings.layout.read_by_object_id:
+            entries = list_staged_entries(amend)
+            paths = (path for path in entries)
+        else:
+            paths = iter_staged_paths(amend)
+
+        first_path: Optional[str] = next(paths, None)
+        if first_path is None:
+            debug_log("Found 0 staged files")
+            if allow_empty:
+                return "# No files changed (empty commit)"
+            return ""
+
+        skip: Optional[SkipMatcher] = settings.skip
+        if skip_patterns:
+            skip = (skip or SkipMatcher()).with_globs(skip_patterns)
+
+        all_files: List[str] = []
+        total_files_size: int = 0  # Track total size of all file contents
+        # Stop listing files once the section would crowd out the diff; the
+        # rest of the names are then never read from git
+        listing_budget: int = max(limits.max_total_files, limits.max_prompt_size - limits.max_diff_size)
+        listed_chars: int = 0
+        listed_files: int = 0
+
+        def add_entry(entry: str) -> None:
+            nonlocal listed_chars
+            all_files.append(entry)
+            listed_chars += len(entry)
+
+        names: Iterator[str] = chain([first_path], paths)
+        if settings.rollup_files:
+            head: List[str] = [first_path] + list(islice(paths, settings.rollup_files))
+            names = chain(head, paths)
+            changes: List[StagedEntry] = []
+            if len(head) > settings.rollup_files:
+                changes = list((entries if entries is not None else list_staged_entries(amend)).values())
+            if changes:
+                paths.close()
+                detailed, summary = rollup_changes(changes, skip)
+                debug_log(f"Listing {len(detailed)} of {len(changes)} staged files, summing up the rest by directory")
+                add_entry(
+                    f"# {len(changes):,} files changed. The {len(detailed)} with the most changed lines follow; "
+                    f"the other {len(changes) - len(detailed):,} by directory:\n" + "\n".join(summary) + "\n"
+                )
+                names = (entry.path for entry in detailed)
+                count_event("file_list_rolled_up")
+
+        for filename in names:
+            if listed_chars >= listing_budget:
+                debug_log(f"Files section reached {listed_chars} chars after {listed_files} files, not listing the rest")
+                all_files.append("# ... more files changed; not listed to stay within the prompt size limit\n")
+                count_event("file_list_truncated")
+                paths.close()
+                break
+            listed_files += 1
+            if filename:
+                # Check if file matches any skip pattern
+                skip_pattern_matched: Optional[str] = skip.match(filename) if skip else None
+                if skip_pattern_matched is not None:
+                    debug_log(f"Skipping file content for {filename} (matches pattern: {skip_pattern_matched})")
+                    # Include filename but not content
+                    add_entry(f"{filename} (skipped: matches pattern '{skip_pattern_matched}')\n```\nFile content excluded from AI prompt\n```\n")
+                    continue
+
+                try:
+                    entry: Optional[StagedEntry] = entries.get(filename) if entries is not None else None
+                    # Check if file is binary
+                    is_binary_check: str
+                    if entry is not None:
+                        is_binary_check = "-" if entry.binary else ""
+                    elif amend:
+                        # For amend, check if file exists in index first, then HEAD
                         is_binary_check = run_git(
-                            ["diff", "HEAD^", "HEAD", "--numstat", "--", filename], check=False
+                            ["diff", "--cached", "--numstat", "--", filename], check=False
                         )
-                else:
-                    is_binary_check = run_git(
-                        ["diff", "--cached", "--numstat", "--", filename], check=False
-                    )
-
-                # Git shows '-' for binary files in numstat
-                if is_binary_check and is_binary_check.strip().startswith("-"):
-                    # It's a binary file
-                    file_info: str = get_binary_file_info(filename, amend)
-                    all_files.append(
-                        f"{filename} (binary file)\n```\n{file_info}\n```\n"
-                    )
-                else:
-                    # It's a text file, get its content
-                    staged_content: str
-                    if amend:
-                        # Try staged version first, then fall back to HEAD version
-                        staged_content = run_git(
-                            ["show", f":{filename}"], check=False
-                        )
-                        if not staged_content or "fatal:" in staged_content:
-                            # Fall back to HEAD version
-                            staged_content = run_git(
-                                ["show", f"HEAD:{filename}"], check=False
+                        if not is_binary_check or "fatal:" in is_binary_check:
+                            is_binary_check = run_git(
+                                ["diff", "HEAD^", "HEAD", "--numstat", "--", filename], check=False
                             )
-                        staged_content = staged_content.strip()
                     else:
-                        # Get the staged content of the file (what's in the index)
-                        staged_content = run_git(
-                            ["show", f":{filename}"], check=False
-                        ).strip()
-
-                    # Redact any secrets in file content before including in debug logs
-                    file_size = len(staged_content.encode('utf-8'))
-                    debug_log(f"Processing file {filename} with content length: {len(staged_content)} chars, {file_size} bytes")
-
-                    # Check per-file size limit
-                    if file_size > MAX_FILE_SIZE:
-                        size_kb = file_size / 1024
-                        limit_kb = MAX_FILE_SIZE / 1024
-                        debug_log(f"File {filename} exceeds per-file size limit ({size_kb:.1f}KB > {limit_kb:.1f}KB), including metadata only")
-                        file_info_msg = f"File too large ({size_kb:.1f}KB, limit: {limit_kb:.1f}KB) - content excluded from AI prompt"
-                        all_files.append(f"{filename} (large file)\n```\n{file_info_msg}\n```\n")
-                    # Check total files size limit
-                    elif total_files_size + file_size > MAX_TOTAL_FILES:
-                        remaining_kb = (MAX_TOTAL_FILES - total_files_size) / 1024
-                        debug_log(f"Adding {filename} would exceed total files limit, including metadata only (remaining budget: {remaining_kb:.1f}KB)")
-                        file_info_msg = f"File skipped to stay within total size limit ({MAX_TOTAL_FILES / 1024:.0f}KB) - content excluded from AI prompt"
-                        all_files.append(f"{filename} (size limit)\n```\n{file_info_msg}\n```\n")
-                    elif staged_content or staged_content == "":  # Include empty files too
-                        all_files.append(f"{filename}\n```\n{staged_content}\n```\n")
-                        total_files_size += file_size
-                        debug_log(f"Added {filename} ({file_size} bytes), total files size now: {total_files_size} bytes")
-            except Exception as e:
-                debug_log(f"Error processing file {filename}: {e}")
-                # File might be newly added or have other issues, skip it
-                continue
+                        is_binary_check = run_git(
+                            ["diff", "--cached", "--numstat", "--", filename], check=False
+                        )
+
+                    # Git shows '-' for binary files in numstat
+                    if is_binary_check and is_binary_check.strip().startswith("-"):
+                        # It's a binary file
+                        file_info: str = get_binary_file_info(filename, amend, entry=entry)
+                        all_files.append(
+                            f"{filename} (binary file)\n```\n{file_info}\n```\n"
+                        )
+                    else:
+                        # It's a text file, get its content. Files over the
+                        # limit (after normalizing) are only read in part
+                        read_limit: int = limits.max_file_size * (NORMALIZE_MAX_FACTOR if settings.normalize else 1)
+                        if filename.endswith(NOTEBOOK_EXTENSIONS):
+                            # Outputs make up most of a notebook and are dropped when rendering
+                            read_limit = max(read_limit, LARGE_FILE_READ_LIMIT)
+                        staged_content: str
+                        # Unread remainder of a file larger than read_limit
+                        rest: Optional[Iterator[str]] = None
+                        if entry is not None:
+                            blob: Optional[str] = read_blob(entry.oid)
+                            if blob is None:
+                                debug_log(f"Blob of {filename} is not available locally, including metadata only")
+                                file_info_msg = "Content not available locally (partial clone) - content excluded from AI prompt"
+                                add_entry(f"{filename} (not fetched)\n```\n{file_info_msg}\n```\n")
+                                count_event("blob_not_fetched")
+                                continue
+                            if entry.binary is None and "\0" in blob:
+                                file_info = get_binary_file_info(filename, amend, entry=entry)
+                                add_entry(f"{filename} (binary file)\n```\n{file_info}\n```\n")
+                                continue
+                            staged_content = blob
+                        elif amend:
+                            # Try staged version first, then fall back to HEAD version
+                            staged_content, rest = read_text_prefix(["show", f":{filename}"], read_limit)
+                            if not staged_content or "fatal:" in staged_content:
+                                # Fall back to HEAD version
+                                staged_content, rest = read_text_prefix(["show", f"HEAD:{filename}"], read_limit)
+                        else:
+                            # Get the staged content of the file (what's in the index)
+                            staged_content, rest = read_text_prefix(["show", f":{filename}"], read_limit)
+                        raw_content: str = staged_content
+                        if rest is None:
+                            staged_content = staged_content.strip()
+
+                        if rest is None and filename.endswith(NOTEBOOK_EXTENSIONS):
+                            notebook: Optional[str] = render_notebook(staged_content)
+                            if notebook is not None:
+                                debug_log(f"Rendered notebook {filename} from {len(staged_content)} to {len(notebook)} chars")
+                                staged_content = notebook.strip()
+                        # Files that cannot shrink under the limit are not worth normalizing
+                        if rest is None and settings.normalize and len(staged_content) <= read_limit:
+                            staged_content = normalize_content(filename, staged_content)
+
+                        # Redact any secrets in file content before including in debug logs
+                        file_size = len(staged_content.encode('utf-8'))
+                        debug_log(f"Processing file {filename} with content length: {len(staged_content)} chars, {file_size} bytes")
+
+                        # Check per-file size limit
+                        if rest is not None or file_size > limits.max_file_size:
+                            # Excerpt the text that would have been sent: the
+                            # rendered notebook or normalized file, if it was
+                            # read whole and changed by that
+                            excerpt_source: str = raw_content
+                            changed: List[Tuple[int, int]] = changed_line_ranges(filename, amend)
+                            if rest is None and staged_content != raw_content.strip():
+                                excerpt_source = staged_content
+                                if staged_content.count("\n") != raw_content.strip().count("\n"):
+                                    # Line numbers of the changes no longer apply
+                                    changed = []
+                            excerpt_lines, read_bytes, complete = large_file_excerpt(
+                                chain([excerpt_source], rest or ()),
+                                limits.max_file_size // 2,
+                                changed,
+                            )
+                            if isinstance(rest, Generator):
+                                # Stop git instead of waiting for it to be collected
+                                rest.close()
+                            excerpt: str = "\n".join(excerpt_lines)
+                            excerpt_size: int = len(excerpt.encode("utf-8"))
+                            size_text: str = (
+                                f"{read_bytes / 1024:.1f}KB" if complete else f"over {read_bytes / 1024:.0f}KB"
+                            )
+                            limit_kb = limits.max_file_size / 1024
+                            count_event("file_too_large")
+                            if total_files_size + excerpt_size > limits.max_total_files:
+                                debug_log(f"File {filename} exceeds per-file size limit ({size_text} > {limit_kb:.1f}KB), including metadata only")
+                                file_info_msg = f"File too large ({size_text}, limit: {limit_kb:.1f}KB) - content excluded from AI prompt"
+                                add_entry(f"{filename} (large file)\n```\n{file_info_msg}\n```\n")
+                            else:
+                                debug_log(f"File {filename} exceeds per-file size limit ({size_text} > {limit_kb:.1f}KB), including a {excerpt_size} byte excerpt")
+                                file_info_msg = f"File too large ({size_text}, limit: {limit_kb:.1f}KB) - excerpt of its first and last lines and the lines around changes:"
+                                add_entry(f"{filename} (large file)\n```\n{file_info_msg}\n{excerpt}\n```\n")
+                                total_files_size += excerpt_size
+                        # Check total files size limit
+                        elif total_files_size + file_size > limits.max_total_files:
+                            remaining_kb = (limits.max_total_files - total_files_size) / 1024
+                            debug_log(f"Adding {filename} would exceed total files limit, including metadata only (remaining budget: {remaining_kb:.1f}KB)")
+                            file_info_msg = f"File skipped to stay within total size limit ({limits.max_total_files / 1024:.0f}KB) - content excluded from AI prompt"
+                            add_entry(f"{filename} (size limit)\n```\n{file_info_msg}\n```\n")
+                            count_event("file_over_budget")
+                        elif staged_content or staged_content == "":  # Include empty files too
+                            add_entry(f"{filename}\n```\n{staged_content}\n```\n")
+                            total_files_size += file_size
+                            debug_log(f"Added {filename} ({file_size} bytes), total files size now: {total_files_size} bytes")
+                except Exception as e:
+                    debug_log(f"Error processing file {filename}: {e}")
+                    # File might be newly added or have other issues, skip it
+                    continue
 
-    debug_log(f"Total files content size: {total_files_size} bytes ({total_files_size / 1024:.1f}KB)")
-    return "\n".join(all_files) if all_files else "# No files changed (empty commit)"
+        debug_log(f"Listed {listed_files} staged files")
+        debug_log(f"Total files content size: {total_files_size} bytes ({total_files_size / 1024:.1f}KB)")
+        return "\n".join(all_files) if all_files else "# No files changed (empty commit)"
 
 
-def get_git_diff(amend: bool = False, allow_empty: bool = False) -> str:
-    """Get the git diff of staged changes, with binary file handling.
+@dataclass(frozen=True)
+class SubmoduleChange:
+    """A staged change of the commit a submodule points to."""
+
+    path: str
+    # Commit before the change ("" when the submodule is added)
+    old: str
+    # Commit after the change ("" when the submodule is removed)
+    new: str
+
+
+# Mode of a gitlink, the tree entry recording a submodule's commit
+SUBMODULE_MODE: str = "160000"
+
+
+def list_submodule_changes(root: str, amend: bool = False) -> List[SubmoduleChange]:
+    """List the submodules whose commit the staged changes move.
+
+    Submodules are found through .gitmodules, so a repository without one
+    costs a single file read and no git call. Submodules whose entry was
+    removed from .gitmodules are not listed.
 
     Args:
-        amend: Whether we're amending a commit
-        allow_empty: Whether this is an empty commit
+        root: Work tree root
+        amend: Whether we're amending a commit (compare with HEAD's parent)
 
     Returns:
-        Formatted diff string
+        Changed submodules, in path order
     """
-    debug_log(f"Getting git diff - amend: {amend}, allow_empty: {allow_empty}")
+    modules: Dict[str, str] = read_git_config_file(os.path.join(root, ".gitmodules"))
+    paths: List[str] = [
+        value for key, value in modules.items() if key.startswith("submodule.") and key.endswith(".path")
+    ]
+    if not paths:
+        return []
 
-    diff: str
+    base: List[str] = []
     if amend:
-        # For --amend, show the diff of the last commit plus any new staged changes
-        # Get the parent of HEAD (or use empty tree if it's the first commit)
-        try:
-            parent: str = run_git(["rev-parse", "HEAD^"]).strip()
-            # Diff from parent to current index (staged changes + last commit)
-            diff = run_git(["diff", f"{parent}..HEAD"]).strip()
-            # Also include any newly staged changes
-            staged_diff: str = run_git(["diff", "--cached"]).strip()
-            if staged_diff:
-                diff = (
-                    f"{diff}\n\n# Additional staged changes:\n{staged_diff}"
-                    if diff
-                    else staged_diff
-                )
-        except:
-            # First commit, use empty tree
-            diff = run_git(["diff", "--cached"]).strip()
+        parent: str = run_git(["rev-parse", "--verify", "--quiet", "HEAD^"], check=False).strip()
+        base = [parent] if parent else []
+    output: str = run_git(
+        ["diff", "--cached", "--raw", "-z", "--no-abbrev", "--no-renames"] + base
+        + ["--"] + [f":(top,literal){path}" for path in paths],
+        check=False,
+    )
+    fields: List[str] = output.split("\0")
+    changes: List[SubmoduleChange] = []
+    for header, path in zip(fields[0::2], fields[1::2]):
+        parts: List[str] = header.lstrip(":").split()
+        if len(parts) < 5 or SUBMODULE_MODE not in parts[:2]:
+            continue
+        changes.append(SubmoduleChange(
+            path=path,
+            old=parts[2] if parts[0] == SUBMODULE_MODE else "",
+            new=parts[3] if parts[1] == SUBMODULE_MODE else "",
+        ))
+    return changes
+
+
+def summarize_submodule(change: SubmoduleChange, root: str, settings: RunSettings) -> List[str]:
+    """Summarise the commits a submodule change brings in or drops.
+
+    Runs git log inside the submodule's checkout, within
+    SUBMODULE_TIME_BUDGET seconds and without fetching missing objects.
+
+    Args:
+        change: The submodule change
+        root: Work tree root of the superproject
+        settings: Settings of the run
+
+    Returns:
+        Summary lines: a heading, then up to SUBMODULE_LOG_LIMIT commits
+        prefixed with "+" (brought in) or "-" (dropped)
+    """
+    limit: int = SUBMODULE_LOG_LIMIT
+    if not change.new:
+        return [f"{change.path}: removed (was {change.old[:7]})"]
+    if change.old:
+        heading: str = f"{change.path}: {change.old[:7]}..{change.new[:7]}"
+        log_args: List[str] = [
+            "log", "--oneline", "--no-decorate", "--left-right", f"-n{limit + 1}", f"{change.old}...{change.new}",
+        ]
     else:
-        diff = run_git(["diff", "--cached"]).strip()
+        heading = f"{change.path}: added at {change.new[:7]}"
+        log_args = ["log", "--oneline", "--no-decorate", f"-n{limit + 1}", change.new]
 
-    diff_size_bytes = len(diff.encode('utf-8'))
-    debug_log(f"Diff size: {len(diff)} characters, {diff_size_bytes} bytes ({diff_size_bytes / 1024:.1f}KB)")
+    submodule_dir: str = os.path.join(root, change.path)
+    if find_git_dir(submodule_dir) is None:
+        return [f"{heading} (not checked out)"]
 
-    if not diff and allow_empty:
-        return "```\n# No changes (empty commit)\n```"
+    submodule_settings: RunSettings = replace(
+        settings, cwd=submodule_dir, git_timeout=SUBMODULE_TIME_BUDGET, lazy_fetch=False
+    )
+    with run_context(submodule_settings), profile_span("submodule", path=change.path):
+        try:
+            commits: List[str] = run_git(log_args).splitlines()
+        except subprocess.TimeoutExpired:
+            return [f"{heading} (log timed out after {SUBMODULE_TIME_BUDGET:g}s)"]
+        except (subprocess.CalledProcessError, OSError):
+            return [f"{heading} (commits not available locally)"]
 
-    # Check if diff exceeds size limit
-    if diff_size_bytes > MAX_DIFF_SIZE:
-        # Truncate diff intelligently: keep beginning and end
-        lines = diff.split("\n")
-        total_lines = len(lines)
+    count: str = f"more than {limit}" if len(commits) > limit else str(len(commits))
+    lines: List[str] = [f"{heading} ({count} commit{'' if len(commits) == 1 else 's'})"]
+    for commit in commits[:limit]:
+        sign: str = "-" if commit.startswith("<") else "+"
+        lines.append(f"  {sign} {commit.lstrip('<> ')}")
+    if len(commits) > limit:
+        lines.append("  ...")
+    return lines
 
-        # Calculate how many lines we can keep (approximation)
-        avg_line_size = diff_size_bytes / total_lines if total_lines > 0 else 100
-        lines_to_keep = int(MAX_DIFF_SIZE / avg_line_size * 0.9)  # 90% to be safe
 
-        if lines_to_keep < 20:
-            lines_to_keep = 20  # Minimum 20 lines
+def summarize_submodule_changes(amend: bool = False) -> str:
+    """Describe staged submodule updates by their commit logs.
 
-        # Keep first and last portions
-        keep_start = lines_to_keep // 2
-        keep_end = lines_to_keep // 2
+    A diff shows a submodule update only as a pair of "Subproject commit"
+    lines. This lists the commits in between for each changed submodule,
+    looking the submodules up concurrently on a thread pool.
 
-        truncated_lines = (
-            lines[:keep_start] +
-            [
-                "",
-                f"# ... [TRUNCATED: {total_lines - lines_to_keep} lines omitted, diff too large] ...",
-                f"# Original size: {diff_size_bytes / 1024:.1f}KB, limit: {MAX_DIFF_SIZE / 1024:.1f}KB",
-                ""
-            ] +
-            lines[-keep_end:]
-        )
+    Args:
+        amend: Whether we're amending a commit
+
+    Returns:
+        "# "-prefixed summary lines, or "" if no submodule changed
+    """
+    settings: RunSettings = active_settings()
+    root: Optional[str] = find_work_tree(settings.cwd)
+    if not root or not os.path.isfile(os.path.join(root, ".gitmodules")):
+        return ""
+    changes: List[SubmoduleChange] = list_submodule_changes(root, amend)
+    if not changes:
+        return ""
+    debug_log(f"Summarizing {len(changes)} submodule changes")
 
-        diff = "\n".join(truncated_lines)
-        debug_log(f"Diff truncated from {total_lines} lines to {len(truncated_lines)} lines")
+    from concurrent.futures import ThreadPoolExecutor
 
-    # Process the diff to add information about binary files
-    diff_lines: List[str] = diff.split("\n") if diff else []
-    processed_lines: List[str] = []
-    i: int = 0
+    with ThreadPoolExecutor(max_workers=min(SUBMODULE_WORKERS, len(changes))) as pool:
+        futures = [pool.submit(summarize_submodule, change, root, settings) for change in changes]
+        summaries: List[List[str]] = [future.result() for future in futures]
+    lines: List[str] = ["# Submodule changes:"]
+    lines.extend(f"# {line}" for summary in summaries for line in summary)
+    return "\n".join(lines)
 
-    while i < len(diff_lines):
-        line: str = diff_lines[i]
-
-        # Check for binary file indicators
-        if line.startswith("Binary files"):
-            # Extract filename from the binary files line
-            # Format: "Binary files a/path/file and b/path/file differ"
-            parts: List[str] = line.split(" ")
-            if len(parts) >= 4:
-                file_a: str = parts[2].lstrip("a/")
-                file_b: str = parts[4].lstrip("b/")
-                # Use the 'b/' version as it's the new version
-                filename: str = file_b if file_b != "/dev/null" else file_a
-
-                # Add enhanced binary file information
+
+def get_git_diff(amend: bool = False, allow_empty: bool = False, settings: Optional[RunSettings] = None) -> str:
+    """Get the git diff of staged changes, with binary file handling.
+
+    Args:
+        amend: Whether we're amending a commit
+        allow_empty: Whether this is an empty commit
+        settings: Settings for this run (default: the active run's)
+
+    Returns:
+        Formatted diff string
+    """
+    settings = settings or active_settings()
+    limits: Limits = settings.limits
+    with run_context(settings):
+        debug_log(f"Getting git diff - amend: {amend}, allow_empty: {allow_empty}")
+
+        # The diff is streamed into a bounded buffer, so a huge change costs
+        # memory proportional to max_diff_size, not to the size of the change
+        excerpt: ExcerptBuffer = ExcerptBuffer(limits.max_diff_size)
+        # Once the diff outgrows its budget, hunks repeating earlier changes
+        # are dropped before they take up space
+        repeated: HunkDeduplicator = HunkDeduplicator(limits.max_diff_size)
+        if amend:
+            # For --amend, show the diff of the last commit plus any new staged changes
+            # Get the parent of HEAD (or use empty tree if it's the first commit)
+            try:
+                parent: str = run_git(["rev-parse", "HEAD^"]).strip()
+                # Diff from parent to current index (staged changes + last commit)
+                for chunk in repeated.filter(rewrite_diff_sections(stream_git_text(["diff", f"{parent}..HEAD"]))):
+                    excerpt.feed(chunk)
+                excerpt.flush()
+                # Also include any newly staged changes
+                staged_diff: Iterator[str] = repeated.filter(rewrite_diff_sections(stream_git_text(["diff", "--cached"])))
+                first_chunk: Optional[str] = next(staged_diff, None)
+                if first_chunk is not None:
+                    if excerpt.total_lines:
+                        excerpt.extend(["", "# Additional staged changes:"])
+                    excerpt.feed(first_chunk)
+                    for chunk in staged_diff:
+                        excerpt.feed(chunk)
+            except:
+                # First commit, use empty tree
+                excerpt = ExcerptBuffer(limits.max_diff_size)
+                repeated = HunkDeduplicator(limits.max_diff_size)
+                for chunk in repeated.filter(rewrite_diff_sections(stream_git_text(["diff", "--cached"]))):
+                    excerpt.feed(chunk)
+        else:
+            for chunk in repeated.filter(rewrite_diff_sections(stream_git_text(["diff", "--cached"]))):
+                excerpt.feed(chunk)
+        excerpt.flush()
+
+        debug_log(f"Diff size: {excerpt.total_lines} lines, {excerpt.total_bytes} bytes ({excerpt.total_bytes / 1024:.1f}KB)")
+
+        if not excerpt.total_lines and allow_empty:
+            return "```\n# No changes (empty commit)\n```"
+
+        if excerpt.truncated:
+            debug_log(f"Diff truncated from {excerpt.total_lines} lines, {excerpt.omitted_lines} lines omitted")
+            count_event("diff_truncated")
+
+        # Process the diff to add information about binary files
+        diff_lines: List[str] = excerpt.lines()
+        processed_lines: List[str] = []
+        i: int = 0
+
+        while i < len(diff_lines):
+            line: str = diff_lines[i]
+
+            # Check for binary file indicators
+            if line.startswith("Binary files"):
+                # Extract filename from the binary files line
+                # Format: "Binary files a/path/file and b/path/file differ"
+                parts: List[str] = line.split(" ")
+                if len(parts) >= 4:
+                    file_a: str = parts[2].lstrip("a/")
+                    file_b: str = parts[4].lstrip("b/")
+                    # Use the 'b/' version as it's the new version
+                    filename: str = file_b if file_b != "/dev/null" else file_a
+
+                    # Add enhanced binary file information
+                    processed_lines.append(line)
+                    processed_lines.append(f"# Binary file: {filename}")
+
+                    # Try to get more info about the binary file
+                    binary_info: str = get_binary_file_info(filename, amend)
+                    for info_line in binary_info.split("\n"):
+                        processed_lines.append(f"# {info_line}")
+            else:
                 processed_lines.append(line)
-                processed_lines.append(f"# Binary file: {filename}")
 
-                # Try to get more info about the binary file
-                binary_info: str = get_binary_file_info(filename, amend)
-                for info_line in binary_info.split("\n"):
-                    processed_lines.append(f"# {info_line}")
-        else:
-            processed_lines.append(line)
+            i += 1
 
-        i += 1
+        if repeated.dropped_hunks:
+            debug_log(f"Dropped {repeated.dropped_hunks} hunks repeating earlier changes")
+            count_event("hunks_deduplicated", repeated.dropped_hunks)
+            processed_lines.extend(["", repeated.summary()])
+
+        submodules: str = summarize_submodule_changes(amend)
+        if submodules:
+            processed_lines.extend(["", submodules])
 
-    processed_diff: str = "\n".join(processed_lines) if processed_lines else diff
-    return f"```\n{processed_diff}\n```"
+        processed_diff: str = "\n".join(processed_lines)
+        return f"```\n{processed_diff}\n```"
 
 
 def get_git_editor() -> str:
@@ -1165,102 +4758,428 @@ def show_dry_run_summary(args: argparse.Namespace) -> None:
         print(f"Error: Failed to run git commit --dry-run: {e}")
         sys.exit(1)
 
-def make_api_request(config: Dict[str, Any], message: str) -> str:
+class KeepAliveOpener:
+    """Drop-in replacement for urlopen() that reuses HTTP(S) connections.
+
+    Idle connections are pooled per scheme, host and port, so consecutive
+    requests to the same API endpoint skip the TCP and TLS handshakes.
+    Errors are raised as URLError/HTTPError, like urlopen(). Safe to share
+    between threads; each request checks a connection out of the pool.
+    """
+
+    def __init__(self) -> None:
+        import http.client  # noqa: F401 (used by _checkout and __call__)
+
+        self._idle: Dict[Tuple[str, str, Optional[int]], List[http.client.HTTPConnection]] = {}
+        self._lock = threading.Lock()
+
+    def _checkout(
+        self, key: Tuple[str, str, Optional[int]], timeout: float
+    ) -> Tuple[http.client.HTTPConnection, bool]:
+        """Take an idle connection from the pool, or open a new one.
+
+        Returns:
+            Tuple of (connection, whether it was reused)
+        """
+        with self._lock:
+            idle = self._idle.get(key)
+            if idle:
+                conn = idle.pop()
+                if conn.sock is not None:
+                    conn.sock.settimeout(timeout)
+                return conn, True
+
+        import http.client
+
+        scheme, host, port = key
+        if scheme == "https":
+            return http.client.HTTPSConnection(host, port, timeout=timeout), False
+        return http.client.HTTPConnection(host, port, timeout=timeout), False
+
+    def _checkin(self, key: Tuple[str, str, Optional[int]], conn: http.client.HTTPConnection) -> None:
+        with self._lock:
+            self._idle.setdefault(key, []).append(conn)
+
+    def __call__(self, req: Request, timeout: float = REQ_TIMEOUT) -> addinfourl:
+        """Send a request, reusing a pooled connection when one is idle.
+
+        Args:
+            req: Request to send
+            timeout: Socket timeout in seconds
+
+        Returns:
+            Response with the body already read, usable as a context manager
+
+        Raises:
+            HTTPError: If the server answers with a 4xx or 5xx status
+            URLError: If the connection fails
+        """
+        import http.client
+        from urllib.error import HTTPError, URLError
+        from urllib.parse import urlsplit
+        from urllib.response import addinfourl
+
+        parts = urlsplit(req.full_url)
+        key: Tuple[str, str, Optional[int]] = (parts.scheme, parts.hostname or "", parts.port)
+        path: str = parts.path or "/"
+        if parts.query:
+            path += "?" + parts.query
+
+        while True:
+            conn, reused = self._checkout(key, timeout)
+            try:
+                if conn.sock is None:
+                    # DNS, TCP and (for https) TLS handshake
+                    with profile_span("http.connect", scheme=key[0], host=key[1]):
+                        conn.connect()
+                with profile_span("http.ttfb", reused=reused):
+                    conn.request(req.get_method(), path, body=req.data, headers=dict(req.header_items()))
+                    response = conn.getresponse()
+                with profile_span("http.download", status=response.status) as span:
+                    body: bytes = response.read()
+                    if span is not None:
+                        span["bytes"] = len(body)
+                break
+            except (OSError, http.client.HTTPException) as e:
+                conn.close()
+                # The server may have closed a pooled connection while it sat idle
+                if reused and isinstance(e, (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError)):
+                    debug_log("Pooled connection was closed by the server, reconnecting")
+                    continue
+                raise URLError(e)
+
+        if response.will_close:
+            conn.close()
+        else:
+            self._checkin(key, conn)
+
+        if response.status >= 400:
+            raise HTTPError(req.full_url, response.status, response.reason, response.headers, None)
+        return addinfourl(io.BytesIO(body), response.headers, req.full_url, response.status)
+
+    def close(self) -> None:
+        """Close all idle connections."""
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for conns in idle.values():
+            for conn in conns:
+                conn.close()
+
+
+@dataclass
+class Completion:
+    """A successful API response."""
+
+    content: str
+    # Token counts reported by the API (prompt_tokens, completion_tokens, ...)
+    usage: Dict[str, int] = field(default_factory=dict)
+    attempts: int = 1
+
+
+# The prompt is escaped into the request body this many characters at a time
+REQUEST_BODY_SEGMENT: int = 64 * 1024
+
+
+def build_request_body(model: str, prompt: str) -> bytearray:
+    """Encode a chat completion request as JSON.
+
+    The prompt is JSON-escaped one segment at a time straight into the
+    body, so besides the prompt itself there is only the body, not the
+    payload dict, json.dumps() string and encoded copy of it. The bytes
+    are the same as json.dumps() of the payload, UTF-8 encoded.
+
+    Args:
+        model: Model name
+        prompt: Prompt, sent as the one user message
+
+    Returns:
+        Request body, to send as is on every attempt
+    """
+    import json
+    from json.encoder import encode_basestring_ascii
+
+    body: bytearray = bytearray(b'{"model": ')
+    body += json.dumps(model).encode("utf-8")
+    body += b', "messages": [{"role": "user", "content": "'
+    for start in range(0, len(prompt), REQUEST_BODY_SEGMENT):
+        body += encode_basestring_ascii(prompt[start:start + REQUEST_BODY_SEGMENT])[1:-1].encode("ascii")
+    body += b'"}]}'
+    return body
+
+
+# Request bodies of at least this many bytes are gzipped for endpoints listed
+# in the gzip_requests setting
+GZIP_MIN_BYTES: int = 16 * 1024
+GZIP_LEVEL: int = 6
+
+# Endpoints that answered 415 to a gzipped body, by URL, in the cache
+# directory. They are sent plain bodies until the entry is this old.
+ENDPOINTS_FILE: str = "endpoints.json"
+GZIP_RECHECK_SECONDS: int = 30 * 24 * 60 * 60
+
+
+def wants_gzip(api_url: str, hosts: List[str]) -> bool:
+    """Check whether requests to an endpoint are configured to be gzipped.
+
+    Args:
+        api_url: API endpoint URL
+        hosts: Parsed gzip_requests setting
+
+    Returns:
+        True if the host of api_url is listed, or every host is
+    """
+    from urllib.parse import urlsplit
+
+    return "*" in hosts or (urlsplit(api_url).hostname or "").lower() in hosts
+
+
+def _read_endpoints(path: str) -> Dict[str, Any]:
+    import json
+
+    try:
+        with open(path, encoding="utf-8") as f:
+            endpoints: Any = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return endpoints if isinstance(endpoints, dict) else {}
+
+
+def gzip_refused(api_url: str, path: Optional[str] = None) -> bool:
+    """Check whether an endpoint recently refused a gzipped request body.
+
+    Args:
+        api_url: API endpoint URL
+        path: Endpoints file (default: ENDPOINTS_FILE in the cache directory)
+
+    Returns:
+        True if the endpoint answered 415 within GZIP_RECHECK_SECONDS
+    """
+    path = path or os.path.join(get_cache_dir(), ENDPOINTS_FILE)
+    entry: Any = _read_endpoints(path).get(api_url)
+    if not isinstance(entry, dict) or not isinstance(entry.get("gzip_refused"), (int, float)):
+        return False
+    return bool(time.time() - entry["gzip_refused"] < GZIP_RECHECK_SECONDS)
+
+
+def remember_gzip_refused(api_url: str, path: Optional[str] = None) -> None:
+    """Record that an endpoint refused a gzipped request body.
+
+    Failures are logged and otherwise ignored; the next run then tries
+    gzip again.
+
+    Args:
+        api_url: API endpoint URL
+        path: Endpoints file (default: ENDPOINTS_FILE in the cache directory)
+    """
+    import json
+
+    path = path or os.path.join(get_cache_dir(), ENDPOINTS_FILE)
+    endpoints: Dict[str, Any] = _read_endpoints(path)
+    entry: Any = endpoints.get(api_url)
+    endpoints[api_url] = dict(entry if isinstance(entry, dict) else {}, gzip_refused=int(time.time()))
+    tmp_path: str = f"{path}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(endpoints, f)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        debug_log(f"Could not write {path}: {e}")
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+
+
+def request_completion(
+    config: Dict[str, Any],
+    message: str,
+    settings: Optional[RunSettings] = None,
+    opener: Optional[Callable[..., Any]] = None,
+) -> Completion:
     """Make API request with retry logic.
 
     Args:
         config: Configuration dictionary with API settings
         message: Prompt message to send to API
+        settings: Settings for this run (default: the active run's)
+        opener: Callable used instead of urlopen(), such as a KeepAliveOpener
 
     Returns:
-        Generated commit message from AI
+        Generated commit message with the token usage reported by the API
 
     Raises:
-        SystemExit: On API failure after retries
+        APIRequestError: On a client error, or on failure after all retries
     """
-    debug_log(f"Making API request to {config['api_url']} with model {config['model']}")
-    debug_log(f"Prompt length: {len(message)} characters")
+    import json
+    from urllib.error import HTTPError, URLError
+    from urllib.request import Request
+
+    settings = settings or active_settings()
+    with run_context(settings), ExitStack() as cleanup:
+        if opener is None and settings.profiler is not None:
+            from urllib.request import getproxies
+
+            # urlopen() can't time the connection, TTFB and download separately
+            if not getproxies():
+                opener = KeepAliveOpener()
+                cleanup.callback(opener.close)
+        open_url: Callable[..., Any] = opener or _lazy("urlopen")
+
+        debug_log(f"Making API request to {config['api_url']} with model {config['model']}")
+        debug_log(f"Prompt length: {len(message)} characters")
+
+        # Encoded once and sent with a Content-Length on every attempt
+        body: bytearray = build_request_body(config["model"], message)
+        debug_log(f"Request body: {len(body)} bytes")
+
+        # Create request with headers (will be redacted in debug output)
+        headers: Dict[str, str] = {
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {config['api_key']}",
+        }
 
-    delay: float = RETRY_DELAY
-    last_error: Optional[Exception] = None
+        # Large bodies are compressed once for endpoints configured for it,
+        # unless the endpoint has refused gzip before
+        data: Union[bytes, bytearray] = body
+        if (
+            len(body) >= GZIP_MIN_BYTES
+            and wants_gzip(config["api_url"], config.get("gzip_requests") or [])
+            and not gzip_refused(config["api_url"])
+        ):
+            import gzip
+
+            data = gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+            headers["Content-Encoding"] = "gzip"
+            debug_log(f"Request body gzipped to {len(data)} bytes")
+            count_event("request_gzipped")
+
+        # Log headers with explicitly redacted auth
+        safe_headers = dict(headers)
+        if "Authorization" in safe_headers:
+            safe_headers["Authorization"] = "Bearer [REDACTED]"
+        debug_log(f"Request headers: {safe_headers}")
+
+        delay: float = settings.retry_delay
+        last_error: Optional[Exception] = None
+
+        attempt: int = 0
+        while attempt < settings.max_retries:
+            attempt += 1
+            debug_log(f"API request attempt {attempt}/{settings.max_retries}")
+            if settings.metrics is not None:
+                settings.metrics.attempts += 1
+
+            try:
+                req: Request = Request(config["api_url"], data=data, headers=headers)
+
+                with profile_span("http.request", url=config["api_url"], attempt=attempt), \
+                        open_url(req, timeout=settings.timeout) as response:
+                    payload: Dict[str, Any] = json.loads(response.read().decode("utf-8"))
+                    result: str = payload["choices"][0]["message"]["content"]
+
+                    # Check for empty response
+                    if not result or not result.strip():
+                        raise ValueError("API returned empty response")
+
+                    debug_log(f"API request successful on attempt {attempt}, response length: {len(result)} characters")
+                    usage: Dict[str, int] = {
+                        key: value for key, value in (payload.get("usage") or {}).items()
+                        if isinstance(value, int)
+                    }
+                    if settings.metrics is not None:
+                        settings.metrics.usage = usage
+                    return Completion(content=result, usage=usage, attempts=attempt)
+
+            except (URLError, HTTPError) as e:
+                last_error = e
+                error_msg: str = str(e)
+
+                # Check if it's an HTTP error with a status code
+                if isinstance(e, HTTPError):
+                    error_msg = f"HTTP {e.code}: {e.reason}"
+                    # 415 Unsupported Media Type: send the plain body instead,
+                    # without using up an attempt
+                    if e.code == 415 and data is not body:
+                        debug_log("Endpoint refused the gzipped body, sending it uncompressed")
+                        remember_gzip_refused(config["api_url"])
+                        count_event("gzip_refused")
+                        data = body
+                        del headers["Content-Encoding"]
+                        attempt -= 1
+                        continue
+                    # Don't retry on client errors (4xx)
+                    if 400 <= e.code < 500:
+                        debug_log(f"API request failed with client error, not retrying: {error_msg}")
+                        raise APIRequestError(f"API request failed: {error_msg}")
 
-    for attempt in range(1, MAX_RETRIES + 1):
-        debug_log(f"API request attempt {attempt}/{MAX_RETRIES}")
+                debug_log(f"API request attempt {attempt} failed: {error_msg}")
 
-        try:
-            payload: Dict[str, Any] = {
-                "model": config["model"],
-                "messages": [{"role": "user", "content": message}],
-            }
+                if attempt < settings.max_retries:
+                    debug_log(f"Retrying in {delay} seconds...")
+                    time.sleep(delay)
+                    delay *= settings.retry_backoff
 
-            # Create request with headers (will be redacted in debug output)
-            headers: Dict[str, str] = {
-                "Content-Type": "application/json",
-                "Authorization": f"Bearer {config['api_key']}",
-            }
+            except KeyboardInterrupt:
+                # User pressed Ctrl+C, exit immediately without retry
+                debug_log("API request interrupted by user")
+                raise
 
-            # Log headers with explicitly redacted auth
-            safe_headers = dict(headers)
-            if "Authorization" in safe_headers:
-                safe_headers["Authorization"] = "Bearer [REDACTED]"
-            debug_log(f"Request headers: {safe_headers}")
+            except (KeyError, IndexError, json.JSONDecodeError, ValueError) as e:
+                last_error = e
+                error_type = "empty" if isinstance(e, ValueError) else "parse"
+                debug_log(f"Failed to {error_type} API response on attempt {attempt}: {e}")
 
-            req: Request = Request(
-                config["api_url"],
-                data=json.dumps(payload).encode("utf-8"),
-                headers=headers,
-            )
+                if attempt < settings.max_retries:
+                    debug_log(f"Retrying in {delay} seconds...")
+                    time.sleep(delay)
+                    delay *= settings.retry_backoff
 
-            with urlopen(req, timeout=REQ_TIMEOUT) as response:
-                data: Dict[str, Any] = json.loads(response.read().decode("utf-8"))
-                result: str = data["choices"][0]["message"]["content"]
+        # All retries exhausted
+        debug_log(f"All {settings.max_retries} API request attempts failed")
+        raise APIRequestError(f"Failed to make API request after {settings.max_retries} attempts: {last_error}")
 
-                # Check for empty response
-                if not result or not result.strip():
-                    raise ValueError("API returned empty response")
 
-                debug_log(f"API request successful on attempt {attempt}, response length: {len(result)} characters")
-                return result
+def make_api_request(config: Dict[str, Any], message: str, settings: Optional[RunSettings] = None) -> str:
+    """Make API request with retry logic.
 
-        except (URLError, HTTPError) as e:
-            last_error = e
-            error_msg: str = str(e)
+    Args:
+        config: Configuration dictionary with API settings
+        message: Prompt message to send to API
+        settings: Settings for this run (default: the active run's)
 
-            # Check if it's an HTTP error with a status code
-            if isinstance(e, HTTPError):
-                error_msg = f"HTTP {e.code}: {e.reason}"
-                # Don't retry on client errors (4xx)
-                if 400 <= e.code < 500:
-                    debug_log(f"API request failed with client error, not retrying: {error_msg}")
-                    print(f"Error: API request failed: {error_msg}")
-                    sys.exit(1)
+    Returns:
+        Generated commit message from AI
 
-            debug_log(f"API request attempt {attempt} failed: {error_msg}")
+    Raises:
+        APIRequestError: On a client error, or on failure after all retries
+    """
+    return request_completion(config, message, settings=settings).content
 
-            if attempt < MAX_RETRIES:
-                debug_log(f"Retrying in {delay} seconds...")
-                time.sleep(delay)
-                delay *= RETRY_BACKOFF
 
-        except KeyboardInterrupt:
-            # User pressed Ctrl+C, exit immediately without retry
-            debug_log("API request interrupted by user")
-            raise
+def status_comment_lines(status: str) -> List[str]:
+    """Turn git --name-status output into commit template comments.
 
-        except (KeyError, IndexError, json.JSONDecodeError, ValueError) as e:
-            last_error = e
-            error_type = "empty" if isinstance(e, ValueError) else "parse"
-            debug_log(f"Failed to {error_type} API response on attempt {attempt}: {e}")
+    Past RunSettings.rollup_files files, the files are summed up by
+    directory (see summarize_by_directory()). Line counts would take a
+    --numstat diff of every file, so the summary only counts files.
 
-            if attempt < MAX_RETRIES:
-                debug_log(f"Retrying in {delay} seconds...")
-                time.sleep(delay)
-                delay *= RETRY_BACKOFF
+    Args:
+        status: Output of git diff --name-status or git diff-tree --name-status
 
-    # All retries exhausted
-    debug_log(f"All {MAX_RETRIES} API request attempts failed")
-    print(f"Error: Failed to make API request after {MAX_RETRIES} attempts: {last_error}")
-    sys.exit(1)
+    Returns:
+        Comment lines without newlines
+    """
+    lines: List[str] = [line for line in status.split("\n") if line]
+    threshold: int = active_settings().rollup_files
+    if not threshold or len(lines) <= threshold:
+        return [f"# {line}" for line in lines]
+    changes: List[StagedEntry] = [
+        StagedEntry(line.rpartition("\t")[2], line[:1], "") for line in lines
+    ]
+    return [f"# {len(changes):,} files, by directory:"] + [
+        f"#   {line}" for line in summarize_by_directory(changes, line_counts=False)
+    ]
 
 
 def create_commit_message_file(
@@ -1376,9 +5295,8 @@ def create_commit_message_file(
                     ["diff-tree", "--no-commit-id", "--name-status", "-r", "HEAD"]
                 )
                 if last_commit_files:
-                    for line in last_commit_files.split("\n"):
-                        if line:
-                            f.write(f"# {line}\n")
+                    for line in status_comment_lines(last_commit_files):
+                        f.write(f"{line}\n")
             except:
                 pass
 
@@ -1387,9 +5305,8 @@ def create_commit_message_file(
             if staged_status.strip():
                 f.write("# \n")
                 f.write("# Additional staged changes:\n")
-                for line in staged_status.split("\n"):
-                    if line:
-                        f.write(f"# {line}\n")
+                for line in status_comment_lines(staged_status):
+                    f.write(f"{line}\n")
         elif allow_empty:
             # For empty commits, note that there are no changes
             f.write("# No changes to be committed (empty commit)\n")
@@ -1397,9 +5314,8 @@ def create_commit_message_file(
             f.write("# Changes to be committed:\n")
             # Get staged files status
             status: str = run_git(["diff", "--cached", "--name-status"])
-            for line in status.split("\n"):
-                if line:
-                    f.write(f"# {line}\n")
+            for line in status_comment_lines(status):
+                f.write(f"{line}\n")
         f.write("#\n")
 
         # Add verbose diff if requested
@@ -1411,28 +5327,36 @@ def create_commit_message_file(
             f.write("# Diff of changes to be committed:\n")
             f.write("#\n")
 
-            # Get the appropriate diff
-            diff_output: str
+            # Stream the diff into the file as comments; it is never held in memory
+            wrote_diff: bool = False
             if amend:
                 # For amend, show diff from parent to current state
                 try:
                     parent: str = run_git(["rev-parse", "HEAD^"]).strip()
-                    diff_output = run_git(["diff", f"{parent}..HEAD"])
+                    for text in comment_text(stream_git_text(["diff", f"{parent}..HEAD"])):
+                        f.write(text)
+                        wrote_diff = True
                     # Also include any newly staged changes
-                    staged_diff: str = run_git(["diff", "--cached"])
-                    if staged_diff.strip():
-                        diff_output += "\n# Additional staged changes:\n" + staged_diff
+                    staged_diff: Iterator[str] = stream_git_text(["diff", "--cached"])
+                    first_chunk: Optional[str] = next(staged_diff, None)
+                    if first_chunk is not None:
+                        f.write("# \n# # Additional staged changes:\n")
+                        for text in comment_text(chain([first_chunk], staged_diff)):
+                            f.write(text)
+                        wrote_diff = True
                 except:
                     # First commit or other issue, just show staged
-                    diff_output = run_git(["diff", "--cached"])
+                    for text in comment_text(stream_git_text(["diff", "--cached"])):
+                        f.write(text)
+                        wrote_diff = True
             else:
                 # Normal commit, show staged changes
-                diff_output = run_git(["diff", "--cached"])
+                for text in comment_text(stream_git_text(["diff", "--cached"])):
+                    f.write(text)
+                    wrote_diff = True
 
-            # Add diff as comments
-            if diff_output:
-                for line in diff_output.split("\n"):
-                    f.write(f"# {line}\n")
+            if wrote_diff:
+                f.write("# \n")
             elif allow_empty:
                 f.write("# No changes (empty commit)\n")
 
@@ -1452,6 +5376,8 @@ def open_editor(filepath: str, editor: str) -> None:
     """
     debug_log(f"Opening editor: {editor} {filepath}")
 
+    import shlex
+
     try:
         # Use POSIX splitting except on Windows for better compatibility
         cmd: List[str] = shlex.split(editor, posix=(os.name != "nt")) + [filepath]
@@ -1537,16 +5463,466 @@ def is_commit_message_empty(filepath: str) -> bool:
         return True
 
 
+def split_ai_warnings(text: str) -> Tuple[str, List[str]]:
+    """Separate the commit message from the AI's comment-line warnings.
+
+    Consecutive comment lines form one warning, e.g. the "WARNING", "Found
+    in" and "Details" lines the default prompt asks for.
+
+    Args:
+        text: Raw response from the API
+
+    Returns:
+        Tuple of (commit message, list of warnings without the "#" markers)
+    """
+    message_lines: List[str] = []
+    warnings: List[str] = []
+    block: List[str] = []
+
+    for line in text.splitlines():
+        if line.lstrip().startswith("#"):
+            block.append(line.lstrip().lstrip("#").strip())
+            continue
+        if block:
+            warnings.append("\n".join(block))
+            block = []
+        message_lines.append(line)
+    if block:
+        warnings.append("\n".join(block))
+
+    return "\n".join(message_lines).strip(), warnings
+
+
+@dataclass
+class CommitResult:
+    """Outcome of CommitAI.generate()."""
+
+    # Commit message without the AI's warning comments
+    message: str
+    warnings: List[str]
+    # Unmodified API response
+    raw: str
+    model: str
+    # Seconds spent per phase: config, prompt, diff, files, scrub, api, total
+    timings: Dict[str, float]
+    # Token counts reported by the API
+    usage: Dict[str, int]
+    prompt_size: int
+    # Secrets scrubbed from the prompt, by kind
+    redactions: Dict[str, int] = field(default_factory=dict)
+
+
+class CommitAI:
+    """Reusable session for generating commit messages from Python.
+
+    Keeps each repository's parsed configuration, storage layout (see
+    detect_repo_layout()) and prompt template, and the HTTP connections to
+    the API, across calls, so a long-running process avoids the per-commit
+    startup cost of the command line tool::
+
+        with CommitAI(repo="/path/to/repo") as ai:
+            result = ai.generate(context="Fix login redirect")
+            print(result.message)
+
+    API settings not passed to the constructor come from the environment and
+    config files, as for the command line tool. Sessions are safe to share
+    between threads. Call reload() after changing config files or templates.
+    """
+
+    # Prompt templates kept per session, keyed by repository, context and amend
+    TEMPLATE_CACHE_SIZE: int = 64
+
+    def __init__(
+        self,
+        repo: Optional[str] = None,
+        api_key: Optional[str] = None,
+        api_url: Optional[str] = None,
+        model: Optional[str] = None,
+        debug: bool = False,
+        scrub_secrets: Optional[bool] = None,
+        keep_alive: bool = True,
+    ) -> None:
+        """Create a session.
+
+        Args:
+            repo: Default repository for generate() (default: the process cwd)
+            api_key: API key, overriding GIT_COMMIT_AI_KEY
+            api_url: API URL, overriding GIT_COMMIT_AI_URL
+            model: Model name, overriding GIT_COMMIT_AI_MODEL and config files
+            debug: Whether to log debug output for this session's runs
+            scrub_secrets: Override the scrub_secrets setting
+            keep_alive: Whether to reuse HTTP connections between requests
+        """
+        import argparse
+        from urllib.request import getproxies
+
+        self.repo: Optional[str] = repo
+        self.debug: bool = debug
+        self.scrub_secrets: Optional[bool] = scrub_secrets
+        self._overrides = argparse.Namespace(api_key=api_key, api_url=api_url, model=model)
+        # urlopen() already handles proxies from the environment
+        self._opener: Optional[KeepAliveOpener] = KeepAliveOpener() if keep_alive and not getproxies() else None
+        self._lock = threading.Lock()
+        self._configs: Dict[str, Dict[str, Any]] = {}
+        self._layouts: Dict[str, RepoLayout] = {}
+        self._templates: Dict[Tuple[str, Optional[str], bool], str] = {}
+
+    def __enter__(self) -> CommitAI:
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """Close pooled HTTP connections."""
+        if self._opener is not None:
+            self._opener.close()
+
+    def reload(self) -> None:
+        """Forget cached configuration, repository layouts and prompt templates."""
+        with self._lock:
+            self._configs.clear()
+            self._layouts.clear()
+            self._templates.clear()
+
+    def config(self, repo: Optional[str] = None) -> Dict[str, Any]:
+        """Get the configuration for a repository, loading it on first use.
+
+        Args:
+            repo: Repository path (default: the session's)
+
+        Returns:
+            Configuration dictionary as returned by get_env_config()
+
+        Raises:
+            ConfigError: If no API key is configured
+        """
+        path: str = self._resolve(repo)
+        with self._lock:
+            config: Optional[Dict[str, Any]] = self._configs.get(path)
+        if config is None:
+            with run_context(RunSettings(cwd=path, debug=self.debug)):
+                config = get_env_config(self._overrides)
+            if self.scrub_secrets is not None:
+                config["scrub_secrets"] = self.scrub_secrets
+            with self._lock:
+                self._configs[path] = config
+        return config
+
+    def _resolve(self, repo: Optional[str]) -> str:
+        return os.path.abspath(repo or self.repo or os.getcwd())
+
+    def _layout(self, path: str) -> RepoLayout:
+        with self._lock:
+            layout: Optional[RepoLayout] = self._layouts.get(path)
+        if layout is None:
+            layout = detect_repo_layout(path)
+            with self._lock:
+                self._layouts[path] = layout
+        return layout
+
+    def _template(self, path: str, config: Dict[str, Any], args: argparse.Namespace, settings: RunSettings) -> str:
+        key: Tuple[str, Optional[str], bool] = (path, args.message, args.amend)
+        with self._lock:
+            template: Optional[str] = self._templates.get(key)
+        if template is None:
+            template = build_ai_prompt(config["repo_config"], args, settings=settings)
+            with self._lock:
+                if len(self._templates) >= self.TEMPLATE_CACHE_SIZE:
+                    # Drop the oldest entry (dicts keep insertion order)
+                    del self._templates[next(iter(self._templates))]
+                self._templates[key] = template
+        return template
+
+    def generate(
+        self,
+        repo: Optional[str] = None,
+        context: Optional[str] = None,
+        amend: bool = False,
+        allow_empty: bool = False,
+        skip: Optional[List[str]] = None,
+    ) -> CommitResult:
+        """Generate a commit message for the staged changes of a repository.
+
+        Nothing is committed; use the returned message with git commit.
+
+        Args:
+            repo: Repository path (default: the session's)
+            context: Additional context about the commit, like -m
+            amend: Describe the previous commit plus staged changes, like --amend
+            allow_empty: Allow an empty commit, like --allow-empty
+            skip: Glob patterns of files to leave out of the prompt, like
+                --skip, in addition to the repository's .gitcommitaiignore
+
+        Returns:
+            The generated message with warnings, timings and token usage
+
+        Raises:
+            CommitAIError: If nothing is staged, configuration is missing, or
+                the API request fails
+        """
+        import argparse
+
+        path: str = self._resolve(repo)
+        timings: Dict[str, float] = {}
+        started: float = time.perf_counter()
+        mark: float = started
+
+        def lap(phase: str) -> None:
+            nonlocal mark
+            now: float = time.perf_counter()
+            timings[phase] = now - mark
+            mark = now
+
+        config: Dict[str, Any] = self.config(path)
+        lap("config")
+
+        settings: RunSettings = RunSettings(
+            limits=config["limits"],
+            cwd=path,
+            debug=self.debug,
+            skip=load_skip_matcher(path).with_globs(skip or []),
+            layout=self._layout(path),
+        )
+        args: argparse.Namespace = argparse.Namespace(message=context, amend=amend)
+        base_prompt: str = self._template(path, config, args, settings)
+        lap("prompt")
+
+        git_diff: str = get_git_diff(amend=amend, allow_empty=allow_empty, settings=settings)
+        if not git_diff.strip("`\n") and not allow_empty:
+            raise CommitAIError("no changes added to commit")
+        lap("diff")
+
+        all_files: str = get_staged_files(amend=amend, allow_empty=allow_empty, settings=settings)
+        lap("files")
+
+        redactions: Dict[str, int] = {}
+        if config.get("scrub_secrets", True):
+            git_diff, diff_findings = scrub_prompt_secrets(git_diff)
+            all_files, file_findings = scrub_prompt_secrets(all_files)
+            redactions = dict(Counter(diff_findings) + Counter(file_findings))
+        lap("scrub")
+
+        prompt: str = assemble_prompt(base_prompt, config["repo_config"], git_diff, all_files)
+        completion: Completion = request_completion(config, prompt, settings=settings, opener=self._opener)
+        lap("api")
+        timings["total"] = time.perf_counter() - started
+
+        message, warnings = split_ai_warnings(completion.content)
+        return CommitResult(
+            message=message,
+            warnings=warnings,
+            raw=completion.content,
+            model=config["model"],
+            timings=timings,
+            usage=completion.usage,
+            prompt_size=len(prompt.encode("utf-8")),
+            redactions=redactions,
+        )
+
+
+def commit_command(args: argparse.Namespace) -> List[str]:
+    """Build the git commit command for the parsed arguments, without -F.
+
+    Args:
+        args: Parsed command line arguments
+
+    Returns:
+        git commit argv
+    """
+    commit_cmd: List[str] = ["git", "commit"]
+
+    if args.amend:
+        commit_cmd.append("--amend")
+
+    if args.no_verify:
+        commit_cmd.append("--no-verify")
+
+    if args.allow_empty:
+        commit_cmd.append("--allow-empty")
+
+    if args.author:
+        commit_cmd.extend(["--author", args.author])
+
+    if args.date:
+        commit_cmd.extend(["--date", args.date])
+
+    return commit_cmd
+
+
+def print_json(document: Dict[str, Any]) -> None:
+    """Write a document to stdout as JSON (--json mode).
+
+    Args:
+        document: JSON-serialisable result or error
+    """
+    import json
+
+    print(json.dumps(document, indent=2, ensure_ascii=False))
+
+
+def print_memory_report(memory_peaks: Dict[str, int]) -> None:
+    """Print the peak traced memory of each phase to stderr.
+
+    Args:
+        memory_peaks: Peak bytes per phase, in phase order
+    """
+    if not memory_peaks:
+        return
+    print("Peak traced memory by phase:", file=sys.stderr)
+    for phase, peak in memory_peaks.items():
+        print(f"  {phase:<16}{peak / (1024 * 1024):8.1f} MB", file=sys.stderr)
+    print(f"  {'overall':<16}{max(memory_peaks.values()) / (1024 * 1024):8.1f} MB", file=sys.stderr)
+
+
+def percentile(values: List[float], percent: float) -> float:
+    """Get a percentile of a list of numbers (nearest-rank method).
+
+    Args:
+        values: Numbers, not necessarily sorted; must not be empty
+        percent: Percentile between 0 and 100
+
+    Returns:
+        The smallest value with at least percent% of values at or below it
+    """
+    ordered: List[float] = sorted(values)
+    rank: int = max(1, math.ceil(percent / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def summarize_metrics(records: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Aggregate metrics ledger records per repository and model.
+
+    Args:
+        records: Records as written by append_metrics()
+
+    Returns:
+        One summary per (repo, model), sorted by repo then model
+    """
+    groups: Dict[Tuple[str, str], List[Dict[str, Any]]] = {}
+    for record in records:
+        groups.setdefault((str(record.get("repo")), str(record.get("model"))), []).append(record)
+
+    summaries: List[Dict[str, Any]] = []
+    for (repo, model), runs in sorted(groups.items()):
+        latencies: List[float] = []
+        tokens: Dict[str, int] = {"prompt": 0, "completion": 0, "total": 0}
+        truncations: Dict[str, int] = {name: 0 for name in TRUNCATION_EVENTS}
+        truncated_runs: int = 0
+        retries: int = 0
+        cache: Dict[str, int] = {"hit": 0, "miss": 0}
+        for run in runs:
+            api_seconds: Any = (run.get("timings") or {}).get("api")
+            if isinstance(api_seconds, (int, float)):
+                latencies.append(float(api_seconds))
+            usage: Dict[str, Any] = run.get("usage") or {}
+            prompt_tokens: int = int(usage.get("prompt_tokens") or 0)
+            completion_tokens: int = int(usage.get("completion_tokens") or 0)
+            tokens["prompt"] += prompt_tokens
+            tokens["completion"] += completion_tokens
+            tokens["total"] += int(usage.get("total_tokens") or prompt_tokens + completion_tokens)
+            events: Dict[str, Any] = run.get("events") or {}
+            if any(events.get(name) for name in TRUNCATION_EVENTS):
+                truncated_runs += 1
+            for name in TRUNCATION_EVENTS:
+                truncations[name] += int(events.get(name) or 0)
+            cache["hit"] += int(events.get("config_cache_hit") or 0)
+            cache["miss"] += int(events.get("config_cache_miss") or 0)
+            retries += max(0, int(run.get("attempts") or 0) - 1)
+
+        lookups: int = cache["hit"] + cache["miss"]
+        summaries.append({
+            "repo": repo,
+            "model": model,
+            "runs": len(runs),
+            "committed": sum(1 for run in runs if run.get("committed")),
+            "latency": {
+                f"p{p}": round(percentile(latencies, p), 3) for p in (50, 90, 99)
+            } if latencies else None,
+            "tokens": tokens,
+            "truncation_rate": round(truncated_runs / len(runs), 4),
+            "truncations": truncations,
+            "retries": retries,
+            "config_cache_hit_rate": round(cache["hit"] / lookups, 4) if lookups else None,
+        })
+    return summaries
+
+
+def stats_command(argv: List[str]) -> int:
+    """Run `git-commitai stats`: report on the metrics ledger.
+
+    Args:
+        argv: Arguments after "stats"
+
+    Returns:
+        Process exit code
+    """
+    import argparse
+
+    parser: argparse.ArgumentParser = argparse.ArgumentParser(
+        prog="git-commitai stats",
+        description="Report API latency, token spend and truncation rates per repository and model "
+                    "from the local metrics ledger",
+    )
+    parser.add_argument("--repo", metavar="PATH", help="Only report on the repository at PATH")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    args: argparse.Namespace = parser.parse_args(argv)
+
+    records: Iterable[Dict[str, Any]] = read_metrics()
+    if args.repo:
+        repo: str = os.path.abspath(args.repo)
+        records = (record for record in records if record.get("repo") == repo)
+    summaries: List[Dict[str, Any]] = summarize_metrics(records)
+
+    if args.json:
+        print_json({"ledger": get_metrics_path(), "groups": summaries})
+        return 0
+    if not summaries:
+        print(f"No runs recorded in {get_metrics_path()}")
+        return 0
+
+    for summary in summaries:
+        print(f"{summary['repo']} ({summary['model']})")
+        print(f"  runs:        {summary['runs']} ({summary['committed']} committed)")
+        latency: Optional[Dict[str, float]] = summary["latency"]
+        if latency:
+            print(f"  API latency: p50 {latency['p50']:.2f}s  p90 {latency['p90']:.2f}s  p99 {latency['p99']:.2f}s")
+        tokens: Dict[str, int] = summary["tokens"]
+        print(
+            f"  tokens:      {tokens['total']:,} total ({tokens['prompt']:,} prompt, "
+            f"{tokens['completion']:,} completion), {tokens['total'] // summary['runs']:,} per run"
+        )
+        truncations: Dict[str, int] = summary["truncations"]
+        print(
+            f"  truncated:   {summary['truncation_rate']:.0%} of runs "
+            f"(diff {truncations['diff_truncated']}, files too large {truncations['file_too_large']}, "
+            f"files over budget {truncations['file_over_budget']})"
+        )
+        print(f"  retries:     {summary['retries']}")
+        if summary["config_cache_hit_rate"] is not None:
+            print(f"  config cache hits: {summary['config_cache_hit_rate']:.0%}")
+    return 0
+
+
 def main() -> None:
     """Main entry point for git-commitai."""
-    global DEBUG
+    # Answer a bare --version before importing argparse or running git
+    if sys.argv[1:] == ["--version"]:
+        print(f"{os.path.basename(sys.argv[0])} {__version__}")
+        sys.exit(0)
 
-    # Check for --help flag early and show man page if available
+    if sys.argv[1:2] == ["stats"]:
+        sys.exit(stats_command(sys.argv[2:]))
+
+    # Check for --help flag early and show man page if available; when
+    # output is captured (e.g. by an editor integration) use argparse help
     if "--help" in sys.argv or "-h" in sys.argv:
-        if show_man_page():
+        if sys.stdout.isatty() and show_man_page():
             sys.exit(0)
         # fall through to argparse help
 
+    import argparse
+
     parser: argparse.ArgumentParser = argparse.ArgumentParser(
         description="Generate AI-powered git commit messages",
         formatter_class=argparse.RawDescriptionHelpFormatter,
@@ -1558,9 +5934,13 @@ Examples:
   git-commitai --amend            # Amend the previous commit with new message
   git-commitai --allow-empty      # Create an empty commit
   git-commitai --dry-run          # Show what would be committed without committing
+  git-commitai --yes              # Commit with the generated message, no editor
+  git-commitai --json             # Print the generated message as JSON, no commit
   git-commitai --author "Name <email@example.com>"  # Override author
   git-commitai --date "2024-01-01T12:00:00"  # Override date
   git-commitai --debug            # Enable debug logging
+  git-commitai --profile          # Write a trace of where the time went
+  git-commitai --memory-report    # Show the peak memory of each phase
   git-commitai --version          # Show version information
 
 Configuration:
@@ -1603,6 +5983,14 @@ Environment variables:
   GIT_COMMIT_AI_KEY     Your API key (required)
   GIT_COMMIT_AI_URL     API endpoint URL (default: OpenRouter)
   GIT_COMMIT_AI_MODEL   Model to use (default: qwen/qwen3-coder)
+  GIT_COMMIT_AI_SCRUB_SECRETS  Set to 0 to send diffs without secret scrubbing
+  GIT_COMMIT_AI_GIT_FAST_PATH  Set to 0 to run git with your full config
+  GIT_COMMIT_AI_METRICS        Set to 0 to stop recording runs in the metrics ledger
+
+Subcommands:
+  git-commitai stats [--repo PATH] [--json]
+                        Report API latency (p50/p90/p99), token spend and
+                        truncation rates per repository and model
 
 For full documentation, run: man git-commitai
 For more information, visit: https://github.com/semperai/git-commitai
@@ -1640,6 +6028,17 @@ For more information, visit: https://github.com/semperai/git-commitai
         action="store_true",
         help="Don't actually commit, just show what would be committed",
     )
+    parser.add_argument(
+        "-y",
+        "--yes",
+        action="store_true",
+        help="Commit with the generated message without opening the editor",
+    )
+    parser.add_argument(
+        "--json",
+        action="store_true",
+        help="Print the message, warnings, prompt sizes and timings as JSON instead of opening the editor",
+    )
     parser.add_argument(
         "--author",
         help="Override author information (format: 'Name <email@example.com>')",
@@ -1659,6 +6058,19 @@ For more information, visit: https://github.com/semperai/git-commitai
         action="store_true",
         help="Enable debug logging to stderr",
     )
+    parser.add_argument(
+        "--profile",
+        nargs="?",
+        const="",
+        metavar="DIR",
+        help="Record where the time goes and write a Chrome trace and OTLP spans to DIR "
+             "(default: ~/.cache/git-commitai/profiles)",
+    )
+    parser.add_argument(
+        "--memory-report",
+        action="store_true",
+        help="Trace memory allocations and report the peak of each phase on stderr (slows the run down)",
+    )
     parser.add_argument(
         "--version",
         action="version",
@@ -1674,25 +6086,75 @@ For more information, visit: https://github.com/semperai/git-commitai
 
     args: argparse.Namespace = parser.parse_args()
 
-    # Enable debug mode if flag is set
-    if args.debug:
-        DEBUG = True
-        debug_log("=" * 60)
-        debug_log(f"Git Commit AI v{__version__} started with --debug flag")
-        debug_log(f"Python version: {sys.version}")
-        debug_log(f"Arguments: {sys.argv[1:]}")
-        if args.dry_run:
-            debug_log("DRY RUN MODE - No commit will be created")
+    profiler: Optional[Profiler] = Profiler() if args.profile is not None else None
+    metrics: Optional[RunMetrics] = (
+        RunMetrics() if parse_bool(os.environ.get("GIT_COMMIT_AI_METRICS", "1")) else None
+    )
+    memory_peaks: Optional[Dict[str, int]] = {} if args.memory_report else None
+    if memory_peaks is not None:
+        import tracemalloc
+
+        tracemalloc.start()
+    settings: RunSettings = RunSettings(
+        debug=args.debug, profiler=profiler, metrics=metrics, memory_peaks=memory_peaks
+    )
+    exit_code: Any = 0
+    # The debug flag travels in the settings; everything that may log,
+    # including reporting after the run, happens inside this context
+    with run_context(settings):
+        if args.debug:
+            debug_log("=" * 60)
+            debug_log(f"Git Commit AI v{__version__} started with --debug flag")
+            debug_log(f"Python version: {sys.version}")
+            debug_log(f"Arguments: {sys.argv[1:]}")
+            if args.dry_run:
+                debug_log("DRY RUN MODE - No commit will be created")
+
+        try:
+            with profile_span("git-commitai", version=__version__):
+                run_commit(args)
+        except SystemExit as e:
+            exit_code = e.code
+            raise
+        except KeyboardInterrupt:
+            exit_code = 130
+            raise
+        finally:
+            if profiler is not None:
+                trace_path, otlp_path = profiler.write(args.profile or os.path.join(get_cache_dir(), "profiles"))
+                print(f"Profile written to {trace_path} and {otlp_path}", file=sys.stderr)
+            # Runs that stopped before building a prompt have nothing to report
+            if metrics is not None and metrics.prompt_bytes:
+                append_metrics(metrics.to_record(exit_code))
+            if memory_peaks is not None:
+                tracemalloc.stop()
+                print_memory_report(memory_peaks)
+
+
+def run_commit(args: argparse.Namespace) -> None:
+    """Generate a message and commit, as requested on the command line.
+
+    Exits the process with git's exit codes on errors and aborts.
+
+    Args:
+        args: Parsed command line arguments
+    """
+    profiler: Optional[Profiler] = active_settings().profiler
+    metrics: Optional[RunMetrics] = active_settings().metrics
+    memory_peaks: Optional[Dict[str, int]] = active_settings().memory_peaks
 
     # Check if in a git repository first
     try:
-        subprocess.run(
-            ["git", "rev-parse", "--git-dir"], capture_output=True, check=True
-        )
+        argv, extra = git_command(["rev-parse", "--git-dir"])
+        with profile_span("git rev-parse", argv=" ".join(argv)):
+            subprocess.run(argv, capture_output=True, check=True, **extra)
         debug_log("Git repository detected")
     except subprocess.CalledProcessError:
         debug_log("Not in a git repository")
-        print("fatal: not a git repository (or any of the parent directories): .git")
+        if args.json:
+            print_json({"error": "not a git repository"})
+        else:
+            print("fatal: not a git repository (or any of the parent directories): .git")
         sys.exit(128)  # Git's standard exit code for this error
 
     # Check for conflicting flags
@@ -1704,55 +6166,136 @@ For more information, visit: https://github.com/semperai/git-commitai
         )
         sys.exit(1)
 
-    # Check for staged changes or if we're amending or auto-staging or allowing empty
-    if not check_staged_changes(amend=args.amend, auto_stage=args.all, allow_empty=args.allow_empty):
-        sys.exit(1)
-
-    # Get configuration (including repo-specific config)
-    config: Dict[str, Any] = get_env_config(args)
+    # Read once, for the status shown when nothing is staged and for the run
+    with profile_span("config files"):
+        repo_config: Dict[str, Any] = load_gitcommitai_config()
 
-    # Build the AI prompt using repository-specific customization
-    prompt: str = build_ai_prompt(config["repo_config"], args)
-
-    # Get git information
-    git_diff: str = get_git_diff(amend=args.amend, allow_empty=args.allow_empty)
-    skip_patterns: Optional[List[str]] = args.skip if hasattr(args, 'skip') and args.skip else None
-    all_files: str = get_staged_files(amend=args.amend, allow_empty=args.allow_empty, skip_patterns=skip_patterns)
+    # Check for staged changes or if we're amending or auto-staging or allowing empty
+    with profile_span("staged"):
+        if args.json:
+            # Keep stdout for the JSON document; git-style status goes to stderr
+            with redirect_stdout(sys.stderr):
+                can_commit: bool = check_staged_changes(
+                    amend=args.amend, auto_stage=args.all, allow_empty=args.allow_empty, repo_config=repo_config
+                )
+            if not can_commit:
+                print_json({"error": "no changes added to commit"})
+                sys.exit(1)
+        elif not check_staged_changes(
+            amend=args.amend, auto_stage=args.all, allow_empty=args.allow_empty, repo_config=repo_config
+        ):
+            sys.exit(1)
+
+    # Seconds spent per phase, reported in --json mode
+    timings: Dict[str, float] = metrics.timings if metrics is not None else {}
+    phase_start: int = time.perf_counter_ns()
+
+    def lap(phase: str) -> None:
+        nonlocal phase_start
+        now: int = time.perf_counter_ns()
+        timings[phase] = round((now - phase_start) / 1e9, 6)
+        attributes: Dict[str, Any] = {}
+        if memory_peaks is not None:
+            import tracemalloc
+
+            memory_peaks[phase] = attributes["memory_peak"] = tracemalloc.get_traced_memory()[1]
+            # Python 3.8 has no reset_peak(); peaks are then cumulative
+            reset_peak: Optional[Callable[[], None]] = getattr(tracemalloc, "reset_peak", None)
+            if reset_peak is not None:
+                reset_peak()
+        if profiler is not None:
+            profiler.record(phase, phase_start, now, **attributes)
+        phase_start = now
 
-    # Handle template placeholders if using custom template
-    if config["repo_config"].get('prompt_template'):
-        # Check if template has placeholders for DIFF and FILES
-        if '{DIFF}' in prompt:
-            prompt = prompt.replace('{DIFF}', git_diff)
-        else:
-            # Append at the end if no placeholder
-            prompt += f"\n\nHere is the git diff of changes:\n\n{git_diff}"
+    try:
+        # Get configuration (including repo-specific config)
+        config: Dict[str, Any] = get_env_config(args, repo_config)
+        lap("config")
+        if metrics is not None:
+            metrics.model = config["model"]
+        settings: RunSettings = replace(
+            active_settings(),
+            limits=config.get("limits") or Limits.from_config(config.get("repo_config", {})),
+            layout=detect_repo_layout(active_settings().cwd),
+            skip=load_skip_matcher(active_settings().cwd).with_globs(getattr(args, "skip", None) or []),
+        )
 
-        if '{FILES}' in prompt:
-            prompt = prompt.replace('{FILES}', all_files)
+        # Build the AI prompt using repository-specific customization
+        prompt: str = build_ai_prompt(config["repo_config"], args, settings=settings)
+        lap("prompt")
+
+        # Get git information
+        git_diff: str = get_git_diff(amend=args.amend, allow_empty=args.allow_empty, settings=settings)
+        lap("diff")
+        all_files: str = get_staged_files(amend=args.amend, allow_empty=args.allow_empty, settings=settings)
+        lap("files")
+
+        # Scrub credentials from the sections that carry repository content
+        if config.get("scrub_secrets", True):
+            git_diff, diff_findings = scrub_prompt_secrets(git_diff)
+            all_files, file_findings = scrub_prompt_secrets(all_files)
+            if diff_findings or file_findings:
+                debug_log(f"Scrubbed secrets from prompt - diff: {diff_findings}, files: {file_findings}")
+        lap("scrub")
+
+        # Insert the diff and file contents into the prompt
+        prompt_size: Dict[str, int] = {
+            "base": len(prompt.encode("utf-8")),
+            "diff": len(git_diff.encode("utf-8")),
+            "files": len(all_files.encode("utf-8")),
+        }
+        prompt = assemble_prompt(prompt, config["repo_config"], git_diff, all_files)
+        prompt_size["total"] = len(prompt.encode("utf-8"))
+        if metrics is not None:
+            metrics.prompt_bytes = prompt_size
+
+        # Make API request with retry logic
+        commit_message: str = make_api_request(config, prompt, settings=settings)
+        lap("api")
+    except CommitAIError as e:
+        if args.json:
+            print_json({"error": str(e)})
         else:
-            # Append at the end if no placeholder
-            prompt += f"\n\nHere are all the modified files with their content for context:\n\n{all_files}"
-
-        # Add final instruction if not already in template
-        if "Generate the commit message" not in prompt and "generate the commit message" not in prompt.lower():
-            prompt += "\n\nGenerate the commit message following the rules above:"
-    else:
-        # Default behavior - append diff and files
-        prompt += f"""
-
-Here is the git diff of changes:
-
-{git_diff}
-
-Here are all the modified files with their content for context:
-
-{all_files}
-
-Generate the commit message following the rules above:"""
-
-    # Make API request with retry logic
-    commit_message: str = make_api_request(config, prompt)
+            print(f"Error: {e}")
+        sys.exit(e.exit_code)
+
+    # Batch modes: commit directly and/or report as JSON, without an editor
+    if args.yes or args.json:
+        message, warnings = split_ai_warnings(commit_message)
+        committed: bool = False
+        if args.yes and not args.dry_run:
+            commit_cmd: List[str] = commit_command(args) + ["-F", "-"]
+            debug_log(f"Executing commit command: {' '.join(commit_cmd)}")
+            # In JSON mode git's own output would corrupt the document
+            result = subprocess.run(commit_cmd, input=message + "\n", text=True, capture_output=args.json)
+            if result.returncode != 0:
+                debug_log(f"Commit failed with code {result.returncode}")
+                if args.json:
+                    print_json({"error": (result.stderr or "").strip() or "git commit failed"})
+                sys.exit(result.returncode)
+            committed = True
+            lap("commit")
+            if metrics is not None:
+                metrics.committed = True
+            if not args.json:
+                for warning in warnings:
+                    print(f"warning: {warning}", file=sys.stderr)
+
+        if args.json:
+            document: Dict[str, Any] = {
+                "message": message,
+                "warnings": warnings,
+                "model": config["model"],
+                "committed": committed,
+                "prompt_size": prompt_size,
+                "timings": timings,
+            }
+            if memory_peaks is not None:
+                document["memory_peaks"] = memory_peaks
+            print_json(document)
+            sys.exit(0)
+        if committed:
+            sys.exit(0)
 
     # If dry-run mode, show what would be committed and exit
     if args.dry_run:
@@ -1781,7 +6324,9 @@ Generate the commit message following the rules above:"""
 
     # Open editor
     editor: str = get_git_editor()
+    lap("prepare editor")
     open_editor(commit_file, editor)
+    lap("editor")
 
     # Check if file was modified (saved)
     mtime_after: float = os.path.getmtime(commit_file)
@@ -1804,37 +6349,32 @@ Generate the commit message following the rules above:"""
 
     # Perform the commit
     try:
-        commit_cmd: List[str] = ["git", "commit"]
-
-        if args.amend:
-            commit_cmd.append("--amend")
-
-        if args.no_verify:
-            commit_cmd.append("--no-verify")
-
-        if args.allow_empty:
-            commit_cmd.append("--allow-empty")
-
-        if args.author:
-            commit_cmd.extend(["--author", args.author])
-
-        if args.date:
-            commit_cmd.extend(["--date", args.date])
-
-        commit_cmd.extend(["-F", commit_file])
+        commit_cmd = commit_command(args) + ["-F", commit_file]
 
         debug_log(f"Executing commit command: {' '.join(commit_cmd)}")
-        subprocess.run(commit_cmd, check=True)
+        with profile_span("git commit", argv=" ".join(commit_cmd)):
+            subprocess.run(commit_cmd, check=True)
         debug_log("Commit successful")
+        if metrics is not None:
+            metrics.committed = True
     except subprocess.CalledProcessError as e:
         debug_log(f"Commit failed with code {e.returncode}")
         sys.exit(e.returncode)
 
 
-if __name__ == "__main__":
+def cli() -> None:
+    """Run main() as a command, exiting quietly on Ctrl+C.
+
+    This is the entry point of both ``python git_commitai.py`` and the
+    installed git-commitai launcher.
+    """
     try:
         main()
     except KeyboardInterrupt:
         # Exit quietly on Ctrl+C
         print("\nAborted.", file=sys.stderr)
         sys.exit(130)  # Standard exit code for SIGINT
+
+
+if __name__ == "__main__":
+    cli()
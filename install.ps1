@@ -109,11 +109,14 @@ function Install-User {
         New-Item -ItemType Directory -Path $scriptsDir -Force | Out-Null
     }
 
-    # Download Python script
+    # Download the launcher and the module it imports; importing the module
+    # lets Python cache its bytecode instead of compiling it on every run
     Write-Color "Downloading git-commitai..." "Yellow"
-    $scriptUrl = "https://raw.githubusercontent.com/semperai/git-commitai/master/git_commitai.py"
-    $scriptPath = "$userBin\git_commitai.py"
-    Download-File -Url $scriptUrl -Output $scriptPath
+    $repoUrl = "https://raw.githubusercontent.com/semperai/git-commitai/master"
+    $scriptPath = "$userBin\git-commitai"
+    Download-File -Url "$repoUrl/git-commitai" -Output $scriptPath
+    Download-File -Url "$repoUrl/git_commitai.py" -Output "$userBin\git_commitai.py"
+    python -m compileall -q "$userBin" | Out-Null
 
     # Create batch wrapper for command line
     $batchContent = @"
@@ -166,11 +169,14 @@ function Install-System {
         New-Item -ItemType Directory -Path $systemBin -Force | Out-Null
     }
 
-    # Download Python script
+    # Download the launcher and the module it imports; importing the module
+    # lets Python cache its bytecode instead of compiling it on every run
     Write-Color "Downloading git-commitai..." "Yellow"
-    $scriptUrl = "https://raw.githubusercontent.com/semperai/git-commitai/master/git_commitai.py"
-    $scriptPath = "$systemBin\git_commitai.py"
-    Download-File -Url $scriptUrl -Output $scriptPath
+    $repoUrl = "https://raw.githubusercontent.com/semperai/git-commitai/master"
+    $scriptPath = "$systemBin\git-commitai"
+    Download-File -Url "$repoUrl/git-commitai" -Output $scriptPath
+    Download-File -Url "$repoUrl/git_commitai.py" -Output "$systemBin\git_commitai.py"
+    python -m compileall -q "$systemBin" | Out-Null
 
     # Create batch wrapper
     $batchContent = @"
@@ -14,6 +14,7 @@ NC='\033[0m' # No Color
 
 # System installation directories
 INSTALL_DIR="/usr/local/bin"
+LIB_DIR="/usr/local/lib/git-commitai"
 MAN_DIR="/usr/local/share/man/man1"
 REPO_URL="https://raw.githubusercontent.com/semperai/git-commitai/master"
 
@@ -166,6 +167,22 @@ remove_file() {
     fi
 }
 
+# Function to remove a directory with or without sudo
+remove_directory() {
+    local dir=$1
+
+    if [[ ! -d "$dir" ]]; then
+        return 0
+    fi
+
+    if is_writable "$(dirname "$dir")"; then
+        rm -rf "$dir"
+    else
+        print_color $YELLOW "Removing $dir (requires sudo)..."
+        sudo rm -rf "$dir"
+    fi
+}
+
 # Function to install system-wide
 install_system() {
     print_color $BLUE "Installing git-commitai..."
@@ -175,9 +192,10 @@ install_system() {
     temp_dir=$(mktemp -d)
     trap "rm -rf $temp_dir" EXIT
 
-    # Download script to temp directory first
+    # Download the launcher and the module it imports to temp directory first
     print_color $YELLOW "Downloading git-commitai..."
-    download_file "$REPO_URL/git_commitai.py" "$temp_dir/git-commitai"
+    download_file "$REPO_URL/git-commitai" "$temp_dir/git-commitai"
+    download_file "$REPO_URL/git_commitai.py" "$temp_dir/git_commitai.py"
     chmod +x "$temp_dir/git-commitai"
 
     # Download man page to temp directory
@@ -186,11 +204,21 @@ install_system() {
 
     # Create directories if they don't exist
     create_directory "$INSTALL_DIR"
+    create_directory "$LIB_DIR"
     create_directory "$MAN_DIR"
 
     # Copy files to system directories
     print_color $YELLOW "Installing git-commitai to $INSTALL_DIR..."
     copy_file "$temp_dir/git-commitai" "$INSTALL_DIR" "git-commitai"
+    copy_file "$temp_dir/git_commitai.py" "$LIB_DIR" "git_commitai.py"
+
+    # Precompile the module: users usually cannot write __pycache__ here, and
+    # compiling it from source would otherwise happen on every run
+    if is_writable "$LIB_DIR"; then
+        python3 -m compileall -q "$LIB_DIR" || true
+    else
+        sudo python3 -m compileall -q "$LIB_DIR" || true
+    fi
 
     print_color $YELLOW "Installing man page to $MAN_DIR..."
     copy_file "$temp_dir/git-commitai.1" "$MAN_DIR" "git-commitai.1"
@@ -380,6 +408,7 @@ uninstall() {
     # Confirm uninstall
     print_color $YELLOW "This will remove:"
     echo "  • $INSTALL_DIR/git-commitai (if it exists)"
+    echo "  • $LIB_DIR (if it exists)"
     echo "  • $MAN_DIR/git-commitai.1 (if it exists)"
     echo "  • git alias 'commitai'"
     echo ""
@@ -392,6 +421,7 @@ uninstall() {
 
     # Remove system files with verification
     remove_file "$INSTALL_DIR/git-commitai"
+    remove_directory "$LIB_DIR"
     remove_file "$MAN_DIR/git-commitai.1"
 
     # Remove git alias (doesn't require sudo)
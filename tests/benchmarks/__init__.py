@@ -0,0 +1 @@
+"""Benchmarks for git-commitai against synthetic repositories."""
@@ -0,0 +1,168 @@
+"""Synthetic repositories and baseline checking for the benchmarks.
+
+Each scenario builds a throwaway git repository once per session. Timings
+are compared against baselines.json; a stage fails when it is slower than
+its baseline by more than the tolerance factor (GIT_COMMIT_AI_BENCHMARK_TOLERANCE,
+default 1.5) plus a small absolute slack for timer noise. Run with
+--update-baselines to store the current timings instead.
+"""
+
+import json
+import os
+import random
+import subprocess
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable
+
+import pytest
+
+BASELINE_FILE = Path(__file__).with_name("baselines.json")
+TOLERANCE = float(os.environ.get("GIT_COMMIT_AI_BENCHMARK_TOLERANCE", "1.5"))
+SLACK_SECONDS = 0.05
+
+GIT_IDENTITY = ["-c", "user.name=Benchmark", "-c", "user.email=benchmark@example.com"]
+
+
+def git(repo, *args):
+    subprocess.run(["git", "-C", str(repo)] + GIT_IDENTITY + list(args), check=True, capture_output=True)
+
+
+def write_sources(repo, count, start=0):
+    """Write count small Python modules, 100 per directory."""
+    for i in range(start, start + count):
+        directory = repo / "src" / f"pkg{i // 100:03d}"
+        directory.mkdir(parents=True, exist_ok=True)
+        body = "".join(f"def function_{i}_{n}(x):\n    return x * {n} + {i}\n\n" for n in range(12))
+        (directory / f"module{i:05d}.py").write_text(body)
+
+
+def write_large_text(path, size):
+    """Write a text file of about size bytes."""
+    line_no = 0
+    written = 0
+    with open(path, "w") as f:
+        while written < size:
+            chunk = "".join(f"value_{n} = {n * 7919 % 1000003}\n" for n in range(line_no, line_no + 10000))
+            line_no += 10000
+            f.write(chunk)
+            written += len(chunk)
+
+
+def write_binaries(repo, count, size):
+    rng = random.Random(0)
+    directory = repo / "assets"
+    directory.mkdir(exist_ok=True)
+    for i in range(count):
+        (directory / f"image{i:04d}.bin").write_bytes(rng.getrandbits(8 * size).to_bytes(size, "little"))
+
+
+def build_files(count):
+    def build(repo):
+        write_sources(repo, count)
+        git(repo, "add", "-A")
+    return build
+
+
+def build_large_diff(repo):
+    (repo / "README").write_text("data\n")
+    git(repo, "add", "-A")
+    git(repo, "commit", "-q", "-m", "Initial commit")
+    write_large_text(repo / "data.txt", 200 * 1024 * 1024)
+    git(repo, "add", "-A")
+
+
+def build_binary_heavy(repo):
+    write_sources(repo, 20)
+    write_binaries(repo, 300, 64 * 1024)
+    git(repo, "add", "-A")
+
+
+def build_amend_huge(repo):
+    (repo / "README").write_text("data\n")
+    git(repo, "add", "-A")
+    git(repo, "commit", "-q", "-m", "Initial commit")
+    write_sources(repo, 5000)
+    write_large_text(repo / "data.txt", 20 * 1024 * 1024)
+    git(repo, "add", "-A")
+    git(repo, "commit", "-q", "-m", "Huge commit")
+    (repo / "README").write_text("data\nmore\n")
+    git(repo, "add", "README")
+
+
+@dataclass
+class Scenario:
+    build: Callable[[Path], None]
+    amend: bool = False
+    # Timed runs per stage; the fastest counts
+    repeats: int = 3
+
+
+SCENARIOS = {
+    "files_10": Scenario(build_files(10)),
+    "files_1000": Scenario(build_files(1000), repeats=1),
+    "files_20000": Scenario(build_files(20000), repeats=1),
+    "diff_200mb": Scenario(build_large_diff, repeats=1),
+    "binary_heavy": Scenario(build_binary_heavy),
+    "amend_huge": Scenario(build_amend_huge, amend=True, repeats=1),
+}
+
+
+@pytest.fixture(scope="module")
+def scenario_repo(request, tmp_path_factory):
+    """Build the repository for the scenario named by the test's parameter."""
+    repo = tmp_path_factory.mktemp(request.param)
+    git(repo, "init", "-q")
+    SCENARIOS[request.param].build(repo)
+    return repo
+
+
+class Baselines:
+    """Stored stage timings, and the timings measured in this session."""
+
+    def __init__(self, update):
+        self.update = update
+        self.stored = json.loads(BASELINE_FILE.read_text()) if BASELINE_FILE.exists() else {}
+        self.measured = {}
+
+    def check(self, scenario, timings):
+        """Record timings and fail on stages that regressed past their baseline."""
+        self.measured[scenario] = {stage: round(seconds, 4) for stage, seconds in timings.items()}
+        if self.update:
+            return
+        regressions = []
+        for stage, seconds in timings.items():
+            baseline = self.stored.get(scenario, {}).get(stage)
+            if baseline is not None and seconds > baseline * TOLERANCE + SLACK_SECONDS:
+                regressions.append(f"{stage}: {seconds:.3f}s vs baseline {baseline:.3f}s")
+        assert not regressions, f"{scenario} regressed (tolerance x{TOLERANCE}): " + "; ".join(regressions)
+
+
+# Timings measured in this session, for the terminal summary
+MEASURED = {}
+# Bytes and estimated tokens (before, after) per normalizer benchmark
+SAVINGS = {}
+
+
+@pytest.fixture(scope="session")
+def baselines(request):
+    store = Baselines(update=request.config.getoption("--update-baselines"))
+    store.measured = MEASURED
+    yield store
+    if store.update and store.measured:
+        store.stored.update(store.measured)
+        BASELINE_FILE.write_text(json.dumps(store.stored, indent=2, sort_keys=True) + "\n")
+
+
+def pytest_terminal_summary(terminalreporter):
+    if MEASURED:
+        terminalreporter.write_sep("-", "benchmark timings (seconds)")
+        for scenario, timings in sorted(MEASURED.items()):
+            terminalreporter.write_line(f"{scenario:14} " + "  ".join(f"{k} {v:.3f}" for k, v in timings.items()))
+    if SAVINGS:
+        terminalreporter.write_sep("-", "normalizer savings")
+        for name, saved in sorted(SAVINGS.items()):
+            terminalreporter.write_line(f"{name:22} " + "  ".join(
+                f"{unit} {before:,} -> {after:,} (-{1 - after / before:.0%})"
+                for unit, (before, after) in saved.items()
+            ))
@@ -0,0 +1,30 @@
+"""Benchmark of comparing the hunks of a large refactoring diff."""
+
+import time
+
+import pytest
+
+import git_commitai
+
+
+def section(i):
+    """A file whose hunk rewrites eight call sites, one of 50 kinds."""
+    removed = "".join(f"-    value_{k} = compute(a{k}, b{k}, mode='fast{i % 50}')\n" for k in range(8))
+    added = "".join(f"+    value_{k} = compute(a{k}, b{k}, mode='slow')\n" for k in range(8))
+    return f"diff --git a/f{i}.py b/f{i}.py\n--- a/f{i}.py\n+++ b/f{i}.py\n@@ -1,8 +1,8 @@\n{removed}{added}"
+
+
+@pytest.mark.benchmark
+def test_hunk_deduplication(baselines):
+    """Deduplicate 3,000 modified hunks, on as many processes as there are CPUs."""
+    diff = "".join(section(i) for i in range(3000))
+    chunks = [diff[i:i + 256 * 1024] for i in range(0, len(diff), 256 * 1024)]
+    deduplicator = git_commitai.HunkDeduplicator()
+
+    start = time.perf_counter()
+    with git_commitai.run_context(git_commitai.RunSettings()):
+        result = "".join(deduplicator.filter(iter(chunks)))
+    seconds = time.perf_counter() - start
+
+    assert deduplicator.dropped_hunks == 2900 and result.count("diff --git") == 100
+    baselines.check("hunk_dedup_3000", {"dedup": seconds})
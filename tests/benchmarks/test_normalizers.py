@@ -0,0 +1,157 @@
+"""Benchmarks of the content normalizers on synthetic corpora.
+
+Each normalizer's run time is checked against baselines.json like the
+pipeline stages, and the bytes and estimated tokens it saves are reported
+in the terminal summary.
+"""
+
+import base64
+import json
+import random
+import re
+import textwrap
+import time
+
+import pytest
+
+import git_commitai
+
+from .conftest import SAVINGS
+
+WORDS = (
+    "the commit message should describe why a change was made and what it affects in the "
+    "repository while staying short enough for the model to read quickly"
+).split()
+
+
+def estimate_tokens(text):
+    """Roughly count BPE tokens: short word pieces and symbols (taking one
+    leading space along), other whitespace runs, tabs and newlines."""
+    return len(re.findall(r" ?\w{1,4}| ?[^\w\s]| {1,4}|\t|\n", text))
+
+
+def sentences(rng, count):
+    return " ".join(" ".join(rng.choices(WORDS, k=rng.randint(8, 20))).capitalize() + "." for _ in range(count))
+
+
+def python_corpus(rng):
+    lines = []
+    for c in range(60):
+        lines.append(f"class Handler{c}:")
+        for m in range(8):
+            lines += [
+                f"    def method_{m}(self, value):",
+                "        if value is None:    ",
+                "            for item in self.items:",
+                "                if item.matches(value):",
+                f"                    return item.transform({m})",
+                "        return value",
+                "",
+            ]
+    return "\n".join(lines)
+
+
+def json_corpus(rng):
+    return json.dumps({
+        f"service{i}": {"replicas": rng.randint(1, 9), "env": {f"VAR_{j}": str(rng.random()) for j in range(5)},
+                        "ports": [{"port": 8000 + j, "protocol": "TCP"} for j in range(3)]}
+        for i in range(150)
+    }, indent=4)
+
+
+def yaml_corpus(rng):
+    documents = []
+    for i in range(80):
+        documents.append(textwrap.dedent(f"""\
+            apiVersion: apps/v1
+            kind: Deployment
+            metadata:
+                name: service-{i}
+                labels:
+                    app: service-{i}
+
+            spec:
+                replicas: {rng.randint(1, 9)}
+                template:
+                    spec:
+                        containers:
+                            -   name: app
+                                image: registry.example.com/service-{i}:1.{i}
+                                ports:
+                                    -   containerPort: 8080
+            ---
+        """))
+    return "".join(documents)
+
+
+def markdown_corpus(rng):
+    sections = []
+    for i in range(60):
+        sections.append(f"## Section {i}\n\n" + "\n\n".join(
+            textwrap.fill(sentences(rng, 4), width=72) for _ in range(3)
+        ) + "\n\n- " + "\n- ".join(sentences(rng, 1) for _ in range(3)) + "\n")
+    return "\n".join(sections)
+
+
+def base64_corpus(rng):
+    parts = []
+    for i in range(40):
+        image = base64.b64encode(rng.getrandbits(8 * 3000).to_bytes(3000, "little")).decode()
+        parts.append(f'<section id="s{i}">\n  <p>{sentences(rng, 2)}</p>\n  <img src="data:image/png;base64,{image}">\n</section>\n')
+    return "".join(parts)
+
+
+CORPORA = {
+    "collapse_indentation": (git_commitai.collapse_indentation, python_corpus),
+    "minify_json": (git_commitai.minify_json, json_corpus),
+    "minify_yaml": (git_commitai.minify_yaml, yaml_corpus),
+    "unwrap_paragraphs": (git_commitai.unwrap_paragraphs, markdown_corpus),
+    "strip_base64": (git_commitai.strip_base64, base64_corpus),
+}
+
+
+def best_time(func, *args, repeats=5):
+    best, result = float("inf"), None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def record_savings(name, before, after):
+    SAVINGS[name] = {
+        "bytes": (len(before.encode()), len(after.encode())),
+        "tokens": (estimate_tokens(before), estimate_tokens(after)),
+    }
+    return SAVINGS[name]
+
+
+@pytest.mark.benchmark
+@pytest.mark.parametrize("name", sorted(CORPORA))
+def test_normalizer(name, baselines):
+    """Time one normalizer on its corpus and report what it saves."""
+    normalizer, corpus = CORPORA[name]
+    text = corpus(random.Random(0))
+    seconds, normalized = best_time(normalizer, text)
+    savings = record_savings(name, text, normalized)
+    assert savings["tokens"][1] < savings["tokens"][0]
+    baselines.check(f"normalize_{name}", {"normalize": seconds})
+
+
+@pytest.mark.benchmark
+def test_prose_diff(baselines):
+    """Compare a word diff of re-wrapped Markdown with a line diff."""
+    rng = random.Random(0)
+    old = markdown_corpus(rng)
+    # Edit a few words, which re-wraps the paragraphs they are in
+    new = re.sub(r"\bquickly\b", "fast", old, count=40)
+    new = "\n\n".join(
+        textwrap.fill(paragraph.replace("\n", " "), width=72) if not paragraph.startswith(("#", "-")) else paragraph
+        for paragraph in new.split("\n\n")
+    )
+    files = ["a/guide.md", "b/guide.md"]
+    seconds, diff = best_time(git_commitai.prose_diff, old, new, files)
+    savings = record_savings("prose_diff", git_commitai.unified_diff(old, new, files), diff)
+    assert savings["tokens"][1] < savings["tokens"][0]
+    baselines.check("normalize_prose_diff", {"normalize": seconds})
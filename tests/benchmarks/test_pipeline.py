@@ -0,0 +1,59 @@
+"""End-to-end pipeline benchmarks on synthetic repositories.
+
+Run with ``pytest tests/benchmarks --benchmark``; add ``--update-baselines``
+to record new baselines after an intentional change or on new hardware.
+"""
+
+import shutil
+import time
+
+import pytest
+
+import git_commitai
+
+from .conftest import SCENARIOS
+
+
+def best_of(repeats, func):
+    """Time func; returns (fastest seconds, result of the last call)."""
+    best = float("inf")
+    result = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+@pytest.mark.benchmark
+@pytest.mark.skipif(shutil.which("git") is None, reason="git is not installed")
+@pytest.mark.parametrize("scenario_repo", sorted(SCENARIOS), indirect=True)
+def test_pipeline(scenario_repo, api_server, baselines, monkeypatch, request):
+    """Time each pipeline stage for one scenario against its baseline."""
+    name = request.node.callspec.params["scenario_repo"]
+    scenario = SCENARIOS[name]
+    monkeypatch.chdir(scenario_repo)
+    settings = git_commitai.RunSettings(cwd=str(scenario_repo), retry_delay=0)
+    config = {"api_key": "k", "api_url": api_server.url, "model": "benchmark"}
+    timings = {}
+
+    with git_commitai.run_context(settings):
+        timings["diff"], diff = best_of(
+            scenario.repeats, lambda: git_commitai.get_git_diff(amend=scenario.amend, settings=settings)
+        )
+        timings["files"], files = best_of(
+            scenario.repeats, lambda: git_commitai.get_staged_files(amend=scenario.amend, settings=settings)
+        )
+        prompt = git_commitai.assemble_prompt("Write a commit message.", {}, diff, files)
+        timings["api"], message = best_of(
+            scenario.repeats, lambda: git_commitai.make_api_request(config, prompt, settings=settings)
+        )
+        git_dir = git_commitai.get_git_dir()
+        timings["message_file"], _ = best_of(
+            scenario.repeats,
+            lambda: git_commitai.create_commit_message_file(git_dir, message, amend=scenario.amend, verbose=True),
+        )
+
+    assert message.startswith("Add feature")
+    assert api_server.requests[-1]["messages"][0]["content"] == prompt
+    baselines.check(name, timings)
@@ -0,0 +1,54 @@
+"""Benchmark of matching staged paths against .gitcommitaiignore rules."""
+
+import random
+import time
+
+import pytest
+
+import git_commitai
+
+EXTENSIONS = ["py", "js", "ts", "md", "json", "lock", "svg", "png", "min.js", "snap", "log", "pb.go"]
+
+
+def ignore_file(rng, count):
+    """A .gitcommitaiignore of count rules of the usual kinds."""
+    lines = ["# Generated and vendored files"]
+    for i in range(count):
+        kind = i % 6
+        if kind == 0:
+            lines.append(f"*.{rng.choice(EXTENSIONS)}{i}")
+        elif kind == 1:
+            lines.append(f"vendor{i}/")
+        elif kind == 2:
+            lines.append(f"/src/gen{i}/**")
+        elif kind == 3:
+            lines.append(f"**/fixtures{i}/*.json")
+        elif kind == 4:
+            lines.append(f"!src/gen{i - 2}/keep.py")
+        else:
+            lines.append(f"data_{i}_[0-9]*.csv")
+    return "\n".join(lines + ["*.min.js", "*.snap", "package-lock.json", "dist/"])
+
+
+def paths(rng, count):
+    return [
+        "/".join(f"dir{rng.randint(0, 40)}" for _ in range(rng.randint(0, 4)))
+        + f"/file{i}.{rng.choice(EXTENSIONS)}"
+        for i in range(count)
+    ]
+
+
+@pytest.mark.benchmark
+def test_skip_matcher(baselines):
+    """Parse 200 rules and match 20,000 paths against them."""
+    rng = random.Random(0)
+    content = ignore_file(rng, 200)
+    staged = paths(rng, 20_000)
+
+    start = time.perf_counter()
+    matcher = git_commitai.SkipMatcher.parse(content)
+    skipped = sum(matcher.match(path.lstrip("/")) is not None for path in staged)
+    seconds = time.perf_counter() - start
+
+    assert 0 < skipped < len(staged)
+    baselines.check("skip_matcher_20000", {"match": seconds})
@@ -1,14 +1,106 @@
 """Shared fixtures and test configuration for git-commitai tests."""
 
 import pytest
+import gzip
+import json
 import os
 import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from unittest.mock import patch, MagicMock
 
 # Add parent directory to path so we can import git_commitai
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 
+def pytest_addoption(parser):
+    group = parser.getgroup("benchmarks")
+    group.addoption(
+        "--benchmark", action="store_true",
+        help="Run the synthetic-repository benchmarks in tests/benchmarks",
+    )
+    group.addoption(
+        "--update-baselines", action="store_true",
+        help="Store the benchmark timings as the new baselines instead of checking them",
+    )
+
+
+def pytest_collection_modifyitems(config, items):
+    """Skip benchmarks unless --benchmark is given; they take minutes."""
+    if config.getoption("--benchmark"):
+        return
+    skip = pytest.mark.skip(reason="benchmarks only run with --benchmark")
+    for item in items:
+        if "benchmark" in item.keywords:
+            item.add_marker(skip)
+
+
+@pytest.fixture(autouse=True)
+def isolate_global_config(tmp_path, monkeypatch):
+    """Keep the developer's own git-commitai config out of the tests."""
+    monkeypatch.setenv("XDG_CONFIG_HOME", str(tmp_path / "xdg-config"))
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "xdg-cache"))
+
+
+class FakeAPIHandler(BaseHTTPRequestHandler):
+    """OpenAI-compatible endpoint that records requests and connections."""
+
+    protocol_version = "HTTP/1.1"
+    reply = "Add feature\n\n# ⚠️  WARNING: Hardcoded secret\n# Found in: app.py"
+    status = 200
+
+    def setup(self):
+        super().setup()
+        self.server.connections += 1
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        encoding = self.headers.get("Content-Encoding")
+        self.server.encodings.append(encoding)
+        status = self.status
+        if encoding == "gzip" and not self.server.accept_gzip:
+            status = 415
+        else:
+            self.server.requests.append(json.loads(gzip.decompress(body) if encoding == "gzip" else body))
+        if status != 200:
+            payload = b"{}"
+        else:
+            payload = json.dumps({
+                "choices": [{"message": {"content": self.reply}}],
+                "usage": {"prompt_tokens": 120, "completion_tokens": 8, "details": {}},
+            }).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def api_server():
+    """Fixture for a local OpenAI-compatible API server.
+
+    The server records decoded request bodies in ``requests``, their
+    Content-Encoding headers in ``encodings`` and the number of accepted
+    connections in ``connections``; ``url`` is its endpoint. Gzipped bodies
+    are refused with 415 unless ``accept_gzip`` is set.
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeAPIHandler)
+    server.connections = 0
+    server.requests = []
+    server.encodings = []
+    server.accept_gzip = False
+    thread = threading.Thread(target=server.serve_forever, args=(0.01,), daemon=True)
+    thread.start()
+    server.url = f"http://127.0.0.1:{server.server_address[1]}/v1/chat/completions"
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
 @pytest.fixture
 def mock_env_config():
     """Fixture for mocking environment configuration."""
@@ -24,6 +116,28 @@ def mock_env_config():
         yield mock_config
 
 
+@pytest.fixture(autouse=True)
+def stream_via_run_git(request):
+    """Serve stream_git_text() (and so stream_git()) from run_git().
+
+    Most tests fake git by mocking run_git() or subprocess.run(); this lets
+    those mocks feed the output that is streamed with Popen. Integration
+    tests and benchmarks stream from real git.
+    """
+    if request.node.get_closest_marker("integration") or request.node.get_closest_marker("benchmark"):
+        yield None
+        return
+
+    import git_commitai
+
+    def stream(args, check=True, chunk_size=None, newline=None):
+        output = git_commitai.run_git(args, check=check)
+        return iter([output] if output else [])
+
+    with patch("git_commitai.stream_git_text", side_effect=stream) as mock_stream:
+        yield mock_stream
+
+
 @pytest.fixture
 def mock_args():
     """Fixture for creating mock command line arguments."""
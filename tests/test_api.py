@@ -47,7 +47,7 @@ class TestAPIRequest:
         with patch("git_commitai.urlopen") as mock_urlopen:
             mock_urlopen.side_effect = HTTPError("url", 500, "Server Error", {}, None)
 
-            with pytest.raises(SystemExit):
+            with pytest.raises(git_commitai.APIRequestError):
                 git_commitai.make_api_request(config, "test message")
 
     def test_api_response_parse_error(self):
@@ -62,7 +62,7 @@ class TestAPIRequest:
             # Return invalid JSON
             mock_urlopen.return_value.__enter__.return_value.read.return_value = b"invalid json"
 
-            with pytest.raises(SystemExit):
+            with pytest.raises(git_commitai.APIRequestError):
                 git_commitai.make_api_request(config, "test message")
 
     def test_api_response_missing_fields(self):
@@ -80,17 +80,50 @@ class TestAPIRequest:
                 json.dumps(mock_response).encode()
             )
 
-            with pytest.raises(SystemExit):
+            with pytest.raises(git_commitai.APIRequestError):
                 git_commitai.make_api_request(config, "test message")
 
 
+class TestRequestBody:
+    """Test encoding the request body."""
+
+    @pytest.mark.parametrize("prompt", [
+        "",
+        "Fix bug",
+        'quotes " and \\ backslashes\n\ttabs \x00\x1f',
+        "naïve café — 日本語 😀" * 50,
+    ])
+    def test_same_bytes_as_json_dumps(self, prompt):
+        payload = {"model": "vendor/model-\"1\"", "messages": [{"role": "user", "content": prompt}]}
+        with patch("git_commitai.REQUEST_BODY_SEGMENT", 7):
+            body = git_commitai.build_request_body(payload["model"], prompt)
+        assert bytes(body) == json.dumps(payload).encode("utf-8")
+
+    def test_body_reused_across_attempts(self):
+        config = {"api_key": "k", "api_url": "https://api.example.com", "model": "m"}
+        settings = git_commitai.RunSettings(max_retries=3, retry_delay=0)
+        response = json.dumps({"choices": [{"message": {"content": "Done"}}]}).encode()
+
+        with patch("git_commitai.urlopen") as mock_urlopen:
+            mock_urlopen.side_effect = [
+                HTTPError("url", 503, "Unavailable", {}, None),
+                HTTPError("url", 503, "Unavailable", {}, None),
+                MagicMock(**{"__enter__.return_value.read.return_value": response}),
+            ]
+            assert git_commitai.make_api_request(config, "prompt", settings=settings) == "Done"
+
+        bodies = [call.args[0].data for call in mock_urlopen.call_args_list]
+        assert len(bodies) == 3 and bodies[0] is bodies[1] is bodies[2]
+        assert json.loads(bytes(bodies[0]))["messages"][0]["content"] == "prompt"
+
+
 class TestEnvConfig:
     """Test environment configuration handling."""
 
     def test_no_api_key(self):
         """Test behavior when API key is not set."""
         with patch.dict("os.environ", {}, clear=True):
-            with pytest.raises(SystemExit):
+            with pytest.raises(git_commitai.ConfigError):
                 # Create a mock args object with no overrides
                 mock_args = MagicMock()
                 mock_args.api_key = None
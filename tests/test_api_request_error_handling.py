@@ -22,10 +22,10 @@ class TestAPIRequestErrorHandling:
         with patch("git_commitai.urlopen") as mock_urlopen:
             mock_urlopen.side_effect = HTTPError("url", 401, "Unauthorized", {}, None)
 
-            with pytest.raises(SystemExit) as exc_info:
+            with pytest.raises(git_commitai.APIRequestError) as exc_info:
                 git_commitai.make_api_request(config, "test message")
 
-            assert exc_info.value.code == 1
+            assert exc_info.value.exit_code == 1
             # Should only call once for 4xx errors (no retries)
             assert mock_urlopen.call_count == 1
 
@@ -46,7 +46,7 @@ class TestAPIRequestErrorHandling:
         with patch("git_commitai.urlopen") as mock_urlopen:
             mock_urlopen.side_effect = HTTPError("url", 500, "Server Error", {}, None)
 
-            with pytest.raises(SystemExit):
+            with pytest.raises(git_commitai.APIRequestError):
                 git_commitai.make_api_request(config, "test message")
 
             # Should retry for 5xx errors
@@ -69,7 +69,7 @@ class TestAPIRequestErrorHandling:
         with patch("git_commitai.urlopen") as mock_urlopen:
             mock_urlopen.side_effect = URLError("Connection refused")
 
-            with pytest.raises(SystemExit):
+            with pytest.raises(git_commitai.APIRequestError):
                 git_commitai.make_api_request(config, "test message")
 
         git_commitai.MAX_RETRIES = original_max_retries
@@ -89,7 +89,7 @@ class TestAPIRequestErrorHandling:
         with patch("git_commitai.urlopen") as mock_urlopen:
             mock_urlopen.return_value.__enter__.return_value.read.return_value = b"not json"
 
-            with pytest.raises(SystemExit):
+            with pytest.raises(git_commitai.APIRequestError):
                 git_commitai.make_api_request(config, "test message")
 
             assert mock_urlopen.call_count == 2
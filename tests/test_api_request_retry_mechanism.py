@@ -57,7 +57,7 @@ class TestAPIRequestRetryMechanism:
 
         with patch("git_commitai.urlopen", side_effect=URLError("Failed")):
             with patch("git_commitai.time.sleep") as mock_sleep:
-                with pytest.raises(SystemExit):
+                with pytest.raises(git_commitai.APIRequestError):
                     git_commitai.make_api_request(config, "test")
 
                 # Check backoff delays
@@ -39,12 +39,13 @@ class TestCompleteEdgeCaseCoverage:
 
     def test_show_git_status_with_renamed_files(self):
         """Test show_git_status with renamed files."""
-        with patch("git_commitai.run_git") as mock_run:
-            mock_run.side_effect = [
-                "main",
-                "",  # Not initial commit
-                "R  old.txt -> new.txt\n M modified.txt"
-            ]
+        with patch("git_commitai.run_git") as mock_run, \
+             patch("git_commitai.load_gitcommitai_config", return_value={}):
+            mock_run.return_value = (
+                "# branch.oid abc123\0# branch.head main\0"
+                "2 R. N... 100644 100644 100644 abc abc R100 new.txt\0old.txt\0"
+                "1 .M N... 100644 100644 100644 abc def modified.txt\0"
+            )
 
             with patch("sys.stdout", new=StringIO()) as fake_out:
                 git_commitai.show_git_status()
@@ -53,8 +54,6 @@ class TestCompleteEdgeCaseCoverage:
 
     def test_main_with_all_debug_overrides(self):
         """Test main with all debug config overrides."""
-        original_debug = git_commitai.DEBUG
-
         with patch("subprocess.run") as mock_run:
             mock_run.return_value.returncode = 0
 
@@ -86,9 +85,6 @@ class TestCompleteEdgeCaseCoverage:
                                                                 assert config["api_url"] == "https://cli-url.com"
                                                                 assert config["model"] == "cli-model"
 
-        # Reset debug flag
-        git_commitai.DEBUG = original_debug
-
     def test_get_git_diff_with_binary_file_dev_null(self):
         """Test get_git_diff with binary file deleted or added."""
         diff_output = "Binary files a/deleted.bin and /dev/null differ"
@@ -115,12 +111,15 @@ class TestCompleteEdgeCaseCoverage:
 
     def test_show_git_status_complex_porcelain(self):
         """Test show_git_status with complex porcelain output."""
-        with patch("git_commitai.run_git") as mock_run:
-            mock_run.side_effect = [
-                "feature-branch",
-                "",  # HEAD exists
-                "MM staged_and_modified.txt\nAD added_then_deleted.txt\n?? untracked.txt\n D deleted.txt"
-            ]
+        with patch("git_commitai.run_git") as mock_run, \
+             patch("git_commitai.load_gitcommitai_config", return_value={}):
+            mock_run.return_value = (
+                "# branch.oid abc123\0# branch.head feature-branch\0"
+                "1 MM N... 100644 100644 100644 abc def staged_and_modified.txt\0"
+                "1 AD N... 000000 100644 000000 000 def added_then_deleted.txt\0"
+                "? untracked.txt\0"
+                "1 .D N... 100644 100644 000000 abc abc deleted.txt\0"
+            )
 
             with patch("sys.stdout", new=StringIO()) as fake_out:
                 git_commitai.show_git_status()
@@ -150,7 +149,7 @@ class TestCompleteEdgeCaseCoverage:
             mock_response.__exit__ = lambda self, *args: None
             mock_urlopen.return_value = mock_response
 
-            with pytest.raises(SystemExit):
+            with pytest.raises(git_commitai.APIRequestError):
                 git_commitai.make_api_request(config, "test")
 
         git_commitai.MAX_RETRIES = original_max_retries
@@ -55,7 +55,7 @@ def test_get_staged_files_file_processing_error():
     with patch("git_commitai.run_git") as mock_run_git:
         # File list succeeds, but processing individual file fails
         mock_run_git.side_effect = [
-            "file1.txt\nfile2.txt",  # File list
+            "file1.txt\0file2.txt\0",  # File list
             "",                       # numstat for file1
             Exception("Error reading file1"),  # Error on file1 content
             "",                       # numstat for file2
@@ -84,7 +84,7 @@ def test_git_root_fallback_on_exception():
 
 def test_load_gitcommitai_config_exception():
     """Test load_gitcommitai_config handles exceptions gracefully (line 208-209)."""
-    with patch("git_commitai.get_git_root", return_value="/tmp"), \
+    with patch("git_commitai.find_work_tree", return_value="/tmp"), \
          patch("os.path.exists", return_value=True), \
          patch("builtins.open", side_effect=IOError("Permission denied")):
 
@@ -7,7 +7,7 @@ import git_commitai
 
 
 def test_file_exceeds_max_size():
-    """Test that files exceeding MAX_FILE_SIZE show metadata only."""
+    """Test that files exceeding MAX_FILE_SIZE show an excerpt only."""
     with patch("git_commitai.run_git") as mock_run_git, \
          patch("git_commitai.MAX_FILE_SIZE", 1024), \
          patch("git_commitai.MAX_TOTAL_FILES", 100 * 1024):  # High total limit for test
@@ -18,6 +18,7 @@ def test_file_exceeds_max_size():
             "large_file.txt",  # diff --cached --name-only
             "",                # numstat check (not binary)
             large_content,     # git show :large_file.txt
+            "",                # diff -U0 for the changed lines
         ]
 
         result = git_commitai.get_staged_files()
@@ -27,11 +28,11 @@ def test_file_exceeds_max_size():
         assert "(large file)" in result
         # Content should NOT be included
         assert large_content not in result
-        # Should show metadata instead
+        # Should show an excerpt instead
         assert "File too large" in result
         assert "2.0KB" in result
         assert "limit: 1.0KB" in result
-        assert "content excluded from AI prompt" in result
+        assert "excerpt of its first and last lines" in result
 
 
 def test_file_within_max_size():
@@ -87,6 +88,7 @@ def test_file_one_byte_over_max_size():
             "over_file.txt",
             "",
             over_content,
+            "",
         ]
 
         result = git_commitai.get_staged_files()
@@ -116,11 +118,12 @@ def test_multiple_files_some_exceed_limit():
         large = "x" * 2048
 
         mock_run_git.side_effect = [
-            "small.txt\nlarge.txt",  # both files
+            "small.txt\0large.txt\0",  # both files
             "",                       # numstat small
             small,                    # content small
             "",                       # numstat large
             large,                    # content large
+            "",                       # changed lines large
         ]
 
         result = git_commitai.get_staged_files()
@@ -129,7 +132,7 @@ def test_multiple_files_some_exceed_limit():
         assert "small.txt" in result
         assert small in result
 
-        # Large file: metadata only
+        # Large file: excerpt only
         assert "large.txt" in result
         assert large not in result
         assert "File too large" in result
@@ -147,6 +150,7 @@ def test_file_size_check_uses_byte_count():
             "unicode.txt",
             "",
             unicode_content,
+            "",
         ]
 
         result = git_commitai.get_staged_files()
@@ -192,6 +196,7 @@ def test_size_display_formatting():
             "file.txt",
             "",
             large,
+            "",
         ]
 
         result = git_commitai.get_staged_files()
@@ -2,7 +2,7 @@
 
 import pytest
 import tempfile
-from unittest.mock import patch, MagicMock
+from unittest.mock import ANY, patch, MagicMock
 
 import git_commitai
 
@@ -159,7 +159,8 @@ class TestAllowEmptyFlag:
                                                     mock_check.assert_called_once_with(
                                                         amend=False,
                                                         auto_stage=False,
-                                                        allow_empty=True
+                                                        allow_empty=True,
+                                                        repo_config=ANY,
                                                     )
 
                                                     # Verify create_commit_message_file was called with allow_empty=True
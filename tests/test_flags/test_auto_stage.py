@@ -3,7 +3,7 @@
 import pytest
 import subprocess
 import tempfile
-from unittest.mock import patch, MagicMock
+from unittest.mock import ANY, patch, MagicMock
 from io import StringIO
 
 import git_commitai
@@ -138,7 +138,8 @@ class TestAutoStageFlag:
                                                     mock_check.assert_called_once_with(
                                                         amend=False,
                                                         auto_stage=True,
-                                                        allow_empty=False
+                                                        allow_empty=False,
+                                                        repo_config=ANY,
                                                     )
 
                                                     # Verify create_commit_message_file was called with auto_staged=True
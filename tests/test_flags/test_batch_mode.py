@@ -0,0 +1,107 @@
+"""Tests for the non-interactive --yes and --json modes."""
+
+import json
+from io import StringIO
+from unittest.mock import patch
+
+import pytest
+
+import git_commitai
+
+CONFIG = {"api_key": "test", "api_url": "http://test", "model": "test-model", "repo_config": {}}
+RESPONSE = "Add feature\n\n# ⚠️  WARNING: Hardcoded secret\n# Found in: app.py"
+
+
+def run_main(argv, response=RESPONSE, staged=True, commit_returncode=0):
+    """Run main() with mocked git and API; returns (exit code, stdout, subprocess mock)."""
+    with patch("subprocess.run") as mock_run, \
+         patch("git_commitai.check_staged_changes", return_value=staged), \
+         patch("git_commitai.get_env_config", return_value=CONFIG), \
+         patch("git_commitai.get_git_diff", return_value="```\n+print('hi')\n```"), \
+         patch("git_commitai.get_staged_files", return_value="app.py\n```\nprint('hi')\n```\n"), \
+         patch("git_commitai.make_api_request", return_value=response), \
+         patch("git_commitai.create_commit_message_file") as mock_file, \
+         patch("git_commitai.open_editor") as mock_editor, \
+         patch("sys.argv", ["git-commitai"] + argv), \
+         patch("sys.stdout", new=StringIO()) as fake_out:
+        mock_run.return_value.returncode = commit_returncode
+        mock_run.return_value.stderr = "hook failed"
+        code = 0
+        try:
+            git_commitai.main()
+        except SystemExit as e:
+            code = e.code
+        mock_file.assert_not_called()
+        mock_editor.assert_not_called()
+    return code, fake_out.getvalue(), mock_run
+
+
+def commit_calls(mock_run):
+    return [c for c in mock_run.call_args_list if c[0][0][:2] == ["git", "commit"]]
+
+
+class TestYesFlag:
+    """Test committing without opening the editor."""
+
+    def test_commits_generated_message(self):
+        code, _, mock_run = run_main(["--yes", "--no-verify"])
+        assert code == 0
+        calls = commit_calls(mock_run)
+        assert len(calls) == 1
+        assert calls[0][0][0] == ["git", "commit", "--no-verify", "-F", "-"]
+        # Warnings are stripped from the committed message
+        assert calls[0].kwargs["input"] == "Add feature\n"
+
+    def test_commit_failure_exit_code(self):
+        code, _, _ = run_main(["-y"], commit_returncode=1)
+        assert code == 1
+
+    def test_dry_run_does_not_commit(self):
+        with patch("git_commitai.show_dry_run_summary", side_effect=SystemExit(0)) as mock_summary:
+            code, _, mock_run = run_main(["--yes", "--dry-run"])
+        assert code == 0
+        assert commit_calls(mock_run) == []
+        mock_summary.assert_called_once()
+
+
+class TestJsonFlag:
+    """Test emitting the result as JSON."""
+
+    def test_document(self):
+        code, out, mock_run = run_main(["--json"])
+        assert code == 0
+        doc = json.loads(out)
+        assert doc["message"] == "Add feature"
+        assert doc["warnings"] == ["⚠️  WARNING: Hardcoded secret\nFound in: app.py"]
+        assert doc["model"] == "test-model"
+        assert doc["committed"] is False
+        assert doc["prompt_size"]["diff"] == len("```\n+print('hi')\n```")
+        assert doc["prompt_size"]["total"] > doc["prompt_size"]["base"]
+        assert set(doc["timings"]) == {"config", "prompt", "diff", "files", "scrub", "api"}
+        assert commit_calls(mock_run) == []
+
+    def test_json_with_yes_commits(self):
+        code, out, mock_run = run_main(["--json", "--yes"])
+        assert code == 0
+        assert json.loads(out)["committed"] is True
+        assert commit_calls(mock_run)[0].kwargs["capture_output"] is True
+
+    def test_nothing_staged(self):
+        code, out, _ = run_main(["--json"], staged=False)
+        assert code == 1
+        assert json.loads(out) == {"error": "no changes added to commit"}
+
+    def test_api_error(self):
+        with patch("git_commitai.make_api_request", side_effect=git_commitai.APIRequestError("HTTP 500")):
+            with patch("subprocess.run") as mock_run, \
+                 patch("git_commitai.check_staged_changes", return_value=True), \
+                 patch("git_commitai.get_env_config", return_value=CONFIG), \
+                 patch("git_commitai.get_git_diff", return_value=""), \
+                 patch("git_commitai.get_staged_files", return_value=""), \
+                 patch("sys.argv", ["git-commitai", "--json"]), \
+                 patch("sys.stdout", new=StringIO()) as fake_out:
+                mock_run.return_value.returncode = 0
+                with pytest.raises(SystemExit) as exc_info:
+                    git_commitai.main()
+        assert exc_info.value.code == 1
+        assert json.loads(fake_out.getvalue()) == {"error": "HTTP 500"}
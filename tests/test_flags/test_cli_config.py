@@ -1,6 +1,7 @@
 """Tests for CLI configuration override flags (--api-key, --api-url, --model)."""
 
 import pytest
+import json
 import os
 from unittest.mock import patch, MagicMock
 from io import StringIO
@@ -390,27 +391,23 @@ class TestCLIConfigOverrides:
         }
 
         with patch("git_commitai.urlopen") as mock_urlopen:
-            with patch("json.dumps") as mock_json_dumps:
-                mock_json_dumps.return_value = '{"test": "data"}'
+            # Mock successful response
+            mock_response = MagicMock()
+            mock_response.read.return_value = b'{"choices": [{"message": {"content": "Test message"}}]}'
+            mock_urlopen.return_value.__enter__.return_value = mock_response
 
-                # Mock successful response
-                mock_response = MagicMock()
-                mock_response.read.return_value = b'{"choices": [{"message": {"content": "Test message"}}]}'
-                mock_urlopen.return_value.__enter__.return_value = mock_response
+            result = git_commitai.make_api_request(config, "test prompt")
 
-                result = git_commitai.make_api_request(config, "test prompt")
+            # Verify Request was created with correct URL
+            request_call = mock_urlopen.call_args[0][0]
+            assert request_call.full_url == "https://override.api.com/v1/chat"
 
-                # Verify Request was created with correct URL
-                request_call = mock_urlopen.call_args[0][0]
-                assert request_call.full_url == "https://override.api.com/v1/chat"
+            # Verify headers include the override key
+            assert request_call.headers["Authorization"] == "Bearer test-override-key"
 
-                # Verify headers include the override key
-                assert request_call.headers["Authorization"] == "Bearer test-override-key"
-
-                # Verify the model was included in payload
-                mock_json_dumps.assert_called_once()
-                payload = mock_json_dumps.call_args[0][0]
-                assert payload["model"] == "override-model"
+            # Verify the model was included in payload
+            payload = json.loads(bytes(request_call.data))
+            assert payload["model"] == "override-model"
 
     def test_precedence_cli_over_env(self):
         """Test that CLI arguments have precedence over environment variables."""
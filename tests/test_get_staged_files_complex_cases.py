@@ -9,7 +9,7 @@ class TestGetStagedFilesComplexCases:
         with patch("git_commitai.run_git") as mock_run:
             def side_effect(args, check=True):
                 if "diff" in args and "--cached" in args and "--name-only" in args:
-                    return "file1.py\nfile2.py"
+                    return "file1.py\0file2.py\0"
                 elif "--numstat" in args:
                     # Simulate error for one file
                     if "file1.py" in args:
@@ -7,99 +7,131 @@ from io import StringIO
 import git_commitai
 
 
+def status_v2(*records, branch="main", oid="1234567890abcdef1234567890abcdef12345678"):
+    """Build git status --porcelain=v2 --branch -z output."""
+    headers = [f"# branch.oid {oid}", f"# branch.head {branch}"]
+    return "\0".join(headers + list(records)) + "\0"
+
+
+def changed(xy, path):
+    """Ordinary changed-entry record for porcelain v2."""
+    return f"1 {xy} N... 100644 100644 100644 abc123 def456 {path}"
+
+
 class TestGitStatus:
     """Test the git status parsing and display functions."""
 
-    def test_parse_porcelain_modified_files(self):
-        """Test parsing modified files from git status --porcelain."""
-        with patch("git_commitai.run_git") as mock_run:
-            # Setup mock returns
-            mock_run.side_effect = [
-                "main",  # git branch --show-current
-                "",  # git rev-parse HEAD (success, not initial commit)
-                " M README.md\n M git-commitai\n?? LICENSE",  # git status --porcelain
-            ]
-
+    def run_status(self, output, **kwargs):
+        with patch("git_commitai.run_git", return_value=output) as mock_run, \
+             patch("git_commitai.load_gitcommitai_config", return_value={}):
             with patch("sys.stdout", new=StringIO()) as fake_out:
-                git_commitai.show_git_status()
-                output = fake_out.getvalue()
+                git_commitai.show_git_status(**kwargs)
+        return fake_out.getvalue(), mock_run
 
-                # Check that both modified files are shown
-                assert "modified:   README.md" in output
-                assert "modified:   git-commitai" in output
-                assert "LICENSE" in output
-                assert "Untracked files:" in output
-                assert "Changes not staged for commit:" in output
+    def test_single_git_call(self):
+        """Test that status comes from one porcelain v2 call."""
+        _, mock_run = self.run_status(status_v2())
+        mock_run.assert_called_once_with(["status", "--porcelain=v2", "--branch", "-z"])
+
+    def test_parse_porcelain_modified_files(self):
+        """Test parsing modified and untracked files."""
+        output, _ = self.run_status(status_v2(
+            changed(".M", "README.md"), changed(".M", "git-commitai"), "? LICENSE",
+        ))
+
+        # Check that both modified files are shown
+        assert "On branch main" in output
+        assert "modified:   README.md" in output
+        assert "modified:   git-commitai" in output
+        assert "LICENSE" in output
+        assert "Untracked files:" in output
+        assert "Changes not staged for commit:" in output
 
     def test_parse_porcelain_staged_and_modified(self):
         """Test parsing files that are staged with additional modifications."""
-        with patch("git_commitai.run_git") as mock_run:
-            mock_run.side_effect = [
-                "main",
-                "",
-                "MM file1.txt\nM  file2.txt\n M file3.txt",
-            ]
+        output, _ = self.run_status(status_v2(
+            changed("MM", "file1.txt"), changed("M.", "file2.txt"), changed(".M", "file3.txt"),
+        ))
 
-            with patch("sys.stdout", new=StringIO()) as fake_out:
-                git_commitai.show_git_status()
-                output = fake_out.getvalue()
-
-                # MM means staged with additional unstaged changes
-                assert "modified:   file1.txt" in output
-                # M  means staged only (not shown in unstaged)
-                assert "modified:   file2.txt" not in output
-                # _M means modified but not staged
-                assert "modified:   file3.txt" in output
+        # MM means staged with additional unstaged changes
+        assert "modified:   file1.txt" in output
+        # M. means staged only (not shown in unstaged)
+        assert "modified:   file2.txt" not in output
+        # .M means modified but not staged
+        assert "modified:   file3.txt" in output
 
     def test_parse_porcelain_deleted_files(self):
         """Test parsing deleted files."""
-        with patch("git_commitai.run_git") as mock_run:
-            mock_run.side_effect = ["main", "", " D deleted.txt\nD  staged_delete.txt"]
+        output, _ = self.run_status(status_v2(changed(".D", "deleted.txt"), changed("D.", "staged_delete.txt")))
 
-            with patch("sys.stdout", new=StringIO()) as fake_out:
-                git_commitai.show_git_status()
-                output = fake_out.getvalue()
+        assert "deleted:    deleted.txt" in output
+        assert "deleted:    staged_delete.txt" not in output
+
+    def test_paths_with_spaces_and_newlines(self):
+        """Test that NUL-separated records keep unusual paths intact."""
+        output, _ = self.run_status(status_v2(changed(".M", "my file.txt"), "? new\nline.txt"))
+
+        assert "modified:   my file.txt" in output
+        assert "\tnew\nline.txt" in output
 
-                assert "deleted:    deleted.txt" in output
-                assert "deleted:    staged_delete.txt" not in output
+    def test_renamed_file_skips_original_path(self):
+        """Test that the original path of a rename is not parsed as a record."""
+        rename = "2 R. N... 100644 100644 100644 abc123 abc123 R100 new.txt"
+        output, _ = self.run_status(status_v2(rename, "old.txt", changed(".M", "modified.txt")))
+
+        assert "modified:   modified.txt" in output
+        assert "old.txt" not in output
 
     def test_clean_working_tree(self):
         """Test output when working tree is clean."""
-        with patch("git_commitai.run_git") as mock_run:
-            mock_run.side_effect = [
-                "main",
-                "",
-                "",  # No output from git status --porcelain
-            ]
-
-            with patch("sys.stdout", new=StringIO()) as fake_out:
-                git_commitai.show_git_status()
-                output = fake_out.getvalue()
+        output, _ = self.run_status(status_v2())
 
-                assert "nothing to commit, working tree clean" in output
+        assert "nothing to commit, working tree clean" in output
 
     def test_initial_commit(self):
         """Test output for initial commit."""
-        with patch("git_commitai.run_git") as mock_run:
+        output, _ = self.run_status(status_v2("? README.md", oid="(initial)"))
 
-            def side_effect(args, check=True):
-                if "branch" in args and "--show-current" in args:
-                    return "main"
-                elif "rev-parse" in args and "HEAD" in args:
-                    if check:
-                        raise subprocess.CalledProcessError(1, args)
-                    return ""
-                elif "status" in args and "--porcelain" in args:
-                    return "?? README.md"
-                return ""
+        assert "Initial commit" in output
 
-            mock_run.side_effect = side_effect
+    def test_detached_head(self):
+        """Test output in detached HEAD state."""
+        output, _ = self.run_status(status_v2(branch="(detached)", oid="abc1234567890"))
 
-            with patch("sys.stdout", new=StringIO()) as fake_out:
+        assert "HEAD detached at abc1234" in output
+
+    def test_untracked_mode_argument(self):
+        """Test that an explicit untracked-file mode is passed to git."""
+        output, mock_run = self.run_status(status_v2(), untracked_files="no")
+
+        mock_run.assert_called_once_with(["status", "--porcelain=v2", "--branch", "-z", "-uno"])
+        assert "nothing to commit (use -u to show untracked files)" in output
+
+    def test_untracked_mode_from_config(self):
+        """Test that the untracked_files setting in .gitcommitai is used."""
+        with patch("git_commitai.run_git", return_value=status_v2()) as mock_run, \
+             patch("git_commitai.load_gitcommitai_config", return_value={"untracked_files": "normal"}):
+            with patch("sys.stdout", new=StringIO()):
                 git_commitai.show_git_status()
-                output = fake_out.getvalue()
 
-                assert "Initial commit" in output
+        mock_run.assert_called_once_with(["status", "--porcelain=v2", "--branch", "-z", "-unormal"])
+
+    def test_untracked_mode_from_loaded_config(self):
+        """Test that config passed in is used instead of reading it again."""
+        with patch("git_commitai.run_git", return_value=status_v2()) as mock_run, \
+             patch("git_commitai.load_gitcommitai_config") as mock_load:
+            with patch("sys.stdout", new=StringIO()):
+                git_commitai.show_git_status(repo_config={"untracked_files": "no"})
+
+        mock_load.assert_not_called()
+        mock_run.assert_called_once_with(["status", "--porcelain=v2", "--branch", "-z", "-uno"])
+
+    def test_untracked_mode_parsed(self):
+        """Test parsing and validating untracked_files in .gitcommitai."""
+        config = git_commitai.parse_gitcommitai_config("untracked_files: No\nTemplate")
+        assert config["untracked_files"] == "no"
+        config = git_commitai.parse_gitcommitai_config("untracked_files: sometimes\nTemplate")
+        assert "untracked_files" not in config
 
 
 class TestCheckStagedChanges:
@@ -11,7 +11,7 @@ class TestLoadGitCommitAIConfig:
 
     def test_no_config_file(self):
         """Test when no .gitcommitai file exists."""
-        with patch("git_commitai.get_git_root", return_value="/repo/root"):
+        with patch("git_commitai.find_work_tree", return_value="/repo/root"):
             with patch("os.path.exists", return_value=False):
                 config = git_commitai.load_gitcommitai_config()
                 assert config == {}
@@ -29,7 +29,7 @@ Files: {FILES}
 
 Generate a commit message:"""
 
-        with patch("git_commitai.get_git_root", return_value="/repo/root"):
+        with patch("git_commitai.find_work_tree", return_value="/repo/root"):
             with patch("os.path.exists", return_value=True):
                 with patch("builtins.open", mock_open(read_data=template_content)):
                     config = git_commitai.load_gitcommitai_config()
@@ -53,7 +53,7 @@ Changes: {DIFF}
 
 Generate message:"""
 
-        with patch("git_commitai.get_git_root", return_value="/repo/root"):
+        with patch("git_commitai.find_work_tree", return_value="/repo/root"):
             with patch("os.path.exists", return_value=True):
                 with patch("builtins.open", mock_open(read_data=content)):
                     config = git_commitai.load_gitcommitai_config()
@@ -68,7 +68,7 @@ Generate message:"""
         content = """model: claude-3-opus
 Template content here"""
 
-        with patch("git_commitai.get_git_root", return_value="/repo/root"):
+        with patch("git_commitai.find_work_tree", return_value="/repo/root"):
             with patch("os.path.exists", return_value=True):
                 with patch("builtins.open", mock_open(read_data=content)):
                     config = git_commitai.load_gitcommitai_config()
@@ -80,7 +80,7 @@ Template content here"""
         content = """model=gpt-4-turbo
 Template content here"""
 
-        with patch("git_commitai.get_git_root", return_value="/repo/root"):
+        with patch("git_commitai.find_work_tree", return_value="/repo/root"):
             with patch("os.path.exists", return_value=True):
                 with patch("builtins.open", mock_open(read_data=content)):
                     config = git_commitai.load_gitcommitai_config()
@@ -94,7 +94,7 @@ Template content here"""
             "prompt": "Custom prompt template with {DIFF} and {FILES}"
         }
 
-        with patch("git_commitai.get_git_root", return_value="/repo/root"):
+        with patch("git_commitai.find_work_tree", return_value="/repo/root"):
             with patch("os.path.exists", return_value=True):
                 with patch("builtins.open", mock_open(read_data=json.dumps(json_config))):
                     config = git_commitai.load_gitcommitai_config()
@@ -109,7 +109,7 @@ Template content here"""
             "some_other_field": "value"
         }
 
-        with patch("git_commitai.get_git_root", return_value="/repo/root"):
+        with patch("git_commitai.find_work_tree", return_value="/repo/root"):
             with patch("os.path.exists", return_value=True):
                 with patch("builtins.open", mock_open(read_data=json.dumps(json_config))):
                     config = git_commitai.load_gitcommitai_config()
@@ -122,7 +122,7 @@ Template content here"""
         content = """{This is not valid JSON}
 But it's a valid template with {DIFF}"""
 
-        with patch("git_commitai.get_git_root", return_value="/repo/root"):
+        with patch("git_commitai.find_work_tree", return_value="/repo/root"):
             with patch("os.path.exists", return_value=True):
                 with patch("builtins.open", mock_open(read_data=content)):
                     config = git_commitai.load_gitcommitai_config()
@@ -132,21 +132,21 @@ But it's a valid template with {DIFF}"""
 
     def test_file_read_error(self):
         """Test handling of file read errors."""
-        with patch("git_commitai.get_git_root", return_value="/repo/root"):
+        with patch("git_commitai.find_work_tree", return_value="/repo/root"):
             with patch("os.path.exists", return_value=True):
                 with patch("builtins.open", side_effect=IOError("Permission denied")):
                     config = git_commitai.load_gitcommitai_config()
                     assert config == {}
 
     def test_git_root_error(self):
-        """Test handling when git root cannot be determined."""
-        with patch("git_commitai.get_git_root", side_effect=Exception("Not a git repo")):
+        """Test handling when the work tree cannot be determined."""
+        with patch("git_commitai.find_work_tree", side_effect=Exception("Not a git repo")):
             config = git_commitai.load_gitcommitai_config()
             assert config == {}
 
     def test_empty_file(self):
         """Test loading an empty .gitcommitai file."""
-        with patch("git_commitai.get_git_root", return_value="/repo/root"):
+        with patch("git_commitai.find_work_tree", return_value="/repo/root"):
             with patch("os.path.exists", return_value=True):
                 with patch("builtins.open", mock_open(read_data="")):
                     config = git_commitai.load_gitcommitai_config()
@@ -156,7 +156,7 @@ But it's a valid template with {DIFF}"""
         """Test loading a file with only whitespace."""
         content = "   \n\n\t\n   "
 
-        with patch("git_commitai.get_git_root", return_value="/repo/root"):
+        with patch("git_commitai.find_work_tree", return_value="/repo/root"):
             with patch("os.path.exists", return_value=True):
                 with patch("builtins.open", mock_open(read_data=content)):
                     config = git_commitai.load_gitcommitai_config()
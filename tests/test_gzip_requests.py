@@ -0,0 +1,137 @@
+"""Tests for gzip-compressed API request bodies."""
+
+import gzip
+import json
+import os
+import time
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+import git_commitai
+
+PROMPT = "".join(f"+    value_{i} = compute(value_{i - 1})\n" for i in range(2000))
+
+
+@pytest.mark.parametrize("value, hosts", [
+    ("yes", ["*"]),
+    (True, ["*"]),
+    ("off", []),
+    ("", []),
+    ("api.openai.com, OpenRouter.ai", ["api.openai.com", "openrouter.ai"]),
+    ("localhost", ["localhost"]),
+])
+def test_parse_gzip_hosts(value, hosts):
+    assert git_commitai.parse_gzip_hosts(value) == hosts
+
+
+@pytest.mark.parametrize("url, hosts, expected", [
+    ("https://openrouter.ai/api/v1/chat/completions", ["openrouter.ai"], True),
+    ("https://api.openai.com/v1/chat/completions", ["openrouter.ai"], False),
+    ("http://127.0.0.1:8080/v1", ["*"], True),
+    ("http://127.0.0.1:8080/v1", [], False),
+])
+def test_wants_gzip(url, hosts, expected):
+    assert git_commitai.wants_gzip(url, hosts) is expected
+
+
+class TestConfig:
+    """Test reading the gzip_requests setting."""
+
+    def args(self):
+        return MagicMock(api_key="k", api_url=None, model=None)
+
+    def test_from_config_file(self):
+        with patch("git_commitai.load_gitcommitai_config", return_value={"gzip_requests": ["openrouter.ai"]}):
+            assert git_commitai.get_env_config(self.args())["gzip_requests"] == ["openrouter.ai"]
+
+    def test_environment_overrides_file(self):
+        with patch("git_commitai.load_gitcommitai_config", return_value={"gzip_requests": ["openrouter.ai"]}), \
+             patch.dict("os.environ", {"GIT_COMMIT_AI_GZIP": "0"}):
+            assert git_commitai.get_env_config(self.args())["gzip_requests"] == []
+
+    def test_off_by_default(self):
+        with patch("git_commitai.load_gitcommitai_config", return_value={}):
+            assert git_commitai.get_env_config(self.args())["gzip_requests"] == []
+
+    def test_settings_line(self):
+        config = git_commitai.parse_gitcommitai_config("gzip_requests: openrouter.ai localhost\n{DIFF}\n")
+        assert config["gzip_requests"] == ["openrouter.ai", "localhost"]
+
+
+class TestRequests:
+    """Test sending gzipped bodies and falling back to plain ones."""
+
+    def complete(self, server, prompt=PROMPT, hosts=("127.0.0.1",)):
+        config = {"api_key": "k", "api_url": server.url, "model": "m", "gzip_requests": list(hosts)}
+        settings = git_commitai.RunSettings(max_retries=1, retry_delay=0, metrics=git_commitai.RunMetrics())
+        assert git_commitai.request_completion(config, prompt, settings=settings).content
+        return settings.metrics
+
+    def test_large_body_gzipped(self, api_server):
+        api_server.accept_gzip = True
+        metrics = self.complete(api_server)
+        assert api_server.encodings == ["gzip"]
+        assert api_server.requests[0]["messages"][0]["content"] == PROMPT
+        assert metrics.events["request_gzipped"] == 1
+
+    @pytest.mark.parametrize("prompt, hosts", [("short prompt", ["*"]), (PROMPT, ["api.example.com"])])
+    def test_sent_plain(self, api_server, prompt, hosts):
+        api_server.accept_gzip = True
+        self.complete(api_server, prompt, hosts)
+        assert api_server.encodings == [None]
+
+    def test_refused_gzip_falls_back_and_is_remembered(self, api_server):
+        metrics = self.complete(api_server)
+        assert api_server.encodings == ["gzip", None]
+        assert api_server.requests[0]["messages"][0]["content"] == PROMPT
+        assert metrics.events["gzip_refused"] == 1
+        assert git_commitai.gzip_refused(api_server.url)
+
+        self.complete(api_server)
+        assert api_server.encodings == ["gzip", None, None]
+
+    def test_retry_after_empty_response_sends_same_body(self):
+        config = {"api_key": "k", "api_url": "https://api.example.com", "model": "m", "gzip_requests": ["*"]}
+        settings = git_commitai.RunSettings(max_retries=2, retry_delay=0)
+        empty = json.dumps({"choices": [{"message": {"content": ""}}]}).encode()
+        good = json.dumps({"choices": [{"message": {"content": "Done"}}]}).encode()
+
+        with patch("git_commitai.urlopen") as mock_urlopen:
+            mock_urlopen.return_value.__enter__.return_value.read.side_effect = [empty, good]
+            assert git_commitai.make_api_request(config, PROMPT, settings=settings) == "Done"
+
+        first, second = [call.args[0].data for call in mock_urlopen.call_args_list]
+        assert isinstance(second, bytes) and second is first
+        assert json.loads(gzip.decompress(second))["messages"][0]["content"] == PROMPT
+
+    def test_other_client_errors_not_retried_plain(self, api_server):
+        api_server.accept_gzip = True
+        config = {"api_key": "k", "api_url": api_server.url, "model": "m", "gzip_requests": ["*"]}
+        with patch.object(api_server.RequestHandlerClass, "status", 401), \
+             pytest.raises(git_commitai.APIRequestError, match="401"):
+            git_commitai.request_completion(config, PROMPT, settings=git_commitai.RunSettings(max_retries=3))
+        assert api_server.encodings == ["gzip"]
+
+
+class TestEndpointsFile:
+    """Test remembering which endpoints refused gzip."""
+
+    def test_refusal_expires(self, tmp_path):
+        path = str(tmp_path / "endpoints.json")
+        git_commitai.remember_gzip_refused("https://a.example/v1", path)
+        git_commitai.remember_gzip_refused("https://b.example/v1", path)
+        assert git_commitai.gzip_refused("https://a.example/v1", path)
+        assert not git_commitai.gzip_refused("https://c.example/v1", path)
+
+        later = time.time() + git_commitai.GZIP_RECHECK_SECONDS + 1
+        with patch("time.time", return_value=later):
+            assert not git_commitai.gzip_refused("https://a.example/v1", path)
+
+    def test_unreadable_file_ignored(self, tmp_path):
+        path = tmp_path / "endpoints.json"
+        path.write_text("[not json")
+        assert not git_commitai.gzip_refused("https://a.example/v1", str(path))
+        git_commitai.remember_gzip_refused("https://a.example/v1", str(path))
+        assert list(json.loads(path.read_text())) == ["https://a.example/v1"]
+        assert os.listdir(tmp_path) == ["endpoints.json"]
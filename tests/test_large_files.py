@@ -0,0 +1,162 @@
+"""Tests for excerpting files over the per-file size limit."""
+
+import json
+import shutil
+import subprocess
+from unittest.mock import patch
+
+import pytest
+
+import git_commitai
+
+
+def numbered(count):
+    return "".join(f"line {i}\n" for i in range(1, count + 1))
+
+
+class TestLargeFileExcerpt:
+    """Test keeping the head, tail and changed regions of a file."""
+
+    def excerpt(self, text, max_bytes, changed=(), chunk_size=7):
+        chunks = [text[i:i + chunk_size] for i in range(0, len(text), chunk_size)]
+        return git_commitai.large_file_excerpt(iter(chunks), max_bytes, list(changed))
+
+    @pytest.mark.parametrize("chunk_size", [1, 7, 100_000])
+    def test_head_changes_and_tail(self, chunk_size):
+        lines, read, complete = self.excerpt(numbered(1000), 400, [(500, 500)], chunk_size)
+        assert complete and read == len(numbered(1000))
+        assert lines[0] == "line 1"
+        assert lines[-1] == "line 1000"
+        middle = lines.index("line 500")
+        assert lines[middle - 4:middle + 5] == [
+            "[... 483 lines omitted ...]",
+            "line 497", "line 498", "line 499", "line 500", "line 501", "line 502", "line 503",
+            lines[middle + 4],
+        ]
+        assert lines[middle + 4].startswith("[... ") and lines[middle + 4].endswith(" lines omitted ...]")
+        assert sum(len(line) + 1 for line in lines) < 400 + 200
+
+    def test_deletion_at_end_of_file(self):
+        lines, _, _ = self.excerpt(numbered(1000), 200, [(1000, 1000)])
+        assert lines[-4:] == ["line 997", "line 998", "line 999", "line 1000"]
+
+    def test_long_lines_cut(self):
+        lines, _, _ = self.excerpt("x" * 10_000 + "\nend\n", 800)
+        assert lines == ["x" * 100 + " [... line cut ...]", "end"]
+
+    def test_stops_at_read_limit(self):
+        with patch("git_commitai.LARGE_FILE_READ_LIMIT", 10_000):
+            lines, read, complete = self.excerpt(numbered(100_000), 400, [(50_000, 50_000)], 1000)
+        assert not complete and read <= 11_000
+        assert lines[0] == "line 1"
+        assert lines[-1] == "[... rest of the file not read ...]"
+        assert "line 50000" not in lines
+
+
+class TestChangedLineRanges:
+    """Test reading changed lines from hunk headers."""
+
+    def test_hunks(self):
+        diff = (
+            "diff --git a/f b/f\n--- a/f\n+++ b/f\n"
+            "@@ -3 +3 @@\n-a\n+b\n"
+            "@@ -10,0 +11,4 @@\n+c\n"
+            "@@ -20,2 +23,0 @@\n-d\n"
+            "@@ -1 +0,0 @@\n-e\n"
+        )
+        with patch("git_commitai.run_git", return_value=diff) as mock_run:
+            assert git_commitai.changed_line_ranges("f") == [(3, 3), (11, 14), (23, 23), (1, 1)]
+        assert mock_run.call_args[0][0] == ["diff", "--cached", "-U0", "--diff-filter=M", "--", "f"]
+
+    def test_amend(self):
+        with patch("git_commitai.run_git", return_value="") as mock_run:
+            assert git_commitai.changed_line_ranges("f", amend=True) == []
+        assert mock_run.call_args[0][0] == ["diff", "--cached", "-U0", "--diff-filter=M", "HEAD^", "--", "f"]
+
+
+class TestReadTextPrefix:
+    """Test reading only the beginning of git output."""
+
+    def test_complete_and_partial(self):
+        with patch("git_commitai.stream_git_text", return_value=iter(["abc", "def"])):
+            assert git_commitai.read_text_prefix(["show", ":f"], 10) == ("abcdef", None)
+        with patch("git_commitai.stream_git_text", return_value=iter(["abc", "def", "ghi"])):
+            text, rest = git_commitai.read_text_prefix(["show", ":f"], 4)
+            assert (text, list(rest)) == ("abcdef", ["ghi"])
+
+
+def test_staged_file_excerpt():
+    content = numbered(5000)
+
+    def run_git(args, check=True):
+        if args[0] == "show":
+            return content
+        if "-U0" in args:
+            return "@@ -2500 +2500 @@\n-old\n+line 2500"
+        return "big.txt\0" if "-z" in args else "1\t1\tbig.txt"
+
+    settings = git_commitai.RunSettings(limits=git_commitai.Limits(max_file_size=1024))
+    with patch("git_commitai.run_git", side_effect=run_git):
+        files = git_commitai.get_staged_files(settings=settings)
+    assert files.startswith("big.txt (large file)\n```\nFile too large (")
+    assert "excerpt of its first and last lines and the lines around changes:\nline 1\n" in files
+    assert "\nline 2500\n" in files and "\nline 5000\n```" in files
+    assert len(files) < 2048
+
+
+def staged_files(name, content, max_file_size=1024):
+    def run_git(args, check=True):
+        if args[0] == "show":
+            return content
+        if "-U0" in args:
+            return "@@ -250 +250 @@\n-old\n+new"
+        return f"{name}\0" if "-z" in args else f"1\t1\t{name}"
+
+    settings = git_commitai.RunSettings(limits=git_commitai.Limits(max_file_size=max_file_size))
+    with patch("git_commitai.run_git", side_effect=run_git):
+        return git_commitai.get_staged_files(settings=settings)
+
+
+def test_notebook_excerpt_is_rendered():
+    cells = [
+        {"cell_type": "code", "source": [f"value_{i} = compute({i})\n"],
+         "outputs": [{"output_type": "stream", "text": ["OUTPUT " * 200]}]}
+        for i in range(400)
+    ]
+    files = staged_files("analysis.ipynb", json.dumps({"cells": cells, "metadata": {}, "nbformat": 4}))
+    assert "analysis.ipynb (large file)" in files
+    assert "# %%\nvalue_0 = compute(0)\n" in files and "value_399 = compute(399)" in files
+    assert "OUTPUT" not in files and '"cell_type"' not in files
+
+
+def test_normalized_excerpt_keeps_changed_lines():
+    content = "def f():\n" + "".join(f"        value_{i} = {i}\n" for i in range(1, 500))
+    files = staged_files("module.py", content, max_file_size=4096)
+    assert "module.py (large file)" in files
+    assert "\n value_1 = 1\n" in files and "\n value_249 = 249\n" in files
+    assert "        value_" not in files
+
+
+def _git(repo, *args):
+    subprocess.run(
+        ["git", "-C", str(repo), "-c", "user.name=T", "-c", "user.email=t@example.com"] + list(args),
+        check=True, capture_output=True,
+    )
+
+
+@pytest.mark.integration
+@pytest.mark.skipif(shutil.which("git") is None, reason="git is not installed")
+def test_excerpt_from_git(tmp_path):
+    _git(tmp_path, "init", "-q")
+    (tmp_path / "data.txt").write_text(numbered(200_000))
+    _git(tmp_path, "add", "-A")
+    _git(tmp_path, "commit", "-q", "-m", "Add data")
+    (tmp_path / "data.txt").write_text(numbered(200_000).replace("line 123456\n", "changed 123456\n"))
+    _git(tmp_path, "add", "-A")
+
+    settings = git_commitai.RunSettings(cwd=str(tmp_path), normalize=False)
+    with patch("git_commitai.LARGE_FILE_READ_LIMIT", 4 * 1024 * 1024):
+        files = git_commitai.get_staged_files(settings=settings)
+    assert "data.txt (large file)" in files
+    assert "\nline 1\n" in files and "\nchanged 123456\n" in files and "\nline 200000\n" in files
+    assert len(files) < settings.limits.max_file_size
@@ -0,0 +1,166 @@
+"""Tests for layered (user + repository) configuration and its cache."""
+
+import os
+import json
+from unittest.mock import patch, MagicMock
+
+import pytest
+
+import git_commitai
+
+
+@pytest.fixture
+def repo(tmp_path):
+    """A fake repository root with a .git directory."""
+    root = tmp_path / "repo"
+    (root / ".git").mkdir(parents=True)
+    return root
+
+
+@pytest.fixture
+def global_config(tmp_path, monkeypatch):
+    """Path of the user-level config file (not created)."""
+    xdg = tmp_path / "xdg"
+    monkeypatch.setenv("XDG_CONFIG_HOME", str(xdg))
+    path = xdg / "git-commitai" / "config"
+    path.parent.mkdir(parents=True)
+    return path
+
+
+def load(repo):
+    with git_commitai.run_context(git_commitai.RunSettings(cwd=str(repo))):
+        return git_commitai.load_gitcommitai_config()
+
+
+class TestLayeredConfig:
+    """Test merging the user config file with the repository .gitcommitai."""
+
+    def test_global_path_uses_xdg(self, global_config):
+        """Test that the user config lives under XDG_CONFIG_HOME."""
+        assert git_commitai.get_global_config_path() == str(global_config)
+
+    def test_global_path_defaults_to_dot_config(self):
+        """Test the ~/.config fallback when XDG_CONFIG_HOME is unset."""
+        with patch.dict(os.environ, {"HOME": "/home/user"}):
+            os.environ.pop("XDG_CONFIG_HOME", None)
+            path = git_commitai.get_global_config_path()
+        assert path == os.path.join("/home/user", ".config", "git-commitai", "config")
+
+    def test_global_only(self, repo, global_config):
+        """Test that the user config applies when the repository has none."""
+        global_config.write_text("model: shared-model\nmax_diff_size: 1000\n\nShared template {DIFF}")
+        config = load(repo)
+        assert config["model"] == "shared-model"
+        assert config["max_diff_size"] == 1000
+        assert config["prompt_template"] == "Shared template {DIFF}"
+
+    def test_repo_overrides_global(self, repo, global_config):
+        """Test that .gitcommitai settings override the user config."""
+        global_config.write_text("model: shared-model\nmax_diff_size: 1000\n\nShared template")
+        (repo / ".gitcommitai").write_text("model: repo-model\n\nRepo template")
+        config = load(repo)
+        assert config["model"] == "repo-model"
+        assert config["max_diff_size"] == 1000
+        assert config["prompt_template"] == "Repo template"
+
+    def test_found_from_subdirectory_without_git(self, repo, global_config):
+        """Test that the repository root is found without running git."""
+        (repo / ".gitcommitai").write_text("model: repo-model\n\nRepo template")
+        (repo / "src" / "pkg").mkdir(parents=True)
+        with patch("subprocess.run", side_effect=AssertionError("git was run")), \
+             patch("subprocess.Popen", side_effect=AssertionError("git was run")):
+            assert load(repo / "src" / "pkg")["model"] == "repo-model"
+
+    def test_invalid_values_ignored(self, repo, global_config):
+        """Test that invalid settings are dropped instead of aborting the load."""
+        (repo / ".gitcommitai").write_text("max_file_size: lots\nmax_diff_size: -5\nmodel: gpt-4\nTemplate")
+        config = load(repo)
+        assert "max_file_size" not in config
+        assert "max_diff_size" not in config
+        assert config["model"] == "gpt-4"
+        assert config["prompt_template"] == "Template"
+
+    def test_json_settings(self):
+        """Test that JSON config files accept the same settings."""
+        config = git_commitai.parse_gitcommitai_config(
+            json.dumps({"model": "gpt-4", "max_file_size": 100, "prompt": "P"})
+        )
+        assert config == {"model": "gpt-4", "max_file_size": 100, "prompt_template": "P"}
+
+
+class TestConfigCache:
+    """Test caching the merged config in the git directory."""
+
+    def test_cache_written(self, repo, global_config):
+        """Test that the merged config is stored in the git directory."""
+        (repo / ".gitcommitai").write_text("model: gpt-4\nTemplate")
+        load(repo)
+        cache = json.loads((repo / ".git" / git_commitai.CONFIG_CACHE_FILE).read_text())
+        assert cache["config"] == {"model": "gpt-4", "prompt_template": "Template"}
+
+    def test_cache_hit_skips_parsing(self, repo, global_config):
+        """Test that unchanged config files are not parsed again."""
+        (repo / ".gitcommitai").write_text("model: gpt-4\nTemplate")
+        first = load(repo)
+        with patch("git_commitai.parse_gitcommitai_config") as mock_parse:
+            second = load(repo)
+        mock_parse.assert_not_called()
+        assert second == first
+
+    def test_cache_invalidated_by_change(self, repo, global_config):
+        """Test that editing a config file invalidates the cache."""
+        config_file = repo / ".gitcommitai"
+        config_file.write_text("model: gpt-4\nTemplate")
+        load(repo)
+        config_file.write_text("model: claude-3-opus\nTemplate")
+        stat = config_file.stat()
+        os.utime(config_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+        assert load(repo)["model"] == "claude-3-opus"
+
+    def test_cache_invalidated_by_new_global_file(self, repo, global_config):
+        """Test that creating the user config file invalidates the cache."""
+        assert load(repo) == {}
+        global_config.write_text("model: shared-model")
+        assert load(repo) == {"model": "shared-model"}
+
+    def test_corrupt_cache_ignored(self, repo, global_config):
+        """Test that an unreadable cache falls back to parsing."""
+        (repo / ".git" / git_commitai.CONFIG_CACHE_FILE).write_text("not json")
+        (repo / ".gitcommitai").write_text("model: gpt-4")
+        assert load(repo) == {"model": "gpt-4"}
+
+
+class TestFindGitDir:
+    """Test locating the git directory without running git."""
+
+    def test_dot_git_directory(self, repo):
+        assert git_commitai.find_git_dir(str(repo)) == str(repo / ".git")
+
+    def test_gitdir_file(self, tmp_path):
+        """Test worktrees and submodules whose .git is a file."""
+        root = tmp_path / "worktree"
+        root.mkdir()
+        (root / ".git").write_text("gitdir: ../main/.git/worktrees/wt\n")
+        expected = os.path.normpath(str(tmp_path / "main" / ".git" / "worktrees" / "wt"))
+        assert git_commitai.find_git_dir(str(root)) == expected
+
+    def test_missing(self, tmp_path):
+        assert git_commitai.find_git_dir(str(tmp_path)) is None
+
+
+class TestSizeLimitPrecedence:
+    """Test that environment variables win over config file size limits."""
+
+    def test_env_var_wins(self):
+        args = MagicMock()
+        args.api_key = "key"
+        args.api_url = None
+        args.model = None
+        with patch.dict(os.environ, {"GIT_COMMIT_AI_MAX_DIFF_SIZE": "2048"}), \
+             patch("git_commitai.MAX_DIFF_SIZE", 2048), \
+             patch("git_commitai.MAX_FILE_SIZE", 100), \
+             patch("git_commitai.load_gitcommitai_config",
+                   return_value={"max_diff_size": 999, "max_file_size": 500}):
+            limits = git_commitai.get_env_config(args)["limits"]
+            assert limits.max_diff_size == 2048
+            assert limits.max_file_size == 500
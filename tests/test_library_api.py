@@ -0,0 +1,162 @@
+"""Tests for the importable CommitAI session API."""
+
+import json
+import shutil
+import subprocess
+from unittest.mock import patch, MagicMock
+from urllib.error import HTTPError
+from urllib.request import Request
+
+import pytest
+
+import git_commitai
+
+
+class TestSplitAIWarnings:
+    """Test separating warnings from the generated message."""
+
+    def test_message_only(self):
+        assert git_commitai.split_ai_warnings("Fix bug\n") == ("Fix bug", [])
+
+    def test_warning_blocks(self):
+        text = (
+            "Add login\n\nBody line\n\n"
+            "# ⚠️  WARNING: Hardcoded secret\n# Found in: app.py\n\n"
+            "# ⚠️  WARNING: Typo\n"
+        )
+        message, warnings = git_commitai.split_ai_warnings(text)
+        assert message == "Add login\n\nBody line"
+        assert warnings == ["⚠️  WARNING: Hardcoded secret\nFound in: app.py", "⚠️  WARNING: Typo"]
+
+
+class TestAssemblePrompt:
+    """Test inserting the diff and files into the prompt."""
+
+    def test_default_prompt(self):
+        prompt = git_commitai.assemble_prompt("Base", {}, "DIFF", "FILES")
+        assert prompt.startswith("Base\n\nHere is the git diff of changes:\n\nDIFF")
+        assert "FILES\n\nGenerate the commit message" in prompt
+
+    def test_template_placeholders(self):
+        config = {"prompt_template": "x"}
+        prompt = git_commitai.assemble_prompt("D: {DIFF} F: {FILES}", config, "d", "f")
+        assert prompt == "D: d F: f\n\nGenerate the commit message following the rules above:"
+
+
+class TestRequestCompletion:
+    """Test the structured API response."""
+
+    def test_usage_returned(self):
+        response = MagicMock()
+        response.read.return_value = json.dumps({
+            "choices": [{"message": {"content": "Fix bug"}}],
+            "usage": {"prompt_tokens": 10, "completion_tokens": 2, "prompt_tokens_details": {"cached_tokens": 0}},
+        }).encode()
+        response.__enter__.return_value = response
+        with patch("git_commitai.urlopen", return_value=response):
+            completion = git_commitai.request_completion({"api_key": "k", "api_url": "http://x", "model": "m"}, "p")
+        assert completion.content == "Fix bug"
+        assert completion.usage == {"prompt_tokens": 10, "completion_tokens": 2}
+        assert completion.attempts == 1
+
+
+class TestKeepAliveOpener:
+    """Test connection reuse against a local HTTP server."""
+
+    def _request(self, url):
+        return Request(url, data=b'{"model": "m"}', headers={"Content-Type": "application/json"})
+
+    def test_connection_reused(self, api_server):
+        opener = git_commitai.KeepAliveOpener()
+        try:
+            for _ in range(3):
+                with opener(self._request(api_server.url), timeout=5) as response:
+                    assert json.loads(response.read())["choices"]
+        finally:
+            opener.close()
+        assert len(api_server.requests) == 3
+        assert api_server.connections == 1
+
+    def test_http_error_raised(self, api_server):
+        opener = git_commitai.KeepAliveOpener()
+        with patch.object(api_server.RequestHandlerClass, "status", 401):
+            with pytest.raises(HTTPError) as exc_info:
+                opener(self._request(api_server.url), timeout=5)
+        opener.close()
+        assert exc_info.value.code == 401
+
+
+def _git(repo, *args):
+    subprocess.run(["git", "-C", str(repo)] + list(args), check=True, capture_output=True)
+
+
+def _session(repo, server):
+    return git_commitai.CommitAI(repo=str(repo), api_key="k", api_url=server.url, model="test-model")
+
+
+@pytest.fixture
+def repo(tmp_path):
+    repo = tmp_path / "repo"
+    repo.mkdir()
+    _git(repo, "init", "-q")
+    return repo
+
+
+@pytest.mark.integration
+@pytest.mark.skipif(shutil.which("git") is None, reason="git is not installed")
+class TestCommitAISession:
+    """Test generating messages with a CommitAI session."""
+
+    def test_generate(self, repo, api_server):
+        (repo / "app.py").write_text("print('hello')\n")
+        _git(repo, "add", "app.py")
+
+        with _session(repo, api_server) as ai:
+            result = ai.generate(context="Greeting")
+
+        assert result.message == "Add feature"
+        assert result.warnings == ["⚠️  WARNING: Hardcoded secret\nFound in: app.py"]
+        assert result.usage == {"prompt_tokens": 120, "completion_tokens": 8}
+        assert result.model == "test-model"
+        assert set(result.timings) == {"config", "prompt", "diff", "files", "scrub", "api", "total"}
+        prompt = api_server.requests[0]["messages"][0]["content"]
+        assert "print('hello')" in prompt
+        assert "Additional context from user: Greeting" in prompt
+        assert result.prompt_size == len(prompt.encode("utf-8"))
+
+    def test_session_reuses_config_and_connection(self, repo, api_server):
+        (repo / "a.txt").write_text("a\n")
+        _git(repo, "add", "a.txt")
+
+        with _session(repo, api_server) as ai:
+            with patch("git_commitai.load_gitcommitai_config", wraps=git_commitai.load_gitcommitai_config) as mock_load:
+                for _ in range(3):
+                    ai.generate()
+        assert mock_load.call_count == 1
+        assert api_server.connections == 1
+
+    def test_repository_layout_detected_once(self, repo, api_server):
+        """Test that runs get the repository's layout, detected once per session."""
+        _git(repo, "config", "core.sparseCheckout", "true")
+        _git(repo, "config", "index.sparse", "true")
+        (repo / "a.txt").write_text("a\n")
+        _git(repo, "add", "a.txt")
+
+        with _session(repo, api_server) as ai, \
+             patch("git_commitai.detect_repo_layout", wraps=git_commitai.detect_repo_layout) as mock_detect, \
+             patch("git_commitai.get_staged_files", wraps=git_commitai.get_staged_files) as mock_files:
+            ai.generate()
+            ai.generate()
+        assert mock_detect.call_count == 1
+        assert all(call.kwargs["settings"].layout.sparse_index for call in mock_files.call_args_list)
+
+    def test_nothing_staged(self, repo, api_server):
+        with _session(repo, api_server) as ai:
+            with pytest.raises(git_commitai.CommitAIError):
+                ai.generate()
+        assert api_server.requests == []
+
+    def test_missing_api_key(self, repo, monkeypatch):
+        monkeypatch.delenv("GIT_COMMIT_AI_KEY", raising=False)
+        with pytest.raises(git_commitai.ConfigError):
+            git_commitai.CommitAI(repo=str(repo)).config()
@@ -0,0 +1,147 @@
+"""Tests for summarising lockfile diffs."""
+
+import json
+import shutil
+import subprocess
+from unittest.mock import patch
+
+import pytest
+
+import git_commitai
+
+
+def npm_lock(**packages):
+    return json.dumps({
+        "name": "app", "lockfileVersion": 3,
+        "packages": {"": {"name": "app"}, **{
+            f"node_modules/{name}": {"version": version, "integrity": "sha512-" + "x" * 80}
+            for name, version in packages.items()
+        }},
+    }, indent=2)
+
+
+class TestParseLockfile:
+    """Test reading package versions from each lockfile format."""
+
+    def test_package_lock_v3(self):
+        content = json.dumps({"packages": {
+            "": {"name": "app"},
+            "node_modules/lodash": {"version": "4.17.21"},
+            "node_modules/a/node_modules/lodash": {"version": "3.10.1"},
+            "node_modules/@scope/pkg": {"version": "1.0.0"},
+            "node_modules/linked": {"link": True},
+        }})
+        assert git_commitai.parse_lockfile("package-lock.json", content) == {
+            "lodash": {"4.17.21", "3.10.1"}, "@scope/pkg": {"1.0.0"},
+        }
+
+    def test_package_lock_v1(self):
+        content = json.dumps({"dependencies": {
+            "a": {"version": "1.0.0", "dependencies": {"b": {"version": "2.0.0"}}},
+        }})
+        assert git_commitai.parse_lockfile("package-lock.json", content) == {"a": {"1.0.0"}, "b": {"2.0.0"}}
+
+    def test_yarn_classic_and_berry(self):
+        classic = (
+            "# yarn lockfile v1\n\n"
+            '"@babel/core@^7.0.0", "@babel/core@^7.1.0":\n  version "7.22.5"\n  resolved "https://x"\n\n'
+            "lodash@^4.17.0:\n  version \"4.17.21\"\n"
+        )
+        assert git_commitai.parse_lockfile("yarn.lock", classic) == {
+            "@babel/core": {"7.22.5"}, "lodash": {"4.17.21"},
+        }
+        berry = '__metadata:\n  version: 6\n\n"lodash@npm:^4.17.0":\n  version: 4.17.21\n  resolution: "x"\n'
+        assert git_commitai.parse_lockfile("yarn.lock", berry) == {"lodash": {"4.17.21"}}
+
+    @pytest.mark.parametrize("name", ["poetry.lock", "Cargo.lock"])
+    def test_toml_packages(self, name):
+        content = (
+            "version = 3\n\n[[package]]\nname = \"serde\"\nversion = \"1.0.188\"\n"
+            "dependencies = [\n \"serde_derive\",\n]\n\n"
+            "[package.extras]\nname = \"not-a-package\"\nversion = \"0\"\n\n"
+            "[[package]]\nname = \"anyhow\"\nversion = \"1.0.75\"\n\n[metadata]\ncontent-hash = \"abc\"\n"
+        )
+        assert git_commitai.parse_lockfile(name, content) == {"serde": {"1.0.188"}, "anyhow": {"1.0.75"}}
+
+    def test_go_sum(self):
+        content = (
+            "golang.org/x/text v0.3.7 h1:abc=\n"
+            "golang.org/x/text v0.3.7/go.mod h1:def=\n"
+            "github.com/pkg/errors v0.9.1/go.mod h1:ghi=\n"
+        )
+        assert git_commitai.parse_lockfile("go.sum", content) == {
+            "golang.org/x/text": {"v0.3.7"}, "github.com/pkg/errors": {"v0.9.1"},
+        }
+
+    def test_invalid_json(self):
+        assert git_commitai.parse_lockfile("package-lock.json", "{") is None
+
+
+class TestLockfileDiff:
+    """Test the summary that replaces a lockfile's diff."""
+
+    FILES = ["a/package-lock.json", "b/package-lock.json"]
+
+    def test_summary(self):
+        old = npm_lock(lodash="4.17.20", request="2.88.2", react="18.2.0")
+        new = npm_lock(lodash="4.17.21", react="18.2.0", leftpad="1.3.0", axios="1.5.0")
+        assert git_commitai.lockfile_diff(old, new, self.FILES) == (
+            "# Dependency changes: 1 updated, 2 added, 1 removed\n"
+            "#   lodash 4.17.20 → 4.17.21\n"
+            "#   + axios 1.5.0\n"
+            "#   + leftpad 1.3.0\n"
+            "#   - request 2.88.2\n"
+        )
+
+    def test_capped(self):
+        new = npm_lock(**{f"pkg{i:03d}": "1.0.0" for i in range(git_commitai.LOCKFILE_SUMMARY_LIMIT + 5)})
+        summary = git_commitai.lockfile_diff("", new, ["/dev/null", "b/package-lock.json"]).splitlines()
+        assert summary[0] == f"# Dependency changes: 0 updated, {git_commitai.LOCKFILE_SUMMARY_LIMIT + 5} added, 0 removed"
+        assert summary[-1] == "#   ... and 5 more"
+        assert len(summary) == git_commitai.LOCKFILE_SUMMARY_LIMIT + 2
+
+    def test_unparsable_falls_back_to_diff(self):
+        assert git_commitai.lockfile_diff("{\n", "{}\n", self.FILES) == (
+            "--- a/package-lock.json\n+++ b/package-lock.json\n@@ -1 +1 @@\n-{\n+{}\n"
+        )
+
+    def test_in_streamed_diff(self):
+        diff = (
+            "diff --git a/web/package-lock.json b/web/package-lock.json\n"
+            "index 1234567..89abcde 100644\n--- a/web/package-lock.json\n+++ b/web/package-lock.json\n"
+            + "@@ -1,9 +1,9 @@\n" + "-  \"integrity\": \"sha512-xxxx\"\n" * 5000
+        )
+        blobs = {"1234567": npm_lock(lodash="4.17.20"), "89abcde": npm_lock(lodash="4.17.21")}
+        with patch("git_commitai.read_blob", side_effect=blobs.get):
+            result = "".join(git_commitai.rewrite_diff_sections(iter([diff[:1000], diff[1000:]])))
+        assert result == (
+            "diff --git a/web/package-lock.json b/web/package-lock.json\nindex 1234567..89abcde 100644\n"
+            "# Dependency changes: 1 updated, 0 added, 0 removed\n#   lodash 4.17.20 → 4.17.21\n"
+        )
+
+
+def _git(repo, *args):
+    subprocess.run(
+        ["git", "-C", str(repo), "-c", "user.name=T", "-c", "user.email=t@example.com"] + list(args),
+        check=True, capture_output=True,
+    )
+
+
+@pytest.mark.integration
+@pytest.mark.skipif(shutil.which("git") is None, reason="git is not installed")
+def test_lockfile_bump_from_git(tmp_path):
+    _git(tmp_path, "init", "-q")
+    packages = {f"dep{i:03d}": "1.0.0" for i in range(300)}
+    (tmp_path / "package-lock.json").write_text(npm_lock(**packages))
+    _git(tmp_path, "add", "-A")
+    _git(tmp_path, "commit", "-q", "-m", "Add lockfile")
+    packages.update(dep007="1.2.0", dep100="2.0.0")
+    del packages["dep200"]
+    (tmp_path / "package-lock.json").write_text(npm_lock(**packages))
+    _git(tmp_path, "add", "-A")
+
+    diff = git_commitai.get_git_diff(settings=git_commitai.RunSettings(cwd=str(tmp_path)))
+    assert "# Dependency changes: 2 updated, 0 added, 1 removed\n" in diff
+    assert "dep007 1.0.0 → 1.2.0" in diff
+    assert "integrity" not in diff
+    assert len(diff) < 1000
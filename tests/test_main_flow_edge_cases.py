@@ -25,16 +25,18 @@ class TestMainFlowEdgeCases:
 
     def test_main_debug_flag(self):
         """Test --debug flag enables debug mode."""
+        debug_states = []
         with patch("sys.argv", ["git-commitai", "--debug"]):
             with patch("subprocess.run") as mock_run:
                 mock_run.return_value.returncode = 0
-                with patch("git_commitai.check_staged_changes", return_value=False):
+                with patch("git_commitai.check_staged_changes") as mock_check:
+                    mock_check.side_effect = lambda *a, **k: debug_states.append(git_commitai.active_settings().debug)
                     with patch("git_commitai.show_git_status"):
                         with pytest.raises(SystemExit):
                             git_commitai.main()
-                        assert git_commitai.DEBUG is True
-        # Reset DEBUG flag
-        git_commitai.DEBUG = False
+        assert debug_states == [True]
+        # The flag belongs to that run only
+        assert git_commitai.active_settings().debug is False
 
     def test_main_strip_comments_failure(self):
         """Test main flow when strip_comments_and_save fails."""
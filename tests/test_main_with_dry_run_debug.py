@@ -32,6 +32,3 @@ class TestMainWithDryRunDebug:
                                 debug_calls = [str(call) for call in mock_debug.call_args_list]
                                 assert any("DRY RUN MODE" in str(call) or "dry-run" in str(call).lower()
                                           for call in debug_calls)
-
-        # Reset debug flag
-        git_commitai.DEBUG = False
@@ -0,0 +1,209 @@
+"""Tests for bounded-memory diff handling and --memory-report."""
+
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tracemalloc
+from io import StringIO
+from unittest.mock import patch
+
+import pytest
+
+import git_commitai
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Peak memory allowed for collecting a change, relative to the prompt limits
+# (max_diff_size + max_total_files + max_file_size). It must not depend on
+# the size of the change itself.
+MEMORY_BASE_BYTES = 2 * 1024 * 1024
+MEMORY_LIMIT_FACTOR = 8
+
+
+def memory_ceiling(limits):
+    return MEMORY_BASE_BYTES + MEMORY_LIMIT_FACTOR * (
+        limits.max_diff_size + limits.max_total_files + limits.max_file_size
+    )
+
+
+class TestExcerptBuffer:
+    """Test keeping the beginning and end of a stream."""
+
+    def test_under_budget_keeps_everything(self):
+        excerpt = git_commitai.ExcerptBuffer(1024)
+        excerpt.extend(["a", "b", "c"])
+        assert excerpt.lines() == ["a", "b", "c"]
+        assert not excerpt.truncated
+        assert excerpt.total_bytes == 6
+
+    def test_over_budget_keeps_head_and_tail(self):
+        excerpt = git_commitai.ExcerptBuffer(10 * 1024)
+        lines = [f"+line {i:06d}" for i in range(100_000)]
+        excerpt.extend(lines)
+        kept = excerpt.lines()
+        assert excerpt.truncated
+        assert kept[0] == lines[0]
+        assert kept[-1] == lines[-1]
+        assert excerpt.omitted_lines == len(lines) - len(kept) + 4
+        assert any("TRUNCATED: " in line and "lines omitted" in line for line in kept)
+        assert sum(len(line) + 1 for line in kept) < 10 * 1024
+
+    def test_minimum_lines_kept(self):
+        excerpt = git_commitai.ExcerptBuffer(100)
+        excerpt.extend("x" * 50 for _ in range(100))
+        kept = excerpt.lines()
+        assert len(kept) == 2 * git_commitai.ExcerptBuffer.MIN_LINES + 4
+
+    @pytest.mark.parametrize("max_bytes", [100, 2048, 10 * 1024, 1024 * 1024])
+    @pytest.mark.parametrize("chunk_size", [1, 7, 4096])
+    def test_feed_matches_lines(self, max_bytes, chunk_size):
+        lines = [f"+line {i} {'é' * (i % 3)}{'x' * (i % 50)}" for i in range(3000)]
+        text = "\n".join(lines)
+        by_line = git_commitai.ExcerptBuffer(max_bytes)
+        by_line.extend(lines)
+        by_chunk = git_commitai.ExcerptBuffer(max_bytes)
+        for start in range(0, len(text), chunk_size):
+            by_chunk.feed(text[start:start + chunk_size])
+        assert by_chunk.lines() == by_line.lines()
+        assert (by_chunk.total_lines, by_chunk.total_bytes, by_chunk.omitted_lines) == (
+            by_line.total_lines, by_line.total_bytes, by_line.omitted_lines
+        )
+
+
+class TestCommentText:
+    """Test commenting streamed text."""
+
+    @pytest.mark.parametrize("chunks", [["a\n\nb\n"], ["a", "\n", "\nb", "\n"], ["a\n\n", "b"]])
+    def test_lines_prefixed(self, chunks):
+        assert "".join(git_commitai.comment_text(chunks)) == "# a\n# \n# b\n"
+
+    def test_empty(self):
+        assert list(git_commitai.comment_text(["", ""])) == []
+
+
+def _git(repo, *args):
+    subprocess.run(
+        ["git", "-C", str(repo), "-c", "user.name=T", "-c", "user.email=t@example.com"] + list(args),
+        check=True, capture_output=True,
+    )
+
+
+@pytest.fixture(scope="module")
+def big_change(tmp_path_factory):
+    """A repository with 30 MB of staged text in 300 files."""
+    repo = tmp_path_factory.mktemp("big")
+    _git(repo, "init", "-q")
+    # Long lines keep the traced test fast; tracemalloc slows every line down
+    line = "x = '" + "abcdefghijklmnopqrstuvwxyz0123456789" * 28 + "'\n"
+    for i in range(300):
+        (repo / f"file{i:03d}.py").write_text(line * (100 * 1024 // len(line)))
+    _git(repo, "add", "-A")
+    return repo
+
+
+@pytest.mark.integration
+@pytest.mark.skipif(shutil.which("git") is None, reason="git is not installed")
+class TestStreamGit:
+    """Test streaming git output."""
+
+    def test_lines(self, big_change):
+        settings = git_commitai.RunSettings(cwd=str(big_change))
+        with git_commitai.run_context(settings):
+            lines = list(git_commitai.stream_git(["diff", "--cached", "--name-only"]))
+        assert lines[:2] == ["file000.py", "file001.py"]
+        assert len(lines) == 300
+
+    def test_failure_raises(self, big_change):
+        with git_commitai.run_context(git_commitai.RunSettings(cwd=str(big_change))):
+            with pytest.raises(subprocess.CalledProcessError):
+                list(git_commitai.stream_git(["rev-parse", "--verify", "no-such-ref"]))
+            assert list(git_commitai.stream_git(["rev-parse", "--verify", "no-such-ref"], check=False)) == []
+
+    def test_stopping_early(self, big_change):
+        with git_commitai.run_context(git_commitai.RunSettings(cwd=str(big_change))):
+            stream = git_commitai.stream_git(["diff", "--cached"])
+            assert next(stream).startswith("diff --git")
+            stream.close()
+
+
+@pytest.mark.integration
+@pytest.mark.skipif(shutil.which("git") is None, reason="git is not installed")
+class TestMemoryCeiling:
+    """Test that memory follows the prompt limits, not the size of the change."""
+
+    def test_traced_peak(self, big_change, tmp_path):
+        settings = git_commitai.RunSettings(cwd=str(big_change))
+        git_dir = tmp_path / "gitdir"
+        git_dir.mkdir()
+        tracemalloc.start()
+        try:
+            with git_commitai.run_context(settings):
+                diff = git_commitai.get_git_diff(settings=settings)
+                files = git_commitai.get_staged_files(settings=settings)
+                commit_file = git_commitai.create_commit_message_file(str(git_dir), "Add files", verbose=True)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        assert "TRUNCATED" in diff and "(large file)" in files
+        # The verbose diff was written out in full
+        assert os.path.getsize(commit_file) > 29 * 1024 * 1024
+        assert peak < memory_ceiling(settings.limits), f"peak {peak} bytes"
+
+    @pytest.mark.skipif(sys.platform == "win32", reason="resource is not available on Windows")
+    def test_peak_rss(self, big_change, tmp_path):
+        """Test the peak RSS of a child process collecting the change."""
+        script = (
+            "import resource, sys, git_commitai as g\n"
+            "if sys.argv[1] == 'collect':\n"
+            f"    s = g.RunSettings(cwd={str(big_change)!r})\n"
+            "    g.get_git_diff(settings=s); g.get_staged_files(settings=s)\n"
+            "    with g.run_context(s):\n"
+            f"        g.create_commit_message_file({str(tmp_path)!r}, 'Add files', verbose=True)\n"
+            "rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss\n"
+            "print(rss if sys.platform == 'darwin' else rss * 1024)\n"
+        )
+
+        def peak_rss(mode):
+            result = subprocess.run(
+                [sys.executable, "-c", script, mode], cwd=ROOT, capture_output=True, text=True, check=True
+            )
+            return int(result.stdout)
+
+        growth = peak_rss("collect") - peak_rss("import")
+        assert growth < memory_ceiling(git_commitai.Limits()), f"RSS grew by {growth} bytes"
+
+
+class TestMemoryReportFlag:
+    """Test --memory-report."""
+
+    def run_main(self, argv):
+        config = {"api_key": "k", "api_url": "http://test", "model": "m", "repo_config": {}}
+        with patch("subprocess.run") as mock_run, \
+             patch("git_commitai.check_staged_changes", return_value=True), \
+             patch("git_commitai.get_env_config", return_value=config), \
+             patch("git_commitai.get_git_diff", return_value="```\n+x\n```"), \
+             patch("git_commitai.get_staged_files", return_value="x.py\n"), \
+             patch("git_commitai.make_api_request", return_value="Add x"), \
+             patch("sys.argv", ["git-commitai"] + argv), \
+             patch("sys.stdout", new=StringIO()) as fake_out, \
+             patch("sys.stderr", new=StringIO()) as fake_err:
+            mock_run.return_value.returncode = 0
+            with pytest.raises(SystemExit):
+                git_commitai.main()
+        return fake_out.getvalue(), fake_err.getvalue()
+
+    def test_report(self):
+        out, err = self.run_main(["--json", "--memory-report"])
+        peaks = json.loads(out)["memory_peaks"]
+        assert list(peaks) == ["config", "prompt", "diff", "files", "scrub", "api"]
+        assert all(isinstance(peak, int) for peak in peaks.values())
+        assert "Peak traced memory by phase:" in err
+        assert "  overall " in err
+        assert not tracemalloc.is_tracing()
+
+    def test_off_by_default(self):
+        out, err = self.run_main(["--json"])
+        assert "memory_peaks" not in json.loads(out)
+        assert "Peak traced memory" not in err
@@ -0,0 +1,207 @@
+"""Tests for the metrics ledger and `git-commitai stats`."""
+
+import json
+import os
+from io import StringIO
+from unittest.mock import patch, MagicMock
+
+import pytest
+
+import git_commitai
+
+CONFIG = {"api_key": "test", "api_url": "http://test", "model": "test-model", "repo_config": {}}
+
+
+def api_response(content="Add x", usage=None):
+    response = MagicMock()
+    response.read.return_value = json.dumps({
+        "choices": [{"message": {"content": content}}],
+        "usage": usage or {"prompt_tokens": 100, "completion_tokens": 5, "total_tokens": 105},
+    }).encode()
+    response.__enter__.return_value = response
+    return response
+
+
+def run_main(argv, env=None, urlopen=None):
+    """Run main() with mocked git; the API is reached through a mocked urlopen."""
+    with patch("subprocess.run") as mock_run, \
+         patch("git_commitai.check_staged_changes", return_value=True), \
+         patch("git_commitai.get_env_config", return_value=CONFIG), \
+         patch("git_commitai.get_git_diff", return_value="```\n+x\n```"), \
+         patch("git_commitai.get_staged_files", return_value="x.py\n"), \
+         patch("git_commitai.urlopen", **(urlopen or {"return_value": api_response()})), \
+         patch("git_commitai.time.sleep"), \
+         patch.dict(os.environ, env or {}), \
+         patch("sys.argv", ["git-commitai"] + argv), \
+         patch("sys.stdout", new=StringIO()) as fake_out:
+        mock_run.return_value.returncode = 0
+        code = 0
+        try:
+            git_commitai.main()
+        except SystemExit as e:
+            code = e.code
+    return code, fake_out.getvalue()
+
+
+def record(repo="/r", model="m", api=1.0, events=None, attempts=1, committed=True, **usage):
+    return {
+        "repo": repo, "model": model, "timings": {"api": api}, "events": events or {},
+        "attempts": attempts, "committed": committed,
+        "usage": usage or {"prompt_tokens": 100, "completion_tokens": 10},
+    }
+
+
+class TestLedger:
+    """Test appending to and reading the rotating ledger."""
+
+    def test_round_trip(self, tmp_path):
+        path = str(tmp_path / "cache" / "metrics.jsonl")
+        git_commitai.append_metrics({"a": 1}, path)
+        git_commitai.append_metrics({"a": 2}, path)
+        assert list(git_commitai.read_metrics(path)) == [{"a": 1}, {"a": 2}]
+        with open(path) as f:
+            assert f.readline() == '{"a":1}\n'
+
+    def test_default_path(self, tmp_path):
+        git_commitai.append_metrics({"a": 1})
+        assert git_commitai.get_metrics_path() == str(tmp_path / "xdg-cache" / "git-commitai" / "metrics.jsonl")
+        assert list(git_commitai.read_metrics()) == [{"a": 1}]
+
+    def test_rotation(self, tmp_path):
+        path = str(tmp_path / "metrics.jsonl")
+        with patch("git_commitai.METRICS_MAX_BYTES", 20), patch("git_commitai.METRICS_BACKUPS", 2):
+            for i in range(7):
+                git_commitai.append_metrics({"i": i}, path)
+        assert sorted(os.listdir(tmp_path)) == ["metrics.jsonl", "metrics.jsonl.1", "metrics.jsonl.2"]
+        with patch("git_commitai.METRICS_BACKUPS", 2):
+            # Two records per file; the oldest file was dropped
+            assert [r["i"] for r in git_commitai.read_metrics(path)] == [2, 3, 4, 5, 6]
+
+    def test_bad_lines_skipped(self, tmp_path):
+        path = tmp_path / "metrics.jsonl"
+        path.write_text('{"a": 1}\nnot json\n[1]\n{"a": 2}\n')
+        assert list(git_commitai.read_metrics(str(path))) == [{"a": 1}, {"a": 2}]
+
+    def test_write_errors_ignored(self, tmp_path):
+        blocker = tmp_path / "file"
+        blocker.write_text("")
+        git_commitai.append_metrics({"a": 1}, str(blocker / "metrics.jsonl"))
+
+
+class TestRunRecord:
+    """Test the record main() appends for each run."""
+
+    def test_record_written(self, tmp_path):
+        code, _ = run_main(["--json"])
+        assert code == 0
+        (entry,) = git_commitai.read_metrics()
+        assert entry["model"] == "test-model"
+        assert entry["exit_code"] == 0
+        assert entry["committed"] is False
+        assert entry["attempts"] == 1
+        assert entry["usage"] == {"prompt_tokens": 100, "completion_tokens": 5, "total_tokens": 105}
+        assert entry["prompt_bytes"]["diff"] == len("```\n+x\n```")
+        assert set(entry["prompt_bytes"]) == {"base", "diff", "files", "total"}
+        assert "api" in entry["timings"]
+
+    def test_retries_counted(self):
+        from urllib.error import URLError
+        run_main(["--json"], urlopen={"side_effect": [URLError("down"), api_response()]})
+        (entry,) = git_commitai.read_metrics()
+        assert entry["attempts"] == 2
+
+    def test_committed_with_yes(self):
+        code, _ = run_main(["--yes"])
+        assert code == 0
+        assert next(git_commitai.read_metrics())["committed"] is True
+
+    def test_failed_run_recorded(self):
+        from urllib.error import HTTPError
+        code, _ = run_main(["--json"], urlopen={"side_effect": HTTPError("http://test", 401, "Unauthorized", {}, None)})
+        assert code == 1
+        (entry,) = git_commitai.read_metrics()
+        assert entry["exit_code"] == 1
+        assert entry["usage"] == {}
+
+    def test_disabled(self):
+        run_main(["--json"], env={"GIT_COMMIT_AI_METRICS": "0"})
+        assert list(git_commitai.read_metrics()) == []
+
+    def test_truncation_event(self):
+        metrics = git_commitai.RunMetrics()
+        settings = git_commitai.RunSettings(limits=git_commitai.Limits(max_diff_size=100), metrics=metrics)
+        diff = "\n".join(f"+line {i}" for i in range(200))
+        with patch("git_commitai.run_git", return_value=diff):
+            git_commitai.get_git_diff(settings=settings)
+        assert metrics.events == {"diff_truncated": 1}
+
+    def test_count_event_without_metrics(self):
+        git_commitai.count_event("diff_truncated")
+
+
+class TestSummaries:
+    """Test aggregating ledger records."""
+
+    def test_percentile(self):
+        values = [float(i) for i in range(1, 101)]
+        assert git_commitai.percentile(values, 50) == 50
+        assert git_commitai.percentile(values, 99) == 99
+        assert git_commitai.percentile([3.0], 90) == 3.0
+
+    def test_groups(self):
+        records = [
+            record(api=1.0),
+            record(api=3.0, events={"diff_truncated": 1, "config_cache_hit": 1}, attempts=3),
+            record(api=2.0, events={"config_cache_miss": 1}, committed=False),
+            record(model="other", api=9.0),
+        ]
+        first, second = git_commitai.summarize_metrics(records)
+        assert (first["repo"], first["model"], first["runs"], first["committed"]) == ("/r", "m", 3, 2)
+        assert first["latency"] == {"p50": 2.0, "p90": 3.0, "p99": 3.0}
+        assert first["tokens"] == {"prompt": 300, "completion": 30, "total": 330}
+        assert first["truncation_rate"] == pytest.approx(1 / 3, abs=1e-4)
+        assert first["truncations"]["diff_truncated"] == 1
+        assert first["retries"] == 2
+        assert first["config_cache_hit_rate"] == 0.5
+        assert second["model"] == "other"
+
+    def test_missing_fields(self):
+        (summary,) = git_commitai.summarize_metrics([{"repo": "/r", "model": "m"}])
+        assert summary["latency"] is None
+        assert summary["config_cache_hit_rate"] is None
+
+
+class TestStatsCommand:
+    """Test `git-commitai stats`."""
+
+    def run_stats(self, *args):
+        with patch("sys.argv", ["git-commitai", "stats"] + list(args)), \
+             patch("subprocess.run") as mock_run, \
+             patch("sys.stdout", new=StringIO()) as fake_out:
+            with pytest.raises(SystemExit) as exc_info:
+                git_commitai.main()
+        mock_run.assert_not_called()
+        return exc_info.value.code, fake_out.getvalue()
+
+    def test_empty(self):
+        code, out = self.run_stats()
+        assert code == 0
+        assert out.startswith("No runs recorded in ")
+
+    def test_report(self):
+        for entry in (record(api=1.0), record(api=2.0, events={"file_too_large": 2})):
+            git_commitai.append_metrics(entry)
+        code, out = self.run_stats()
+        assert code == 0
+        assert out.splitlines()[0] == "/r (m)"
+        assert "p50 1.00s  p90 2.00s  p99 2.00s" in out
+        assert "220 total (200 prompt, 20 completion)" in out
+        assert "50% of runs" in out
+
+    def test_json_and_repo_filter(self, tmp_path):
+        git_commitai.append_metrics(record(repo=str(tmp_path)))
+        git_commitai.append_metrics(record(repo="/elsewhere"))
+        code, out = self.run_stats("--json", "--repo", str(tmp_path))
+        assert code == 0
+        groups = json.loads(out)["groups"]
+        assert [g["repo"] for g in groups] == [str(tmp_path)]
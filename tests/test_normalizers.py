@@ -0,0 +1,118 @@
+"""Tests for the per-file-type content normalizers."""
+
+import base64
+import json
+import os
+from unittest.mock import patch
+
+import pytest
+
+import git_commitai
+
+ENCODED = base64.b64encode(bytes(range(256)) * 2).decode()
+
+
+class TestStripBase64:
+    """Test replacing long base64 runs."""
+
+    def test_data_uri(self):
+        text = f'<img src="data:image/png;base64,{ENCODED}">'
+        assert git_commitai.strip_base64(text) == f'<img src="data:image/png;base64,[base64, {len(ENCODED)} chars]">'
+
+    @pytest.mark.parametrize("text", ["x" * 500, "short Ab1", "-" * 300, "ab12" * 100])
+    def test_not_base64(self, text):
+        assert git_commitai.strip_base64(text) == text
+
+
+class TestCollapseIndentation:
+    """Test re-indenting source code."""
+
+    def test_levels_kept(self):
+        source = "def f(x):\n    if x:   \n        return 1\n    return 2\n"
+        assert git_commitai.collapse_indentation(source) == "def f(x):\n if x:\n  return 1\n return 2\n"
+
+    def test_tabs_and_two_spaces(self):
+        assert git_commitai.collapse_indentation("a\n\tb\n\t\tc") == "a\n b\n  c"
+        assert git_commitai.collapse_indentation("a\n  b\n    c\n   d") == "a\n  b\n    c\n   d"
+
+
+class TestMinify:
+    """Test the JSON and YAML minifiers."""
+
+    def test_json(self):
+        document = {"name": "app", "deps": {"lodash": "^4"}, "list": [1, 2], "text": "naïve"}
+        assert git_commitai.minify_json(json.dumps(document, indent=4)) == (
+            '{"name":"app","deps":{"lodash":"^4"},"list":[1,2],"text":"naïve"}'
+        )
+
+    def test_invalid_json_unchanged(self):
+        assert git_commitai.minify_json('{\n  "a": 1,\n}') == '{\n  "a": 1,\n}'
+
+    def test_yaml(self):
+        yaml = "spec:\n    replicas: 3\n\n    template:\n        name: web   \n"
+        assert git_commitai.minify_yaml(yaml) == "spec:\n replicas: 3\n template:\n  name: web"
+
+
+class TestUnwrapParagraphs:
+    """Test joining wrapped Markdown paragraphs."""
+
+    def test_blocks_kept(self):
+        markdown = (
+            "# Title\n\nA long\nwrapped paragraph.  \nAfter a hard break\n\n"
+            "- item one\n  continued\n- item two\n\n```\ncode\n  indented\n```\n"
+            "| a | b |\n|---|---|\n\nHeading\n-------\nText\n"
+        )
+        assert git_commitai.unwrap_paragraphs(markdown) == (
+            "# Title\n\nA long wrapped paragraph.\nAfter a hard break\n\n"
+            "- item one continued\n- item two\n\n```\ncode\n  indented\n```\n"
+            "| a | b |\n|---|---|\n\nHeading\n-------\nText\n"
+        )
+
+
+class TestProseDiff:
+    """Test word diffs of Markdown."""
+
+    def test_word_diff(self):
+        assert git_commitai.word_diff("The quick brown fox.", "The quick red fox!") == (
+            "The quick [-brown fox.-]{+red fox!+}"
+        )
+
+    def test_rewrapped_paragraph(self):
+        old = "# Guide\n\nThe quick brown fox\njumps over the lazy dog.\n\nUnchanged.\n"
+        new = "# Guide\n\nThe quick red fox jumps\nover the lazy dog.\n\nUnchanged.\n\nAdded.\n"
+        assert git_commitai.prose_diff(old, new, ["a/g.md", "b/g.md"]) == (
+            "--- a/g.md\n+++ b/g.md\n"
+            "@@ -2,3 +2,3 @@\n\nThe quick [-brown-]{+red+} fox jumps over the lazy dog.\n\n"
+            "@@ -6,1 +6,3 @@\n\n{+Added.+}\n"
+        )
+
+    def test_prose_sections_follow_setting(self):
+        assert git_commitai.diff_section_rewriter("diff --git a/README.md b/README.md") is git_commitai.prose_diff
+        with git_commitai.run_context(git_commitai.RunSettings(normalize=False)):
+            assert git_commitai.diff_section_rewriter("diff --git a/README.md b/README.md") is None
+
+
+class TestStagedContent:
+    """Test normalizers in get_staged_files()."""
+
+    def staged(self, filename, content, **settings):
+        def run_git(args, check=True):
+            if args[0] == "show":
+                return content
+            return f"{filename}\0" if "-z" in args else f"3\t1\t{filename}"
+
+        with patch("git_commitai.run_git", side_effect=run_git):
+            return git_commitai.get_staged_files(settings=git_commitai.RunSettings(**settings))
+
+    def test_by_extension(self):
+        assert self.staged("config.json", '{\n  "a": [\n    1\n  ]\n}\n') == 'config.json\n```\n{"a":[1]}\n```\n'
+        assert self.staged("notes.txt", "  keep  this\n  as is\n") == "notes.txt\n```\nkeep  this\n  as is\n```\n"
+
+    def test_budget_counts_normalized_size(self):
+        pretty = json.dumps({f"key{i}": list(range(5)) for i in range(200)}, indent=8)
+        limits = git_commitai.Limits(max_file_size=len(pretty) // 2)
+        assert "(large file)" not in self.staged("data.json", pretty, limits=limits)
+
+    def test_disabled(self):
+        with patch.dict(os.environ, {"GIT_COMMIT_AI_NORMALIZE": "0"}):
+            assert self.staged("config.json", '{\n  "a": 1\n}') == 'config.json\n```\n{\n  "a": 1\n}\n```\n'
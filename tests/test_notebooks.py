@@ -0,0 +1,145 @@
+"""Tests for rendering Jupyter notebooks from their cell sources."""
+
+import json
+import shutil
+import subprocess
+from unittest.mock import patch
+
+import pytest
+
+import git_commitai
+
+IMAGE = "iVBORw0KGgo" + "A" * 50_000
+
+
+def notebook(*sources, image=IMAGE, count=1):
+    cells = [{"cell_type": "markdown", "metadata": {}, "source": ["# Analysis\n", "Load the data."]}]
+    for source in sources:
+        cells.append({
+            "cell_type": "code",
+            "execution_count": count,
+            "metadata": {"scrolled": True},
+            "outputs": [{"output_type": "display_data", "data": {"image/png": image}, "metadata": {}}],
+            "source": source,
+        })
+    return json.dumps({"cells": cells, "metadata": {"kernelspec": {"name": "python3"}}, "nbformat": 4,
+                       "nbformat_minor": 5}, indent=1)
+
+
+class TestRenderNotebook:
+    """Test rendering notebook JSON."""
+
+    def test_cells_without_outputs(self):
+        rendered = git_commitai.render_notebook(notebook("import pandas as pd\ndf = pd.read_csv('x.csv')\n"))
+        assert rendered == (
+            "# %% [markdown]\n# Analysis\nLoad the data.\n\n"
+            "# %%\nimport pandas as pd\ndf = pd.read_csv('x.csv')\n"
+        )
+
+    def test_nbformat_3(self):
+        content = json.dumps({"worksheets": [{"cells": [{"cell_type": "code", "input": ["x = 1"], "outputs": []}]}]})
+        assert git_commitai.render_notebook(content) == "# %%\nx = 1\n"
+
+    @pytest.mark.parametrize("content", ["", "not json", "[1, 2]", '{"cells": 3}'])
+    def test_not_a_notebook(self, content):
+        assert git_commitai.render_notebook(content) is None
+
+
+def notebook_diff(old_oid="1234567", new_oid="89abcde"):
+    return (
+        "diff --git a/nb.ipynb b/nb.ipynb\n"
+        f"index {old_oid}..{new_oid} 100644\n"
+        "--- a/nb.ipynb\n"
+        "+++ b/nb.ipynb\n"
+        "@@ -1,3 +1,3 @@\n"
+        f'-   "image/png": "{IMAGE}"\n'
+        f'+   "image/png": "{IMAGE}x"\n'
+    )
+
+
+PLAIN_DIFF = "diff --git a/a.py b/a.py\nindex 1111111..2222222 100644\n--- a/a.py\n+++ b/a.py\n@@ -1 +1 @@\n-x\n+y\n"
+
+
+class TestNotebookDiffSections:
+    """Test replacing notebook sections in a streamed diff."""
+
+    def render(self, text, blobs, chunk_size=7):
+        chunks = [text[i:i + chunk_size] for i in range(0, len(text), chunk_size)]
+        with patch("git_commitai.read_blob", side_effect=lambda oid: blobs.get(oid)):
+            return "".join(git_commitai.rewrite_diff_sections(iter(chunks)))
+
+    @pytest.mark.parametrize("chunk_size", [1, 7, 100_000])
+    def test_source_diff(self, chunk_size):
+        blobs = {"1234567": notebook("x = 1\n"), "89abcde": notebook("x = 2\n", image=IMAGE + "x")}
+        result = self.render(PLAIN_DIFF + notebook_diff() + PLAIN_DIFF, blobs, chunk_size)
+        assert IMAGE not in result
+        assert result == PLAIN_DIFF + (
+            "diff --git a/nb.ipynb b/nb.ipynb\n"
+            "index 1234567..89abcde 100644\n"
+            "--- a/nb.ipynb\n"
+            "+++ b/nb.ipynb\n"
+            "@@ -3,4 +3,4 @@\n"
+            " Load the data.\n"
+            " \n"
+            " # %%\n"
+            "-x = 1\n"
+            "+x = 2\n"
+        ) + PLAIN_DIFF
+
+    def test_outputs_only(self):
+        blobs = {"1234567": notebook("x = 1\n", count=1), "89abcde": notebook("x = 1\n", count=2)}
+        result = self.render(notebook_diff(), blobs)
+        assert result.endswith("index 1234567..89abcde 100644\n# Only notebook outputs or metadata changed\n")
+
+    def test_new_notebook(self):
+        result = self.render(notebook_diff(old_oid="0000000"), {"89abcde": notebook("x = 1\n")})
+        assert "+# %% [markdown]\n" in result and "+x = 1\n" in result
+
+    def test_blob_not_available(self):
+        result = self.render(notebook_diff(), {})
+        assert result.endswith("# Content not available locally\n")
+
+    def test_passes_other_text_through(self):
+        text = PLAIN_DIFF * 3 + "diff --git a/ipynb.txt b/ipynb.txt\n"
+        with patch("git_commitai.read_blob") as mock_read:
+            assert self.render(text, {}) == text
+        mock_read.assert_not_called()
+
+
+class TestStagedNotebook:
+    """Test the content of staged notebooks."""
+
+    def test_rendered_content(self):
+        def run_git(args, check=True):
+            if args[0] == "show":
+                return notebook("print('hi')\n")
+            return "nb.ipynb\0" if "-z" in args else "3\t1\tnb.ipynb"
+
+        with patch("git_commitai.run_git", side_effect=run_git):
+            files = git_commitai.get_staged_files()
+        assert files == "nb.ipynb\n```\n# %% [markdown]\n# Analysis\nLoad the data.\n\n# %%\nprint('hi')\n```\n"
+
+
+def _git(repo, *args):
+    subprocess.run(
+        ["git", "-C", str(repo), "-c", "user.name=T", "-c", "user.email=t@example.com"] + list(args),
+        check=True, capture_output=True,
+    )
+
+
+@pytest.mark.integration
+@pytest.mark.skipif(shutil.which("git") is None, reason="git is not installed")
+def test_notebook_from_git(tmp_path):
+    _git(tmp_path, "init", "-q")
+    (tmp_path / "analysis.ipynb").write_text(notebook("total = 1\n"))
+    _git(tmp_path, "add", "-A")
+    _git(tmp_path, "commit", "-q", "-m", "Add analysis")
+    (tmp_path / "analysis.ipynb").write_text(notebook("total = 2\n", image=IMAGE[::-1], count=7))
+    _git(tmp_path, "add", "-A")
+
+    settings = git_commitai.RunSettings(cwd=str(tmp_path))
+    diff = git_commitai.get_git_diff(settings=settings)
+    files = git_commitai.get_staged_files(settings=settings)
+    assert "-total = 1\n+total = 2\n" in diff
+    assert "AAAA" not in diff and "AAAA" not in files
+    assert "# %%\ntotal = 2" in files
@@ -0,0 +1,167 @@
+"""Tests for --profile span recording and trace output."""
+
+import json
+import os
+from io import StringIO
+from unittest.mock import patch, MagicMock
+
+import pytest
+
+import git_commitai
+
+CONFIG = {"api_key": "test", "api_url": "http://test", "model": "test-model", "repo_config": {}}
+
+
+def profiled(profiler=None):
+    return git_commitai.run_context(git_commitai.RunSettings(profiler=profiler or git_commitai.Profiler()))
+
+
+class TestProfiler:
+    """Test recording spans and building the trace documents."""
+
+    def test_nested_spans(self):
+        profiler = git_commitai.Profiler()
+        with profiler.span("outer", kind="phase"):
+            with profiler.span("inner") as attributes:
+                attributes["bytes"] = 3
+        inner, outer = profiler.spans
+        assert inner.parent_id == outer.span_id
+        assert outer.parent_id is None
+        assert inner.attributes == {"bytes": 3}
+        assert outer.start_ns <= inner.start_ns <= inner.end_ns <= outer.end_ns
+
+    def test_error_recorded(self):
+        profiler = git_commitai.Profiler()
+        with pytest.raises(ValueError):
+            with profiler.span("failing"):
+                raise ValueError("boom")
+        assert profiler.spans[0].attributes["error"] == "ValueError"
+        assert profiler.otlp()["resourceSpans"][0]["scopeSpans"][0]["spans"][0]["status"]["code"] == 2
+
+    def test_chrome_trace(self):
+        profiler = git_commitai.Profiler()
+        with profiler.span("git diff", argv="git diff"):
+            pass
+        events = profiler.chrome_trace()["traceEvents"]
+        assert events[0]["ph"] == "M"
+        event = events[1]
+        assert event["name"] == "git diff"
+        assert event["cat"] == "git"
+        assert event["ph"] == "X"
+        assert event["ts"] >= 0 and event["dur"] >= 0
+        assert event["args"] == {"argv": "git diff"}
+
+    def test_otlp(self):
+        profiler = git_commitai.Profiler()
+        with profiler.span("outer"):
+            with profiler.span("inner", count=2, ratio=0.5, reused=True, host="h"):
+                pass
+        resource = profiler.otlp()["resourceSpans"][0]
+        assert {"key": "service.name", "value": {"stringValue": "git-commitai"}} in resource["resource"]["attributes"]
+        spans = {s["name"]: s for s in resource["scopeSpans"][0]["spans"]}
+        inner, outer = spans["inner"], spans["outer"]
+        assert inner["traceId"] == outer["traceId"] == profiler.trace_id
+        assert len(inner["traceId"]) == 32 and len(inner["spanId"]) == 16
+        assert inner["parentSpanId"] == outer["spanId"]
+        assert "parentSpanId" not in outer
+        assert int(inner["endTimeUnixNano"]) >= int(inner["startTimeUnixNano"]) > 0
+        assert inner["attributes"] == [
+            {"key": "count", "value": {"intValue": "2"}},
+            {"key": "ratio", "value": {"doubleValue": 0.5}},
+            {"key": "reused", "value": {"boolValue": True}},
+            {"key": "host", "value": {"stringValue": "h"}},
+        ]
+
+    def test_write(self, tmp_path):
+        profiler = git_commitai.Profiler()
+        with profiler.span("phase"):
+            pass
+        trace_path, otlp_path = profiler.write(str(tmp_path / "out"))
+        assert trace_path.endswith(".trace.json") and otlp_path.endswith(".otlp.json")
+        with open(trace_path) as f:
+            assert json.load(f)["traceEvents"][1]["name"] == "phase"
+        with open(otlp_path) as f:
+            assert json.load(f)["resourceSpans"]
+
+
+class TestInstrumentation:
+    """Test the spans recorded by git and HTTP calls."""
+
+    def test_profile_span_off_by_default(self):
+        with git_commitai.profile_span("anything") as span:
+            assert span is None
+
+    def test_run_git_span(self):
+        profiler = git_commitai.Profiler()
+        with patch("git_commitai.subprocess.run") as mock_run, profiled(profiler):
+            mock_run.return_value = MagicMock(stdout="é\n", returncode=0)
+            git_commitai.run_git(["diff", "--cached"])
+        (span,) = profiler.spans
+        assert span.name == "git diff"
+        assert span.attributes["argv"] == "git -c color.ui=never diff --no-ext-diff --no-textconv --cached"
+        assert span.attributes["bytes_out"] == 3
+        assert span.attributes["exit_code"] == 0
+
+    def test_failed_run_git_span(self):
+        import subprocess
+        profiler = git_commitai.Profiler()
+        error = subprocess.CalledProcessError(128, ["git"], output="", stderr="fatal")
+        with patch("git_commitai.subprocess.run", side_effect=error), profiled(profiler):
+            assert git_commitai.run_git(["rev-parse", "HEAD"], check=False) == ""
+        assert profiler.spans[0].attributes["exit_code"] == 128
+
+    def test_http_spans(self, api_server):
+        profiler = git_commitai.Profiler()
+        config = {"api_key": "k", "api_url": api_server.url, "model": "m"}
+        with profiled(profiler), patch("urllib.request.getproxies", return_value={}):
+            completion = git_commitai.request_completion(config, "prompt")
+        assert completion.content.startswith("Add feature")
+        spans = {s.name: s for s in profiler.spans}
+        assert {"http.request", "http.connect", "http.ttfb", "http.download"} <= set(spans)
+        request_id = spans["http.request"].span_id
+        assert all(spans[name].parent_id == request_id for name in ("http.connect", "http.ttfb", "http.download"))
+        assert spans["http.ttfb"].attributes["reused"] is False
+        assert spans["http.download"].attributes["bytes"] > 0
+
+
+class TestProfileFlag:
+    """Test --profile on the command line."""
+
+    def run_main(self, argv, api_error=None):
+        with patch("subprocess.run") as mock_run, \
+             patch("git_commitai.check_staged_changes", return_value=True), \
+             patch("git_commitai.get_env_config", return_value=CONFIG), \
+             patch("git_commitai.get_git_diff", return_value="```\n+x\n```"), \
+             patch("git_commitai.get_staged_files", return_value="x.py\n"), \
+             patch("git_commitai.make_api_request", return_value="Add x", side_effect=api_error), \
+             patch("sys.argv", ["git-commitai"] + argv), \
+             patch("sys.stdout", new=StringIO()), \
+             patch("sys.stderr", new=StringIO()) as fake_err:
+            mock_run.return_value.returncode = 0
+            with pytest.raises(SystemExit):
+                git_commitai.main()
+        return fake_err.getvalue()
+
+    def test_writes_trace_files(self, tmp_path):
+        out = tmp_path / "profiles"
+        err = self.run_main(["--json", "--profile", str(out)])
+        files = sorted(os.listdir(out))
+        assert len(files) == 2
+        assert f"Profile written to {out}" in err
+        trace_file = [f for f in files if f.endswith(".trace.json")][0]
+        with open(out / trace_file) as f:
+            names = {e["name"] for e in json.load(f)["traceEvents"]}
+        assert {"git-commitai", "git rev-parse", "staged", "config", "prompt", "diff", "files", "scrub", "api"} <= names
+
+    def test_default_directory(self, tmp_path):
+        self.run_main(["--json", "--profile"])
+        assert len(os.listdir(tmp_path / "xdg-cache" / "git-commitai" / "profiles")) == 2
+
+    def test_written_on_failure(self, tmp_path):
+        self.run_main(["--profile", str(tmp_path / "profiles")], api_error=git_commitai.APIRequestError("HTTP 500"))
+        assert len(os.listdir(tmp_path / "profiles")) == 2
+
+    def test_off_by_default(self, tmp_path):
+        err = self.run_main(["--json"])
+        assert "Profile written" not in err
+        assert not os.path.exists(tmp_path / "xdg-cache" / "git-commitai" / "profiles")
@@ -0,0 +1,210 @@
+"""Tests for collapsing hunks that repeat a change across files."""
+
+import shutil
+import subprocess
+from unittest.mock import patch
+
+import pytest
+
+import git_commitai
+
+
+def section(path, old_line, new_line, start=10):
+    return (
+        f"diff --git a/{path} b/{path}\n"
+        "index 1111111..2222222 100644\n"
+        f"--- a/{path}\n"
+        f"+++ b/{path}\n"
+        f"@@ -{start},3 +{start},3 @@ def caller():\n"
+        "     setup()\n"
+        f"-{old_line}\n"
+        f"+{new_line}\n"
+        "     return result\n"
+    )
+
+
+def rename(path, receiver, start=10):
+    return section(path, f"    result = {receiver}.fetch_rows(limit)", f"    result = {receiver}.load_rows(limit)", start)
+
+
+class TestHunkChanges:
+    """Test reducing hunks to their changed tokens."""
+
+    def test_identifiers_around_change_ignored(self):
+        first = git_commitai.hunk_changes(rename("a.py", "db").split("\n", 4)[4])
+        second = git_commitai.hunk_changes(rename("b.py", "self.cache", start=99).split("\n", 4)[4])
+        assert first == second == [("fetch_rows", "load_rows")]
+
+    def test_small_and_whitespace_hunks(self):
+        assert git_commitai.hunk_changes("@@ -1 +1,2 @@\n x\n+}\n") == []
+        assert git_commitai.hunk_changes("@@ -1 +1 @@\n-a  = 1\n+a = 1\n") == []
+
+    def test_description(self):
+        assert git_commitai.describe_hunk_changes([("fetch_rows", "load_rows"), ("", "x")]) == (
+            "[-fetch_rows-]{+load_rows+} {+x+}"
+        )
+        assert git_commitai.describe_hunk_changes([("a" * 100, "b")]).endswith("...")
+
+
+class TestHunkDeduplicator:
+    """Test dropping repeated hunks from a streamed diff."""
+
+    def dedupe(self, text, chunk_size=7, budget=0):
+        deduplicator = git_commitai.HunkDeduplicator(budget)
+        chunks = [text[i:i + chunk_size] for i in range(0, len(text), chunk_size)]
+        return "".join(deduplicator.filter(iter(chunks))), deduplicator
+
+    @pytest.mark.parametrize("chunk_size", [1, 7, 100_000])
+    def test_repeated_sections_dropped(self, chunk_size):
+        distinct = section("c.py", "x = 1", "x = 2")
+        diff = (
+            rename("a.py", "db") + distinct + rename("b.py", "self.store")
+            + rename("d.py", "conn") + rename("e.py", "db")
+        )
+        result, deduplicator = self.dedupe(diff, chunk_size)
+        assert result == rename("a.py", "db") + distinct + rename("b.py", "self.store")
+        assert deduplicator.dropped_hunks == 2
+        assert deduplicator.summary() == (
+            "# Repeated changes, shown only in their first hunks in the diff above:\n"
+            "# [-fetch_rows-]{+load_rows+}: applied in 4 files: a.py, b.py, d.py, e.py"
+        )
+
+    def test_same_tokens_changed_twice_kept(self):
+        diff = section("a.py", "timeout = 10", "timeout = 20") + section("b.py", "max_retries = 10", "max_retries = 20")
+        result, deduplicator = self.dedupe(diff)
+        assert result == diff
+        assert deduplicator.summary() == ""
+
+    def test_nothing_dropped_within_budget(self):
+        diff = "".join(rename(f"m{i}.py", "db") for i in range(10))
+        result, deduplicator = self.dedupe(diff, budget=len(diff))
+        assert result == diff and deduplicator.dropped_hunks == 0
+
+        result, deduplicator = self.dedupe(diff, budget=len(rename("m0.py", "db")) * 5)
+        assert result == "".join(rename(f"m{i}.py", "db") for i in range(5))
+        assert deduplicator.dropped_hunks == 5
+
+    def test_section_with_distinct_hunk_kept(self):
+        other = section("c.py", "x = 1", "x = 2", start=50)
+        both = rename("c.py", "conn") + other[other.index("@@"):]
+        shown = rename("a.py", "db") + rename("b.py", "db")
+        result, _ = self.dedupe(shown + both)
+        assert result == shown + both[:both.index("@@")] + other[other.index("@@"):]
+
+    def test_sections_without_hunks_kept(self):
+        binary = "diff --git a/i.png b/i.png\nindex 1111111..2222222 100644\nBinary files a/i.png and b/i.png differ\n"
+        diff = binary + rename("a.py", "db") + binary
+        assert self.dedupe(diff)[0] == diff
+
+    def test_large_hunks_pass_through(self):
+        body = "".join(f"+line {i}\n" for i in range(2000))
+        big = f"diff --git a/big b/big\n--- a/big\n+++ b/big\n@@ -0,0 +1,2000 @@\n{body}"
+        result, deduplicator = self.dedupe(big + big.replace("a/big", "a/big2").replace("b/big", "b/big2"), 4096)
+        assert result.count(body) == 2 and deduplicator.dropped_hunks == 0
+
+    def test_summary_lists_a_few_files(self):
+        diff = "".join(rename(f"src/m{i:03d}.py", "db") for i in range(312))
+        result, deduplicator = self.dedupe(diff, 100_000)
+        assert result == rename("src/m000.py", "db") + rename("src/m001.py", "db")
+        assert deduplicator.summary().endswith(
+            "applied in 312 files: " + ", ".join(f"src/m{i:03d}.py" for i in range(10)) + ", ... and 302 more"
+        )
+
+    def test_passes_other_text_through(self):
+        assert self.dedupe("no diff here\n@@ not a hunk\n")[0] == "no diff here\n@@ not a hunk\n"
+
+
+class TestParallelStage:
+    """Test moving hunk comparison to a process pool."""
+
+    def test_one_worker_stays_in_process(self):
+        stage = git_commitai.ParallelStage(len, workers=1)
+        assert stage.map(["a", "bbb", "cc"]) == [1, 3, 2]
+        assert stage.pool is None
+
+    def test_pool_keeps_order(self):
+        metrics = git_commitai.RunMetrics()
+        stage = git_commitai.ParallelStage(git_commitai.short_count, workers=2)
+        with git_commitai.run_context(git_commitai.RunSettings(metrics=metrics)):
+            assert stage.map([1]) == [git_commitai.short_count(1)]
+            assert stage.pool is None
+            try:
+                numbers = list(range(0, 30_000, 1000))
+                assert stage.map(numbers) == [git_commitai.short_count(n) for n in numbers]
+                assert stage.pool is not None
+            finally:
+                stage.close()
+        assert metrics.events["parallel_stage"] == 1
+
+    def test_falls_back_when_pool_fails(self):
+        stage = git_commitai.ParallelStage(len, workers=2)
+        with patch("concurrent.futures.ProcessPoolExecutor") as mock_pool:
+            mock_pool.return_value.map.side_effect = OSError("no processes")
+            assert stage.map(["a", "bb"]) == [1, 2]
+            assert stage.map(["ccc", "d"]) == [3, 1]
+        assert mock_pool.call_count == 1 and stage.pool is None
+
+    def filter_on(self, diff, workers, min_bytes):
+        """Deduplicate a diff with the given workers and pool threshold."""
+        metrics = git_commitai.RunMetrics()
+        deduplicator = git_commitai.HunkDeduplicator()
+        with git_commitai.run_context(git_commitai.RunSettings(workers=workers, metrics=metrics)), \
+             patch("git_commitai.PARALLEL_MIN_BYTES", min_bytes):
+            chunks = [diff[i:i + 1000] for i in range(0, len(diff), 1000)]
+            result = ("".join(deduplicator.filter(iter(chunks))), deduplicator.summary())
+        return result, metrics.events.get("parallel_stage", 0)
+
+    @pytest.mark.parametrize("workers", [2, 3])
+    def test_same_diff_on_workers(self, workers):
+        diff = "".join(rename(f"m{i}.py", "db") for i in range(40)) + section("x.py", "a = 1", "a = 2")
+        serial, serial_pools = self.filter_on(diff, 1, 0)
+        parallel, parallel_pools = self.filter_on(diff, workers, 2000)
+        assert (serial_pools, parallel_pools) == (0, 1)
+        assert parallel == serial
+        assert serial[0] == rename("m0.py", "db") + rename("m1.py", "db") + section("x.py", "a = 1", "a = 2")
+
+    def test_small_diff_stays_in_process(self):
+        diff = "".join(rename(f"m{i}.py", "db") for i in range(40))
+        result, pools = self.filter_on(diff, 2, len(diff) + 1)
+        assert pools == 0
+        assert result == self.filter_on(diff, 1, 0)[0]
+
+
+@pytest.mark.parametrize("max_diff_size, shown", [(100_000, 40), (1000, 4)])
+def test_in_git_diff(max_diff_size, shown):
+    diff = "".join(rename(f"m{i}.py", "db") for i in range(40))
+    settings = git_commitai.RunSettings(cwd="/nonexistent", limits=git_commitai.Limits(max_diff_size=max_diff_size))
+    with patch("git_commitai.run_git", return_value=diff):
+        result = git_commitai.get_git_diff(settings=settings)
+    assert result.count("diff --git") == shown
+    if shown == 40:
+        assert "Repeated changes" not in result
+        return
+    assert "# [-fetch_rows-]{+load_rows+}: applied in 40 files: m0.py" in result
+
+
+def _git(repo, *args):
+    subprocess.run(
+        ["git", "-C", str(repo), "-c", "user.name=T", "-c", "user.email=t@example.com"] + list(args),
+        check=True, capture_output=True,
+    )
+
+
+@pytest.mark.integration
+@pytest.mark.skipif(shutil.which("git") is None, reason="git is not installed")
+def test_rename_from_git(tmp_path):
+    _git(tmp_path, "init", "-q")
+    for i in range(50):
+        (tmp_path / f"mod{i:02d}.py").write_text(f"def f{i}(store):\n    return store.fetch_rows({i})\n")
+    _git(tmp_path, "add", "-A")
+    _git(tmp_path, "commit", "-q", "-m", "Add modules")
+    for i in range(50):
+        (tmp_path / f"mod{i:02d}.py").write_text(f"def f{i}(store):\n    return store.load_rows({i})\n")
+    (tmp_path / "mod07.py").write_text("def f7(store):\n    return store.load_rows(7, strict=True)\n")
+    _git(tmp_path, "add", "-A")
+
+    settings = git_commitai.RunSettings(cwd=str(tmp_path), limits=git_commitai.Limits(max_diff_size=1000))
+    diff = git_commitai.get_git_diff(settings=settings)
+    assert diff.count("diff --git") == 5
+    assert "strict=True" in diff
+    assert "# [-fetch_rows-]{+load_rows+}: applied in 49 files: mod00.py, mod01.py" in diff
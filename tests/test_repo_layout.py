@@ -0,0 +1,274 @@
+"""Tests for partial-clone and sparse-index aware file collection."""
+
+import os
+import shutil
+import subprocess
+from unittest.mock import patch
+
+import pytest
+
+import git_commitai
+
+RAW_DIFF = "\0".join([
+    ":000000 100644 " + "0" * 40 + " " + "a" * 40 + " A", "logo.png",
+    ":100644 100644 " + "b" * 40 + " " + "b" * 40 + " R100", "old.py", "new.py",
+    ":100644 000000 " + "c" * 40 + " " + "0" * 40 + " D", "gone.txt",
+    ":100644 100644 " + "d" * 40 + " " + "e" * 40 + " M", "tab\there.txt",
+    "-\t-\tlogo.png", "0\t0\t", "old.py", "new.py", "0\t3\tgone.txt", "1\t1\ttab\there.txt", "",
+])
+
+
+class TestReadGitConfigFile:
+    """Test reading git config files without git."""
+
+    def test_entries(self, tmp_path):
+        path = tmp_path / "config"
+        path.write_text(
+            "[core]\n"
+            "\tsparseCheckout = true ; comment\n"
+            "# comment\n"
+            '[remote "Origin"]\n'
+            "\turl = https://example.com/r.git\n"
+            "\tpromisor\n"
+            '\tpartialclonefilter = "blob:none"\n'
+            "[extensions] partialClone = Origin\n"
+        )
+        assert git_commitai.read_git_config_file(str(path)) == {
+            "core.sparsecheckout": "true",
+            "remote.Origin.url": "https://example.com/r.git",
+            "remote.Origin.promisor": "true",
+            "remote.Origin.partialclonefilter": "blob:none",
+            "extensions.partialclone": "Origin",
+        }
+
+    def test_missing_file(self, tmp_path):
+        assert git_commitai.read_git_config_file(str(tmp_path / "config")) == {}
+
+
+class TestDetectRepoLayout:
+    """Test detecting partial clones and sparse indexes."""
+
+    @pytest.fixture(autouse=True)
+    def no_git_dir_env(self):
+        with patch.dict(os.environ):
+            os.environ.pop("GIT_DIR", None)
+            yield
+
+    def make_repo(self, root, config, worktree_config=None):
+        git_dir = root / ".git"
+        git_dir.mkdir(parents=True)
+        (git_dir / "config").write_text(config)
+        if worktree_config is not None:
+            (git_dir / "config.worktree").write_text(worktree_config)
+        return git_dir
+
+    def test_plain_repository(self, tmp_path):
+        self.make_repo(tmp_path, "[core]\n\tbare = false\n")
+        assert git_commitai.detect_repo_layout(str(tmp_path)) == git_commitai.RepoLayout()
+
+    def test_partial_clone_from_subdirectory(self, tmp_path):
+        self.make_repo(tmp_path, '[remote "origin"]\n\tpromisor = true\n\tpartialclonefilter = blob:none\n')
+        (tmp_path / "src").mkdir()
+        layout = git_commitai.detect_repo_layout(str(tmp_path / "src"))
+        assert layout.partial_clone and layout.promisor_remote == "origin"
+        assert layout.read_by_object_id
+
+    def test_partial_clone_extension(self, tmp_path):
+        self.make_repo(tmp_path, "[extensions]\n\tpartialClone = upstream\n")
+        assert git_commitai.detect_repo_layout(str(tmp_path)).promisor_remote == "upstream"
+
+    def test_sparse_index_in_worktree_config(self, tmp_path):
+        self.make_repo(
+            tmp_path,
+            "[extensions]\n\tworktreeConfig = true\n",
+            "[core]\n\tsparseCheckout = true\n[index]\n\tsparse = true\n",
+        )
+        layout = git_commitai.detect_repo_layout(str(tmp_path))
+        assert layout.sparse_checkout and layout.sparse_index and not layout.partial_clone
+        assert layout.read_by_object_id
+
+    def test_sparse_checkout_alone_is_not_special(self, tmp_path):
+        self.make_repo(tmp_path, "[core]\n\tsparseCheckout = true\n")
+        layout = git_commitai.detect_repo_layout(str(tmp_path))
+        assert layout.sparse_checkout and not layout.read_by_object_id
+
+    def test_linked_worktree(self, tmp_path):
+        main_git_dir = self.make_repo(tmp_path / "main", "[extensions]\n\tpartialClone = origin\n")
+        worktree_git_dir = main_git_dir / "worktrees" / "wt"
+        worktree_git_dir.mkdir(parents=True)
+        (worktree_git_dir / "commondir").write_text("../..\n")
+        (tmp_path / "wt").mkdir()
+        (tmp_path / "wt" / ".git").write_text(f"gitdir: {worktree_git_dir}\n")
+        assert git_commitai.detect_repo_layout(str(tmp_path / "wt")).partial_clone
+
+    def test_outside_repository(self, tmp_path):
+        with patch("git_commitai.find_git_dir", return_value=None):
+            assert git_commitai.detect_repo_layout(str(tmp_path)) == git_commitai.RepoLayout()
+
+
+class TestParseRawDiff:
+    """Test parsing git diff --raw --numstat -z."""
+
+    def test_entries(self):
+        entries = git_commitai.parse_raw_diff(RAW_DIFF)
+        assert list(entries) == ["logo.png", "new.py", "gone.txt", "tab\there.txt"]
+        assert entries["logo.png"] == git_commitai.StagedEntry("logo.png", "A", "a" * 40, True)
+        assert entries["new.py"] == git_commitai.StagedEntry("new.py", "R", "b" * 40, False)
+        # Deletions keep the removed blob
+        assert entries["gone.txt"].oid == "c" * 40
+        assert entries["tab\there.txt"].oid == "e" * 40
+
+    def test_without_numstat(self):
+        raw = RAW_DIFF.split("-\t-")[0]
+        assert all(entry.binary is None for entry in git_commitai.parse_raw_diff(raw).values())
+
+    def test_empty(self):
+        assert git_commitai.parse_raw_diff("") == {}
+
+
+class TestLazyFetch:
+    """Test turning off on-demand fetching of missing objects."""
+
+    @pytest.mark.parametrize("fast_path", [True, False])
+    def test_env(self, fast_path):
+        settings = git_commitai.RunSettings(git_fast_path=fast_path, lazy_fetch=False)
+        with git_commitai.run_context(settings):
+            _, extra = git_commitai.git_command(["cat-file", "blob", "a" * 40])
+        assert extra["env"]["GIT_NO_LAZY_FETCH"] == "1"
+
+    def test_allowed_by_default(self):
+        _, extra = git_commitai.git_command(["cat-file", "blob", "a" * 40])
+        assert "GIT_NO_LAZY_FETCH" not in extra["env"]
+
+    def test_run_git_local(self):
+        def fake_run_git(args, check=True):
+            return str(git_commitai.active_settings().lazy_fetch)
+
+        with patch("git_commitai.run_git", side_effect=fake_run_git):
+            assert git_commitai.run_git_local(["cat-file", "-s", "a" * 40]) == "False"
+        assert git_commitai.active_settings().lazy_fetch
+
+
+class TestObjectIdCollection:
+    """Test get_staged_files() reading blobs by id."""
+
+    SETTINGS = git_commitai.RunSettings(layout=git_commitai.RepoLayout(partial_clone=True, promisor_remote="origin"))
+
+    def fake_git(self, blobs, failing=()):
+        calls = []
+
+        def run_git(args, check=True):
+            calls.append((args, git_commitai.active_settings().lazy_fetch))
+            if args[0] in ("diff", "diff-tree"):
+                if args[0] in failing and "--numstat" in args:
+                    raise subprocess.CalledProcessError(128, ["git"] + args)
+                return RAW_DIFF
+            if args[:2] == ["cat-file", "blob"] and args[2] in blobs:
+                return blobs[args[2]]
+            if args[:2] == ["cat-file", "-s"]:
+                return "2048\n"
+            raise subprocess.CalledProcessError(128, ["git"] + args)
+
+        return run_git, calls
+
+    def test_reads_blobs_without_fetching(self):
+        run_git, calls = self.fake_git({"e" * 40: "tabbed\n"})
+        metrics = git_commitai.RunMetrics()
+        settings = git_commitai.replace(self.SETTINGS, metrics=metrics)
+        with patch("git_commitai.run_git", side_effect=run_git):
+            result = git_commitai.get_staged_files(settings=settings)
+
+        assert "logo.png (binary file)\n```\nFile type: .png\nSize: 2.0 KB" in result
+        assert "Status: New file" in result
+        assert "tab\there.txt\n```\ntabbed\n```" in result
+        assert "gone.txt\n```\n\n```" in result
+        assert "new.py (not fetched)\n```\nContent not available locally" in result
+        assert metrics.events == {"blob_not_fetched": 1}
+        # One diff (which may fetch in a batch), then only local reads
+        assert calls[0] == (["diff", "--cached", "--raw", "--numstat", "-z", "--no-abbrev"], True)
+        assert all(not lazy for _, lazy in calls[1:])
+
+    def test_amend_lists_head_changes(self):
+        run_git, calls = self.fake_git({})
+        with patch("git_commitai.run_git", side_effect=run_git):
+            git_commitai.get_staged_files(amend=True, settings=self.SETTINGS)
+        assert calls[0][0][:2] == ["diff-tree", "-r"]
+        assert calls[1][0][:2] == ["diff", "--cached"]
+
+    def test_offline_lists_without_content(self):
+        run_git, calls = self.fake_git({"a" * 40: "\0PNG"}, failing=("diff-tree",))
+        with patch("git_commitai.run_git", side_effect=run_git):
+            result = git_commitai.get_staged_files(amend=True, settings=self.SETTINGS)
+        listings = [(args, lazy) for args, lazy in calls if args[0] in ("diff", "diff-tree")]
+        assert listings[1:] == [
+            (["diff-tree", "-r", "--root", "--no-commit-id", "HEAD", "--raw", "-z", "--no-abbrev", "--no-renames"], False),
+            (["diff", "--cached", "--raw", "-z", "--no-abbrev", "--no-renames"], False),
+        ]
+        # Binary content is still recognised once read
+        assert "logo.png (binary file)" in result
+
+    def test_ordinary_repository_unchanged(self):
+        with patch("git_commitai.run_git", return_value="") as mock_run:
+            git_commitai.get_staged_files(settings=git_commitai.RunSettings())
+        mock_run.assert_called_once_with(["diff", "--cached", "--name-only", "-z"], check=True)
+
+
+def _git(repo, *args):
+    return subprocess.run(
+        ["git", "-C", str(repo), "-c", "user.name=T", "-c", "user.email=t@example.com"] + list(args),
+        check=True, capture_output=True, text=True,
+    ).stdout
+
+
+def count_fetches(trace_file):
+    with open(trace_file) as f:
+        return sum(1 for line in f if "run_command:" in line and " fetch " in line)
+
+
+@pytest.fixture
+def blobless_clone(tmp_path):
+    """A blobless clone whose HEAD commit changed six files."""
+    source = tmp_path / "source"
+    source.mkdir()
+    _git(source, "init", "-q")
+    for i in range(6):
+        (source / f"file{i}.txt").write_text(f"one {i}\n")
+    _git(source, "add", "-A")
+    _git(source, "commit", "-qm", "one")
+    for i in range(6):
+        (source / f"file{i}.txt").write_text(f"two {i}\n")
+    _git(source, "commit", "-qam", "two")
+    _git(source, "config", "uploadpack.allowFilter", "true")
+    _git(source, "config", "uploadpack.allowAnySHA1InWant", "true")
+    clone = tmp_path / "clone"
+    _git(tmp_path, "clone", "-q", "--filter=blob:none", f"file://{source}", str(clone))
+    return clone
+
+
+@pytest.mark.integration
+@pytest.mark.skipif(shutil.which("git") is None, reason="git is not installed")
+class TestPartialClone:
+    """Test collecting changes in a real blobless clone."""
+
+    def collect(self, clone, tmp_path):
+        trace_file = tmp_path / "trace"
+        settings = git_commitai.RunSettings(cwd=str(clone), layout=git_commitai.detect_repo_layout(str(clone)))
+        assert settings.layout.partial_clone
+        with patch.dict(os.environ, {"GIT_TRACE": str(trace_file)}):
+            files = git_commitai.get_staged_files(amend=True, settings=settings)
+        return files, count_fetches(trace_file)
+
+    def test_one_batched_fetch(self, blobless_clone, tmp_path):
+        (blobless_clone / "file0.txt").write_text("three 0\n")
+        _git(blobless_clone, "add", "file0.txt")
+        files, fetches = self.collect(blobless_clone, tmp_path)
+        assert "file0.txt\n```\nthree 0\n```" in files
+        assert "file5.txt\n```\ntwo 5\n```" in files
+        assert fetches == 1
+
+    def test_unreachable_remote(self, blobless_clone, tmp_path):
+        _git(blobless_clone, "remote", "set-url", "origin", f"file://{tmp_path}/missing")
+        files, fetches = self.collect(blobless_clone, tmp_path)
+        # HEAD's blobs were fetched by the checkout; only the listing tried the remote
+        assert "file3.txt\n```\ntwo 3\n```" in files
+        assert fetches == 1
@@ -0,0 +1,168 @@
+"""Tests for summing up long lists of changed files by directory."""
+
+import shutil
+import subprocess
+from unittest.mock import patch
+
+import pytest
+
+import git_commitai
+
+
+def change(path, status="M", added=1, deleted=1):
+    return git_commitai.StagedEntry(path, status, "", added=added, deleted=deleted)
+
+
+@pytest.mark.parametrize("number, text", [
+    (0, "0"), (950, "950"), (1000, "1k"), (1234, "1.2k"), (9960, "10k"), (12_400, "12k"),
+    (999_400, "999k"), (999_600, "1M"), (3_400_000, "3.4M"),
+])
+def test_short_count(number, text):
+    assert git_commitai.short_count(number) == text
+
+
+class TestSummarizeByDirectory:
+    """Test grouping changed files into a few lines."""
+
+    def test_directories_split_while_they_fit(self):
+        entries = (
+            [change(f"src/gen/proto/m{i}.py", added=7, deleted=6) for i in range(1842)]
+            + [change(f"src/app/f{i}.py", "A", added=100, deleted=0) for i in range(30)]
+            + [change("README.md"), change("setup.py", "D", added=0, deleted=80)]
+        )
+        assert git_commitai.summarize_by_directory(entries) == [
+            "README.md — modified (+1/-1)",
+            "setup.py — deleted (+0/-80)",
+            "src/app/** — 30 files added (+3k/-0)",
+            "src/gen/proto/** — 1,842 files modified (+13k/-11k)",
+        ]
+
+    def test_files_beside_directories(self):
+        entries = [change(f"lib/{name}") for name in ("a.py", "b.py", "x/c.py", "x/d.py", "y/e.py")]
+        entries += [change(f"docs/{i}.md") for i in range(10)]
+        assert git_commitai.summarize_by_directory(entries, max_groups=4) == [
+            "docs/** — 10 files modified (+10/-10)",
+            "lib/* — 2 files modified (+2/-2)",
+            "lib/x/** — 2 files modified (+2/-2)",
+            "lib/y/e.py — modified (+1/-1)",
+        ]
+
+    def test_mixed_statuses(self):
+        entries = [change(f"pkg/{i}.go", "A" if i % 3 else "D") for i in range(9)] + [change("other/x.go")]
+        lines = git_commitai.summarize_by_directory(entries, line_counts=False)
+        assert lines == ["other/x.go — modified", "pkg/** — 9 files: 6 added, 3 deleted"]
+
+    def test_smallest_folded_when_nothing_fits(self):
+        entries = [change(f"d{i:03d}/f{j}") for i in range(100) for j in range(1 + (i == 7))]
+        lines = git_commitai.summarize_by_directory(entries, max_groups=5)
+        assert len(lines) == 5
+        assert lines[0] == "d000/f0 — modified (+1/-1)"
+        assert "d007/** — 2 files modified (+2/-2)" in lines
+        assert lines[-1] == "96 other paths — 96 files modified (+96/-96)"
+
+
+class TestRollupChanges:
+    """Test picking the files to show one by one."""
+
+    def test_most_changed_in_original_order(self):
+        entries = [change(f"f{i:03d}", added=i % 7, deleted=0) for i in range(200)]
+        entries[150] = change("package-lock.json", added=9000)
+        skip = git_commitai.SkipMatcher().with_globs(["*.json"])
+        with patch("git_commitai.ROLLUP_DETAIL_FILES", 3):
+            detailed, summary = git_commitai.rollup_changes(entries, skip)
+        assert [entry.path for entry in detailed] == ["f006", "f013", "f020"]
+        assert summary == ["** — 197 files modified (+9.6k/-1)"]
+
+
+def test_numstat_line_counts():
+    output = (
+        ":100644 100644 1111111 2222222 M\0src/a.py\0"
+        ":000000 100644 0000000 3333333 A\0img.png\0"
+        "12\t3\tsrc/a.py\0-\t-\timg.png\0"
+    )
+    entries = git_commitai.parse_raw_diff(output)
+    assert (entries["src/a.py"].added, entries["src/a.py"].deleted, entries["src/a.py"].binary) == (12, 3, False)
+    assert (entries["img.png"].added, entries["img.png"].binary) == (0, True)
+
+
+class TestStagedFiles:
+    """Test the summary in get_staged_files()."""
+
+    def test_summary_then_most_changed(self):
+        names = "".join(f"gen/m{i:03d}.py\0" for i in range(300))
+        raw = "".join(f":100644 100644 1111111 2222222 M\0gen/m{i:03d}.py\0" for i in range(300))
+        numstat = "".join(f"{500 if i == 42 else 1}\t0\tgen/m{i:03d}.py\0" for i in range(300))
+
+        def run_git(args, check=True):
+            if "--raw" in args:
+                return raw + numstat
+            if "--name-only" in args:
+                return names
+            if "--numstat" in args:
+                return f"1\t0\t{args[-1]}"
+            return f"content of {args[-1]}"
+
+        metrics = git_commitai.RunMetrics()
+        settings = git_commitai.RunSettings(metrics=metrics)
+        with patch("git_commitai.run_git", side_effect=run_git), patch("git_commitai.ROLLUP_DETAIL_FILES", 2):
+            result = git_commitai.get_staged_files(settings=settings)
+
+        assert result.startswith(
+            "# 300 files changed. The 2 with the most changed lines follow; the other 298 by directory:\n"
+            "gen/** — 298 files modified (+298/-0)\n"
+        )
+        assert result.count("content of") == 2
+        assert "gen/m000.py\n```\ncontent of :gen/m000.py\n```" in result
+        assert "gen/m042.py\n```\ncontent of :gen/m042.py\n```" in result
+        assert metrics.events["file_list_rolled_up"] == 1
+
+    def test_short_list_unchanged(self):
+        with patch("git_commitai.run_git", side_effect=lambda args, check=True: "a.py\0" if "-z" in args else "x"):
+            result = git_commitai.get_staged_files(settings=git_commitai.RunSettings(rollup_files=1))
+        assert result == "a.py\n```\nx\n```\n"
+
+
+class TestStatusComments:
+    """Test the list of changes in the commit template."""
+
+    def test_short_list_unchanged(self):
+        assert git_commitai.status_comment_lines("M\ta.py\nR100\told.py\tnew.py\n") == [
+            "# M\ta.py", "# R100\told.py\tnew.py"
+        ]
+
+    def test_long_list_by_directory(self):
+        status = "".join(f"M\tsrc/gen/m{i}.py\n" for i in range(1842)) + "R097\told.py\tsrc/new.py\n"
+        with git_commitai.run_context(git_commitai.RunSettings(rollup_files=100)):
+            assert git_commitai.status_comment_lines(status) == [
+                "# 1,843 files, by directory:",
+                "#   src/gen/** — 1,842 files modified",
+                "#   src/new.py — renamed",
+            ]
+
+
+def _git(repo, *args):
+    subprocess.run(
+        ["git", "-C", str(repo), "-c", "user.name=T", "-c", "user.email=t@example.com"] + list(args),
+        check=True, capture_output=True,
+    )
+
+
+@pytest.mark.integration
+@pytest.mark.skipif(shutil.which("git") is None, reason="git is not installed")
+def test_rollup_from_git(tmp_path):
+    _git(tmp_path, "init", "-q")
+    (tmp_path / "gen").mkdir()
+    for i in range(30):
+        (tmp_path / "gen" / f"m{i:02d}.py").write_text(f"VALUE = {i}\n")
+    (tmp_path / "app.py").write_text("".join(f"print({i})\n" for i in range(20)))
+    _git(tmp_path, "add", "-A")
+
+    settings = git_commitai.RunSettings(cwd=str(tmp_path), rollup_files=10)
+    with git_commitai.run_context(settings), patch("git_commitai.ROLLUP_DETAIL_FILES", 1):
+        files = git_commitai.get_staged_files(settings=settings)
+        message_file = git_commitai.create_commit_message_file(str(tmp_path / ".git"), "Add modules")
+    assert files.startswith("# 31 files changed. The 1 with the most changed lines follow; the other 30 by directory:\n")
+    assert "gen/** — 30 files added (+30/-0)\n" in files
+    assert "app.py\n```\nprint(0)\n" in files and "VALUE" not in files
+    with open(message_file) as f:
+        assert "# 31 files, by directory:\n#   app.py — added\n#   gen/** — 30 files added\n" in f.read()
@@ -1,5 +1,5 @@
 import subprocess
-from unittest.mock import MagicMock, patch
+from unittest.mock import ANY, MagicMock, patch
 import git_commitai
 
 class TestRunGitEdgeCases:
@@ -17,7 +17,31 @@ class TestRunGitEdgeCases:
             result = git_commitai.run_git(["status"])
             assert result == ""
             mock_run.assert_called_once_with(
-                ["git", "status"],
+                ["git", "-c", "color.ui=never", "status"],
+                capture_output=True,
+                text=True,
+                check=True,
+                env=ANY,
+            )
+
+    def test_run_git_diff_fast_path(self):
+        """Test that diffs skip external diff drivers and textconv filters."""
+        with patch("git_commitai.subprocess.run") as mock_run:
+            mock_run.return_value = MagicMock(stdout="")
+            git_commitai.run_git(["diff", "--cached"])
+            assert mock_run.call_args[0][0] == [
+                "git", "-c", "color.ui=never", "diff", "--no-ext-diff", "--no-textconv", "--cached",
+            ]
+            assert mock_run.call_args.kwargs["env"]["GIT_OPTIONAL_LOCKS"] == "0"
+
+    def test_run_git_fast_path_opt_out(self):
+        """Test that GIT_COMMIT_AI_GIT_FAST_PATH=0 runs git with the user's config as is."""
+        with patch("git_commitai.subprocess.run") as mock_run, \
+             patch.dict("os.environ", {"GIT_COMMIT_AI_GIT_FAST_PATH": "0"}):
+            mock_run.return_value = MagicMock(stdout="")
+            git_commitai.run_git(["diff", "--cached"])
+            mock_run.assert_called_once_with(
+                ["git", "diff", "--cached"],
                 capture_output=True,
                 text=True,
                 check=True,
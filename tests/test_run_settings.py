@@ -0,0 +1,184 @@
+"""Tests for per-run settings and reentrant, thread-safe generation."""
+
+import os
+import shutil
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import StringIO
+from unittest.mock import patch, MagicMock
+
+import pytest
+
+import git_commitai
+
+
+class TestLimits:
+    """Test building per-run size limits."""
+
+    def test_defaults_follow_module_values(self):
+        """Test that unspecified limits come from the module defaults."""
+        with patch("git_commitai.MAX_FILE_SIZE", 123):
+            assert git_commitai.Limits().max_file_size == 123
+
+    def test_from_config(self):
+        """Test that config file limits override the defaults."""
+        with patch.dict(os.environ, {}, clear=True):
+            limits = git_commitai.Limits.from_config({"max_file_size": 10, "model": "x"})
+        assert limits.max_file_size == 10
+        assert limits.max_diff_size == git_commitai.MAX_DIFF_SIZE
+
+    def test_get_env_config_leaves_globals_alone(self):
+        """Test that loading config no longer rewrites module globals."""
+        args = MagicMock()
+        args.api_key = "key"
+        args.api_url = None
+        args.model = None
+        original = git_commitai.MAX_FILE_SIZE
+        with patch.dict(os.environ, {}, clear=True), \
+             patch("git_commitai.load_gitcommitai_config", return_value={"max_file_size": 7}):
+            config = git_commitai.get_env_config(args)
+        assert config["limits"].max_file_size == 7
+        assert git_commitai.MAX_FILE_SIZE == original
+
+    def test_get_staged_files_uses_settings_limits(self):
+        """Test that get_staged_files applies the limits it is given."""
+        settings = git_commitai.RunSettings(limits=git_commitai.Limits(max_file_size=10))
+        with patch("git_commitai.run_git") as mock_run_git:
+            mock_run_git.side_effect = ["big.txt", "", "x" * 100, ""]
+            result = git_commitai.get_staged_files(settings=settings)
+        assert "(large file)" in result
+
+    def test_get_git_diff_uses_settings_limits(self):
+        """Test that get_git_diff truncates at the limit it is given."""
+        settings = git_commitai.RunSettings(limits=git_commitai.Limits(max_diff_size=100))
+        diff = "\n".join(f"+line {i}" for i in range(200))
+        with patch("git_commitai.run_git", return_value=diff):
+            result = git_commitai.get_git_diff(settings=settings)
+        assert "TRUNCATED" in result
+
+
+class TestRunContext:
+    """Test thread-local run settings."""
+
+    def test_run_git_uses_context_cwd(self):
+        """Test that git commands run in the repository of the active run."""
+        with patch("git_commitai.subprocess.run") as mock_run:
+            mock_run.return_value = MagicMock(stdout="ok")
+            with git_commitai.run_context(git_commitai.RunSettings(cwd="/some/repo")):
+                git_commitai.run_git(["status"])
+        assert mock_run.call_args.kwargs["cwd"] == "/some/repo"
+
+    def test_context_restored(self):
+        """Test that nested contexts restore the previous settings."""
+        outer = git_commitai.RunSettings(cwd="/outer")
+        inner = git_commitai.RunSettings(cwd="/inner")
+        with git_commitai.run_context(outer):
+            with git_commitai.run_context(inner):
+                assert git_commitai.active_settings() is inner
+            assert git_commitai.active_settings() is outer
+        assert git_commitai.active_settings().cwd is None
+
+    def test_context_is_per_thread(self):
+        """Test that another thread does not see this thread's settings."""
+        seen = []
+        with git_commitai.run_context(git_commitai.RunSettings(cwd="/mine")):
+            thread = threading.Thread(target=lambda: seen.append(git_commitai.active_settings().cwd))
+            thread.start()
+            thread.join()
+        assert seen == [None]
+
+    def test_debug_setting_enables_logging(self, capsys):
+        """Test that RunSettings.debug enables debug output for that run only."""
+        with git_commitai.run_context(git_commitai.RunSettings(debug=True)):
+            git_commitai.debug_log("inside")
+        git_commitai.debug_log("outside")
+        err = capsys.readouterr().err
+        assert "DEBUG: inside" in err
+        assert "outside" not in err
+
+    def test_make_api_request_uses_settings_retries(self):
+        """Test that retry settings come from the RunSettings."""
+        from urllib.error import URLError
+        config = {"api_key": "k", "api_url": "http://x", "model": "m"}
+        settings = git_commitai.RunSettings(max_retries=2, retry_delay=0)
+        with patch("git_commitai.urlopen", side_effect=URLError("down")) as mock_urlopen, \
+             patch("git_commitai.time.sleep"):
+            with pytest.raises(git_commitai.APIRequestError):
+                git_commitai.make_api_request(config, "prompt", settings=settings)
+        assert mock_urlopen.call_count == 2
+
+
+class TestEnvironmentDefaults:
+    """Test reading RunSettings defaults from the environment."""
+
+    @pytest.mark.parametrize("value, expected", [("3", 3), (" 2 ", 2), ("auto", None), ("0", None), ("", None)])
+    def test_workers(self, monkeypatch, value, expected):
+        monkeypatch.setenv("GIT_COMMIT_AI_WORKERS", value)
+        default = min(git_commitai.PARALLEL_WORKERS, os.cpu_count() or 1)
+        assert git_commitai.RunSettings().workers == (default if expected is None else expected)
+        assert git_commitai.active_settings().workers == (default if expected is None else expected)
+
+    @pytest.mark.parametrize("value, expected", [("500", 500), ("0", 0), ("lots", None), ("-1", None)])
+    def test_rollup_files(self, monkeypatch, value, expected):
+        monkeypatch.setenv("GIT_COMMIT_AI_ROLLUP_FILES", value)
+        expected = git_commitai.ROLLUP_FILES if expected is None else expected
+        assert git_commitai.RunSettings().rollup_files == expected
+
+    def test_invalid_value_logged(self, monkeypatch, capsys):
+        monkeypatch.setenv("GIT_COMMIT_AI_WORKERS", "auto")
+        with git_commitai.run_context(git_commitai.RunSettings(debug=True)):
+            assert git_commitai.env_int("GIT_COMMIT_AI_WORKERS", 4, minimum=1) == 4
+        assert "Ignoring invalid GIT_COMMIT_AI_WORKERS='auto', using 4" in capsys.readouterr().err
+
+
+class TestErrorsInMain:
+    """Test that main turns CommitAIError into an error message and exit code."""
+
+    def test_missing_api_key(self):
+        with patch("subprocess.run") as mock_run, \
+             patch("git_commitai.check_staged_changes", return_value=True), \
+             patch("git_commitai.load_gitcommitai_config", return_value={}), \
+             patch.dict(os.environ, {}, clear=True), \
+             patch("sys.argv", ["git-commitai"]), \
+             patch("sys.stdout", new=StringIO()) as fake_out:
+            mock_run.return_value.returncode = 0
+            with pytest.raises(SystemExit) as exc_info:
+                git_commitai.main()
+        assert exc_info.value.code == 1
+        assert "Error: GIT_COMMIT_AI_KEY environment variable is not set" in fake_out.getvalue()
+
+
+def _make_repo(path, filename, content):
+    subprocess.run(["git", "init", "-q", str(path)], check=True)
+    (path / filename).write_text(content)
+    subprocess.run(["git", "-C", str(path), "add", filename], check=True)
+
+
+@pytest.mark.integration
+@pytest.mark.skipif(shutil.which("git") is None, reason="git is not installed")
+def test_concurrent_generation_across_repositories(tmp_path):
+    """Test generating prompts for several repositories on a thread pool."""
+    repos = []
+    for i in range(4):
+        path = tmp_path / f"repo{i}"
+        path.mkdir()
+        _make_repo(path, f"file{i}.txt", f"content of repo {i}\n")
+        repos.append(path)
+
+    def collect(path):
+        settings = git_commitai.RunSettings(cwd=str(path))
+        return (
+            git_commitai.get_git_diff(settings=settings),
+            git_commitai.get_staged_files(settings=settings),
+        )
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        results = list(pool.map(collect, repos))
+
+    for i, (diff, files) in enumerate(results):
+        assert f"file{i}.txt" in diff
+        assert f"content of repo {i}" in files
+        for j in range(4):
+            if j != i:
+                assert f"file{j}.txt" not in files
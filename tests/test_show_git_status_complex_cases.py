@@ -7,20 +7,9 @@ class TestShowGitStatusComplexCases:
 
     def test_show_git_status_detached_head(self):
         """Test show_git_status in detached HEAD state."""
-        with patch("git_commitai.run_git") as mock_run:
-            def side_effect(args, check=True):
-                if "--show-current" in args:
-                    return ""  # Empty means detached
-                elif "rev-parse" in args and "--short" in args and "HEAD" in args:
-                    return "abc1234"
-                elif "rev-parse" in args and "HEAD" in args:
-                    return "abc1234567890"  # Full SHA
-                elif "--porcelain" in args:
-                    return ""
-                return ""
-
-            mock_run.side_effect = side_effect
-
+        output_v2 = "# branch.oid abc1234567890\0# branch.head (detached)\0"
+        with patch("git_commitai.run_git", return_value=output_v2), \
+             patch("git_commitai.load_gitcommitai_config", return_value={}):
             with patch("sys.stdout", new=StringIO()) as fake_out:
                 git_commitai.show_git_status()
                 output = fake_out.getvalue()
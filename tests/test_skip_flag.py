@@ -10,7 +10,7 @@ def test_skip_flag_single_pattern():
     # Mock git operations
     with patch("git_commitai.run_git") as mock_run_git:
         # Simulate multiple files staged
-        mock_run_git.return_value = "src/secret.env\nsrc/main.py\nREADME.md"
+        mock_run_git.return_value = "src/secret.env\0src/main.py\0README.md\0"
 
         # Test that .env files are skipped
         result = git_commitai.get_staged_files(skip_patterns=["*.env"])
@@ -26,7 +26,7 @@ def test_skip_flag_multiple_patterns():
     """Test --skip flag with multiple glob patterns."""
     with patch("git_commitai.run_git") as mock_run_git:
         # Mock diff-tree, diff --cached --name-only
-        mock_run_git.return_value = "package-lock.json\nnode_modules/lib.js\nsrc/app.js\ntests/test.py"
+        mock_run_git.return_value = "package-lock.json\0node_modules/lib.js\0src/app.js\0tests/test.py\0"
 
         skip_patterns = ["package-lock.json", "node_modules/*"]
         result = git_commitai.get_staged_files(skip_patterns=skip_patterns)
@@ -41,7 +41,7 @@ def test_skip_flag_multiple_patterns():
 def test_skip_flag_wildcard_patterns():
     """Test --skip flag with various wildcard patterns."""
     with patch("git_commitai.run_git") as mock_run_git:
-        mock_run_git.return_value = "dist/bundle.js\nbuild/output.js\nsrc/index.js"
+        mock_run_git.return_value = "dist/bundle.js\0build/output.js\0src/index.js\0"
 
         # Skip all files in dist/ and build/
         result = git_commitai.get_staged_files(skip_patterns=["dist/*", "build/*"])
@@ -93,7 +93,7 @@ def test_skip_flag_empty_pattern_list():
 def test_skip_flag_case_sensitive():
     """Test that skip patterns are case-sensitive (fnmatch default)."""
     with patch("git_commitai.run_git") as mock_run_git:
-        mock_run_git.return_value = "Test.PY\ntest.py"
+        mock_run_git.return_value = "Test.PY\0test.py\0"
 
         # Pattern *.py should only match lowercase
         result = git_commitai.get_staged_files(skip_patterns=["*.py"])
@@ -0,0 +1,179 @@
+"""Tests for .gitcommitaiignore and the compiled skip matcher."""
+
+import json
+import os
+import shutil
+import subprocess
+from unittest.mock import patch
+
+import pytest
+
+import git_commitai
+
+IGNORE = """\
+# Generated code
+*.log
+!important.log
+build/
+/docs/*.md
+**/fixtures/**
+src/**/generated_*.py
+data_[0-9]*.csv
+\\#hash
+trailing.txt   \n"""
+
+
+@pytest.fixture
+def matcher():
+    return git_commitai.SkipMatcher.parse(IGNORE)
+
+
+class TestGitignoreSemantics:
+    """Test that rules behave like .gitignore."""
+
+    @pytest.mark.parametrize("path, pattern", [
+        ("debug.log", "*.log"),
+        ("deep/dir/debug.log", "*.log"),
+        ("build/out.js", "build/"),
+        ("src/build/out.js", "build/"),
+        ("docs/guide.md", "/docs/*.md"),
+        ("a/fixtures/b/c.json", "**/fixtures/**"),
+        ("src/generated_api.py", "src/**/generated_*.py"),
+        ("src/a/b/generated_api.py", "src/**/generated_*.py"),
+        ("data_2024.csv", "data_[0-9]*.csv"),
+        ("#hash", "\\#hash"),
+        ("trailing.txt", "trailing.txt"),
+    ])
+    def test_excluded(self, matcher, path, pattern):
+        assert matcher.match(path) == pattern
+
+    @pytest.mark.parametrize("path", [
+        "important.log",
+        "build",
+        "docs/sub/guide.md",
+        "lib/docs/guide.md",
+        "lib/generated_api.py",
+        "data_x.csv",
+        "hash",
+        "fixtures",
+        "src/app.py",
+    ])
+    def test_included(self, matcher, path):
+        assert matcher.match(path) is None
+
+    def test_no_reinclusion_under_excluded_directory(self):
+        matcher = git_commitai.SkipMatcher.parse("vendor/\n!vendor/keep.py\n")
+        assert matcher.match("vendor/keep.py") == "vendor/"
+
+    def test_last_rule_wins(self):
+        matcher = git_commitai.SkipMatcher.parse("*.py\n!src/*.py\nsrc/gen.py\n")
+        assert matcher.match("src/app.py") is None
+        assert matcher.match("src/gen.py") == "src/gen.py"
+        assert matcher.match("tools/x.py") == "*.py"
+
+    def test_globs_keep_fnmatch_semantics(self):
+        matcher = git_commitai.SkipMatcher().with_globs(["src/*.js", "*.env"])
+        assert matcher.match("src/deep/app.js") == "src/*.js"
+        assert matcher.match("config/prod.env") == "*.env"
+        assert matcher.match("src/app.ts") is None
+        assert not git_commitai.SkipMatcher() and matcher
+
+
+class TestLoadSkipMatcher:
+    """Test reading and caching .gitcommitaiignore."""
+
+    def repo(self, tmp_path):
+        (tmp_path / ".git").mkdir()
+        (tmp_path / ".gitcommitaiignore").write_text(IGNORE)
+        return tmp_path
+
+    def test_cached_next_to_config(self, tmp_path):
+        repo = self.repo(tmp_path)
+        first = git_commitai.load_skip_matcher(str(repo))
+        cache = json.loads((repo / ".git" / git_commitai.IGNORE_CACHE_FILE).read_text())
+        assert [rule["pattern"] for rule in cache["config"]["rules"]] == [rule.pattern for rule in first.rules]
+
+        with patch("git_commitai.parse_ignore_rule") as mock_parse:
+            second = git_commitai.load_skip_matcher(str(repo))
+        mock_parse.assert_not_called()
+        assert second.rules == first.rules
+
+    def test_cache_follows_file(self, tmp_path):
+        repo = self.repo(tmp_path)
+        git_commitai.load_skip_matcher(str(repo))
+        (repo / ".gitcommitaiignore").write_text("*.tmp\n")
+        os.utime(repo / ".gitcommitaiignore", ns=(0, 10**9))
+        assert [rule.pattern for rule in git_commitai.load_skip_matcher(str(repo)).rules] == ["*.tmp"]
+
+    def test_no_file(self, tmp_path):
+        (tmp_path / ".git").mkdir()
+        assert not git_commitai.load_skip_matcher(str(tmp_path))
+
+
+def section(path, body="+x\n"):
+    return (
+        f"diff --git a/{path} b/{path}\nindex 1111111..2222222 100644\n--- a/{path}\n+++ b/{path}\n"
+        f"@@ -1 +1 @@\n{body}"
+    )
+
+
+class TestDiffSections:
+    """Test leaving skipped files out of the diff."""
+
+    @pytest.mark.parametrize("chunk_size", [1, 7, 100_000])
+    def test_skipped_sections_keep_headers(self, chunk_size):
+        diff = section("src/app.py") + section("build/bundle.js", "+" + "x" * 500 + "\n") + section("README")
+        chunks = [diff[i:i + chunk_size] for i in range(0, len(diff), chunk_size)]
+        settings = git_commitai.RunSettings(skip=git_commitai.SkipMatcher.parse("build/\n"))
+        with git_commitai.run_context(settings):
+            result = "".join(git_commitai.rewrite_diff_sections(iter(chunks)))
+        assert result == section("src/app.py") + (
+            "diff --git a/build/bundle.js b/build/bundle.js\nindex 1111111..2222222 100644\n"
+            "--- a/build/bundle.js\n+++ b/build/bundle.js\n"
+            "# File content excluded from AI prompt (matches pattern 'build/')\n"
+        ) + section("README")
+
+    @pytest.mark.parametrize("line, path", [
+        ("diff --git a/x y.txt b/x y.txt\n", "x y.txt"),
+        ("diff --git a/old.py b/new.py\n", "new.py"),
+        ('diff --git "a/na\\303\\257ve.txt" "b/na\\303\\257ve.txt"\n', "naïve.txt"),
+    ])
+    def test_diff_line_path(self, line, path):
+        assert git_commitai.diff_line_path(line) == path
+
+
+class TestStagedFiles:
+    """Test the matcher in get_staged_files()."""
+
+    def test_settings_and_patterns_combined(self):
+        settings = git_commitai.RunSettings(skip=git_commitai.SkipMatcher.parse("*.lock\n"))
+        with patch("git_commitai.run_git", return_value="a.lock\0b.env\0c.py\0"):
+            result = git_commitai.get_staged_files(skip_patterns=["*.env"], settings=settings)
+        assert "a.lock (skipped: matches pattern '*.lock')" in result
+        assert "b.env (skipped: matches pattern '*.env')" in result
+        assert "c.py (skipped" not in result
+
+
+def _git(repo, *args):
+    subprocess.run(
+        ["git", "-C", str(repo), "-c", "user.name=T", "-c", "user.email=t@example.com"] + list(args),
+        check=True, capture_output=True,
+    )
+
+
+@pytest.mark.integration
+@pytest.mark.skipif(shutil.which("git") is None, reason="git is not installed")
+def test_ignore_file_from_git(tmp_path):
+    _git(tmp_path, "init", "-q")
+    (tmp_path / ".gitcommitaiignore").write_text("dist/\n")
+    (tmp_path / "dist").mkdir()
+    (tmp_path / "dist" / "bundle.js").write_text("minified();\n" * 100)
+    (tmp_path / "app.js").write_text("run();\n")
+    _git(tmp_path, "add", "-A")
+
+    settings = git_commitai.RunSettings(cwd=str(tmp_path), skip=git_commitai.load_skip_matcher(str(tmp_path)))
+    diff = git_commitai.get_git_diff(settings=settings)
+    files = git_commitai.get_staged_files(settings=settings)
+    assert "minified" not in diff and "minified" not in files
+    assert "+run();" in diff
+    assert "dist/bundle.js (skipped: matches pattern 'dist/')" in files
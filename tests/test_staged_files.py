@@ -13,7 +13,7 @@ class TestStagedFiles:
             # Mock the sequence of commands that will be called
             def side_effect(args, check=True):
                 if "diff" in args and "--cached" in args and "--name-only" in args:
-                    return "file1.py\nfile2.md"
+                    return "file1.py\0file2.md\0"
                 elif "diff" in args and "--cached" in args and "--numstat" in args and "file1.py" in args:
                     return "10\t5\tfile1.py"  # Not binary (shows numbers)
                 elif "show" in args and ":file1.py" in args:
@@ -47,7 +47,7 @@ class TestStagedFiles:
 
             def side_effect(args, check=True):
                 if "diff" in args and "--cached" in args and "--name-only" in args:
-                    return "file1.py\nlogo.webp"
+                    return "file1.py\0logo.webp\0"
                 elif "diff" in args and "--cached" in args and "--numstat" in args and "file1.py" in args:
                     return "10\t5\tfile1.py"  # Text file
                 elif "show" in args and ":file1.py" in args:
@@ -76,7 +76,7 @@ class TestStagedFiles:
 
             def side_effect(args, check=True):
                 if "diff-tree" in args and "--no-commit-id" in args and "--name-only" in args:
-                    return "file1.py\nfile2.md"
+                    return "file1.py\0file2.md\0"
                 elif "diff" in args and "--cached" in args and "--name-only" in args:
                     return "file3.js"
                 elif "diff" in args and "--cached" in args and "--numstat" in args and "file1.py" in args:
@@ -0,0 +1,97 @@
+"""Tests for NUL-delimited, streamed enumeration of staged files."""
+
+import shutil
+import subprocess
+from unittest.mock import patch
+
+import pytest
+
+import git_commitai
+
+
+class TestStreamGitRecords:
+    """Test splitting streamed text into lines and records."""
+
+    def stream(self, chunks, **kwargs):
+        with patch("git_commitai.stream_git_text", return_value=iter(chunks)):
+            return list(git_commitai.stream_git(["diff"], **kwargs))
+
+    def test_records_across_chunks(self):
+        chunks = ["a.t", "xt\0new\nli", "ne.txt\0naïve", ".py\0"]
+        assert self.stream(chunks, separator="\0") == ["a.txt", "new\nline.txt", "naïve.py"]
+
+    def test_lines_across_chunks(self):
+        assert self.stream(["one\ntw", "o\n\nthr", "ee"]) == ["one", "two", "", "three"]
+
+    def test_long_lines_in_pieces(self):
+        assert self.stream(["abc", "defgh\nta", "il"], max_line=3) == ["abc", "def", "gh", "tai", "l"]
+
+
+class TestIterStagedPaths:
+    """Test iter_staged_paths() with faked git output."""
+
+    def test_names_with_newlines(self):
+        with patch("git_commitai.run_git", return_value="one\ntwo.txt\0three.txt\0") as mock_run:
+            assert list(git_commitai.iter_staged_paths()) == ["one\ntwo.txt", "three.txt"]
+        mock_run.assert_called_once_with(["diff", "--cached", "--name-only", "-z"], check=True)
+
+    def test_amend_merges_and_sorts(self):
+        def run_git(args, check=True):
+            return "b.py\0a.py\0" if args[0] == "diff-tree" else "c.py\0a.py\0"
+
+        with patch("git_commitai.run_git", side_effect=run_git):
+            assert list(git_commitai.iter_staged_paths(amend=True)) == ["a.py", "b.py", "c.py"]
+
+
+class TestListingBudget:
+    """Test that listing stops once the files section is full."""
+
+    def test_stops_pulling_names(self):
+        pulled = []
+
+        def names(args, check=True, max_line=None, separator="\n"):
+            for i in range(100_000):
+                pulled.append(i)
+                yield f"file{i:05d}.txt"
+
+        def run_git(args, check=True):
+            if "--numstat" in args:
+                return f"1\t0\t{args[-1]}"
+            return "x" * 200
+
+        metrics = git_commitai.RunMetrics()
+        limits = git_commitai.Limits(max_total_files=1024, max_diff_size=1024, max_prompt_size=8 * 1024)
+        # Without the directory rollup, which reads the first names up front
+        settings = git_commitai.RunSettings(limits=limits, metrics=metrics, rollup_files=0)
+        with patch("git_commitai.stream_git", side_effect=names), \
+             patch("git_commitai.run_git", side_effect=run_git):
+            result = git_commitai.get_staged_files(settings=settings)
+
+        assert len(pulled) < 100
+        assert result.rstrip().endswith("not listed to stay within the prompt size limit")
+        assert len(result) < 8 * 1024
+        assert metrics.events["file_list_truncated"] == 1
+
+    def test_small_change_fully_listed(self):
+        with patch("git_commitai.run_git", side_effect=lambda args, check=True: "a.py\0b.py\0" if "-z" in args else "x"):
+            result = git_commitai.get_staged_files()
+        assert "a.py\n```\nx\n```" in result and "b.py\n```\nx\n```" in result
+        assert "not listed" not in result
+
+
+@pytest.mark.integration
+@pytest.mark.skipif(shutil.which("git") is None, reason="git is not installed")
+def test_unusual_names_from_git(tmp_path):
+    subprocess.run(["git", "init", "-q", str(tmp_path)], check=True)
+    names = ["naïve.txt", "two\nlines.txt", "tab\there.txt", "plain.txt"]
+    for name in names:
+        try:
+            (tmp_path / name).write_text(f"{name}\n")
+        except OSError:
+            pytest.skip("file system does not allow this file name")
+    subprocess.run(["git", "-C", str(tmp_path), "add", "-A"], check=True)
+
+    with git_commitai.run_context(git_commitai.RunSettings(cwd=str(tmp_path))):
+        assert sorted(git_commitai.iter_staged_paths()) == sorted(names)
+        files = git_commitai.get_staged_files()
+    assert "two\nlines.txt\n```\ntwo\nlines.txt\n```" in files
@@ -0,0 +1,148 @@
+"""Startup-time regression tests.
+
+git-commitai runs from editor integrations on every preview, so importing it
+and answering --version must stay cheap. These tests run a fresh interpreter
+with ``-X importtime`` to check which modules get imported, and time
+--version end to end through the installed launcher.
+"""
+
+import os
+import py_compile
+import shutil
+import subprocess
+import sys
+import time
+from io import StringIO
+from unittest.mock import patch
+
+import pytest
+
+import git_commitai
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRIPT = os.path.join(ROOT, "git_commitai.py")
+
+# Modules that must only be imported by the code paths that need them
+LAZY_MODULES = [
+    "json", "argparse", "shlex", "fnmatch", "datetime",
+    "urllib.request", "urllib.error", "http.client", "ssl", "email",
+]
+
+# Hard budget for answering --version through the installed launcher, in
+# milliseconds on top of starting a bare interpreter. It covers everything:
+# the launcher, loading git_commitai from cached bytecode, every module it
+# imports eagerly (dataclasses, and through it inspect, included) and main().
+# Compiling git_commitai.py from source on each run alone costs more.
+VERSION_BUDGET_MS = 90
+
+
+def import_times(*args):
+    """Run a fresh interpreter with -X importtime.
+
+    Returns:
+        Dict of module name to (self, cumulative) import time in microseconds
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime"] + list(args),
+        cwd=ROOT, capture_output=True, text=True, check=True,
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        times[name.strip()] = (int(self_us), int(cumulative_us))
+    return times
+
+
+class TestImportTime:
+    """Test what importing git_commitai costs."""
+
+    def test_heavy_modules_not_imported(self):
+        """Test that the network stack, json and argparse load lazily."""
+        imported = import_times("-c", "import git_commitai")
+        assert "git_commitai" in imported
+        assert [m for m in LAZY_MODULES if m in imported] == []
+
+    def test_version_skips_argparse(self):
+        """Test that a bare --version is answered without argparse."""
+        imported = import_times(SCRIPT, "--version")
+        assert "argparse" not in imported
+
+    def test_lazy_attributes(self):
+        """Test that lazily imported names are still module attributes."""
+        from urllib.request import urlopen
+        assert git_commitai.urlopen is urlopen
+        with pytest.raises(AttributeError):
+            git_commitai.no_such_attribute
+
+
+def best_wall_time_ms(command, runs=7):
+    """Run a command several times and return its fastest wall time."""
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(command, capture_output=True, check=True)
+        timings.append(time.perf_counter() - start)
+    return min(timings) * 1000
+
+
+class TestInstalledStartup:
+    """Test --version through the launcher, laid out as install.sh does it."""
+
+    def install(self, prefix):
+        (prefix / "bin").mkdir()
+        (prefix / "lib" / "git-commitai").mkdir(parents=True)
+        launcher = str(prefix / "bin" / "git-commitai")
+        module = str(prefix / "lib" / "git-commitai" / "git_commitai.py")
+        shutil.copy(os.path.join(ROOT, "git-commitai"), launcher)
+        shutil.copy(SCRIPT, module)
+        py_compile.compile(module, doraise=True)
+        return launcher
+
+    def test_launcher_finds_installed_module(self, tmp_path):
+        launcher = self.install(tmp_path)
+        result = subprocess.run(
+            [sys.executable, launcher, "--version"], cwd=str(tmp_path), capture_output=True, text=True, check=True,
+        )
+        assert result.stdout == f"git-commitai {git_commitai.__version__}\n"
+
+    def test_version_budget(self, tmp_path):
+        """Test that answering --version stays within its hard budget."""
+        launcher = self.install(tmp_path)
+        interpreter = best_wall_time_ms([sys.executable, "-c", "pass"])
+        elapsed = best_wall_time_ms([sys.executable, launcher, "--version"]) - interpreter
+        assert elapsed < VERSION_BUDGET_MS, f"--version took {elapsed:.0f}ms, budget {VERSION_BUDGET_MS}ms"
+
+
+class TestFastPaths:
+    """Test answering --version and --help without extra work."""
+
+    def test_version_does_not_run_git(self):
+        with patch("sys.argv", ["git-commitai", "--version"]), \
+             patch("subprocess.run") as mock_run, \
+             patch("sys.stdout", new=StringIO()) as fake_out:
+            with pytest.raises(SystemExit) as exc_info:
+                git_commitai.main()
+        assert exc_info.value.code == 0
+        assert fake_out.getvalue() == f"git-commitai {git_commitai.__version__}\n"
+        mock_run.assert_not_called()
+
+    def test_help_skips_man_when_not_a_terminal(self):
+        """Test that captured --help output comes from argparse, not man."""
+        with patch("sys.argv", ["git-commitai", "--help"]), \
+             patch("git_commitai.show_man_page") as mock_man, \
+             patch("sys.stdout", new=StringIO()) as fake_out:
+            with pytest.raises(SystemExit):
+                git_commitai.main()
+        mock_man.assert_not_called()
+        assert "Generate AI-powered git commit messages" in fake_out.getvalue()
+
+    def test_help_uses_man_on_a_terminal(self):
+        with patch("sys.argv", ["git-commitai", "--help"]), \
+             patch("sys.stdout.isatty", return_value=True), \
+             patch("git_commitai.show_man_page", return_value=True) as mock_man:
+            with pytest.raises(SystemExit) as exc_info:
+                git_commitai.main()
+        assert exc_info.value.code == 0
+        mock_man.assert_called_once()
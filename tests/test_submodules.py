@@ -0,0 +1,217 @@
+"""Tests for summarising submodule updates."""
+
+import shutil
+import subprocess
+import threading
+import time
+from unittest.mock import patch
+
+import pytest
+
+import git_commitai
+
+OLD = "1" * 40
+NEW = "2" * 40
+
+
+def raw(*entries):
+    return "".join(f":{header}\0{path}\0" for header, path in entries)
+
+
+@pytest.fixture
+def superproject(tmp_path):
+    """A work tree with .gitmodules and checked-out submodules, no real git."""
+    (tmp_path / ".git").mkdir()
+    (tmp_path / ".gitmodules").write_text(
+        '[submodule "lib/a"]\n\tpath = lib/a\n\turl = ../a\n'
+        '[submodule "lib/b"]\n\tpath = lib/b\n\turl = ../b\n'
+    )
+    for name in ("a", "b"):
+        (tmp_path / "lib" / name).mkdir(parents=True)
+        (tmp_path / "lib" / name / ".git").write_text(f"gitdir: ../../.git/modules/lib/{name}\n")
+    return tmp_path
+
+
+class TestListSubmoduleChanges:
+    """Test finding gitlink changes in the staged diff."""
+
+    def test_gitlinks_only(self, superproject):
+        output = raw(
+            (f"160000 160000 {OLD} {NEW} M", "lib/a"),
+            (f"000000 160000 {'0' * 40} {NEW} A", "lib/b"),
+            (f"100644 100644 {OLD} {NEW} M", "lib/c"),
+        )
+        with patch("git_commitai.run_git", return_value=output) as mock_run:
+            changes = git_commitai.list_submodule_changes(str(superproject))
+        assert changes == [
+            git_commitai.SubmoduleChange("lib/a", OLD, NEW),
+            git_commitai.SubmoduleChange("lib/b", "", NEW),
+        ]
+        args = mock_run.call_args[0][0]
+        assert args[-3:] == ["--", ":(top,literal)lib/a", ":(top,literal)lib/b"]
+
+    def test_amend_compares_with_parent(self, superproject):
+        calls = []
+
+        def run_git(args, check=True):
+            calls.append(args)
+            return "p" * 40 + "\n" if args[0] == "rev-parse" else ""
+
+        with patch("git_commitai.run_git", side_effect=run_git):
+            assert git_commitai.list_submodule_changes(str(superproject), amend=True) == []
+        assert "p" * 40 in calls[1]
+
+    def test_no_submodules_no_git(self, tmp_path):
+        (tmp_path / ".git").mkdir()
+        with patch("git_commitai.run_git") as mock_run:
+            assert git_commitai.summarize_submodule_changes() == ""
+            (tmp_path / ".gitmodules").write_text("")
+            with git_commitai.run_context(git_commitai.RunSettings(cwd=str(tmp_path))):
+                assert git_commitai.summarize_submodule_changes() == ""
+        mock_run.assert_not_called()
+
+
+class TestSummarizeSubmodule:
+    """Test the log summary of one submodule."""
+
+    def summarize(self, superproject, change, run_git):
+        with patch("git_commitai.run_git", side_effect=run_git):
+            return git_commitai.summarize_submodule(change, str(superproject), git_commitai.RunSettings())
+
+    def test_commits_brought_in_and_dropped(self, superproject):
+        seen = {}
+
+        def run_git(args, check=True):
+            settings = git_commitai.active_settings()
+            seen.update(cwd=settings.cwd, timeout=settings.git_timeout, lazy_fetch=settings.lazy_fetch)
+            assert args[-1] == f"{OLD}...{NEW}"
+            return "> abc1234 Fix parser\n< def5678 Reverted change\n"
+
+        lines = self.summarize(superproject, git_commitai.SubmoduleChange("lib/a", OLD, NEW), run_git)
+        assert lines == [
+            "lib/a: 1111111..2222222 (2 commits)",
+            "  + abc1234 Fix parser",
+            "  - def5678 Reverted change",
+        ]
+        assert seen == {
+            "cwd": str(superproject / "lib" / "a"),
+            "timeout": git_commitai.SUBMODULE_TIME_BUDGET,
+            "lazy_fetch": False,
+        }
+
+    def test_log_capped(self, superproject):
+        log = "".join(f"> {i:07d} Commit {i}\n" for i in range(git_commitai.SUBMODULE_LOG_LIMIT + 1))
+        lines = self.summarize(superproject, git_commitai.SubmoduleChange("lib/a", OLD, NEW), lambda args, check=True: log)
+        assert lines[0].endswith(f"(more than {git_commitai.SUBMODULE_LOG_LIMIT} commits)")
+        assert len(lines) == git_commitai.SUBMODULE_LOG_LIMIT + 2
+        assert lines[-1] == "  ..."
+
+    def test_added_and_removed(self, superproject):
+        added = self.summarize(
+            superproject, git_commitai.SubmoduleChange("lib/a", "", NEW), lambda args, check=True: "abc1234 Initial\n"
+        )
+        assert added == ["lib/a: added at 2222222 (1 commit)", "  + abc1234 Initial"]
+        removed = self.summarize(superproject, git_commitai.SubmoduleChange("lib/a", OLD, ""), None)
+        assert removed == ["lib/a: removed (was 1111111)"]
+
+    def test_failures(self, superproject):
+        change = git_commitai.SubmoduleChange("lib/a", OLD, NEW)
+
+        def missing(args, check=True):
+            raise subprocess.CalledProcessError(128, args)
+
+        def slow(args, check=True):
+            raise subprocess.TimeoutExpired(args, git_commitai.SUBMODULE_TIME_BUDGET)
+
+        assert self.summarize(superproject, change, missing)[0].endswith("(commits not available locally)")
+        assert self.summarize(superproject, change, slow)[0].endswith("(log timed out after 2s)")
+        unchecked = git_commitai.SubmoduleChange("lib/none", OLD, NEW)
+        assert self.summarize(superproject, unchecked, None) == ["lib/none: 1111111..2222222 (not checked out)"]
+
+
+class TestSummarizeSubmoduleChanges:
+    """Test the concurrent lookup across submodules."""
+
+    def test_runs_concurrently(self, superproject):
+        output = raw(
+            (f"160000 160000 {OLD} {NEW} M", "lib/a"),
+            (f"160000 160000 {OLD} {NEW} M", "lib/b"),
+        )
+        barrier = threading.Barrier(2, timeout=5)
+
+        def run_git(args, check=True):
+            if args[0] == "diff":
+                return output
+            # Both logs must be running at once to get past the barrier
+            barrier.wait()
+            return f"> abc1234 Update {git_commitai.active_settings().cwd[-1]}\n"
+
+        settings = git_commitai.RunSettings(cwd=str(superproject))
+        with patch("git_commitai.run_git", side_effect=run_git), git_commitai.run_context(settings):
+            summary = git_commitai.summarize_submodule_changes()
+        assert summary.splitlines() == [
+            "# Submodule changes:",
+            "# lib/a: 1111111..2222222 (1 commit)",
+            "#   + abc1234 Update a",
+            "# lib/b: 1111111..2222222 (1 commit)",
+            "#   + abc1234 Update b",
+        ]
+
+    def test_in_diff(self, superproject):
+        def run_git(args, check=True):
+            if args[0] == "diff" and "--raw" in args:
+                return raw((f"160000 160000 {OLD} {NEW} M", "lib/a"))
+            if args[0] == "diff":
+                return f"-Subproject commit {OLD}\n+Subproject commit {NEW}"
+            return "> abc1234 Fix parser\n"
+
+        with patch("git_commitai.run_git", side_effect=run_git):
+            diff = git_commitai.get_git_diff(settings=git_commitai.RunSettings(cwd=str(superproject)))
+        assert diff.endswith(
+            f"+Subproject commit {NEW}\n\n# Submodule changes:\n"
+            "# lib/a: 1111111..2222222 (1 commit)\n#   + abc1234 Fix parser\n```"
+        )
+
+
+def _git(repo, *args):
+    return subprocess.run(
+        ["git", "-C", str(repo), "-c", "user.name=T", "-c", "user.email=t@example.com",
+         "-c", "protocol.file.allow=always"] + list(args),
+        check=True, capture_output=True, text=True,
+    ).stdout
+
+
+@pytest.mark.integration
+@pytest.mark.skipif(shutil.which("git") is None, reason="git is not installed")
+def test_submodule_bump_from_git(tmp_path):
+    library = tmp_path / "library"
+    _git(tmp_path, "init", "-q", str(library))
+    (library / "lib.py").write_text("v = 1\n")
+    _git(library, "add", "-A")
+    _git(library, "commit", "-q", "-m", "Initial version")
+
+    app = tmp_path / "app"
+    _git(tmp_path, "init", "-q", str(app))
+    _git(app, "submodule", "add", "-q", str(library), "vendor/library")
+    _git(app, "commit", "-q", "-m", "Add library")
+
+    checkout = app / "vendor" / "library"
+    for version in (2, 3):
+        (checkout / "lib.py").write_text(f"v = {version}\n")
+        _git(checkout, "commit", "-q", "-am", f"Release {version}")
+    _git(app, "add", "vendor/library")
+
+    start = time.monotonic()
+    diff = git_commitai.get_git_diff(settings=git_commitai.RunSettings(cwd=str(app)))
+    assert time.monotonic() - start < 30
+    summary = diff[diff.index("# Submodule changes:"):].splitlines()
+    assert summary[1].startswith("# vendor/library: ") and summary[1].endswith("(2 commits)")
+    assert [line.split(None, 3)[1::2] for line in summary[2:4]] == [["+", "Release 3"], ["+", "Release 2"]]
+
+
+def test_run_git_timeout():
+    with patch("git_commitai.subprocess.run", side_effect=subprocess.TimeoutExpired(["git"], 0.5)) as mock_run:
+        with git_commitai.run_context(git_commitai.RunSettings(git_timeout=0.5)):
+            with pytest.raises(subprocess.TimeoutExpired):
+                git_commitai.run_git(["log"])
+    assert mock_run.call_args.kwargs["timeout"] == 0.5
@@ -17,7 +17,7 @@ def test_total_files_size_limit():
         file3_content = "z" * (8 * 1024)
 
         mock_run_git.side_effect = [
-            "file1.txt\nfile2.txt\nfile3.txt",  # file list
+            "file1.txt\0file2.txt\0file3.txt\0",  # file list
             "",  # numstat file1
             file1_content,  # content file1 (8KB, fits)
             "",  # numstat file2
@@ -92,7 +92,7 @@ max_prompt_size: 500000
 You are a commit message generator.
 """
 
-    with patch("git_commitai.get_git_root", return_value="/test"), \
+    with patch("git_commitai.find_work_tree", return_value="/test"), \
          patch("os.path.exists", return_value=True), \
          patch("builtins.open", create=True) as mock_open:
 
@@ -120,6 +120,7 @@ def test_total_files_respects_per_file_limit():
             "huge.txt",
             "",
             huge_file,
+            "",
         ]
 
         result = git_commitai.get_staged_files()
@@ -138,7 +139,7 @@ def test_empty_files_dont_count_toward_total():
          patch("git_commitai.MAX_TOTAL_FILES", 5 * 1024):
 
         mock_run_git.side_effect = [
-            "empty.txt\nsmall.txt",
+            "empty.txt\0small.txt\0",
             "",  # numstat empty
             "",  # content empty (0 bytes)
             "",  # numstat small
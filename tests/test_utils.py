@@ -3,7 +3,7 @@
 import pytest
 import subprocess
 import os
-from unittest.mock import patch
+from unittest.mock import ANY, patch
 import git_commitai
 
 
@@ -71,11 +71,13 @@ class TestGitUtilities:
             result = git_commitai.run_git(["status"])
             assert result == "On branch main"
             mock_run.assert_called_once_with(
-                ["git", "status"],
+                ["git", "-c", "color.ui=never", "status"],
                 capture_output=True,
                 text=True,
-                check=True
+                check=True,
+                env=ANY,
             )
+            assert mock_run.call_args.kwargs["env"]["GIT_OPTIONAL_LOCKS"] == "0"
 
     def test_run_git_failure(self):
         """Test git command execution failure."""